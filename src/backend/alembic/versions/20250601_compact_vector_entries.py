@@ -0,0 +1,27 @@
+"""compact ColPali bookkeeping: patch_count instead of JSON point-id list
+
+Revision ID: 20250601_compact_vectors
+Revises: 20250530_processing_rules
+Create Date: 2025-06-01
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20250601_compact_vectors'
+down_revision = '20250530_processing_rules'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Point IDs are now derived from (doc_id, page, patch); only the count is kept
+    with op.batch_alter_table('vectors', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('patch_count', sa.Integer(), nullable=True))
+        batch_op.alter_column('vector_ids', existing_type=sa.Text(), nullable=True)
+
+
+def downgrade():
+    with op.batch_alter_table('vectors', schema=None) as batch_op:
+        batch_op.alter_column('vector_ids', existing_type=sa.Text(), nullable=False)
+        batch_op.drop_column('patch_count')
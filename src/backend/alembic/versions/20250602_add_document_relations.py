@@ -0,0 +1,37 @@
+"""add document_relations table (precomputed related documents)
+
+Revision ID: 20250602_document_relations
+Revises: 20250601_compact_vectors
+Create Date: 2025-06-02
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20250602_document_relations'
+down_revision = '20250601_compact_vectors'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # startup() runs Base.metadata.create_all before migrating – table may exist
+    if sa.inspect(op.get_bind()).has_table('document_relations'):
+        return
+    op.create_table(
+        'document_relations',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('document_id', sa.Integer(), sa.ForeignKey('documents.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('related_id', sa.Integer(), sa.ForeignKey('documents.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('relation_type', sa.String(length=32), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.UniqueConstraint('document_id', 'related_id', 'relation_type', name='uq_document_relation'),
+    )
+    op.create_index('ix_document_relations_id', 'document_relations', ['id'])
+    op.create_index('ix_document_relations_document_id', 'document_relations', ['document_id'])
+    op.create_index('ix_document_relations_related_id', 'document_relations', ['related_id'])
+
+
+def downgrade():
+    op.drop_table('document_relations')
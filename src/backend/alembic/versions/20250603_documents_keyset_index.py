@@ -0,0 +1,29 @@
+"""composite (created_at, id) index for keyset pagination of documents
+
+Revision ID: 20250603_documents_keyset
+Revises: 20250602_document_relations
+Create Date: 2025-06-03
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20250603_documents_keyset'
+down_revision = '20250602_document_relations'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keyset cursors compare (created_at, id) – legacy rows without a timestamp
+    # would fall out of the ordering, so give them one.
+    op.execute(
+        "UPDATE documents SET created_at = COALESCE(updated_at, CURRENT_TIMESTAMP) WHERE created_at IS NULL"
+    )
+    indexes = {ix['name'] for ix in sa.inspect(op.get_bind()).get_indexes('documents')}
+    if 'ix_documents_created_at_id' not in indexes:
+        op.create_index('ix_documents_created_at_id', 'documents', ['created_at', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_documents_created_at_id', table_name='documents')
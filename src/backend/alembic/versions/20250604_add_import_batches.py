@@ -0,0 +1,49 @@
+"""import_batches table and documents.import_batch_id (bulk import)
+
+Revision ID: 20250604_import_batches
+Revises: 20250603_documents_keyset
+Create Date: 2025-06-04
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20250604_import_batches'
+down_revision = '20250603_documents_keyset'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    # startup() runs Base.metadata.create_all before migrating – table may exist
+    if not inspector.has_table('import_batches'):
+        op.create_table(
+            'import_batches',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('source', sa.String(length=255), nullable=True),
+            sa.Column('status', sa.String(length=20), nullable=False, server_default='queued'),
+            sa.Column('total', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('duplicates', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('skipped', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('created_by', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+        )
+        op.create_index('ix_import_batches_id', 'import_batches', ['id'])
+
+    columns = {c['name'] for c in inspector.get_columns('documents')}
+    if 'import_batch_id' not in columns:
+        with op.batch_alter_table('documents') as batch:
+            batch.add_column(sa.Column('import_batch_id', sa.Integer(), nullable=True))
+    indexes = {ix['name'] for ix in inspector.get_indexes('documents')}
+    if 'ix_documents_import_batch_id' not in indexes:
+        op.create_index('ix_documents_import_batch_id', 'documents', ['import_batch_id'])
+
+
+def downgrade():
+    op.drop_index('ix_documents_import_batch_id', table_name='documents')
+    with op.batch_alter_table('documents') as batch:
+        batch.drop_column('import_batch_id')
+    op.drop_table('import_batches')
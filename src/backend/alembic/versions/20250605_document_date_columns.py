@@ -0,0 +1,51 @@
+"""typed shadow DATE columns for document/due/payment dates + batched backfill
+
+Revision ID: 20250605_document_dates
+Revises: 20250604_import_batches
+Create Date: 2025-06-05
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.dates import SHADOW_COLUMNS, backfill_sync
+
+# revision identifiers, used by Alembic.
+revision = '20250605_document_dates'
+down_revision = '20250604_import_batches'
+branch_labels = None
+depends_on = None
+
+_INDEXED = ('document_on', 'due_on')
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    columns = {c['name'] for c in inspector.get_columns('documents')}
+    missing = [shadow for shadow in SHADOW_COLUMNS.values() if shadow not in columns]
+    if missing:
+        with op.batch_alter_table('documents') as batch:
+            for shadow in missing:
+                batch.add_column(sa.Column(shadow, sa.Date(), nullable=True))
+
+    indexes = {ix['name'] for ix in sa.inspect(bind).get_indexes('documents')}
+    for shadow in _INDEXED:
+        if f'ix_documents_{shadow}' not in indexes:
+            op.create_index(f'ix_documents_{shadow}', 'documents', [shadow])
+
+    # Parse the existing text dates in id-ordered batches (same parser as the ORM listeners)
+    documents = sa.table(
+        'documents',
+        sa.column('id', sa.Integer),
+        *(sa.column(source, sa.String) for source in SHADOW_COLUMNS),
+        *(sa.column(shadow, sa.Date) for shadow in SHADOW_COLUMNS.values()),
+    )
+    backfill_sync(bind, documents)
+
+
+def downgrade():
+    for shadow in _INDEXED:
+        op.drop_index(f'ix_documents_{shadow}', table_name='documents')
+    with op.batch_alter_table('documents') as batch:
+        for shadow in SHADOW_COLUMNS.values():
+            batch.drop_column(shadow)
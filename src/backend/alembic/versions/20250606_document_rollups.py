@@ -0,0 +1,37 @@
+"""document_rollups table (pre-aggregated analytics)
+
+Revision ID: 20250606_document_rollups
+Revises: 20250605_document_dates
+Create Date: 2025-06-06
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20250606_document_rollups'
+down_revision = '20250605_document_dates'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # startup() runs Base.metadata.create_all before migrating – table may exist.
+    # Rows are filled by the reconciler (app.rollups) on first start.
+    if not sa.inspect(op.get_bind()).has_table('document_rollups'):
+        op.create_table(
+            'document_rollups',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('entity_id', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('month', sa.String(length=7), nullable=False, server_default=''),
+            sa.Column('document_type', sa.String(length=50), nullable=False, server_default=''),
+            sa.Column('status', sa.String(length=50), nullable=False, server_default=''),
+            sa.Column('currency', sa.String(length=10), nullable=False, server_default=''),
+            sa.Column('doc_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('amount_sum', sa.Float(), nullable=False, server_default='0'),
+            sa.UniqueConstraint('entity_id', 'month', 'document_type', 'status', 'currency',
+                                name='uq_document_rollups_key'),
+        )
+
+
+def downgrade():
+    op.drop_table('document_rollups')
@@ -0,0 +1,57 @@
+"""vendor dimension table + documents.vendor_id backfill
+
+Revision ID: 20250607_vendors
+Revises: 20250606_document_rollups
+Create Date: 2025-06-07
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.vendors import link_documents_sync
+
+# revision identifiers, used by Alembic.
+revision = '20250607_vendors'
+down_revision = '20250606_document_rollups'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    # startup() runs Base.metadata.create_all before migrating – table may exist.
+    if not sa.inspect(bind).has_table('vendors'):
+        op.create_table(
+            'vendors',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('canonical', sa.String(length=255), nullable=False),
+            sa.Column('name', sa.String(length=255), nullable=False),
+            sa.Column('address_entry_id', sa.Integer(),
+                      sa.ForeignKey('address_book.id', ondelete='SET NULL'), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+        )
+        op.create_index('ix_vendors_id', 'vendors', ['id'])
+        op.create_index('ix_vendors_canonical', 'vendors', ['canonical'], unique=True)
+
+    columns = {c['name'] for c in sa.inspect(bind).get_columns('documents')}
+    if 'vendor_id' not in columns:
+        with op.batch_alter_table('documents') as batch:
+            batch.add_column(sa.Column('vendor_id', sa.Integer(), nullable=True))
+    indexes = {ix['name'] for ix in sa.inspect(bind).get_indexes('documents')}
+    if 'ix_documents_vendor_id' not in indexes:
+        op.create_index('ix_documents_vendor_id', 'documents', ['vendor_id'])
+
+    # Resolve existing senders in id-ordered batches (same canonicalisation as the ORM listener)
+    documents = sa.table(
+        'documents',
+        sa.column('id', sa.Integer),
+        sa.column('sender', sa.String),
+        sa.column('vendor_id', sa.Integer),
+    )
+    link_documents_sync(bind, documents)
+
+
+def downgrade():
+    op.drop_index('ix_documents_vendor_id', table_name='documents')
+    with op.batch_alter_table('documents') as batch:
+        batch.drop_column('vendor_id')
+    op.drop_table('vendors')
@@ -0,0 +1,54 @@
+"""fx_rates table + documents.amount_base (base-currency amounts)
+
+Revision ID: 20250608_fx_rates
+Revises: 20250607_vendors
+Create Date: 2025-06-08
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.fx import reconvert_sync
+
+# revision identifiers, used by Alembic.
+revision = '20250608_fx_rates'
+down_revision = '20250607_vendors'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    # startup() runs Base.metadata.create_all before migrating – table may exist.
+    if not sa.inspect(bind).has_table('fx_rates'):
+        op.create_table(
+            'fx_rates',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('currency', sa.String(length=10), nullable=False),
+            sa.Column('rate_date', sa.Date(), nullable=False),
+            sa.Column('rate', sa.Float(), nullable=False),
+            sa.UniqueConstraint('currency', 'rate_date', name='uq_fx_rates_currency_date'),
+        )
+
+    columns = {c['name'] for c in sa.inspect(bind).get_columns('documents')}
+    if 'amount_base' not in columns:
+        with op.batch_alter_table('documents') as batch:
+            batch.add_column(sa.Column('amount_base', sa.Float(), nullable=True))
+
+    # Base-currency and currency-less amounts convert 1:1 right away; foreign
+    # ones are filled once rates are loaded (FX_RATES_FILE / POST /api/fx/rates)
+    documents = sa.table(
+        'documents',
+        sa.column('id', sa.Integer),
+        sa.column('amount', sa.Float),
+        sa.column('amount_base', sa.Float),
+        sa.column('currency', sa.String),
+        sa.column('document_on', sa.Date),
+        sa.column('created_at', sa.DateTime),
+    )
+    reconvert_sync(bind, documents, only_missing=True)
+
+
+def downgrade():
+    with op.batch_alter_table('documents') as batch:
+        batch.drop_column('amount_base')
+    op.drop_table('fx_rates')
@@ -0,0 +1,27 @@
+"""composite index for the set-based due-date notification scan
+
+Revision ID: 20250609_notifications_scan
+Revises: 20250608_fx_rates
+Create Date: 2025-06-09
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20250609_notifications_scan'
+down_revision = '20250608_fx_rates'
+branch_labels = None
+depends_on = None
+
+_INDEX = 'ix_notifications_document_type_read'
+
+
+def upgrade():
+    # startup() may already have created it (create_all / IF NOT EXISTS fallback)
+    indexes = {ix['name'] for ix in sa.inspect(op.get_bind()).get_indexes('notifications')}
+    if _INDEX not in indexes:
+        op.create_index(_INDEX, 'notifications', ['document_id', 'type', 'is_read'])
+
+
+def downgrade():
+    op.drop_index(_INDEX, table_name='notifications')
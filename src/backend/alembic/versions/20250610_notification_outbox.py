@@ -0,0 +1,44 @@
+"""notification_outbox table (after-commit channel delivery)
+
+Revision ID: 20250610_notification_outbox
+Revises: 20250609_notifications_scan
+Create Date: 2025-06-10
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20250610_notification_outbox'
+down_revision = '20250609_notifications_scan'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    # startup() runs Base.metadata.create_all before migrating – table may exist.
+    if not sa.inspect(bind).has_table('notification_outbox'):
+        op.create_table(
+            'notification_outbox',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('notification_id', sa.Integer(),
+                      sa.ForeignKey('notifications.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('channel', sa.String(length=50), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False, server_default='pending'),
+            sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+            sa.Column('last_error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('sent_at', sa.DateTime(), nullable=True),
+        )
+
+    indexes = {ix['name'] for ix in sa.inspect(bind).get_indexes('notification_outbox')}
+    if 'ix_notification_outbox_due' not in indexes:
+        op.create_index(
+            'ix_notification_outbox_due', 'notification_outbox', ['channel', 'status', 'next_attempt_at']
+        )
+
+
+def downgrade():
+    op.drop_index('ix_notification_outbox_due', table_name='notification_outbox')
+    op.drop_table('notification_outbox')
@@ -0,0 +1,43 @@
+"""job_runs table (scheduler run history + single-runner claims)
+
+Revision ID: 20250611_job_runs
+Revises: 20250610_notification_outbox
+Create Date: 2025-06-11
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20250611_job_runs'
+down_revision = '20250610_notification_outbox'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    # startup() runs Base.metadata.create_all before migrating – table may exist.
+    if not sa.inspect(bind).has_table('job_runs'):
+        op.create_table(
+            'job_runs',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('job', sa.String(length=100), nullable=False),
+            sa.Column('scheduled_for', sa.DateTime(), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False, server_default='running'),
+            sa.Column('worker', sa.String(length=100), nullable=True),
+            sa.Column('started_at', sa.DateTime(), nullable=False),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.Column('duration_ms', sa.Float(), nullable=True),
+            sa.Column('detail', sa.Text(), nullable=True),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.UniqueConstraint('job', 'scheduled_for', name='uq_job_runs_job_slot'),
+        )
+
+    indexes = {ix['name'] for ix in sa.inspect(bind).get_indexes('job_runs')}
+    if 'ix_job_runs_job_started' not in indexes:
+        op.create_index('ix_job_runs_job_started', 'job_runs', ['job', 'started_at'])
+
+
+def downgrade():
+    op.drop_index('ix_job_runs_job_started', table_name='job_runs')
+    op.drop_table('job_runs')
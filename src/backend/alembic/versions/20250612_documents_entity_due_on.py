@@ -0,0 +1,26 @@
+"""composite (entity_id, due_on) index for calendar range queries
+
+Revision ID: 20250612_documents_entity_due_on
+Revises: 20250611_job_runs
+Create Date: 2025-06-12
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20250612_documents_entity_due_on'
+down_revision = '20250611_job_runs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    # startup() may already have created it (create_all / DDL fallback).
+    indexes = {ix['name'] for ix in sa.inspect(bind).get_indexes('documents')}
+    if 'ix_documents_entity_due_on' not in indexes:
+        op.create_index('ix_documents_entity_due_on', 'documents', ['entity_id', 'due_on'])
+
+
+def downgrade():
+    op.drop_index('ix_documents_entity_due_on', table_name='documents')
@@ -0,0 +1,27 @@
+"""documents.relations_computed_at (related documents computed once)
+
+Revision ID: 20250613_relations_computed_at
+Revises: 20250612_documents_entity_due_on
+Create Date: 2025-06-13
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20250613_relations_computed_at'
+down_revision = '20250612_documents_entity_due_on'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    # startup() may already have added it (create_all / DDL fallback).
+    columns = {c['name'] for c in sa.inspect(bind).get_columns('documents')}
+    if 'relations_computed_at' not in columns:
+        op.add_column('documents', sa.Column('relations_computed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('documents') as batch:
+        batch.drop_column('relations_computed_at')
@@ -0,0 +1,38 @@
+"""document_tombstones table (deletions for incremental exports)
+
+Revision ID: 20250614_document_tombstones
+Revises: 20250613_relations_computed_at
+Create Date: 2025-06-14
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20250614_document_tombstones'
+down_revision = '20250613_relations_computed_at'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    # startup() runs Base.metadata.create_all before migrating – table may exist.
+    if not sa.inspect(bind).has_table('document_tombstones'):
+        op.create_table(
+            'document_tombstones',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('document_id', sa.Integer(), nullable=False),
+            sa.Column('deleted_at', sa.DateTime(), nullable=False),
+        )
+
+    indexes = {ix['name'] for ix in sa.inspect(bind).get_indexes('document_tombstones')}
+    for column in ('document_id', 'deleted_at'):
+        name = f'ix_document_tombstones_{column}'
+        if name not in indexes:
+            op.create_index(name, 'document_tombstones', [column])
+
+
+def downgrade():
+    op.drop_index('ix_document_tombstones_deleted_at', table_name='document_tombstones')
+    op.drop_index('ix_document_tombstones_document_id', table_name='document_tombstones')
+    op.drop_table('document_tombstones')
@@ -0,0 +1,33 @@
+"""document_rollups.unconverted_count / unconverted_sum (amounts without a rate)
+
+Revision ID: 20250615_rollup_unconverted
+Revises: 20250614_document_tombstones
+Create Date: 2025-06-15
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20250615_rollup_unconverted'
+down_revision = '20250614_document_tombstones'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    # startup() may already have added them (create_all / DDL fallback).  Existing
+    # rows start at 0 – the first reconciliation after startup fills them in.
+    columns = {c['name'] for c in sa.inspect(bind).get_columns('document_rollups')}
+    if 'unconverted_count' not in columns:
+        op.add_column('document_rollups', sa.Column('unconverted_count', sa.Integer(), nullable=False,
+                                                    server_default='0'))
+    if 'unconverted_sum' not in columns:
+        op.add_column('document_rollups', sa.Column('unconverted_sum', sa.Float(), nullable=False,
+                                                    server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('document_rollups') as batch:
+        batch.drop_column('unconverted_sum')
+        batch.drop_column('unconverted_count')
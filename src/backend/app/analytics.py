@@ -2,13 +2,14 @@
 Analytics functionality for the Document Management System.
 """
 import logging
-from sqlalchemy import func, desc, and_, extract, select, cast, Date, text
+from sqlalchemy import func, desc, and_, case, extract, select, text
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional, Tuple
-from app.models import Document, Tag, DocumentTag
+from app.models import Document, DocumentRollup, Tag, DocumentTag
+from app.dates import month_start, parse_date
+from app import fx, rollups
 from calendar import monthrange
-import re
 
 # Configure logging
 logging.basicConfig(
@@ -18,11 +19,35 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class AnalyticsService:
-    """Service for document analytics."""
+    """Service for document analytics.
+
+    Dashboard aggregates read the ``document_rollups`` table (see
+    ``app.rollups``) once it has been reconciled and fall back to live
+    queries over ``documents`` before that.  *entity_id* scopes every
+    aggregate to one tenant.
+    """
     
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, entity_id: Optional[int] = None):
         """Initialize the analytics service with a database session."""
         self.db = db
+        self.entity_id = entity_id
+
+    def _use_rollups(self) -> bool:
+        return rollups.is_ready()
+
+    def _scope(self, model) -> list:
+        return [model.entity_id == self.entity_id] if self.entity_id is not None else []
+
+    async def _rollup_counts(self, column, label: str) -> List[Dict[str, Any]]:
+        total = func.sum(DocumentRollup.doc_count)
+        stmt = (
+            select(column, total)
+            .where(*self._scope(DocumentRollup))
+            .group_by(column)
+            .having(total > 0)
+        )
+        rows = (await self.db.execute(stmt)).all()
+        return [{label: value or None, "count": count} for value, count in rows]
     
     async def get_document_count_by_type(self) -> List[Dict[str, Any]]:
         """Get document count grouped by document type.
@@ -30,9 +55,12 @@ class AnalyticsService:
         Returns:
             List of dictionaries with document_type and count
         """
+        if self._use_rollups():
+            return await self._rollup_counts(DocumentRollup.document_type, "document_type")
         if hasattr(self.db, 'execute'):
             stmt = (
                 select(Document.document_type, func.count(Document.id).label('count'))
+                .where(*self._scope(Document))
                 .group_by(Document.document_type)
             )
             res = await self.db.execute(stmt)
@@ -51,9 +79,12 @@ class AnalyticsService:
         Returns:
             List of dictionaries with status and count
         """
+        if self._use_rollups():
+            return await self._rollup_counts(DocumentRollup.status, "status")
         if hasattr(self.db, 'execute'):
             stmt = (
                 select(Document.status, func.count(Document.id).label('count'))
+                .where(*self._scope(Document))
                 .group_by(Document.status)
             )
             res = await self.db.execute(stmt)
@@ -66,204 +97,195 @@ class AnalyticsService:
         
         return [{"status": status, "count": count} for status, count in results]
     
+    @staticmethod
+    def _month_rows(rows) -> List[Dict[str, Any]]:
+        """Shape ``(month, <aggregates>…)`` rows into the dashboard's month dicts."""
+        out = []
+        for row in rows:
+            values = dict(row._mapping)
+            month = parse_date(values.pop("month"))
+            if month is not None:
+                out.append({"year": month.year, "month": month.month, "month_name": month.strftime('%B'), **values})
+        out.sort(key=lambda x: (x["year"], x["month"]))
+        return out
+
     async def get_document_count_by_month(self, months: int = 6) -> List[Dict[str, Any]]:
         """Get document count by month for the last N months.
-        
+
+        Groups on the typed ``document_on`` column (``created_at`` when the
+        document has no date) in SQL.
+
         Args:
             months: Number of months to include
             
         Returns:
             List of dictionaries with month, year, and count
         """
-        today = datetime.utcnow()
-        start_date = today - timedelta(days=30 * months)
-        
-        if hasattr(self.db, "execute"):
-            # Async mode - For string date fields, we need to fetch and parse manually  
-            stmt = select(Document)
-            result = await self.db.execute(stmt)
-            documents = result.scalars().all()
-            
-            # Group by year/month manually
-            monthly_data = {}
-            
-            for doc in documents:
-                # Use created_at if document_date is not available
-                date_to_use = None
-                
-                if doc.document_date:
-                    try:
-                        # Parse document_date string
-                        date_str = str(doc.document_date)
-                        
-                        # Try ISO format first
-                        if re.match(r'^\d{4}-\d{2}-\d{2}', date_str):
-                            date_to_use = datetime.strptime(date_str[:10], '%Y-%m-%d')
-                        # Try European format
-                        elif re.match(r'^\d{1,2}\.\d{1,2}\.\d{4}', date_str):
-                            parts = date_str.split('.')
-                            if len(parts) >= 3:
-                                date_to_use = datetime(int(parts[2]), int(parts[1]), int(parts[0]))
-                    except (ValueError, TypeError, IndexError):
-                        pass
-                
-                # Fallback to created_at if document_date parsing failed
-                if not date_to_use and doc.created_at:
-                    date_to_use = doc.created_at
-                
-                if not date_to_use or date_to_use < start_date:
-                    continue
-                    
-                year = date_to_use.year
-                month = date_to_use.month
-                key = f"{year}-{month:02d}"
-                
-                if key not in monthly_data:
-                    monthly_data[key] = {
-                        "year": year,
-                        "month": month,
-                        "month_name": date_to_use.strftime('%B'),
-                        "count": 0
-                    }
-                
-                monthly_data[key]["count"] += 1
-            
-            # Convert to list and sort
-            results = list(monthly_data.values())
-            results.sort(key=lambda x: (x["year"], x["month"]))
-            
-        else:
+        start_date = (datetime.utcnow() - timedelta(days=30 * months)).date()
+
+        if not hasattr(self.db, "execute"):
             # Sync mode fallback - this shouldn't be used in the current setup
-            results = []
-        
-        return results
+            return []
+
+        if self._use_rollups():
+            rows = await self._rollup_months(start_date, func.sum(DocumentRollup.doc_count).label("count"))
+            return self._month_rows(rows)
+
+        effective, bucket = self._live_month()
+        stmt = (
+            select(bucket, func.count(Document.id).label("count"))
+            .where(effective >= start_date.replace(day=1), *self._scope(Document))
+            .group_by(bucket)
+        )
+        rows = (await self.db.execute(stmt)).all()
+        return self._month_rows(rows)
+
+    @staticmethod
+    def _live_month():
+        """``(effective day, month bucket)`` – the same rule the rollups key on:
+        ``document_on``, else the day the document was created."""
+        effective = func.coalesce(Document.document_on, func.date(Document.created_at))
+        return effective, month_start(effective).label("month")
+
+    async def _rollup_months(self, start_date, *aggregates, where=()):
+        # Month buckets are whole months, so the first (partial) month is included
+        bucket = (DocumentRollup.month + "-01").label("month")
+        stmt = (
+            select(bucket, *aggregates)
+            .where(
+                DocumentRollup.month != "",
+                DocumentRollup.month >= rollups.month_key(start_date),
+                *where,
+                *self._scope(DocumentRollup),
+            )
+            .group_by(DocumentRollup.month)
+            .having(func.sum(DocumentRollup.doc_count) > 0)
+        )
+        return (await self.db.execute(stmt)).all()
     
     async def get_invoice_amount_by_month(self, months: int = 6) -> List[Dict[str, Any]]:
         """Get total invoice amount by month for the last N months.
-        
+
         Args:
             months: Number of months to include
             
         Returns:
-            List of dictionaries with month, year, and total_amount
+            List of dictionaries with month, year, and total_amount (in the
+            base currency, see ``app.fx``).  Like the document counts, every
+            invoice counts – undated ones in the month they were created,
+            ones without an amount with 0.  Amounts with no known rate are
+            left out of ``total_amount`` and counted in ``unconverted_count``.
         """
-        today = datetime.utcnow()
-        start_date = today - timedelta(days=30 * months)
-        
-        if hasattr(self.db, "execute"):
-            # Async mode - For string date fields, we need to fetch and parse manually
-            stmt = select(Document).where(
-                Document.document_type == 'invoice',
-                Document.amount.isnot(None)
+        start_date = (datetime.utcnow() - timedelta(days=30 * months)).date()
+
+        if not hasattr(self.db, "execute"):
+            # Sync mode fallback - this shouldn't be used in the current setup
+            return []
+
+        if self._use_rollups():
+            rows = await self._rollup_months(
+                start_date,
+                func.sum(DocumentRollup.amount_sum).label("total_amount"),
+                func.sum(DocumentRollup.doc_count).label("count"),
+                func.sum(DocumentRollup.unconverted_count).label("unconverted_count"),
+                where=(DocumentRollup.document_type == "invoice",),
             )
-            
-            result = await self.db.execute(stmt)
-            documents = result.scalars().all()
-            
-            # Group by year/month manually
-            monthly_data = {}
-            
-            for doc in documents:
-                if not doc.document_date:
-                    continue
-                    
-                try:
-                    # Parse date string (could be ISO format or European format)
-                    date_str = str(doc.document_date)
-                    
-                    # Try ISO format first
-                    if re.match(r'^\d{4}-\d{2}-\d{2}', date_str):
-                        doc_date = datetime.strptime(date_str[:10], '%Y-%m-%d')
-                    # Try European format
-                    elif re.match(r'^\d{1,2}\.\d{1,2}\.\d{4}', date_str):
-                        parts = date_str.split('.')
-                        if len(parts) >= 3:
-                            doc_date = datetime(int(parts[2]), int(parts[1]), int(parts[0]))
-                    else:
-                        continue
-                        
-                    # Check if within date range
-                    if doc_date < start_date:
-                        continue
-                        
-                    year = doc_date.year
-                    month = doc_date.month
-                    key = f"{year}-{month:02d}"
-                    
-                    if key not in monthly_data:
-                        monthly_data[key] = {
-                            "year": year,
-                            "month": month,
-                            "month_name": doc_date.strftime('%B'),
-                            "total_amount": 0.0,
-                            "count": 0
-                        }
-                    
-                    monthly_data[key]["total_amount"] += float(doc.amount) if doc.amount else 0.0
-                    monthly_data[key]["count"] += 1
-                    
-                except (ValueError, TypeError, IndexError) as e:
-                    # Skip documents with invalid dates
-                    continue
-            
-            # Convert to list and sort
-            results = list(monthly_data.values())
-            results.sort(key=lambda x: (x["year"], x["month"]))
-            
         else:
-            # Sync mode fallback - this shouldn't be used in the current setup
-            results = []
-        
+            effective, bucket = self._live_month()
+            stmt = (
+                select(
+                    bucket,
+                    func.sum(fx.base_amount()).label("total_amount"),
+                    func.count(Document.id).label("count"),
+                    func.sum(case((fx.unconverted(), 1), else_=0)).label("unconverted_count"),
+                )
+                .where(
+                    Document.document_type == 'invoice',
+                    effective >= start_date.replace(day=1),
+                    *self._scope(Document),
+                )
+                .group_by(bucket)
+            )
+            rows = (await self.db.execute(stmt)).all()
+        results = self._month_rows(rows)
+        for item in results:
+            item["total_amount"] = float(item["total_amount"] or 0.0)
+            item["unconverted_count"] = int(item["unconverted_count"] or 0)
         return results
     
     async def get_payment_status_summary(self) -> Dict[str, Any]:
-        """Get summary counts + amounts for invoice payment status (async-aware)."""
+        """Get summary counts + amounts for invoice payment status (async-aware).
+
+        One aggregate query; "overdue" is an indexed range on ``due_on``.
+        Amounts are in the base currency (``currency`` in the result); those
+        with no known rate are left out and listed per currency under
+        ``unconverted``.
+        """
         today = datetime.utcnow().date()
+        is_paid = Document.status == "paid"
+        is_unpaid = Document.status == "unpaid"
+        is_overdue = and_(is_unpaid, Document.due_on < today)
 
-        async def _scalar(stmt):
-            if hasattr(self.db, "execute"):
-                res = await self.db.execute(stmt)
-                return res.scalar() or 0
-            return stmt.scalar()  # type: ignore – sync Session path
+        def _count(cond):
+            return func.sum(case((cond, 1), else_=0))
 
-        if hasattr(self.db, "execute"):
-            # Async mode – craft select() statements
-            iso_due = Document.due_date.op('~')(r'^\\d{4}-\\d{2}-\\d{2}$')
-            base = select(func.count(Document.id)).where(Document.document_type == "invoice")
-            total_invoices = await _scalar(base)
+        def _amount(cond):
+            return func.sum(case((cond, fx.base_amount()), else_=0))
 
-            paid_invoices = await _scalar(
-                base.where(Document.status == "paid")
-            )
-            unpaid_invoices = await _scalar(
-                base.where(Document.status == "unpaid")
-            )
-            overdue_invoices = await _scalar(
-                base.where(Document.status == "unpaid", iso_due, cast(Document.due_date, Date) < today)
-            )
+        if self._use_rollups():
+            # Status totals from the rollups; "overdue" depends on today, so it
+            # stays a live (indexed) query over the unpaid invoices only.
+            def _rollup(cond, column):
+                return func.sum(case((cond, column), else_=0))
 
-            # Amount aggregates
-            amt_base = select(func.sum(Document.amount)).where(
-                Document.document_type == "invoice", Document.amount.isnot(None)
-            )
-            total_amount = await _scalar(amt_base)
-            paid_amount = await _scalar(amt_base.where(Document.status == "paid"))
-            unpaid_amount = await _scalar(amt_base.where(Document.status == "unpaid"))
-            overdue_amount = await _scalar(
-                amt_base.where(Document.status == "unpaid", iso_due, cast(Document.due_date, Date) < today)
+            paid = DocumentRollup.status == "paid"
+            unpaid = DocumentRollup.status == "unpaid"
+            totals = select(
+                func.sum(DocumentRollup.doc_count),
+                _rollup(paid, DocumentRollup.doc_count),
+                _rollup(unpaid, DocumentRollup.doc_count),
+                func.sum(DocumentRollup.amount_sum),
+                _rollup(paid, DocumentRollup.amount_sum),
+                _rollup(unpaid, DocumentRollup.amount_sum),
+            ).where(DocumentRollup.document_type == "invoice", *self._scope(DocumentRollup))
+            overdue = select(func.count(Document.id), func.sum(fx.base_amount())).where(
+                Document.document_type == "invoice", is_overdue, *self._scope(Document)
             )
+            (total_invoices, paid_invoices, unpaid_invoices,
+             total_amount, paid_amount, unpaid_amount) = (v or 0 for v in (await self.db.execute(totals)).one())
+            overdue_invoices, overdue_amount = (v or 0 for v in (await self.db.execute(overdue)).one())
+            unconverted = fx.unconverted_by_currency((await self.db.execute(
+                select(
+                    DocumentRollup.currency,
+                    func.sum(DocumentRollup.unconverted_count),
+                    func.sum(DocumentRollup.unconverted_sum),
+                )
+                .where(DocumentRollup.document_type == "invoice", *self._scope(DocumentRollup))
+                .group_by(DocumentRollup.currency)
+            )).all())
         else:
-            # Legacy sync Session
-            iso_due_sync = Document.due_date.op('~')(r'^\\d{4}-\\d{2}-\\d{2}$')
-            total_invoices = self.db.query(func.count(Document.id)).filter(Document.document_type == "invoice").scalar() or 0
-            paid_invoices = self.db.query(func.count(Document.id)).filter(Document.document_type == "invoice", Document.status == "paid").scalar() or 0
-            unpaid_invoices = self.db.query(func.count(Document.id)).filter(Document.document_type == "invoice", Document.status == "unpaid").scalar() or 0
-            overdue_invoices = self.db.query(func.count(Document.id)).filter(Document.document_type == "invoice", Document.status == "unpaid", iso_due_sync, cast(Document.due_date, Date) < today).scalar() or 0
+            stmt = select(
+                func.count(Document.id),
+                _count(is_paid),
+                _count(is_unpaid),
+                _count(is_overdue),
+                func.sum(fx.base_amount()),
+                _amount(is_paid),
+                _amount(is_unpaid),
+                _amount(is_overdue),
+            ).where(Document.document_type == "invoice", *self._scope(Document))
 
-            total_amount = self.db.query(func.sum(Document.amount)).filter(Document.document_type == "invoice", Document.amount.isnot(None)).scalar() or 0
-            paid_amount = self.db.query(func.sum(Document.amount)).filter(Document.document_type == "invoice", Document.status == "paid", Document.amount.isnot(None)).scalar() or 0
-            unpaid_amount = self.db.query(func.sum(Document.amount)).filter(Document.document_type == "invoice", Document.status == "unpaid", Document.amount.isnot(None)).scalar() or 0
-            overdue_amount = self.db.query(func.sum(Document.amount)).filter(Document.document_type == "invoice", Document.status == "unpaid", iso_due_sync, cast(Document.due_date, Date) < today, Document.amount.isnot(None)).scalar() or 0
+            if hasattr(self.db, "execute"):
+                row = (await self.db.execute(stmt)).one()
+                unconverted = await fx.unconverted_totals(
+                    self.db, Document.document_type == "invoice", *self._scope(Document)
+                )
+            else:
+                # Legacy sync Session
+                row = self.db.execute(stmt).one()
+                unconverted = []
+            (total_invoices, paid_invoices, unpaid_invoices, overdue_invoices,
+             total_amount, paid_amount, unpaid_amount, overdue_amount) = (v or 0 for v in row)
 
         return {
             "total_invoices": total_invoices,
@@ -277,6 +299,9 @@ class AnalyticsService:
             "paid_percentage": (paid_invoices / total_invoices * 100) if total_invoices else 0,
             "unpaid_percentage": (unpaid_invoices / total_invoices * 100) if total_invoices else 0,
             "overdue_percentage": (overdue_invoices / total_invoices * 100) if total_invoices else 0,
+            "currency": fx.base_currency(),
+            "unconverted_count": sum(entry["count"] for entry in unconverted),
+            "unconverted": unconverted,
         }
     
     def get_upcoming_due_dates(self, days: int = 30) -> List[Dict[str, Any]]:
@@ -292,19 +317,19 @@ class AnalyticsService:
         end_date = today + timedelta(days=days)
         
         documents = self.db.query(Document).filter(
-            Document.due_date >= today,
-            Document.due_date <= end_date,
+            Document.due_on >= today,
+            Document.due_on <= end_date,
             Document.status != 'paid'
-        ).order_by(Document.due_date).all()
+        ).order_by(Document.due_on).all()
         
         result = []
         for doc in documents:
-            days_until_due = (doc.due_date - today).days
+            days_until_due = (doc.due_on - today).days
             result.append({
                 "id": doc.id,
                 "title": doc.title,
                 "sender": doc.sender,
-                "due_date": doc.due_date.isoformat() if doc.due_date else None,
+                "due_date": doc.due_on.isoformat() if doc.due_on else None,
                 "amount": float(doc.amount) if doc.amount else None,
                 "document_type": doc.document_type,
                 "days_until_due": days_until_due
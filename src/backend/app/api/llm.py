@@ -321,13 +321,13 @@ async def batch_extract_tenants(
         if all_documents:
             # Process all documents that don't have tenant assignments
             result = await db.execute(
-                select(Document).where(
+                select(Document.id).where(
                     Document.recipient.is_(None) | 
                     (Document.recipient == "") |
                     (Document.recipient == "Your Company")
                 )
             )
-            documents_to_process = [doc.id for doc in result.scalars().all()]
+            documents_to_process = list(result.scalars().all())
         elif document_ids:
             documents_to_process = document_ids
         else:
@@ -414,7 +414,7 @@ async def auto_assign_unmatched_documents(
     try:
         # Find documents with generic or empty recipients
         result = await db.execute(
-            select(Document).where(
+            select(Document.id).where(
                 or_(
                     Document.recipient.is_(None),
                     Document.recipient == "",
@@ -427,9 +427,9 @@ async def auto_assign_unmatched_documents(
             ).limit(50)  # Process max 50 at a time
         )
         
-        unmatched_docs = result.scalars().all()
+        unmatched_ids = result.scalars().all()
         
-        if not unmatched_docs:
+        if not unmatched_ids:
             return {
                 "status": "success",
                 "message": "No unmatched documents found",
@@ -440,17 +440,17 @@ async def auto_assign_unmatched_documents(
         processed = 0
         assigned = 0
         
-        for doc in unmatched_docs:
+        for doc_id in unmatched_ids:
             try:
-                result = await agent.analyze_and_assign_tenant(doc.id, current_user.id)
+                result = await agent.analyze_and_assign_tenant(doc_id, current_user.id)
                 processed += 1
                 
                 if result["status"] == "success":
                     assigned += 1
-                    logger.info(f"Auto-assigned document {doc.id} to tenant: {result['tenant']['alias']}")
+                    logger.info(f"Auto-assigned document {doc_id} to tenant: {result['tenant']['alias']}")
                     
             except Exception as e:
-                logger.error(f"Error auto-assigning document {doc.id}: {e}")
+                logger.error(f"Error auto-assigning document {doc_id}: {e}")
         
         await db.commit()
         
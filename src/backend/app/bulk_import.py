@@ -0,0 +1,356 @@
+"""app.bulk_import
+===============
+Bulk import of many files and ZIP/TAR archives.
+
+Staging runs in a worker thread: every file or archive member is copied
+chunk-wise into a fresh batch folder while hashing (TAR is read as a stream,
+ZIP member by member from the spooled upload).  Hidden, unsupported and
+oversized members are skipped and repeats within the batch dropped.  Hashes
+already stored are removed with one ``IN`` query per chunk, then the
+``ImportBatch`` row and one ``queued`` placeholder ``Document`` per remaining
+file are inserted in a single transaction.
+
+Placeholders go onto an in-process queue drained by ``IMPORT_CONCURRENCY``
+workers, which run the normal pipeline (``process_new_document``) on the
+placeholder row.  Placeholders still queued after a restart are picked up
+again by ``resume_pending``.  ``progress`` reports counts, throughput and an
+ETA for a batch.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import shutil
+import tarfile
+import uuid
+import zipfile
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select, update
+
+from app import events, ingestion, rollups
+from app.config import settings
+from app.models import Document, ImportBatch
+
+logger = logging.getLogger(__name__)
+
+_CONCURRENCY = int(os.getenv("IMPORT_CONCURRENCY", 2))
+_MAX_FILES = int(os.getenv("IMPORT_MAX_FILES", 10000))
+_HASH_LOOKUP_CHUNK = 500
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+_PENDING = ("queued", "processing")
+
+# (batch_id, document_id, path, sha256)
+_Job = Tuple[int, int, str, str]
+_queue: Optional[asyncio.Queue] = None
+_workers: List[asyncio.Task] = []
+
+
+def import_root() -> str:
+    """Where batch folders live – below the inbox but not watched (non-recursive watcher)."""
+    return os.getenv("IMPORT_FOLDER") or os.path.join(settings.WATCH_FOLDER, "imports")
+
+
+def is_archive(filename: Optional[str]) -> bool:
+    return (filename or "").lower().endswith(ARCHIVE_SUFFIXES)
+
+
+# ---------------------------------------------------------------------------
+# Staging (blocking – runs in a worker thread)
+# ---------------------------------------------------------------------------
+
+@dataclass
+class _Stager:
+    folder: str
+    max_size: int
+    max_files: int
+    staged: Dict[str, ingestion.StoredUpload] = field(default_factory=dict)  # sha256 → file
+    names: Dict[str, str] = field(default_factory=dict)  # sha256 → original name
+    duplicates: int = 0
+    skipped: int = 0
+
+    def add(self, name: str, src) -> None:
+        name = os.path.basename((name or "").replace("\\", "/")).strip()
+        stem, ext = os.path.splitext(name)
+        if not name or name.startswith(".") or ext.lower() not in ingestion.DOCUMENT_EXTENSIONS:
+            self.skipped += 1
+            return
+        if len(self.staged) >= self.max_files:
+            raise ingestion.UploadRejected(413, f"More than {self.max_files} files in one import")
+
+        part = os.path.join(self.folder, f".{uuid.uuid4().hex}.part")
+        stored = ingestion.copy_stream(src, part, self.max_size)
+        if stored is None:
+            self.skipped += 1
+            return
+        if stored.sha256 in self.staged:
+            os.remove(part)
+            self.duplicates += 1
+            return
+
+        target = os.path.join(self.folder, name)
+        n = 1
+        while os.path.exists(target):
+            target = os.path.join(self.folder, f"{stem} ({n}){ext}")
+            n += 1
+        os.replace(part, target)
+        stored.path = target
+        self.staged[stored.sha256] = stored
+        self.names[stored.sha256] = name
+
+    def add_archive(self, name: str, src) -> None:
+        try:
+            if name.lower().endswith(".zip"):
+                with zipfile.ZipFile(src) as zf:
+                    for info in zf.infolist():
+                        if not info.is_dir():
+                            with zf.open(info) as member:
+                                self.add(info.filename, member)
+            else:
+                # "r|*" = sequential stream, any compression – never seeks back
+                with tarfile.open(fileobj=src, mode="r|*") as tf:
+                    for member in tf:
+                        if member.isfile():
+                            self.add(member.name, tf.extractfile(member))
+        except (zipfile.BadZipFile, tarfile.TarError) as exc:
+            raise ingestion.UploadRejected(400, f"Unreadable archive {name}: {exc}")
+
+    def drop(self, digests) -> None:
+        for digest in digests:
+            stored = self.staged.pop(digest, None)
+            if stored is not None:
+                os.remove(stored.path)
+                self.duplicates += 1
+
+
+# ---------------------------------------------------------------------------
+# Batch creation
+# ---------------------------------------------------------------------------
+
+async def create_batch(db, uploads: List[Any], user_id: Optional[int] = None) -> Dict[str, Any]:
+    """Stage *uploads* (``UploadFile``s), insert placeholders, enqueue them.
+
+    Raises ``ingestion.UploadRejected`` for unreadable archives or too many files.
+    """
+    folder = os.path.join(import_root(), uuid.uuid4().hex)
+    os.makedirs(folder, exist_ok=True)
+    stager = _Stager(folder, settings.MAX_UPLOAD_SIZE, _MAX_FILES)
+
+    def _stage():
+        for upload in uploads:
+            if is_archive(upload.filename):
+                stager.add_archive(upload.filename, upload.file)
+            else:
+                stager.add(upload.filename, upload.file)
+
+    try:
+        await asyncio.to_thread(_stage)
+
+        # Already stored, or being ingested right now by an upload/the watcher
+        hashes = list(stager.staged)
+        known = set(ingestion._claims.values()) & set(hashes)
+        for start in range(0, len(hashes), _HASH_LOOKUP_CHUNK):
+            rows = await db.execute(
+                select(Document.hash).where(Document.hash.in_(hashes[start:start + _HASH_LOOKUP_CHUNK]))
+            )
+            known.update(rows.scalars())
+        await asyncio.to_thread(stager.drop, known)
+
+        batch = ImportBatch(
+            source=", ".join(u.filename or "?" for u in uploads)[:255],
+            status="queued",
+            total=len(stager.staged),
+            duplicates=stager.duplicates,
+            skipped=stager.skipped,
+            created_by=user_id,
+        )
+        db.add(batch)
+        await db.flush()
+
+        jobs: List[_Job] = []
+        if stager.staged:
+            now = datetime.utcnow()
+            rows = await db.execute(
+                insert(Document).returning(Document.id, Document.hash),
+                [
+                    {
+                        "title": os.path.splitext(stager.names[digest])[0].replace("_", " "),
+                        "file_path": stored.path,
+                        "original_file_name": stager.names[digest],
+                        "hash": digest,
+                        "status": "queued",
+                        "import_batch_id": batch.id,
+                        "created_at": now,
+                        "updated_at": now,
+                    }
+                    for digest, stored in stager.staged.items()
+                ],
+            )
+            jobs = [(batch.id, doc_id, stager.staged[digest].path, digest) for doc_id, digest in rows]
+        else:
+            batch.status = "done"
+            batch.finished_at = datetime.utcnow()
+        await db.commit()
+        if jobs:
+            rollups.mark_stale()  # Core insert – not seen by the rollup listener
+    except BaseException:
+        await db.rollback()
+        shutil.rmtree(folder, ignore_errors=True)
+        raise
+
+    if not stager.staged:
+        shutil.rmtree(folder, ignore_errors=True)
+    for job in jobs:
+        enqueue(job)
+    logger.info(
+        "Import batch %s: %d queued, %d duplicates, %d skipped",
+        batch.id, batch.total, batch.duplicates, batch.skipped,
+    )
+    return await progress(db, batch.id)
+
+
+# ---------------------------------------------------------------------------
+# Queue + workers
+# ---------------------------------------------------------------------------
+
+def _get_queue() -> asyncio.Queue:
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue()
+    return _queue
+
+
+def enqueue(job: _Job) -> None:
+    _get_queue().put_nowait(job)
+
+
+def start_workers(process: Callable[..., Awaitable[None]], session_factory, concurrency: int = _CONCURRENCY) -> None:
+    """Start the import workers (idempotent).  *process* is ``process_new_document``."""
+    global _workers
+    if any(not w.done() for w in _workers):
+        return
+    _workers = [
+        asyncio.create_task(_worker(process, session_factory), name=f"import-worker-{n}")
+        for n in range(max(1, concurrency))
+    ]
+
+
+async def stop_workers() -> None:
+    for worker in _workers:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+
+async def _worker(process, session_factory) -> None:
+    queue = _get_queue()
+    while True:
+        batch_id, document_id, path, digest = await queue.get()
+        try:
+            if not ingestion.claim(path, digest):
+                continue  # the watcher got there first
+            async with session_factory() as db:
+                doc = (await db.execute(
+                    update(Document).where(Document.id == document_id).values(status="processing")
+                    .returning(Document.title, Document.entity_id)
+                )).first()
+                if doc is not None:  # Core write – not seen by the ORM flush hook
+                    events.queue(db.sync_session, "document.status",
+                                 events.document_status(document_id, "processing", "queued", doc.title),
+                                 entity_id=doc.entity_id)
+                await db.execute(
+                    update(ImportBatch)
+                    .where(ImportBatch.id == batch_id, ImportBatch.started_at.is_(None))
+                    .values(started_at=datetime.utcnow(), status="processing")
+                )
+                await db.commit()
+            rollups.mark_stale()
+            await ingestion.process_claimed(path, process, file_hash=digest, document_id=document_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.error("Import of %s (batch %s) failed: %s", path, batch_id, exc)
+        finally:
+            try:
+                async with session_factory() as db:
+                    await _finish_if_done(db, batch_id)
+            except Exception as exc:  # pragma: no cover – bookkeeping only
+                logger.debug("Batch %s completion check failed: %s", batch_id, exc)
+            queue.task_done()
+
+
+async def _finish_if_done(db, batch_id: int) -> None:
+    pending = (await db.execute(
+        select(func.count()).select_from(Document)
+        .where(Document.import_batch_id == batch_id, Document.status.in_(_PENDING))
+    )).scalar()
+    if not pending:
+        await db.execute(
+            update(ImportBatch)
+            .where(ImportBatch.id == batch_id, ImportBatch.finished_at.is_(None))
+            .values(status="done", finished_at=datetime.utcnow())
+        )
+        await db.commit()
+
+
+async def resume_pending(db) -> int:
+    """Re-enqueue placeholders left queued/processing by a restart → count."""
+    rows = (await db.execute(
+        select(Document.import_batch_id, Document.id, Document.file_path, Document.hash)
+        .where(Document.import_batch_id.is_not(None), Document.status.in_(_PENDING))
+        .order_by(Document.id)
+    )).all()
+    for row in rows:
+        enqueue(tuple(row))
+    return len(rows)
+
+
+# ---------------------------------------------------------------------------
+# Progress
+# ---------------------------------------------------------------------------
+
+async def progress(db, batch_id: int) -> Optional[Dict[str, Any]]:
+    """Counts, throughput (documents/minute) and ETA for *batch_id*."""
+    batch = (await db.execute(select(ImportBatch).where(ImportBatch.id == batch_id))).scalar_one_or_none()
+    if batch is None:
+        return None
+    counts = dict((await db.execute(
+        select(Document.status, func.count())
+        .where(Document.import_batch_id == batch_id)
+        .group_by(Document.status)
+    )).all())
+    queued = counts.pop("queued", 0)
+    processing = counts.pop("processing", 0)
+    failed = counts.pop("failed", 0)
+    completed = sum(counts.values())
+
+    throughput = eta = None
+    if batch.started_at is not None:
+        elapsed = ((batch.finished_at or datetime.utcnow()) - batch.started_at).total_seconds()
+        done = completed + failed
+        if elapsed > 0 and done:
+            throughput = round(done / elapsed * 60, 2)
+            remaining = queued + processing
+            eta = round(remaining / (done / elapsed)) if remaining else 0
+
+    return {
+        "id": batch.id,
+        "source": batch.source,
+        "status": batch.status,
+        "total": batch.total,
+        "duplicates": batch.duplicates,
+        "skipped": batch.skipped,
+        "queued": queued,
+        "processing": processing,
+        "completed": completed,
+        "failed": failed,
+        "documents_per_minute": throughput,
+        "eta_seconds": eta,
+        "created_at": batch.created_at,
+        "started_at": batch.started_at,
+        "finished_at": batch.finished_at,
+    }
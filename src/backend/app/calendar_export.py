@@ -1,13 +1,46 @@
 """
 Calendar export functionality for the Document Management System.
+
+ICS feeds
+---------
+Calendar apps poll ``/api/calendar/export/ics`` every few minutes per
+subscriber, so the feed is built for cheap repeat fetches:
+
+• :func:`iter_feed` streams one all-day ``VEVENT`` per document with a typed
+  ``due_on`` straight from a server-side cursor – no ``Calendar`` object and
+  no full rows in memory.
+• Each rendering is cached per (user, tenant, filter).  An ``after_flush``
+  listener drops every cached feed when a document changes; Core writes and
+  other workers are caught by the short TTL and the validator below.
+• The validator – row count, newest ``updated_at`` and highest id of the
+  filtered documents, one aggregate query – gives a strong ``ETag``.
+  ``Last-Modified`` is the newest change in the tenant or the newest
+  tombstone, so documents leaving the feed move it too.  ``If-None-Match`` /
+  ``If-Modified-Since`` answer ``304`` without rendering anything.
+
+Range queries
+-------------
+:func:`events_in_range` serves the calendar page and heatmaps: a compact
+projection of the documents due in any week / month / quarter plus per-day
+counts, filtered on the typed ``due_on`` (and tenant) so the composite
+``ix_documents_entity_due_on`` index answers it.
 """
+import calendar
+import hashlib
 import logging
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
-from ics import Calendar, Event
-from app.models import Document
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from sqlalchemy import case, event, func, select
 from sqlalchemy.orm import Session
-from sqlalchemy import select, and_
+from starlette.responses import Response, StreamingResponse
+
+from app.cache import TTLCache
+from app.file_serving import etag_matches
+from app.models import Document, DocumentTombstone
 
 # Configure logging
 logging.basicConfig(
@@ -16,187 +49,339 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+_STREAM_BATCH = int(os.getenv("CALENDAR_FEED_BATCH", 500))
+
+# (owner, filter) → rendered feed; dropped wholesale on any document change
+_feeds: "TTLCache[RenderedFeed]" = TTLCache(
+    maxsize=int(os.getenv("CALENDAR_FEED_CACHE_SIZE", 128)),
+    ttl=float(os.getenv("CALENDAR_FEED_CACHE_TTL", 300)),
+)
+
+_PRODID = "-//137docs//Due dates//EN"
+
+
+@dataclass(frozen=True)
+class FeedFilter:
+    """What a feed contains; part of the cache key."""
+
+    entity_id: Optional[int] = None
+    days: Optional[int] = None  # only due within the next *days* (and not paid)
+    document_type: Optional[str] = None
+    include_paid: bool = True
+
+
+@dataclass
+class RenderedFeed:
+    etag: str
+    last_modified: Optional[datetime]
+    body: bytes
+
+
+def invalidate() -> None:
+    """Forget every cached feed (Core writers that change documents)."""
+    _feeds.clear()
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_on_change(session: Session, flush_context) -> None:
+    if any(isinstance(obj, Document) for obj in (*session.new, *session.dirty, *session.deleted)):
+        _feeds.clear()
+
+
+# ---------------------------------------------------------------------------
+# Rendering
+# ---------------------------------------------------------------------------
+
+def _conditions(flt: FeedFilter) -> list:
+    conditions = [Document.due_on.isnot(None)]
+    if flt.entity_id is not None:
+        conditions.append(Document.entity_id == flt.entity_id)
+    if flt.document_type:
+        conditions.append(Document.document_type == flt.document_type)
+    if flt.days is not None:
+        today = datetime.utcnow().date()
+        conditions.append(Document.due_on.between(today, today + timedelta(days=flt.days)))
+    if flt.days is not None or not flt.include_paid:
+        conditions.append(func.coalesce(Document.status, "") != "paid")
+    return conditions
+
+
+def _escape(value: object) -> str:
+    """RFC 5545 TEXT escaping."""
+    text = "" if value is None else str(value)
+    return (
+        text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    """Fold a content line at 75 octets (continuation lines start with a space)."""
+    raw = line.encode("utf-8")
+    if len(raw) <= 75:
+        return line + "\r\n"
+    parts, current, size = [], "", 0
+    for ch in line:
+        width = len(ch.encode("utf-8"))
+        if size + width > (75 if not parts else 74):
+            parts.append(current)
+            current, size = "", 0
+        current += ch
+        size += width
+    parts.append(current)
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _stamp(value: datetime) -> str:
+    return value.strftime("%Y%m%dT%H%M%SZ")
+
+
+def _vevent(row, dtstamp: str) -> str:
+    kind = (row.document_type or "document").capitalize()
+    description = [f"Sender: {row.sender}"]
+    if row.amount:
+        description.append(f"Amount: {row.amount}" + (f" {row.currency}" if row.currency else ""))
+    description += [f"Status: {row.status}", f"Document ID: {row.id}"]
+    due: date = row.due_on
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:document-{row.id}@137docs",
+        f"DTSTAMP:{dtstamp}",
+        f"DTSTART;VALUE=DATE:{due:%Y%m%d}",
+        f"DTEND;VALUE=DATE:{due + timedelta(days=1):%Y%m%d}",
+        f"SUMMARY:{_escape(f'{kind}: {row.title}')}",
+        f"DESCRIPTION:{_escape(chr(10).join(description))}",
+    ]
+    if row.updated_at:
+        lines.append(f"LAST-MODIFIED:{_stamp(row.updated_at)}")
+    lines.append("END:VEVENT")
+    return "".join(_fold(line) for line in lines)
+
+
+async def iter_feed(db, flt: FeedFilter, name: str = "137docs due dates") -> AsyncIterator[str]:
+    """Yield the ICS feed for *flt* chunk by chunk, oldest due date first."""
+    dtstamp = _stamp(datetime.utcnow())
+    yield "".join(_fold(line) for line in (
+        "BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{_PRODID}", "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{_escape(name)}",
+    ))
+    stmt = (
+        select(
+            Document.id, Document.title, Document.document_type, Document.sender, Document.amount,
+            Document.currency, Document.status, Document.due_on, Document.updated_at,
+        )
+        .where(*_conditions(flt))
+        .order_by(Document.due_on, Document.id)
+        .execution_options(yield_per=_STREAM_BATCH)
+    )
+    result = await db.stream(stmt)
+    async for rows in result.partitions():
+        yield "".join(_vevent(row, dtstamp) for row in rows)
+    yield "END:VCALENDAR\r\n"
+
+
+async def _validator(db, flt: FeedFilter, owner: object) -> Tuple[str, Optional[datetime]]:
+    # A document that leaves the filter (paid, retyped, due date cleared) or is
+    # deleted does not move the filtered max(updated_at), so Last-Modified also
+    # takes the tenant's newest change and the newest tombstone into account.
+    scope = [Document.entity_id == flt.entity_id] if flt.entity_id is not None else []
+    count, newest, top, scope_newest, deleted = (await db.execute(
+        select(
+            func.count(), func.max(Document.updated_at), func.max(Document.id),
+            select(func.max(Document.updated_at)).where(*scope).scalar_subquery(),
+            select(func.max(DocumentTombstone.deleted_at)).scalar_subquery(),
+        ).where(*_conditions(flt))
+    )).one()
+    stamps = [stamp for stamp in (newest, scope_newest, deleted) if stamp is not None]
+    if flt.days is not None:  # the window moves with the calendar day
+        today = datetime.utcnow().date()
+        owner = (owner, today)
+        stamps.append(datetime.combine(today, datetime.min.time()))
+    digest = hashlib.sha1(repr((owner, flt, count, newest, top, _PRODID)).encode()).hexdigest()
+    return f'"{digest}"', max(stamps, default=None)
+
+
+def _not_modified(headers: Mapping[str, str], etag: str, last_modified: Optional[datetime]) -> bool:
+    if_none_match = headers.get("if-none-match")
+    if if_none_match:
+        return etag_matches(if_none_match, etag)
+    since = headers.get("if-modified-since")
+    if since and last_modified:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(since).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+async def feed_response(db, session_factory, owner: object, flt: FeedFilter,
+                        request_headers: Mapping[str, str]) -> Response:
+    """``200`` (cached or streamed) / ``304`` ICS response for *owner* and *flt*.
+
+    *db* (the request session) only answers the validator query; the body is
+    streamed from its own *session_factory* session, like ``export.iter_documents``.
+    """
+    key = (owner, flt)
+    cached = _feeds.get(key)
+    if cached is None:
+        etag, last_modified = await _validator(db, flt, owner)
+    else:
+        etag, last_modified = cached.etag, cached.last_modified
+
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, max-age=0, must-revalidate",
+        "Content-Disposition": "attachment; filename=calendar.ics",
+    }
+    if last_modified:
+        headers["Last-Modified"] = formatdate(calendar.timegm(last_modified.timetuple()), usegmt=True)
+    if _not_modified(request_headers, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    if cached is not None and cached.etag == etag:
+        return Response(cached.body, media_type="text/calendar", headers=headers)
+
+    async def _render() -> AsyncIterator[bytes]:
+        chunks: List[bytes] = []
+        async with session_factory() as feed_db:
+            async for chunk in iter_feed(feed_db, flt):
+                data = chunk.encode("utf-8")
+                chunks.append(data)
+                yield data
+        _feeds.set(key, RenderedFeed(etag, last_modified, b"".join(chunks)))
+
+    return StreamingResponse(_render(), media_type="text/calendar", headers=headers)
+
+
+# ---------------------------------------------------------------------------
+# Range queries (calendar page, heatmaps)
+# ---------------------------------------------------------------------------
+
+# Widest range one call may ask for (a year view); events are capped as well
+MAX_RANGE_DAYS = 366
+_RANGE_EVENT_LIMIT = int(os.getenv("CALENDAR_RANGE_LIMIT", 5000))
+
+
+def _range_conditions(start: date, end: date, entity_ids: Optional[Iterable[int]],
+                      document_type: Optional[str], include_paid: bool) -> list:
+    # Sargable on ix_documents_entity_due_on (single tenant) / ix_documents_due_on
+    conditions = [Document.due_on.between(start, end)]
+    if entity_ids is not None:
+        ids = sorted(set(entity_ids))
+        conditions.append(Document.entity_id == ids[0] if len(ids) == 1 else Document.entity_id.in_(ids))
+    if document_type:
+        conditions.append(Document.document_type == document_type)
+    if not include_paid:
+        conditions.append(func.coalesce(Document.status, "") != "paid")
+    return conditions
+
+
+async def range_rows(db, start: date, end: date, entity_ids: Optional[Iterable[int]] = None,
+                     document_type: Optional[str] = None, include_paid: bool = True,
+                     limit: int = _RANGE_EVENT_LIMIT) -> list:
+    """Compact rows due between *start* and *end* (inclusive), by due date."""
+    stmt = (
+        select(
+            Document.id, Document.title, Document.sender, Document.document_type, Document.status,
+            Document.due_on, Document.amount, Document.currency, Document.entity_id,
+        )
+        .where(*_range_conditions(start, end, entity_ids, document_type, include_paid))
+        .order_by(Document.due_on, Document.id)
+        .limit(limit)
+    )
+    return (await db.execute(stmt)).all()
+
+
+async def events_in_range(db, start: date, end: date, entity_ids: Optional[Iterable[int]] = None,
+                          document_type: Optional[str] = None, include_paid: bool = True,
+                          with_events: bool = True) -> Dict[str, Any]:
+    """Events plus per-day counts for ``start <= due_on <= end`` in two indexed queries.
+
+    ``days`` lists only days with documents: ``count``, ``unpaid`` and
+    ``amount`` (base currency, see :mod:`app.fx`) – enough for a heatmap
+    without fetching the events (*with_events* ``False``).
+    """
+    if entity_ids is not None and not entity_ids:
+        return {"start": start.isoformat(), "end": end.isoformat(), "days": [], "events": [], "truncated": False}
+
+    unpaid = func.sum(case((func.coalesce(Document.status, "") != "paid", 1), else_=0))
+    per_day = (await db.execute(
+        select(Document.due_on, func.count(), unpaid, func.sum(Document.amount_base))
+        .where(*_range_conditions(start, end, entity_ids, document_type, include_paid))
+        .group_by(Document.due_on)
+        .order_by(Document.due_on)
+    )).all()
+    days = [
+        {"date": day.isoformat(), "count": count, "unpaid": int(open_ or 0), "amount": round(amount or 0.0, 2)}
+        for day, count, open_, amount in per_day
+    ]
+
+    events: List[Dict[str, Any]] = []
+    if with_events:
+        rows = await range_rows(db, start, end, entity_ids, document_type, include_paid)
+        events = [
+            {
+                "id": row.id,
+                "title": row.title,
+                "sender": row.sender,
+                "document_type": row.document_type,
+                "status": row.status,
+                "due_date": row.due_on.isoformat(),
+                "amount": row.amount,
+                "currency": row.currency,
+                "entity_id": row.entity_id,
+            }
+            for row in rows
+        ]
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "days": days,
+        "events": events,
+        "truncated": with_events and len(events) < sum(d["count"] for d in days),
+    }
+
+
 class CalendarService:
-    """Service for calendar export functionality."""
-    
-    def __init__(self, db: Session):
+    """Service for calendar queries used by the calendar page."""
+
+    def __init__(self, db):
         """Initialize the calendar service with a database session."""
         self.db = db
-    
-    def generate_calendar(self, document_ids: Optional[List[int]] = None) -> Calendar:
-        """Generate a calendar with events for documents.
-        
-        Args:
-            document_ids: Optional list of document IDs to include. If None, includes all documents with due dates.
-            
-        Returns:
-            Calendar object with events
-        """
-        calendar = Calendar()
-        
-        # Query documents with due dates
-        query = self.db.query(Document).filter(Document.due_date.isnot(None))
-        
-        # Filter by document IDs if provided
-        if document_ids:
-            query = query.filter(Document.id.in_(document_ids))
-        
-        documents = query.all()
-        
-        # Create events for each document
-        for document in documents:
-            event = Event()
-            
-            # Set event properties
-            event.name = f"{document.document_type.capitalize()}: {document.title}"
-            
-            # Set description with document details
-            description = f"Sender: {document.sender}\n"
-            if document.amount:
-                description += f"Amount: {document.amount}\n"
-            description += f"Status: {document.status}\n"
-            description += f"Document ID: {document.id}"
-            event.description = description
-            
-            # Set date and time
-            due_date = document.due_date
-            event.begin = datetime.combine(due_date, datetime.min.time())
-            event.make_all_day()
-            
-            # Add event to calendar
-            calendar.events.add(event)
-        
-        logger.info(f"Generated calendar with {len(calendar.events)} events")
-        return calendar
-    
-    def generate_ics_file(self, document_ids: Optional[List[int]] = None) -> str:
-        """Generate an ICS file content for documents.
-        
-        Args:
-            document_ids: Optional list of document IDs to include. If None, includes all documents with due dates.
-            
-        Returns:
-            ICS file content as string
-        """
-        calendar = self.generate_calendar(document_ids)
-        return str(calendar)
-    
-    def generate_upcoming_due_dates_calendar(self, days: int = 30) -> Calendar:
-        """Generate a calendar with events for documents with upcoming due dates.
-        
-        Args:
-            days: Number of days ahead to check
-            
-        Returns:
-            Calendar object with events
-        """
-        calendar = Calendar()
-        
-        # Get current date
-        today = datetime.utcnow().date()
-        end_date = today + timedelta(days=days)
-        
-        # Query documents with upcoming due dates
-        documents = self.db.query(Document).filter(
-            Document.due_date >= today,
-            Document.due_date <= end_date,
-            Document.status != 'paid'
-        ).order_by(Document.due_date).all()
-        
-        # Create events for each document
-        for document in documents:
-            event = Event()
-            
-            # Set event properties
-            event.name = f"{document.document_type.capitalize()}: {document.title}"
-            
-            # Set description with document details
-            description = f"Sender: {document.sender}\n"
-            if document.amount:
-                description += f"Amount: {document.amount}\n"
-            description += f"Status: {document.status}\n"
-            description += f"Document ID: {document.id}"
-            event.description = description
-            
-            # Set date and time
-            due_date = document.due_date
-            event.begin = datetime.combine(due_date, datetime.min.time())
-            event.make_all_day()
-            
-            # Add event to calendar
-            calendar.events.add(event)
-        
-        logger.info(f"Generated upcoming due dates calendar with {len(calendar.events)} events")
-        return calendar
-    
-    def generate_upcoming_due_dates_ics(self, days: int = 30) -> str:
-        """Generate an ICS file content for documents with upcoming due dates.
-        
-        Args:
-            days: Number of days ahead to check
-            
-        Returns:
-            ICS file content as string
-        """
-        calendar = self.generate_upcoming_due_dates_calendar(days)
-        return str(calendar)
 
 class CalendarExportService(CalendarService):
     """Backward-compatibility alias – kept for code that imported CalendarExportService."""
-    pass
 
     # ------------------ Helper async wrappers expected by FastAPI endpoints ------------------ #
 
     async def get_events_for_month(self, db, month: int, year: int):
         """Return list of events (documents with due_date) for given month/year (async)."""
-        from datetime import date
-        from sqlalchemy import select, and_
-        from app.models import Document
-
         start = date(year, month, 1)
-        if month == 12:
-            end = date(year + 1, 1, 1)
-        else:
-            end = date(year, month + 1, 1)
-
-        stmt = (
-            select(Document)
-            .where(and_(Document.due_date >= start, Document.due_date < end))
-        )
-        result = await db.execute(stmt)
-        documents = result.scalars().all()
-
+        end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+        rows = await range_rows(db, start, end - timedelta(days=1))
         return [
             {
-                "id": doc.id,
-                "title": doc.sender or doc.title,
-                "due_date": doc.due_date if doc.due_date else None,
-                "status": doc.status,
+                "id": row.id,
+                "title": row.sender or row.title,
+                "due_date": row.due_on.isoformat(),
+                "status": row.status,
             }
-            for doc in documents
+            for row in rows
         ]
 
     async def get_events_for_date(self, db, date_str: str):
         """Return events for a specific date (YYYY-MM-DD) – async."""
-        from datetime import datetime
-        from sqlalchemy import select
-        from app.models import Document
-
         try:
             target_date = datetime.strptime(date_str, "%Y-%m-%d").date()
         except ValueError:
             return []
 
-        stmt = select(Document).where(Document.due_date == target_date)
-        result = await db.execute(stmt)
-        documents = result.scalars().all()
-
+        rows = await range_rows(db, target_date, target_date)
         return [
             {
-                "id": doc.id,
-                "title": doc.title,
+                "id": row.id,
+                "title": row.title,
                 "due_date": date_str,
-                "status": doc.status,
+                "status": row.status,
             }
-            for doc in documents
+            for row in rows
         ]
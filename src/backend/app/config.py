@@ -22,6 +22,8 @@ class Settings(BaseSettings):
     
     # Folder monitoring settings
     WATCH_FOLDER: str = os.path.join(os.path.expanduser("~"), "Documents", "Inbox")
+    # Uploads larger than this (bytes) are rejected with 413 while streaming
+    MAX_UPLOAD_SIZE: int = 100 * 1024 * 1024
     
     # LLM settings
     LLM_MODEL: str = "gwen2.5"
@@ -37,7 +39,11 @@ class Settings(BaseSettings):
     NOTIFICATION_ENABLED: bool = True
     AUTO_OCR: bool = True
     AUTO_TAGGING: bool = True
-    
+    # Vision retrieval (ColPali) – torch/colpali_engine are only imported when enabled
+    VISION_SEARCH_ENABLED: bool = True
+    # Load the ColPali model in a background task at startup instead of on first use
+    VISION_WARMUP: bool = True
+
     # Application defaults
     DEFAULT_CURRENCY: str = os.getenv("DEFAULT_CURRENCY", "USD")
     
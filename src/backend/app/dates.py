@@ -0,0 +1,245 @@
+"""app.dates
+=========
+One canonical parser for the free-text dates the LLM extracts.
+
+``document_date``, ``due_date`` and ``payment_date`` stay ``String(50)`` for
+compatibility, but each has a typed shadow ``DATE`` column (``document_on``,
+``due_on``, ``paid_on``).  Attribute listeners in ``app.models`` keep the
+shadows in sync on every ORM write through :func:`parse_date`, so analytics
+and notification queries can filter and ``GROUP BY`` on indexed dates in SQL.
+
+Rows written before the shadows existed are filled by :func:`backfill`
+(batched by primary key, one short transaction per batch) – from the Alembic
+migration, at startup and via ``/api/admin/cleanup-dates``.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Date, and_, bindparam, or_, select, update
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+logger = logging.getLogger(__name__)
+
+_BATCH = int(os.getenv("DATE_BACKFILL_BATCH_SIZE", 1000))
+
+# text column → typed shadow column
+SHADOW_COLUMNS = {
+    "document_date": "document_on",
+    "due_date": "due_on",
+    "payment_date": "paid_on",
+}
+
+# The day must end the string or be followed by a time part ("T10:00", " 10:00")
+_ISO = re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})(?:$|[T\s])")
+_YMD = re.compile(r"^(\d{4})[/.](\d{1,2})[/.](\d{1,2})$")
+_DMY_DOT = re.compile(r"^(\d{1,2})\.(\d{1,2})\.(\d{2}|\d{4})$")
+_SLASH_OR_DASH = re.compile(r"^(\d{1,2})([/-])(\d{1,2})\2(\d{4})$")
+
+
+def _make(year: int, month: int, day: int) -> Optional[date]:
+    if year < 100:
+        year += 2000
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def parse_date(value: Any) -> Optional[date]:
+    """Best-effort ``date`` for *value* → ``None`` when it cannot be read.
+
+    Accepts ``date``/``datetime`` objects and strings in ISO (``2024-03-31``,
+    with or without a time part), European ``31.03.2024``, ``2024/03/31`` and
+    slash/dash forms – ``03/31/2024`` is read US-style first (as the LLM
+    prompt asks for), falling back to day-first when the month would be > 12.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    if not text:
+        return None
+
+    m = _ISO.match(text)
+    if m:
+        return _make(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    m = _YMD.match(text)
+    if m:
+        return _make(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    m = _DMY_DOT.match(text)
+    if m:
+        return _make(int(m.group(3)), int(m.group(2)), int(m.group(1)))
+    m = _SLASH_OR_DASH.match(text)
+    if m:
+        first, sep, second, year = int(m.group(1)), m.group(2), int(m.group(3)), int(m.group(4))
+        # "/" is US month-first, "-" European day-first; either falls back to the other
+        candidates = [(first, second), (second, first)] if sep == "/" else [(second, first), (first, second)]
+        for month, day in candidates:
+            parsed = _make(year, month, day)
+            if parsed is not None:
+                return parsed
+    return None
+
+
+def to_iso(value: Any) -> Optional[str]:
+    """``YYYY-MM-DD`` for *value*, or ``None`` when it cannot be parsed."""
+    parsed = parse_date(value)
+    return parsed.isoformat() if parsed else None
+
+
+def shadow_values(row: Dict[str, Any]) -> Dict[str, Optional[date]]:
+    """Shadow column values for a mapping holding the text date columns."""
+    return {shadow: parse_date(row.get(source)) for source, shadow in SHADOW_COLUMNS.items() if source in row}
+
+
+# ---------------------------------------------------------------------------
+# SQL helpers
+# ---------------------------------------------------------------------------
+
+class month_start(FunctionElement):
+    """First day of the month of a DATE/TIMESTAMP expression, as a DATE.
+
+    ``date_trunc('month', x)::date`` on Postgres, ``date(x, 'start of month')``
+    on SQLite – either way a value you can ``GROUP BY``.
+    """
+
+    type = Date()
+    inherit_cache = True
+    name = "month_start"
+
+
+@compiles(month_start)
+def _month_start_default(element, compiler, **kw):
+    return "CAST(date_trunc('month', %s) AS DATE)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(month_start, "sqlite")
+def _month_start_sqlite(element, compiler, **kw):
+    return "date(%s, 'start of month')" % compiler.process(element.clauses, **kw)
+
+
+def range_conditions(shadow, text_column, start: Any = None, end: Any = None) -> list:
+    """Inclusive ``start``/``end`` filter on the indexed *shadow* column.
+
+    Bounds that do not parse fall back to comparing the ISO text column.
+    """
+    conditions = []
+    for bound, op in ((start, "__ge__"), (end, "__le__")):
+        if not bound:
+            continue
+        parsed = parse_date(bound)
+        conditions.append(getattr(shadow, op)(parsed) if parsed else getattr(text_column, op)(bound))
+    return conditions
+
+
+# ---------------------------------------------------------------------------
+# Backfill
+# ---------------------------------------------------------------------------
+
+def _missing_clause(table):
+    return or_(*(
+        and_(table.c[source].isnot(None), table.c[source] != "", table.c[shadow].is_(None))
+        for source, shadow in SHADOW_COLUMNS.items()
+    ))
+
+
+def _batch_statements(table, after_id: int, batch_size: int, normalise: bool = False):
+    # Normalising revisits every dated row; otherwise only rows missing a shadow
+    todo = or_(*(table.c[s].isnot(None) for s in SHADOW_COLUMNS)) if normalise else _missing_clause(table)
+    select_stmt = (
+        select(table.c.id, *(table.c[s] for s in SHADOW_COLUMNS), *(table.c[s] for s in SHADOW_COLUMNS.values()))
+        .where(table.c.id > after_id, todo)
+        .order_by(table.c.id)
+        .limit(batch_size)
+    )
+    values = {shadow: bindparam(shadow) for shadow in SHADOW_COLUMNS.values()}
+    if "updated_at" in table.c:  # Alembic's lightweight tables leave it out
+        # Exported columns change → new updated_at for incremental exports
+        values["updated_at"] = datetime.utcnow()
+    update_stmt = update(table).where(table.c.id == bindparam("_id")).values(values)
+    return select_stmt, update_stmt
+
+
+def _batch_params(rows, normalise: bool) -> Tuple[List[Dict[str, Any]], List[int]]:
+    """Update parameters for the rows that actually change, and the ids of
+    rows holding a text date that does not parse."""
+    params, failed = [], []
+    for row in rows:
+        row = dict(row)
+        values = shadow_values(row)
+        if any(row[source] and values[shadow] is None for source, shadow in SHADOW_COLUMNS.items()):
+            failed.append(row["id"])
+        new = {"_id": row["id"], **values}
+        if normalise:
+            # Rewrite parseable text dates to ISO as well (old cleanup-dates behaviour)
+            new.update({
+                source: (values[shadow].isoformat() if values[shadow] else row[source])
+                for source, shadow in SHADOW_COLUMNS.items()
+            })
+        if any(row[key] != value for key, value in new.items() if key != "_id"):
+            params.append(new)
+    return params, failed
+
+
+def backfill_sync(connection, table, batch_size: int = _BATCH) -> int:
+    """Blocking variant for Alembic – commits are left to the migration context."""
+    after_id, done = 0, 0
+    while True:
+        select_stmt, update_stmt = _batch_statements(table, after_id, batch_size)
+        rows = connection.execute(select_stmt).mappings().all()
+        if not rows:
+            return done
+        params, _failed = _batch_params(rows, normalise=False)
+        if params:
+            connection.execute(update_stmt, params)
+        after_id = rows[-1]["id"]
+        done += len(params)
+
+
+async def backfill(session_factory, batch_size: int = _BATCH, normalise: bool = False) -> Dict[str, Any]:
+    """Fill missing shadow dates in batches of *batch_size*, one transaction each.
+
+    Keyset-paged on ``id`` so unparseable rows are visited once, not forever.
+    With *normalise* the text columns are rewritten to ISO too.  Only rows
+    whose values change are written; the result counts them (``changed``)
+    and lists the ids of rows with a text date that did not parse
+    (``failed``).
+    """
+    from app.models import Document
+
+    table = Document.__table__
+    after_id = 0
+    scanned = parsed = changed = 0
+    failed: List[int] = []
+    while True:
+        select_stmt, update_stmt = _batch_statements(table, after_id, batch_size, normalise)
+        if normalise:
+            update_stmt = update_stmt.values({s: bindparam(s) for s in SHADOW_COLUMNS})
+        async with session_factory() as db:
+            rows = (await db.execute(select_stmt)).mappings().all()
+            if not rows:
+                break
+            params, batch_failed = _batch_params(rows, normalise)
+            if params:
+                await db.execute(update_stmt, params)
+                await db.commit()
+        after_id = rows[-1]["id"]
+        scanned += len(rows)
+        parsed += sum(1 for row in rows if any(parse_date(row[s]) for s in SHADOW_COLUMNS))
+        changed += len(params)
+        failed.extend(batch_failed)
+    if scanned:
+        logger.info(
+            "Date backfill: %d row(s) scanned, %d rewritten, %d with an unparseable date",
+            scanned, changed, len(failed),
+        )
+    return {"scanned": scanned, "parsed": parsed, "changed": changed, "failed": failed}
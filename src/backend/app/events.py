@@ -0,0 +1,227 @@
+"""app.events
+==========
+In-process event bus for live UI updates (``GET /api/events/stream``).
+
+Producers publish small JSON events instead of clients polling
+``/api/notifications`` and ``/api/processing/status``:
+
+• ``document.status`` – a document was created or changed status
+  (``processing`` → ``processed`` / ``failed`` …).  Collected by an
+  ``after_flush`` listener for ORM writes; Core writers call :func:`publish`.
+• ``notification.created`` – queued by ``NotificationService``.
+
+ORM events are held on the session and published only ``after_commit``, so
+subscribers never see state that is rolled back.
+
+Each subscriber has a bounded queue and a filter: events carrying an
+``entity_id`` only reach users linked to that tenant (``user_entities``),
+events carrying a ``user_id`` only that user.  A subscriber that falls
+behind gets a single ``resync`` event (refetch via the REST endpoints)
+instead of blocking publishers.  The last ``EVENT_REPLAY_SIZE`` events are
+kept so a reconnecting client can resume from ``Last-Event-ID``.
+
+Single process only – each API worker has its own bus and only sees the
+writes it makes itself.
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator, Deque, Dict, FrozenSet, Optional, Set
+
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.orm import Session
+
+from app.models import Document
+
+logger = logging.getLogger(__name__)
+
+_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", 256))
+_REPLAY_SIZE = int(os.getenv("EVENT_REPLAY_SIZE", 512))
+# Seconds between SSE keep-alive comments on an idle stream (proxies drop silent ones)
+_HEARTBEAT = float(os.getenv("EVENT_STREAM_HEARTBEAT", 15))
+
+_PENDING_KEY = "events_pending"
+
+
+@dataclass(frozen=True)
+class Event:
+    id: int
+    type: str
+    data: Dict[str, Any]
+    entity_id: Optional[int] = None
+    user_id: Optional[int] = None
+
+
+@dataclass(eq=False)
+class Subscription:
+    """One connected client: *entity_ids* ``None`` means every tenant."""
+
+    user_id: Optional[int]
+    entity_ids: Optional[FrozenSet[int]]
+    queue: "asyncio.Queue[Event]" = field(default_factory=lambda: asyncio.Queue(maxsize=_QUEUE_SIZE))
+    lagged: bool = False
+
+    def accepts(self, evt: Event) -> bool:
+        if evt.user_id is not None and evt.user_id != self.user_id:
+            return False
+        if evt.entity_id is not None and self.entity_ids is not None:
+            return evt.entity_id in self.entity_ids
+        return True
+
+
+_subscribers: Set[Subscription] = set()
+_recent: Deque[Event] = deque(maxlen=_REPLAY_SIZE)
+_ids = itertools.count(1)
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def subscribe(user_id: Optional[int], entity_ids: Optional[Set[int]] = None,
+              last_event_id: Optional[int] = None) -> Subscription:
+    """Register a subscriber; events after *last_event_id* are replayed when still buffered."""
+    global _loop
+    _loop = asyncio.get_running_loop()
+    sub = Subscription(user_id, frozenset(entity_ids) if entity_ids is not None else None)
+    if last_event_id is not None:
+        if _recent and _recent[0].id > last_event_id + 1:
+            sub.lagged = True  # gap too old to replay
+        for evt in _recent:
+            if evt.id > last_event_id and sub.accepts(evt):
+                _offer(sub, evt)
+    _subscribers.add(sub)
+    return sub
+
+
+def unsubscribe(sub: Subscription) -> None:
+    _subscribers.discard(sub)
+
+
+def subscriber_count() -> int:
+    return len(_subscribers)
+
+
+def _offer(sub: Subscription, evt: Event) -> None:
+    if sub.lagged:
+        return
+    try:
+        sub.queue.put_nowait(evt)
+    except asyncio.QueueFull:
+        sub.lagged = True  # the stream sends "resync" once the queue drains
+
+
+def _deliver(evt: Event) -> None:
+    _recent.append(evt)
+    for sub in list(_subscribers):
+        if sub.accepts(evt):
+            _offer(sub, evt)
+
+
+def publish(type: str, data: Dict[str, Any], entity_id: Optional[int] = None,
+            user_id: Optional[int] = None) -> Event:
+    """Publish now – safe from any thread; use :func:`queue` inside a transaction."""
+    evt = Event(next(_ids), type, data, entity_id, user_id)
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is not None:
+        _deliver(evt)
+    elif _loop is not None and _loop.is_running():
+        _loop.call_soon_threadsafe(_deliver, evt)  # e.g. Alembic data migrations in a worker thread
+    else:
+        _recent.append(evt)
+    return evt
+
+
+async def next_event(sub: Subscription, timeout: float) -> Optional[Event]:
+    """The next event for *sub*, ``None`` on timeout (caller sends a heartbeat)."""
+    try:
+        return await asyncio.wait_for(sub.queue.get(), timeout=timeout)
+    except asyncio.TimeoutError:
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Transactional publishing
+# ---------------------------------------------------------------------------
+
+def queue(session: Session, type: str, data: Dict[str, Any], entity_id: Optional[int] = None,
+          user_id: Optional[int] = None) -> None:
+    """Publish once *session* (sync session) commits; dropped on rollback."""
+    session.info.setdefault(_PENDING_KEY, []).append((type, data, entity_id, user_id))
+
+
+def _iso(value) -> Optional[str]:
+    return value.isoformat() if isinstance(value, datetime) else None
+
+
+def document_status(doc_id: int, status: Optional[str], previous: Optional[str] = None,
+                    title: Optional[str] = None, updated_at=None) -> Dict[str, Any]:
+    return {
+        "id": doc_id,
+        "status": status,
+        "previous": previous,
+        "title": title,
+        "updated_at": _iso(updated_at) or datetime.utcnow().isoformat(),
+    }
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_status_changes(session: Session, flush_context) -> None:
+    for obj in (*session.new, *session.dirty):
+        if not isinstance(obj, Document):
+            continue
+        state = sa_inspect(obj)
+        history = state.attrs.status.history
+        if obj in session.new:
+            previous = None
+        elif history.has_changes():
+            previous = history.deleted[0] if history.deleted else None
+        else:
+            continue
+        # Loaded values only – never trigger a lazy load from inside the flush
+        values = state.dict
+        queue(
+            session,
+            "document.status",
+            document_status(obj.id, values.get("status"), previous, values.get("title"), values.get("updated_at")),
+            entity_id=values.get("entity_id"),
+        )
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session: Session) -> None:
+    for type, data, entity_id, user_id in session.info.pop(_PENDING_KEY, ()):
+        publish(type, data, entity_id, user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_after_rollback(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def format_sse(evt: Optional[Event] = None, *, type: Optional[str] = None, data: str = "{}") -> str:
+    """Server-Sent Events frame for *evt* (or an ad-hoc *type* without an id)."""
+    if evt is None:
+        return f"event: {type}\ndata: {data}\n\n"
+    return f"id: {evt.id}\nevent: {evt.type}\ndata: {json.dumps(evt.data, default=str)}\n\n"
+
+
+async def stream(sub: Subscription, heartbeat: float = _HEARTBEAT) -> AsyncIterator[str]:
+    """SSE frames for *sub* until the client goes away (the response cancels us)."""
+    try:
+        yield format_sse(type="ready", data=json.dumps({"subscribers": len(_subscribers)}))
+        while True:
+            if sub.lagged and sub.queue.empty():
+                sub.lagged = False
+                yield format_sse(type="resync")
+            evt = await next_event(sub, heartbeat)
+            yield ": keep-alive\n\n" if evt is None else format_sse(evt)
+    finally:
+        unsubscribe(sub)
@@ -0,0 +1,152 @@
+"""app.export
+==========
+Streaming document export (NDJSON / CSV).
+
+Rows are pulled through a server-side cursor (``AsyncSession.stream`` with
+``yield_per``) and encoded one partition at a time, so memory stays flat
+whatever the archive size – nothing is collected into a list first.
+
+Incremental pulls (e.g. the n8n flow): every export is bounded by a
+*watermark* – ``max(updated_at)`` at the moment the export starts – which is
+returned in the ``X-Export-Watermark`` header.  Passing it back as
+``updated_since`` on the next call yields the rows changed since – re-reading
+``EXPORT_WATERMARK_LAG`` seconds before it.  ``updated_at`` is stamped at
+flush, not at commit, so a transaction that flushed before the watermark but
+committed after the export read it would otherwise be skipped for good.
+Consumers therefore get some rows twice and must upsert by ``id``.
+
+Deletions are recorded as :class:`~app.models.DocumentTombstone` rows (ORM
+deletes, via ``before_flush``) and listed by :func:`deleted_since`.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import and_, event, func, or_, select
+from sqlalchemy.orm import Session
+
+from app.models import Document, DocumentTombstone
+from app.repository import DocumentRepository, _embedding_list, _json_safe
+from app.responses import dumps
+
+logger = logging.getLogger(__name__)
+
+_BATCH = int(os.getenv("EXPORT_BATCH_SIZE", 500))
+# Overlap of incremental pulls – longer than any write transaction stays open
+_WATERMARK_LAG = timedelta(seconds=int(os.getenv("EXPORT_WATERMARK_LAG", 300)))
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+async def watermark(db) -> Optional[datetime]:
+    """Latest ``updated_at`` – the upper bound of an export started now."""
+    return (await db.execute(select(func.max(Document.updated_at)))).scalar()
+
+
+def since_with_lag(updated_since: datetime) -> datetime:
+    """Lower bound actually queried for *updated_since* (see the module docstring)."""
+    return updated_since - _WATERMARK_LAG
+
+
+def _statement(fields: List[str], filters: Dict[str, Any], updated_since: Optional[datetime],
+               upper: Optional[datetime]):
+    columns = [c for c in fields if c != "tags"]
+    table = Document.__table__
+    selected = list(dict.fromkeys(["id", *columns]))
+
+    conditions = DocumentRepository._list_filters(**filters)
+    if updated_since is not None:
+        conditions.append(Document.updated_at >= since_with_lag(updated_since))
+    if upper is not None:
+        conditions.append(or_(Document.updated_at <= upper, Document.updated_at.is_(None)))
+
+    stmt = select(*(table.c[name] for name in selected))
+    if conditions:
+        stmt = stmt.where(and_(*conditions))
+    # Oldest change first – an interrupted pull can resume from the last row seen
+    return (
+        stmt.order_by(Document.updated_at, Document.id)
+        .execution_options(yield_per=_BATCH)
+    )
+
+
+async def iter_documents(
+    session_factory,
+    fields: List[str],
+    filters: Optional[Dict[str, Any]] = None,
+    updated_since: Optional[datetime] = None,
+    upper: Optional[datetime] = None,
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Yield JSON-safe document dicts in partitions of ``EXPORT_BATCH_SIZE``.
+
+    Opens its own session: a streaming body must not use the request's
+    ``get_db`` session – FastAPI >= 0.106 closes it before the body runs
+    (0.103, pinned here, only happens to tear it down afterwards).
+    """
+    repo = DocumentRepository()
+    columns = [c for c in fields if c != "tags"]
+    stmt = _statement(fields, filters or {}, updated_since, upper)
+
+    async with session_factory() as db:
+        result = await db.stream(stmt)
+        async for partition in result.mappings().partitions(_BATCH):
+            tags = await repo._tag_names(db, [r["id"] for r in partition]) if "tags" in fields else {}
+            batch = []
+            for row in partition:
+                out = {name: row[name] for name in columns}
+                if out.get("embedding") is not None:
+                    out["embedding"] = _embedding_list(out["embedding"])
+                if "tags" in fields:
+                    out["tags"] = tags[row["id"]]
+                batch.append(_json_safe(out))
+            yield batch
+
+
+async def deleted_since(db, since: Optional[datetime] = None, limit: int = 10000) -> List[Dict[str, Any]]:
+    """Documents deleted after *since* (with the same overlap) → ``[{id, deleted_at}]``, oldest first."""
+    stmt = select(DocumentTombstone.document_id, DocumentTombstone.deleted_at)
+    if since is not None:
+        stmt = stmt.where(DocumentTombstone.deleted_at >= since_with_lag(since))
+    rows = await db.execute(stmt.order_by(DocumentTombstone.deleted_at, DocumentTombstone.id).limit(limit))
+    return [{"id": doc_id, "deleted_at": deleted_at.isoformat()} for doc_id, deleted_at in rows]
+
+
+@event.listens_for(Session, "before_flush")
+def _record_deletions(session: Session, flush_context, instances) -> None:
+    now = datetime.utcnow()
+    session.add_all(
+        DocumentTombstone(document_id=obj.id, deleted_at=now)
+        for obj in session.deleted
+        if isinstance(obj, Document) and obj.id is not None
+    )
+
+
+async def encode_ndjson(batches: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    async for batch in batches:
+        yield b"".join(dumps(row) + b"\n" for row in batch)
+
+
+async def encode_csv(batches: AsyncIterator[List[Dict[str, Any]]], fields: List[str]) -> AsyncIterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(fields)
+    async for batch in batches:
+        for row in batch:
+            writer.writerow([
+                json.dumps(v) if isinstance(v, (list, dict)) else ("" if v is None else v)
+                for v in (row.get(f) for f in fields)
+            ])
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():  # header only – empty export
+        yield buf.getvalue().encode()
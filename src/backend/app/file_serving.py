@@ -0,0 +1,213 @@
+"""app.file_serving
+================
+Serving stored document files to viewers.
+
+• The on-disk location of a document is resolved once (including the legacy
+  inbox → archive rewrite) and kept in a small TTL cache together with the
+  content hash, so repeat requests – a PDF viewer fetching page after page –
+  skip both the database and the ``exists`` probes.  The cached path is only
+  trusted while it still stats; otherwise it is resolved again.
+• ``ETag`` is the document's SHA-256 (a weak mtime/size tag for rows without
+  a hash); a matching ``If-None-Match`` answers ``304``.
+• A single ``Range: bytes=…`` is answered with ``206`` and only those bytes,
+  honouring ``If-Range``.  Multi-range requests get the whole file, which
+  RFC 9110 allows.
+• The media type comes from the file name instead of assuming PDF.
+"""
+from __future__ import annotations
+
+import mimetypes
+import os
+import stat
+from dataclasses import dataclass
+from email.utils import formatdate
+from typing import Mapping, Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from sqlalchemy import select
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from app.cache import TTLCache
+from app.models import Document
+
+_CHUNK = int(os.getenv("FILE_CHUNK_SIZE", 64 * 1024))
+
+# document id → (resolved path, sha256 – empty on legacy rows)
+_paths: TTLCache[Tuple[str, Optional[str]]] = TTLCache(
+    maxsize=int(os.getenv("FILE_PATH_CACHE_SIZE", 4096)),
+    ttl=float(os.getenv("FILE_PATH_CACHE_TTL", 3600)),
+)
+
+
+class FileMissing(Exception):
+    """Document row or its file is gone."""
+
+
+@dataclass
+class ServedFile:
+    path: str
+    size: int
+    mtime: float
+    etag: str
+    media_type: str
+    digest: str = ""  # document SHA-256
+
+
+def forget(document_id: int) -> None:
+    """Drop the cached location of *document_id* (deleted / moved)."""
+    _paths.pop(document_id)
+
+
+def _resolve_on_disk(path: str) -> str:
+    if os.path.exists(path):
+        return path
+    # Historical records may still reference the inbox after the file was
+    # moved to the archive – derive the archive path by swapping the prefix.
+    inbox_prefix = os.getenv("WATCH_FOLDER", "/inbox")
+    archive_prefix = os.getenv("ARCHIVE_FOLDER", "/archive")
+    if path.startswith(inbox_prefix):
+        alt_path = archive_prefix + path[len(inbox_prefix):]
+        if os.path.exists(alt_path):
+            return alt_path
+    raise FileMissing("File not found on disk")
+
+
+def _stat_file(path: str) -> Optional[os.stat_result]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st if stat.S_ISREG(st.st_mode) else None
+
+
+async def lookup(db, document_id: int) -> ServedFile:
+    """Resolve *document_id* to its file.  Raises ``FileMissing`` (→ 404)."""
+    cached = _paths.get(document_id)
+    st = _stat_file(cached[0]) if cached else None
+    if st is None:
+        row = (await db.execute(
+            select(Document.file_path, Document.hash).where(Document.id == document_id)
+        )).first()
+        if row is None:
+            forget(document_id)
+            raise FileMissing("Document not found")
+        path = await anyio.to_thread.run_sync(_resolve_on_disk, row.file_path)
+        st = _stat_file(path)
+        if st is None:
+            raise FileMissing("File not found on disk")
+        cached = (path, row.hash)
+        _paths.set(document_id, cached)
+
+    path, digest = cached
+    etag = f'"{digest}"' if digest else f'W/"{int(st.st_mtime)}-{st.st_size}"'
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    return ServedFile(
+        path=path, size=st.st_size, mtime=st.st_mtime, etag=etag, media_type=media_type, digest=digest or ""
+    )
+
+
+# ---------------------------------------------------------------------------
+# Conditional / range handling
+# ---------------------------------------------------------------------------
+
+def _opaque(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison as required for ``If-None-Match``."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(_opaque(t.strip()) == _opaque(etag) for t in if_none_match.split(","))
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """``(start, end)`` (inclusive) for a single byte range, ``None`` to send everything.
+
+    Raises ``ValueError`` when the range cannot be satisfied (→ 416).
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec:
+        return None
+    first, sep, last = spec.partition("-")
+    if not sep:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            suffix = int(last)
+            if suffix <= 0:
+                raise ValueError("empty suffix range")
+            start, end = max(size - suffix, 0), size - 1
+    except ValueError:
+        if first.isdigit() or last.isdigit():
+            raise
+        return None
+    if start > end or start >= size:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+
+class FileRangeResponse(Response):
+    """Stream *file* (or the ``[start, end]`` slice of it) in chunks."""
+
+    def __init__(self, file: ServedFile, *, start: int = 0, end: Optional[int] = None,
+                 status_code: int = 200, headers: Optional[Mapping[str, str]] = None):
+        super().__init__(status_code=status_code, headers=headers, media_type=file.media_type)
+        self.path = file.path
+        self.start = start
+        self.end = file.size - 1 if end is None else end
+        self.headers["content-length"] = str(self.end - self.start + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        remaining = self.end - self.start + 1
+        async with await anyio.open_file(self.path, mode="rb") as fh:
+            await fh.seek(self.start)
+            while remaining > 0:
+                chunk = await fh.read(min(_CHUNK, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def file_response(file: ServedFile, request_headers: Mapping[str, str]) -> Response:
+    """``200`` / ``206`` / ``304`` / ``416`` for *file* given the request headers."""
+    name = os.path.basename(file.path)
+    headers = {
+        "ETag": file.etag,
+        "Last-Modified": formatdate(file.mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=0, must-revalidate",
+    }
+    if etag_matches(request_headers.get("if-none-match"), file.etag):
+        return Response(status_code=304, headers=headers)
+
+    headers["Content-Disposition"] = f"inline; filename*=utf-8''{quote(name)}"
+    range_header = request_headers.get("range")
+    if_range = request_headers.get("if-range")
+    if if_range and (if_range.startswith("W/") or _opaque(if_range.strip()) != file.etag):
+        range_header = None  # validator changed (or weak) → whole representation
+
+    try:
+        byte_range = parse_range(range_header, file.size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{file.size}"})
+    if byte_range is None:
+        return FileRangeResponse(file, headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{file.size}"
+    return FileRangeResponse(file, start=start, end=end, status_code=206, headers=headers)
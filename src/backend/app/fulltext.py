@@ -0,0 +1,237 @@
+"""app.fulltext
+=============
+Inverted full-text index over ``documents.title`` / ``sender`` / ``content``.
+
+• Postgres – generated ``search_vector tsvector`` column (title weighted A,
+  sender B, OCR text C) with a GIN index; ranked by ``ts_rank_cd``.
+• SQLite   – FTS5 external-content table ``documents_fts`` kept in sync by
+  triggers; ranked by ``bm25()`` with the same column weighting.
+
+``ensure_index()`` runs once at startup and records which backend is
+available.  Without one (e.g. SQLite built without FTS5) callers fall back to
+``ILIKE`` so search keeps working, just slower.
+
+With ``prefix=True`` the last query term is matched as a prefix so that
+search-as-you-type behaves like the old substring filter.  ``match_clause``
+(an unranked filter) does this by default; ranked ``search_ids`` only on
+request because expanding a short prefix multiplies the postings that must be
+scored.  ``search_ids`` takes extra ``Document`` filter conditions so that
+they apply before its ``LIMIT``.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import cast, column, func, literal, literal_column, or_, select, table, text
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.models import Document
+
+logger = logging.getLogger(__name__)
+
+# Text search configuration – "simple" is language-agnostic (mixed DE/EN/FR mail).
+# It is spliced into the generated-column DDL (no bind parameters there), so
+# only plain configuration names are accepted; queries bind it as regconfig.
+_TS_CONFIG_RE = re.compile(r"^[a-z_]+$")
+
+
+def _ts_config(name: str) -> str:
+    if _TS_CONFIG_RE.match(name):
+        return name
+    logger.warning("Ignoring invalid FULLTEXT_TS_CONFIG %r, using 'simple'", name)
+    return "simple"
+
+
+_TS_CONFIG = _ts_config(os.getenv("FULLTEXT_TS_CONFIG", "simple"))
+
+_backend: Optional[str] = None  # "postgres" | "fts5" | None
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def backend() -> Optional[str]:
+    """Return the active index backend, or None when falling back to ILIKE."""
+    return _backend
+
+
+# ---------------------------------------------------------------------------
+# DDL
+# ---------------------------------------------------------------------------
+
+_SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+        title, sender, content,
+        content='documents', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS documents_fts_ai AFTER INSERT ON documents BEGIN
+        INSERT INTO documents_fts(rowid, title, sender, content)
+        VALUES (new.id, new.title, new.sender, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS documents_fts_ad AFTER DELETE ON documents BEGIN
+        INSERT INTO documents_fts(documents_fts, rowid, title, sender, content)
+        VALUES ('delete', old.id, old.title, old.sender, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS documents_fts_au
+        AFTER UPDATE OF title, sender, content ON documents BEGIN
+        INSERT INTO documents_fts(documents_fts, rowid, title, sender, content)
+        VALUES ('delete', old.id, old.title, old.sender, old.content);
+        INSERT INTO documents_fts(rowid, title, sender, content)
+        VALUES (new.id, new.title, new.sender, new.content);
+    END""",
+]
+
+
+async def ensure_index(conn: AsyncConnection) -> Optional[str]:
+    """Create the full-text index for the connected database (idempotent)."""
+    global _backend
+
+    dialect = conn.engine.url.get_backend_name()
+    try:
+        if dialect.startswith("postgres"):
+            known = (await conn.execute(
+                text("SELECT 1 FROM pg_ts_config WHERE cfgname = :cfg"), {"cfg": _TS_CONFIG}
+            )).first()
+            if not known:
+                raise ValueError(f"unknown text search configuration {_TS_CONFIG!r}")
+            await conn.execute(text(
+                "ALTER TABLE documents ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                "GENERATED ALWAYS AS ("
+                f" setweight(to_tsvector('{_TS_CONFIG}', coalesce(title, '')), 'A') ||"
+                f" setweight(to_tsvector('{_TS_CONFIG}', coalesce(sender, '')), 'B') ||"
+                f" setweight(to_tsvector('{_TS_CONFIG}', coalesce(content, '')), 'C')"
+                ") STORED"
+            ))
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_documents_search_vector "
+                "ON documents USING GIN(search_vector)"
+            ))
+            _backend = "postgres"
+        elif dialect == "sqlite":
+            exists = (await conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='documents_fts'"
+            ))).first()
+            for stmt in _SQLITE_DDL:
+                await conn.execute(text(stmt))
+            if not exists:
+                # Index documents that were stored before the FTS table existed
+                await conn.execute(text("INSERT INTO documents_fts(documents_fts) VALUES ('rebuild')"))
+            _backend = "fts5"
+        else:
+            _backend = None
+    except Exception as exc:
+        logger.warning("Full-text index unavailable, falling back to ILIKE: %s", exc)
+        _backend = None
+    return _backend
+
+
+# ---------------------------------------------------------------------------
+# Query helpers
+# ---------------------------------------------------------------------------
+
+def _terms(query: str) -> List[str]:
+    return _TOKEN_RE.findall(query or "")
+
+
+def _fts5_query(query: str, prefix: bool = False) -> str:
+    """Quote every term (no FTS5 syntax injection); optionally prefix-match the last one."""
+    terms = _terms(query)
+    if not terms:
+        return ""
+    quoted = ['"' + t.replace('"', '""') + '"' for t in terms]
+    if prefix:
+        quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _pg_tsquery(query: str, prefix: bool = False) -> str:
+    """``to_tsquery`` input: AND of terms, optionally the last one as prefix."""
+    terms = [t.replace("'", "") for t in _terms(query)]
+    if not terms:
+        return ""
+    if prefix:
+        terms[-1] += ":*"
+    return " & ".join(terms)
+
+
+def match_clause(query: str, prefix: bool = True):
+    """SQL filter selecting documents that match *query* – usable in any select()."""
+    if _backend == "postgres" and _pg_tsquery(query):
+        return text(
+            "documents.search_vector @@ to_tsquery(CAST(:fts_cfg AS regconfig), :fts_q)"
+        ).bindparams(fts_cfg=_TS_CONFIG, fts_q=_pg_tsquery(query, prefix=prefix))
+    if _backend == "fts5" and _fts5_query(query):
+        return Document.id.in_(
+            text("SELECT rowid FROM documents_fts WHERE documents_fts MATCH :fts_q")
+            .bindparams(fts_q=_fts5_query(query, prefix=prefix))
+            .columns(column("rowid"))
+        )
+    return or_(
+        Document.title.ilike(f"%{query}%"),
+        Document.content.ilike(f"%{query}%"),
+        Document.sender.ilike(f"%{query}%"),
+    )
+
+
+async def search_ids(
+    db: AsyncSession, query: str, limit: int = 200, prefix: bool = False, conditions: Sequence = ()
+) -> List[Tuple[int, float]]:
+    """Return ``(document_id, score)`` best first – higher score = better match.
+
+    *conditions* (filters on ``Document`` columns) are applied in the same
+    query, before the ``LIMIT``, so selective filters still get *limit* hits.
+    """
+    if _backend == "postgres":
+        tsq = _pg_tsquery(query, prefix)
+        if not tsq:
+            return []
+        q = func.to_tsquery(cast(literal(_TS_CONFIG), REGCONFIG), tsq)
+        vector = literal_column("documents.search_vector")
+        score = func.ts_rank_cd(vector, q).label("score")
+        rows = await db.execute(
+            select(Document.id, score)
+            .where(vector.op("@@")(q), *conditions)
+            .order_by(score.desc())
+            .limit(limit)
+        )
+        return [(int(r[0]), float(r[1])) for r in rows]
+
+    if _backend == "fts5":
+        ftsq = _fts5_query(query, prefix)
+        if not ftsq:
+            return []
+        # bm25() is "lower is better"; weights mirror the Postgres A/B/C ranks
+        bm25 = literal_column("bm25(documents_fts, 10.0, 5.0, 1.0)")
+        fts = table("documents_fts", column("rowid"))
+        rows = await db.execute(
+            select(Document.id, (-bm25).label("score"))
+            .select_from(fts.join(Document.__table__, Document.id == fts.c.rowid))
+            .where(text("documents_fts MATCH :q").bindparams(q=ftsq), *conditions)
+            .order_by(bm25)
+            .limit(limit)
+        )
+        return [(int(r[0]), float(r[1])) for r in rows]
+
+    if not query.strip():
+        return []
+    rows = await db.execute(
+        select(Document.id).where(match_clause(query), *conditions).order_by(Document.id.desc()).limit(limit)
+    )
+    return [(int(doc_id), 1.0) for doc_id in rows.scalars()]
+
+
+def rrf_fuse(rankings: Sequence[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """Reciprocal-rank fusion of several ranked id lists → ``(id, score)`` best first.
+
+    ``score = Σ 1 / (k + rank)`` – robust to the incomparable score scales of
+    BM25 and cosine similarity.
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))
@@ -0,0 +1,361 @@
+"""app.fx
+======
+Currency normalisation for analytics.
+
+``fx_rates`` holds daily rates quoted per 1 EUR, loaded from local CSV
+dumps (:func:`load_csv`) – the ECB ``eurofxref.csv`` / ``eurofxref-hist.csv``
+files as downloaded, or a long ``date,currency,rate`` table.  Nothing is
+fetched over the network.
+
+Every document carries ``amount_base``: its ``amount`` converted to the
+base currency (``DEFAULT_CURRENCY``) at the rate of its document date (the
+latest rate on or before it, else the earliest known).  A ``before_flush``
+listener fills it on each ORM write; :func:`reconvert` recomputes it in SQL,
+in id-range batches, after new rates are loaded or the base currency
+changes – in the background through :func:`schedule_reconvert`, which keeps
+one run at a time.  Analytics aggregate :func:`base_amount` inside the
+database.  Amounts in a currency without a known rate have no
+``amount_base``: they are left out of base-currency totals and reported
+next to them, per currency, through :func:`unconverted_totals`.
+"""
+from __future__ import annotations
+
+import asyncio
+import csv
+import io
+import logging
+import os
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, case, event, func, inspect as sa_inspect, literal, select, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.dates import parse_date
+from app.models import Document, FxRate
+
+logger = logging.getLogger(__name__)
+
+_BATCH = int(os.getenv("FX_RECONVERT_BATCH_SIZE", 5000))
+_REFERENCE = "EUR"  # ECB quotes every rate against the euro
+
+_reconvert_task: Optional[asyncio.Task] = None
+
+
+def base_currency() -> str:
+    return normalise_currency(settings.DEFAULT_CURRENCY) or _REFERENCE
+
+
+def normalise_currency(value: Optional[str]) -> Optional[str]:
+    """Upper-case, trimmed currency code – the same normalisation the SQL uses."""
+    code = str(value or "").strip().upper()
+    return code or None
+
+
+def base_amount(model=Document):
+    """SQL expression: amount in base currency – NULL (left out of sums) when unconvertible."""
+    return model.amount_base
+
+
+def base_tax(model=Document):
+    """SQL expression: ``tax_amount`` scaled by the document's conversion ratio.
+
+    NULL for documents whose amount could not be converted, like :func:`base_amount`.
+    """
+    converted = and_(model.amount_base.isnot(None), model.amount.isnot(None), model.amount != 0)
+    return case(
+        (converted, model.tax_amount * model.amount_base / model.amount),
+        (model.amount_base.isnot(None), model.tax_amount),
+    )
+
+
+def unconverted(model=Document):
+    """SQL condition: an amount with no rate for its currency (no ``amount_base``)."""
+    return and_(model.amount.isnot(None), model.amount_base.is_(None))
+
+
+def unconverted_by_currency(rows: Iterable[Tuple[Optional[str], int, float]]) -> List[Dict[str, Any]]:
+    """``(currency, count, raw sum)`` rows → one entry per normalised currency."""
+    merged: Dict[str, List[float]] = {}
+    for currency, count, amount in rows:
+        if count:
+            entry = merged.setdefault(normalise_currency(currency) or "", [0, 0.0])
+            entry[0] += count
+            entry[1] += amount or 0.0
+    return [
+        {"currency": currency, "count": int(count), "amount": round(amount, 2)}
+        for currency, (count, amount) in sorted(merged.items())
+    ]
+
+
+async def unconverted_totals(db, *conditions) -> List[Dict[str, Any]]:
+    """Amounts of the documents matching *conditions* that base totals leave
+    out, in their own currency – ``[{"currency", "count", "amount"}]``."""
+    rows = await db.execute(
+        select(Document.currency, func.count(Document.id), func.sum(Document.amount))
+        .where(unconverted(), *conditions)
+        .group_by(Document.currency)
+    )
+    return unconverted_by_currency(rows.all())
+
+
+# ---------------------------------------------------------------------------
+# Conversion (one SQL expression, used per row and in bulk)
+# ---------------------------------------------------------------------------
+
+def _rate(currency, day):
+    """Rate of *currency* at *day*: latest on or before, else the earliest known."""
+    on_or_before = (
+        select(FxRate.rate)
+        .where(FxRate.currency == currency, FxRate.rate_date <= day)
+        .order_by(FxRate.rate_date.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    earliest = (
+        select(FxRate.rate)
+        .where(FxRate.currency == currency)
+        .order_by(FxRate.rate_date)
+        .limit(1)
+        .scalar_subquery()
+    )
+    return case((currency == _REFERENCE, 1.0), else_=func.coalesce(on_or_before, earliest))
+
+
+def _converted(amount, currency, day, base: str):
+    """``amount`` in *currency* → *base* at *day* (NULL when a rate is missing)."""
+    target = literal(1.0) if base == _REFERENCE else _rate(literal(base), day)
+    return case(
+        (currency.is_(None), amount),
+        (currency == base, amount),
+        else_=amount * target / _rate(currency, day),
+    )
+
+
+def _document_day(model=Document):
+    return func.coalesce(model.document_on, func.date(model.created_at))
+
+
+def _day_of(doc: Document) -> date:
+    return doc.document_on or (doc.created_at or datetime.utcnow()).date()
+
+
+@event.listens_for(Session, "before_flush")
+def _convert_amounts(session: Session, flush_context, instances) -> None:
+    docs = [
+        obj for obj in (*session.new, *session.dirty)
+        if isinstance(obj, Document)
+        and (
+            obj in session.new
+            or any(sa_inspect(obj).attrs[name].history.has_changes() for name in ("amount", "currency", "document_on"))
+        )
+    ]
+    if not docs:
+        return
+    base = base_currency()
+    ratios: Dict[Tuple[str, date], Optional[float]] = {}
+    with session.no_autoflush:
+        for doc in docs:
+            currency = normalise_currency(doc.currency)
+            if doc.amount is None:
+                doc.amount_base = None
+                continue
+            if currency is None or currency == base:
+                doc.amount_base = doc.amount
+                continue
+            key = (currency, _day_of(doc))
+            if key not in ratios:
+                ratios[key] = session.execute(
+                    select(_converted(literal(1.0), literal(currency), literal(key[1]), base))
+                ).scalar()
+            ratio = ratios[key]
+            doc.amount_base = doc.amount * ratio if ratio is not None else None
+
+
+# ---------------------------------------------------------------------------
+# Bulk reconversion
+# ---------------------------------------------------------------------------
+
+def _reconvert_statement(table, lo: int, hi: int, base: str,
+                         currencies: Optional[Sequence[str]], only_missing: bool):
+    currency = func.upper(func.trim(table.c.currency))
+    conditions = [table.c.id > lo, table.c.id <= hi]
+    if currencies is not None:
+        conditions.append(currency.in_(list(currencies)))
+    if only_missing:
+        conditions.extend([table.c.amount.isnot(None), table.c.amount_base.is_(None)])
+    converted = _converted(table.c.amount, currency, _document_day(table.c), base)
+    # Only rows whose value moves – and those get a new updated_at (incremental exports)
+    conditions.append(table.c.amount_base.is_distinct_from(converted))
+    values = {"amount_base": converted}
+    if "updated_at" in table.c:  # Alembic's lightweight tables leave it out
+        values["updated_at"] = datetime.utcnow()
+    return update(table).where(*conditions).values(values)
+
+
+def _scope(currencies: Optional[Iterable[str]], base: str) -> Optional[List[str]]:
+    if currencies is None:
+        return None
+    codes = {normalise_currency(c) for c in currencies} - {None}
+    # New rates for the base (or reference) currency move every foreign amount
+    return None if codes & {base, _REFERENCE} else sorted(codes)
+
+
+def reconvert_sync(connection, table, batch_size: int = _BATCH,
+                   currencies: Optional[Iterable[str]] = None, only_missing: bool = False) -> int:
+    """Blocking variant for Alembic – commits are left to the migration context."""
+    base = base_currency()
+    scope = _scope(currencies, base)
+    last = connection.execute(select(func.max(table.c.id))).scalar() or 0
+    changed = 0
+    for lo in range(0, last, batch_size):
+        changed += connection.execute(
+            _reconvert_statement(table, lo, lo + batch_size, base, scope, only_missing)
+        ).rowcount or 0
+    return changed
+
+
+async def reconvert(session_factory, batch_size: int = _BATCH,
+                    currencies: Optional[Iterable[str]] = None, only_missing: bool = False) -> int:
+    """Recompute ``amount_base`` in SQL, one id range per transaction → rows updated.
+
+    *currencies* limits the work to documents in those currencies (all when
+    ``None``); *only_missing* to amounts that were never converted.
+    """
+    from app import rollups, vendors
+
+    base = base_currency()
+    scope = _scope(currencies, base)
+    if scope == []:
+        return 0
+    table = Document.__table__
+    async with session_factory() as db:
+        last = (await db.execute(select(func.max(table.c.id)))).scalar() or 0
+    changed = 0
+    for lo in range(0, last, batch_size):
+        async with session_factory() as db:
+            result = await db.execute(_reconvert_statement(table, lo, lo + batch_size, base, scope, only_missing))
+            await db.commit()
+        changed += result.rowcount or 0
+    if changed:
+        rollups.mark_stale()
+        vendors.invalidate()
+        logger.info("FX: re-converted %d document amount(s) to %s", changed, base)
+    return changed
+
+
+async def _run_reconvert(session_factory, previous: Optional[asyncio.Task], kwargs: Dict[str, Any]) -> int:
+    from app import rollups
+
+    if previous is not None and not previous.done():
+        if kwargs.get("currencies") is None and not kwargs.get("only_missing"):
+            previous.cancel()  # a full run covers whatever the previous one had left
+        await asyncio.wait([previous])
+    with rollups.held():
+        return await reconvert(session_factory, **kwargs)
+
+
+def _log_reconvert(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("FX re-conversion failed: %s", task.exception())
+
+
+def schedule_reconvert(session_factory, **kwargs) -> asyncio.Task:
+    """Run :func:`reconvert` in the background, after the previous run.
+
+    A full re-conversion cancels a run still in progress; scoped ones wait
+    for it.  Rollups serve live queries until the run is over.
+    """
+    global _reconvert_task
+    task = asyncio.create_task(_run_reconvert(session_factory, _reconvert_task, kwargs), name="fx_reconvert")
+    task.add_done_callback(_log_reconvert)
+    _reconvert_task = task
+    return task
+
+
+# ---------------------------------------------------------------------------
+# Loading rates
+# ---------------------------------------------------------------------------
+
+def _parse_day(value: str) -> Optional[date]:
+    value = value.strip()
+    parsed = parse_date(value)
+    if parsed is None:
+        try:  # eurofxref.csv: "17 June 2025"
+            parsed = datetime.strptime(value, "%d %B %Y").date()
+        except ValueError:
+            return None
+    return parsed
+
+
+def _parse_rate(value: str) -> Optional[float]:
+    try:
+        rate = float(value.strip())
+    except (TypeError, ValueError):  # "N/A", blanks
+        return None
+    return rate if rate > 0 else None
+
+
+def parse_csv(text: str) -> List[Tuple[str, date, float]]:
+    """``[(currency, date, rate)]`` from an ECB wide dump or a long ``date,currency,rate`` CSV."""
+    reader = csv.reader(io.StringIO(text.lstrip("\ufeff")))
+    header = [h.strip() for h in next(reader, [])]
+    lower = [h.lower() for h in header]
+    out: List[Tuple[str, date, float]] = []
+
+    if {"date", "currency", "rate"} <= set(lower):
+        i_date, i_cur, i_rate = lower.index("date"), lower.index("currency"), lower.index("rate")
+        for row in reader:
+            if len(row) <= max(i_date, i_cur, i_rate):
+                continue
+            day, rate = _parse_day(row[i_date]), _parse_rate(row[i_rate])
+            currency = normalise_currency(row[i_cur])
+            if day and rate and currency:
+                out.append((currency, day, rate))
+        return out
+
+    if not lower or lower[0] != "date":
+        raise ValueError("Unrecognised FX CSV: expected an ECB dump or date,currency,rate columns")
+    currencies = [normalise_currency(h) for h in header[1:]]
+    for row in reader:
+        if not row:
+            continue
+        day = _parse_day(row[0])
+        if day is None:
+            continue
+        for currency, value in zip(currencies, row[1:]):
+            rate = _parse_rate(value)
+            if currency and rate:
+                out.append((currency, day, rate))
+    return out
+
+
+def _upsert(dialect: str):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(FxRate)
+    return stmt.on_conflict_do_update(
+        index_elements=["currency", "rate_date"],
+        set_={"rate": stmt.excluded.rate},
+    )
+
+
+async def load_csv(session_factory, text: str, batch_size: int = _BATCH) -> Dict[str, Any]:
+    """Upsert the rates in *text* → ``{"rates": n, "currencies": [...]}``."""
+    rows = parse_csv(text)
+    for start in range(0, len(rows), batch_size):
+        chunk = rows[start:start + batch_size]
+        async with session_factory() as db:
+            conn = await db.connection()
+            await db.execute(
+                _upsert(conn.dialect.name),
+                [{"currency": c, "rate_date": d, "rate": r} for c, d, r in chunk],
+            )
+            await db.commit()
+    currencies = sorted({c for c, _, _ in rows})
+    if rows:
+        logger.info("FX: loaded %d rate(s) for %s", len(rows), ", ".join(currencies))
+    return {"rates": len(rows), "currencies": currencies}
@@ -0,0 +1,211 @@
+"""app.ingestion
+=============
+Getting files into the inbox exactly once.
+
+• ``save_upload`` streams an ``UploadFile`` to disk in chunks off the event
+  loop, hashing (SHA-256) and size-checking as it goes.  Data lands in a
+  hidden ``.part`` file that the watcher ignores and is atomically renamed
+  into place only once complete.
+• A small in-process *claim* registry records paths (and hashes) currently
+  being ingested.  The upload claims its final path before the rename, so
+  the folder watcher – which goes through ``ingest_path`` – skips the file
+  instead of processing it a second time.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import select
+
+from app.config import settings
+from app.models import Document
+
+logger = logging.getLogger(__name__)
+
+_CHUNK = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+
+# Same set the folder watcher picks up
+DOCUMENT_EXTENSIONS = frozenset({".pdf", ".docx", ".doc", ".jpg", ".jpeg", ".png", ".tiff", ".tif"})
+
+# realpath → sha256 (or "" when not known yet)
+_claims: Dict[str, str] = {}
+
+
+class UploadRejected(Exception):
+    """Upload refused – carries the HTTP status the API should answer with."""
+
+    def __init__(self, status_code: int, detail: str, document_id: Optional[int] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.document_id = document_id
+
+
+@dataclass
+class StoredUpload:
+    path: str
+    sha256: str
+    size: int
+
+
+# ---------------------------------------------------------------------------
+# Claims
+# ---------------------------------------------------------------------------
+
+def _key(path: str) -> str:
+    return os.path.realpath(path)
+
+
+def claim(path: str, sha256: str = "") -> bool:
+    """Mark *path* as being ingested → False if someone already has it."""
+    key = _key(path)
+    if key in _claims:
+        return False
+    _claims[key] = sha256
+    return True
+
+
+def release(path: str) -> None:
+    _claims.pop(_key(path), None)
+
+
+def is_claimed(path: str) -> bool:
+    return _key(path) in _claims
+
+
+async def ingest_path(path: str, process: Callable[[str], Awaitable[None]]) -> None:
+    """Run *process* for a watcher-detected file unless it is already claimed.
+
+    Watchdog fires created+modified for one write and the polling fallback
+    may see the same file again – only the first caller gets through.
+    """
+    if not claim(path):
+        logger.debug("Skipping %s – already being ingested", path)
+        return
+    try:
+        await process(path)
+    finally:
+        release(path)
+
+
+async def process_claimed(path: str, process: Callable[..., Awaitable[None]], **kwargs) -> None:
+    """Run *process* for a path claimed by ``save_upload`` and release it."""
+    try:
+        await process(path, **kwargs)
+    finally:
+        release(path)
+
+
+# ---------------------------------------------------------------------------
+# Hashing / duplicates
+# ---------------------------------------------------------------------------
+
+def _sha256_sync(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+async def sha256_file(path: str) -> str:
+    """SHA-256 of *path*, read in chunks in a worker thread."""
+    return await asyncio.to_thread(_sha256_sync, path)
+
+
+async def find_duplicate(db, sha256: str) -> Optional[int]:
+    """Id of the document already stored with *sha256*, if any."""
+    return (await db.execute(select(Document.id).where(Document.hash == sha256).limit(1))).scalar()
+
+
+# ---------------------------------------------------------------------------
+# Streaming upload
+# ---------------------------------------------------------------------------
+
+def _unique_path(folder: str, filename: str) -> str:
+    """``folder/filename`` or ``folder/name (n).ext`` if taken or claimed."""
+    stem, ext = os.path.splitext(filename)
+    candidate = os.path.join(folder, filename)
+    n = 1
+    while os.path.exists(candidate) or is_claimed(candidate):
+        candidate = os.path.join(folder, f"{stem} ({n}){ext}")
+        n += 1
+    return candidate
+
+
+def copy_stream(src, dst_path: str, max_size: int) -> Optional[StoredUpload]:
+    """Blocking chunked copy of file object *src* to *dst_path*, hashing as it goes.
+
+    Returns ``None`` (and removes *dst_path*) when *src* exceeds *max_size*.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    with open(dst_path, "wb") as fh:
+        while chunk := src.read(_CHUNK):
+            size += len(chunk)
+            if size > max_size:
+                break
+            _write_chunk(fh, hasher, chunk)
+    if size > max_size:
+        os.remove(dst_path)
+        return None
+    return StoredUpload(path=dst_path, sha256=hasher.hexdigest(), size=size)
+
+
+def _write_chunk(fh, hasher, chunk: bytes) -> None:
+    hasher.update(chunk)
+    fh.write(chunk)
+
+
+async def save_upload(upload, db, folder: Optional[str] = None, max_size: Optional[int] = None) -> StoredUpload:
+    """Stream *upload* into *folder* and claim the resulting path.
+
+    Raises ``UploadRejected`` (413 too large, 409 duplicate, 400 bad name).
+    On success the caller owns the claim and must hand the path to
+    ``process_claimed`` (or ``release`` it).
+    """
+    folder = folder or settings.WATCH_FOLDER
+    max_size = max_size or settings.MAX_UPLOAD_SIZE
+    filename = os.path.basename((upload.filename or "").replace("\\", "/")).strip()
+    if not filename or filename.startswith("."):
+        raise UploadRejected(400, "Invalid file name")
+
+    os.makedirs(folder, exist_ok=True)
+    part = os.path.join(folder, f".upload-{uuid.uuid4().hex}.part")
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        fh = await asyncio.to_thread(open, part, "wb")
+        try:
+            while chunk := await upload.read(_CHUNK):
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadRejected(413, f"File exceeds the {max_size // (1024 * 1024)} MB upload limit")
+                await asyncio.to_thread(_write_chunk, fh, hasher, chunk)
+        finally:
+            await asyncio.to_thread(fh.close)
+
+        digest = hasher.hexdigest()
+        existing = await find_duplicate(db, digest)
+        if existing is None and digest in _claims.values():
+            raise UploadRejected(409, "The same file is already being ingested")
+        if existing is not None:
+            raise UploadRejected(409, "Document already exists", document_id=existing)
+
+        target = _unique_path(folder, filename)
+        claim(target, digest)
+        try:
+            await asyncio.to_thread(os.replace, part, target)
+        except BaseException:
+            release(target)
+            raise
+        return StoredUpload(path=target, sha256=digest, size=size)
+    finally:
+        if os.path.exists(part):
+            await asyncio.to_thread(os.remove, part)
@@ -0,0 +1,354 @@
+"""app.local_vector_index
+=======================
+In-process vector index used for semantic search when the database has no
+vector support (the SQLite deployment path – Postgres uses pgvector).
+
+Storage lives next to ``documents.db`` (``documents.vectors/``):
+
+• ``vectors.f32`` – row-major float32 matrix, memory-mapped and grown by
+  doubling; rows are L2-normalised so cosine similarity is a dot product.
+• ``ids.i64``     – document id per row; ``-1`` marks a deleted row
+  (tombstone).  Rows are reused on update and compacted once tombstones make
+  up a quarter of the file.
+• ``meta.json``   – dimension and row count.
+• ``hnsw.bin``    – optional HNSW graph when ``hnswlib`` is installed and the
+  index holds at least ``LOCAL_VECTOR_HNSW_MIN`` vectors.  Below that (or
+  without hnswlib) search is an exact NumPy scan, which is plenty fast for
+  small installs.
+
+All methods are blocking and guarded by a lock – call them from async code via
+``asyncio.to_thread``.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import settings
+
+try:  # Optional ANN backend – exact search is used without it
+    import hnswlib  # type: ignore
+except ImportError:  # pragma: no cover – depends on environment
+    hnswlib = None
+
+logger = logging.getLogger(__name__)
+
+_HNSW_MIN = int(os.getenv("LOCAL_VECTOR_HNSW_MIN", 20000))
+_HNSW_M = int(os.getenv("LOCAL_VECTOR_HNSW_M", 16))
+_HNSW_EF_CONSTRUCTION = int(os.getenv("LOCAL_VECTOR_HNSW_EF_CONSTRUCTION", 200))
+_HNSW_EF_SEARCH = int(os.getenv("LOCAL_VECTOR_HNSW_EF", 64))
+_INITIAL_CAPACITY = 1024
+
+
+def default_path() -> str:
+    """Directory holding the index – ``documents.vectors`` beside the SQLite file."""
+    return os.getenv(
+        "LOCAL_VECTOR_INDEX_PATH",
+        os.path.splitext(settings.DATABASE_PATH)[0] + ".vectors",
+    )
+
+
+class LocalVectorIndex:
+    """Cosine-similarity index over one vector per document id."""
+
+    def __init__(self, path: str, dim: int = 1536):
+        self.path = path
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._count = 0  # rows in use (live + tombstones)
+        self._capacity = 0
+        self._rows: Dict[int, int] = {}  # doc_id -> row
+        self._vectors: Optional[np.memmap] = None
+        self._ids: Optional[np.memmap] = None
+        self._hnsw = None
+        self._graph_live: Optional[int] = None  # live count when hnsw.bin was saved
+        self._dirty = False
+
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self) -> None:
+        meta_path = self._file("meta.json")
+        saved_live = None
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as fh:
+                meta = json.load(fh)
+            self.dim = int(meta["dim"])
+            self._count = int(meta["count"])
+            saved_live = self._graph_live = meta.get("hnsw_live")
+        capacity = max(_INITIAL_CAPACITY, self._count)
+        if os.path.exists(self._file("ids.i64")):
+            capacity = max(capacity, os.path.getsize(self._file("ids.i64")) // 8)
+        self._map(capacity)
+
+        ids = np.asarray(self._ids[: self._count])
+        live = np.nonzero(ids >= 0)[0]
+        self._rows = {int(ids[r]): int(r) for r in live}
+
+        if hnswlib is not None and len(self._rows) >= _HNSW_MIN:
+            self._load_or_build_hnsw(saved_live)
+
+    def _map(self, capacity: int) -> None:
+        """(Re)map both files with room for *capacity* rows, growing them if needed."""
+        for name, row_bytes in (("vectors.f32", self.dim * 4), ("ids.i64", 8)):
+            fname = self._file(name)
+            size = capacity * row_bytes
+            with open(fname, "ab") as fh:
+                if fh.tell() < size:
+                    fh.truncate(size)
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._ids.flush()
+        self._vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._ids = np.memmap(self._file("ids.i64"), dtype=np.int64, mode="r+", shape=(capacity,))
+        if capacity > self._capacity:
+            self._ids[self._capacity if self._capacity else self._count :] = -1
+        self._capacity = capacity
+
+    def flush(self, graph: bool = True) -> None:
+        """Persist memory-mapped pages and metadata (+ the HNSW graph if *graph*).
+
+        Saving the graph rewrites the whole file, so ingestion flushes with
+        ``graph=False``; a stale graph is detected and rebuilt on next open.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            self._vectors.flush()
+            self._ids.flush()
+            if graph:
+                if self._hnsw is not None:
+                    self._hnsw.save_index(self._file("hnsw.bin"))
+                self._graph_live = len(self._rows) if self._hnsw is not None else None
+            else:
+                self._graph_live = None  # hnsw.bin is now stale – rebuild if reopened
+            tmp = self._file("meta.json.tmp")
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump({
+                    "dim": self.dim,
+                    "count": self._count,
+                    "hnsw_live": self._graph_live,
+                }, fh)
+            os.replace(tmp, self._file("meta.json"))
+            self._dirty = not graph and self._hnsw is not None
+
+    # ------------------------------------------------------------------
+    # HNSW helpers
+    # ------------------------------------------------------------------
+
+    def _load_or_build_hnsw(self, saved_live: Optional[int]) -> None:
+        path = self._file("hnsw.bin")
+        # The graph is saved together with meta.json – reuse it only if both agree
+        if os.path.exists(path) and saved_live is not None and saved_live == len(self._rows):
+            try:
+                index = hnswlib.Index(space="ip", dim=self.dim)
+                index.load_index(path, max_elements=self._capacity, allow_replace_deleted=True)
+                index.set_ef(_HNSW_EF_SEARCH)
+                self._hnsw = index
+                return
+            except Exception as exc:  # pragma: no cover – corrupt file
+                logger.warning("Rebuilding local HNSW index: %s", exc)
+        self._build_hnsw()
+
+    def _build_hnsw(self) -> None:
+        index = hnswlib.Index(space="ip", dim=self.dim)
+        index.init_index(
+            max_elements=max(self._capacity, 1),
+            M=_HNSW_M,
+            ef_construction=_HNSW_EF_CONSTRUCTION,
+            allow_replace_deleted=True,
+        )
+        if self._rows:
+            rows = np.fromiter(self._rows.values(), dtype=np.int64)
+            index.add_items(np.asarray(self._vectors[rows]), np.asarray(self._ids[rows]))
+        index.set_ef(_HNSW_EF_SEARCH)
+        self._hnsw = index
+        self._dirty = True
+
+    # ------------------------------------------------------------------
+    # Mutations
+    # ------------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _normalise(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def add(self, doc_id: int, vector: Sequence[float]) -> None:
+        """Insert or replace the vector of *doc_id*."""
+        self.add_many([doc_id], [vector])
+
+    def add_many(self, doc_ids: Sequence[int], vectors) -> None:
+        """Insert or replace several vectors at once (used by backfills)."""
+        if len(doc_ids) == 0:
+            return
+        mat = self._normalise(vectors)
+        with self._lock:
+            new = [d for d in dict.fromkeys(int(d) for d in doc_ids) if d not in self._rows]
+            if self._count + len(new) > self._capacity:
+                capacity = self._capacity
+                while capacity < self._count + len(new):
+                    capacity *= 2
+                self._map(capacity)
+                if self._hnsw is not None:
+                    self._hnsw.resize_index(capacity)
+            for doc_id in new:
+                self._rows[doc_id] = self._count
+                self._ids[self._count] = doc_id
+                self._count += 1
+
+            rows = np.array([self._rows[int(d)] for d in doc_ids], dtype=np.int64)
+            self._vectors[rows] = mat
+
+            if self._hnsw is not None:
+                self._hnsw.add_items(mat, np.asarray(doc_ids, dtype=np.int64), replace_deleted=True)
+            elif hnswlib is not None and len(self._rows) >= _HNSW_MIN:
+                self._build_hnsw()
+            self._dirty = True
+
+    def delete(self, doc_id: int) -> bool:
+        """Tombstone *doc_id* – returns False if it was not indexed."""
+        with self._lock:
+            row = self._rows.pop(int(doc_id), None)
+            if row is None:
+                return False
+            self._ids[row] = -1
+            if self._hnsw is not None:
+                try:
+                    self._hnsw.mark_deleted(int(doc_id))
+                except RuntimeError:
+                    pass
+            self._dirty = True
+            if self._count - len(self._rows) > max(_INITIAL_CAPACITY, self._count // 4):
+                self.compact()
+            return True
+
+    def compact(self) -> None:
+        """Rewrite the matrix without tombstoned rows."""
+        with self._lock:
+            live = np.fromiter(sorted(self._rows.values()), dtype=np.int64)
+            vectors = np.array(self._vectors[live])
+            ids = np.array(self._ids[live])
+            self._vectors[: len(live)] = vectors
+            self._ids[: len(live)] = ids
+            self._ids[len(live) : self._count] = -1
+            self._count = len(live)
+            self._rows = {int(d): r for r, d in enumerate(ids)}
+            if self._hnsw is not None:
+                self._build_hnsw()
+            self._dirty = True
+
+    # ------------------------------------------------------------------
+    # Query
+    # ------------------------------------------------------------------
+
+    def search(self, vector: Sequence[float], k: int = 10) -> List[Tuple[int, float]]:
+        """Return up to *k* ``(doc_id, cosine_similarity)`` pairs, best first."""
+        query = self._normalise(vector)
+        with self._lock:
+            live = len(self._rows)
+            if live == 0:
+                return []
+            k = min(k, live)
+            if self._hnsw is not None:
+                self._hnsw.set_ef(max(_HNSW_EF_SEARCH, k))
+                labels, distances = self._hnsw.knn_query(query, k=k)
+                # hnswlib "ip" space returns 1 - <a, b>
+                return [(int(l), float(1.0 - d)) for l, d in zip(labels[0], distances[0])]
+
+            scores = np.asarray(self._vectors[: self._count]) @ query[0]
+            scores[np.asarray(self._ids[: self._count]) < 0] = -np.inf
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(int(self._ids[r]), float(scores[r])) for r in top]
+
+
+# ---------------------------------------------------------------------------
+# Process-wide instance
+# ---------------------------------------------------------------------------
+
+_index: Optional[LocalVectorIndex] = None
+_index_lock = threading.Lock()
+
+
+def is_active() -> bool:
+    """True when the configured database lacks pgvector (i.e. this index is used)."""
+    from app.database import engine
+
+    return not engine.url.get_backend_name().startswith("postgres")
+
+
+def get_index() -> LocalVectorIndex:
+    """Return (and lazily open) the index stored beside the SQLite database."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = LocalVectorIndex(default_path())
+    return _index
+
+
+def parse_embedding(value) -> Optional[np.ndarray]:
+    """Decode an ``embedding`` column value (list, pgvector text or JSON) → ndarray."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if not value:
+            return None
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return None
+    arr = np.asarray(value, dtype=np.float32)
+    return arr if arr.ndim == 1 and arr.size else None
+
+
+async def rebuild_from_db(batch_size: int = 2000) -> int:
+    """Index every stored ``documents.embedding`` – used when the index is missing."""
+    import asyncio
+
+    from sqlalchemy import select
+
+    from app.database import async_session
+    from app.models import Document
+
+    index = get_index()
+    added = 0
+    last_id = 0
+    async with async_session() as session:
+        while True:
+            rows = (await session.execute(
+                select(Document.id, Document.embedding)
+                .where(Document.embedding.isnot(None), Document.id > last_id)
+                .order_by(Document.id)
+                .limit(batch_size)
+            )).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            parsed = [(doc_id, parse_embedding(emb)) for doc_id, emb in rows]
+            parsed = [(d, v) for d, v in parsed if v is not None and v.size == index.dim]
+            if parsed:
+                ids, vecs = zip(*parsed)
+                await asyncio.to_thread(index.add_many, list(ids), np.stack(vecs))
+                added += len(ids)
+    await asyncio.to_thread(index.flush)
+    logger.info("Local vector index rebuilt with %d documents", added)
+    return added
@@ -1,14 +1,14 @@
 """
 Main application module for the Document Management System.
 """
-from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form, BackgroundTasks, Query, Request
+from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form, BackgroundTasks, Query, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse, FileResponse, Response
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional, Union
 from app.database import get_db, engine
-from app.models import Base, Document, Tag, User, document_tag as dt, AddressEntry, VectorEntry, Entity
+from app.models import Base, Document, Tag, User, document_tag as dt, AddressEntry, VectorEntry, Entity, UserEntity
 from app.repository import DocumentRepository, UserRepository, LLMConfigRepository, TenantRepository, ProcessingRuleRepository
 from app.watcher import FolderWatcher
 from app.ocr import OCRProcessor
@@ -17,23 +17,37 @@ from app.auth import get_current_user, create_access_token, authenticate_user, g
 from app.config import settings
 from app.notifications import NotificationService
 from app.analytics import AnalyticsService
-from app.calendar_export import CalendarExportService
+from app.calendar_export import CalendarExportService, FeedFilter
 from app.search import SearchService
-from app.colpali_embedder import ColPaliEmbedder
-from app.vector_store import upsert_page
+from app import vision
+from app import local_vector_index
+from app import fulltext
+from app import ingestion
+from app import bulk_import
+from app import file_serving
+from app import renditions
+from app import dates
+from app import rollups
+from app import vendors
+from app import fx
+from app import outbox
+from app import events
+from app import scheduler
+from app import export
+from app import calendar_export
+from app.responses import FastJSONResponse
 import os
 import asyncio
 import logging
 import re
-import hashlib
-from sqlalchemy import select, text, update, func, or_
+from sqlalchemy import select, text, update, func, or_, and_
 import secrets
 from functools import partial
 from difflib import SequenceMatcher
 from pdf2image import convert_from_path
 import json
 from PIL import Image
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from app.services.entity import EntityService
 from app.services.onboarding import OnboardingService
 from collections import defaultdict
@@ -51,6 +65,7 @@ app = FastAPI(
     title="Document Management System API",
     description="API for managing documents, OCR processing, and analytics",
     version="1.0.0",
+    default_response_class=FastJSONResponse,
 )
 
 # Configure CORS
@@ -264,6 +279,13 @@ async def startup():
             'original_file_name': 'VARCHAR(255)',
             'summary': 'TEXT',
             'confidence_score': 'FLOAT',
+            'import_batch_id': 'INTEGER',
+            'document_on': 'DATE',
+            'due_on': 'DATE',
+            'paid_on': 'DATE',
+            'vendor_id': 'INTEGER',
+            'amount_base': 'FLOAT',
+            'relations_computed_at': 'TIMESTAMP',
         }
 
         for col, sql_type in columns_to_add.items():
@@ -272,6 +294,34 @@ async def startup():
             except Exception:
                 await conn.execute(text(f"ALTER TABLE documents ADD COLUMN {col} {sql_type}"))
 
+        for col in ('document_on', 'due_on', 'vendor_id'):
+            await conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_documents_{col} ON documents({col})"))
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_documents_entity_due_on ON documents(entity_id, due_on)"
+        ))
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_notifications_document_type_read "
+            "ON notifications(document_id, type, is_read)"
+        ))
+
+        # ------------------------------------------------------------------
+        # Compact ColPali bookkeeping: patch_count replaces the JSON id list
+        # ------------------------------------------------------------------
+        try:
+            await conn.execute(text("SELECT patch_count FROM vectors LIMIT 1"))
+        except Exception:
+            await conn.execute(text("ALTER TABLE vectors ADD COLUMN patch_count INTEGER"))
+
+        if conn.engine.url.get_backend_name().startswith("postgres"):
+            await conn.execute(text("ALTER TABLE vectors ALTER COLUMN vector_ids DROP NOT NULL"))
+
+        # Rollup amounts without a known FX rate (reconciled at startup)
+        for col, sql_type in {'unconverted_count': 'INTEGER', 'unconverted_sum': 'FLOAT'}.items():
+            try:
+                await conn.execute(text(f"SELECT {col} FROM document_rollups LIMIT 1"))
+            except Exception:
+                await conn.execute(text(f"ALTER TABLE document_rollups ADD COLUMN {col} {sql_type} NOT NULL DEFAULT 0"))
+
         # ------------------------------------------------------------------
         # Ensure critical columns exist on users table (in case Alembic failed)
         # ------------------------------------------------------------------
@@ -412,17 +462,112 @@ async def startup():
         except Exception as exc:
             logger.warning("Settings table initialisation failed: %s", exc)
     
+    # Full-text index (tsvector/GIN on Postgres, FTS5 on SQLite) ---------------
+    async with engine.begin() as conn:
+        await fulltext.ensure_index(conn)
+
     # Start background services ------------------------------------------------
     global _watcher_task
     _watcher_task = asyncio.create_task(start_folder_watcher(settings.WATCH_FOLDER))
 
-    # Daily invoice-due reminder scheduler
+    # Vision model warm-up (no-op when VISION_SEARCH_ENABLED / VISION_WARMUP are off)
+    vision.start_warmup()
+
+    # SQLite: (re)build the in-process semantic index if it is empty
+    if local_vector_index.is_active():
+        try:
+            if len(await asyncio.to_thread(local_vector_index.get_index)) == 0:
+                asyncio.create_task(local_vector_index.rebuild_from_db(), name="local_vector_rebuild")
+        except Exception as exc:
+            logger.warning("Local vector index unavailable: %s", exc)
+
+    # Periodic flush of buffered ColPali vectors (writes are batched across documents)
+    if vision.is_enabled():
+        try:
+            from app import vector_store
+            vector_store.start_flusher()
+        except Exception as exc:
+            logger.warning("Failed to start vector flusher: %s", exc)
+
+    # Bulk-import workers; pick up placeholders a restart left behind
+    from app.database import async_session
+    bulk_import.start_workers(process_new_document, async_session)
+    try:
+        async with async_session() as db:
+            resumed = await bulk_import.resume_pending(db)
+        if resumed:
+            logger.info("Resuming %d queued import(s)", resumed)
+    except Exception as exc:
+        logger.warning("Failed to resume queued imports: %s", exc)
+
+    # Shadow DATE columns – fill rows the migration did not cover (DDL fallback path),
+    # then base-currency amounts (FX_RATES_FILE is an optional local rate dump)
+    async def _backfill_dates():
+        backfilled = False
+        try:
+            if (await dates.backfill(async_session))["changed"]:
+                backfilled = True
+                rollups.mark_stale()
+        except Exception as exc:
+            logger.warning("Date backfill failed: %s", exc)
+        try:
+            rates_file = os.getenv("FX_RATES_FILE")
+            loaded = None
+            if rates_file and os.path.exists(rates_file):
+                with open(rates_file, encoding="utf-8") as fh:
+                    loaded = (await fx.load_csv(async_session, fh.read()))["currencies"]
+            if loaded or backfilled:
+                fx.schedule_reconvert(async_session, currencies=loaded or None)
+            else:
+                fx.schedule_reconvert(async_session, only_missing=True)
+        except Exception as exc:
+            logger.warning("FX rate loading failed: %s", exc)
+
+    asyncio.create_task(_backfill_dates(), name="date_backfill")
+
+    # Vendor dimension – link documents the migration did not cover (DDL fallback path)
+    async def _link_vendors():
+        try:
+            await vendors.link_documents(async_session)
+        except Exception as exc:
+            logger.warning("Vendor backfill failed: %s", exc)
+
+    asyncio.create_task(_link_vendors(), name="vendor_backfill")
+
+    # Dashboard rollups – first reconcile now, then when marked stale (periodic runs: scheduler)
+    rollups.start_reconciler(async_session)
+
+    # Notification outbox – external channels are delivered after commit
+    outbox.start_dispatcher(async_session)
+
+    # Cron-style maintenance jobs (reminders, overdue scan, rollups, vacuum …)
     try:
-        from app.scheduler import start_scheduler
-        start_scheduler()
+        scheduler.start_scheduler(async_session)
     except Exception as exc:
         logger.warning("Failed to start scheduler: %s", exc)
 
+
+@app.on_event("shutdown")
+async def shutdown():
+    await bulk_import.stop_workers()
+    rollups.stop_reconciler()
+    outbox.stop_dispatcher()
+    scheduler.stop_scheduler()
+
+    if local_vector_index.is_active():
+        try:
+            await asyncio.to_thread(local_vector_index.get_index().flush)
+        except Exception as exc:
+            logger.warning("Local vector index flush failed: %s", exc)
+
+    # Push vectors still sitting in the write buffer before the process exits
+    if vision.is_enabled():
+        try:
+            from app import vector_store
+            await vector_store.aclose()
+        except Exception as exc:
+            logger.warning("Vector store shutdown flush failed: %s", exc)
+
 # ---------------------------------------------------------------------------
 #  Folder-Watcher lifecycle helpers (hot-reload when inbox_path changes)
 # ---------------------------------------------------------------------------
@@ -433,7 +578,7 @@ _watcher_task: asyncio.Task | None = None  # Global ref so we can cancel/reload
 async def start_folder_watcher(path: str):
     """Run a FolderWatcher for *path* until cancelled."""
     # Use shorter polling interval for better responsiveness on Docker/macOS
-    folder_watcher = FolderWatcher(path, process_new_document, poll_interval=10)
+    folder_watcher = FolderWatcher(path, _process_watched_document, poll_interval=10)
     await folder_watcher.start_watching()
 
 
@@ -458,10 +603,26 @@ def reload_watcher(new_path: str):
     # Schedule on event-loop (fire-and-forget)
     asyncio.get_event_loop().create_task(_restart())
 
-async def process_new_document(file_path: str):
-    """Process a new document detected by the folder watcher."""
-    document_id = None
+async def _process_watched_document(file_path: str):
+    """Watcher callback – skips files an upload (or an earlier event) already claimed."""
+    await ingestion.ingest_path(file_path, process_new_document)
+
+
+async def process_new_document(file_path: str, file_hash: str | None = None, document_id: int | None = None):
+    """Process a new document detected by the folder watcher or uploaded.
+
+    *document_id* is a queued bulk-import placeholder to fill in instead of
+    inserting a new row.
+    """
     try:
+        # Hash first (chunked, off-loop) so duplicates skip OCR and the LLM
+        if file_hash is None:
+            file_hash = await ingestion.sha256_file(file_path)
+        async with AsyncSession(engine) as _check:
+            if await ingestion.find_duplicate(_check, file_hash) not in (None, document_id):
+                logger.info(f"Duplicate document ignored: {file_path}")
+                return
+
         # Extract text using OCR
         text = await ocr_processor.process_document(file_path)
         # Remove any NUL bytes that break Postgres UTF-8 encoder
@@ -476,13 +637,9 @@ async def process_new_document(file_path: str):
         from app.database import engine as _eng
         async with AsyncSession(_eng) as session:
             async with session.begin():
-                # Compute SHA256 hash to detect duplicates
-                with open(file_path, "rb") as f:
-                    file_hash = hashlib.sha256(f.read()).hexdigest()
-
-                # Skip if a document with same hash already exists
-                existing = await session.execute(select(Document).filter(Document.hash == file_hash))
-                if existing.scalars().first():
+                # Re-check: a concurrent ingestion may have stored it meanwhile
+                existing = await session.execute(select(Document.id).filter(Document.hash == file_hash))
+                if existing.scalar() not in (None, document_id):
                     logger.info(f"Duplicate document ignored: {file_path}")
                     return
 
@@ -500,73 +657,6 @@ async def process_new_document(file_path: str):
                             return str(val)
                     return str(val)
 
-                def _validate_and_convert_date_global(date_str: str) -> str | None:
-                    """
-                    Global date validation and conversion to ISO format (YYYY-MM-DD).
-                    Handles European (DD.MM.YYYY) and American (MM/DD/YYYY) formats.
-                    Returns None if date cannot be parsed.
-                    """
-                    if not date_str or not isinstance(date_str, str):
-                        return None
-                    
-                    date_str = date_str.strip()
-                    if not date_str:
-                        return None
-                    
-                    from datetime import datetime
-                    
-                    # Try ISO format first (already correct)
-                    try:
-                        dt = datetime.fromisoformat(date_str)
-                        return dt.strftime('%Y-%m-%d')
-                    except:
-                        pass
-                    
-                    # Try European format (DD.MM.YYYY)
-                    try:
-                        if '.' in date_str:
-                            parts = date_str.split('.')
-                            if len(parts) == 3:
-                                day, month, year = parts
-                                dt = datetime(int(year), int(month), int(day))
-                                logger.info(f"Converted European date {date_str} -> {dt.strftime('%Y-%m-%d')}")
-                                return dt.strftime('%Y-%m-%d')
-                    except:
-                        pass
-                    
-                    # Try American format (MM/DD/YYYY)
-                    try:
-                        if '/' in date_str:
-                            parts = date_str.split('/')
-                            if len(parts) == 3:
-                                month, day, year = parts
-                                dt = datetime(int(year), int(month), int(day))
-                                logger.info(f"Converted American date {date_str} -> {dt.strftime('%Y-%m-%d')}")
-                                return dt.strftime('%Y-%m-%d')
-                    except:
-                        pass
-                    
-                    # Try other common formats
-                    formats_to_try = [
-                        '%Y-%m-%d',  # ISO (shouldn't reach here but just in case)
-                        '%d-%m-%Y',  # DD-MM-YYYY
-                        '%m-%d-%Y',  # MM-DD-YYYY
-                        '%d/%m/%Y',  # DD/MM/YYYY
-                        '%Y/%m/%d',  # YYYY/MM/DD
-                    ]
-                    
-                    for fmt in formats_to_try:
-                        try:
-                            dt = datetime.strptime(date_str, fmt)
-                            converted = dt.strftime('%Y-%m-%d')
-                            logger.info(f"Converted date {date_str} ({fmt}) -> {converted}")
-                            return converted
-                        except:
-                            continue
-                    
-                    logger.warning(f"Could not parse date: {date_str}")
-                    return None
-
                 def _extract_sender_name(sender_data):
                     """Extract clean company name from sender data."""
                     if sender_data is None:
@@ -592,7 +682,7 @@ async def process_new_document(file_path: str):
                     return str(sender_data).strip()
 
                 # Create document with "processing" status initially
-                document = Document(
+                fields = dict(
                     title=_to_str(metadata.get("title", os.path.basename(file_path))) or os.path.basename(file_path).replace('.pdf', '').replace('_', ' '),
                     file_path=file_path,
                     content=text,
@@ -611,19 +701,31 @@ async def process_new_document(file_path: str):
                 )
                 
                 # Ensure title is never null
-                if not document.title or document.title.strip() == "":
-                    document.title = os.path.basename(file_path).replace('.pdf', '').replace('_', ' ')
+                if not fields["title"] or fields["title"].strip() == "":
+                    fields["title"] = os.path.basename(file_path).replace('.pdf', '').replace('_', ' ')
                 
-                # Persist DB row early so we have an ID for vector mapping and dashboard display
-                await document_repository.create(session, document)
-                document_id = document.id
-                logger.info(f"Document created with processing status: {document.title} (ID: {document_id})")
+                placeholder = await session.get(Document, document_id) if document_id else None
+                if placeholder is not None:
+                    # Bulk-import placeholder: fill in the queued row instead of inserting
+                    for key, value in fields.items():
+                        setattr(placeholder, key, value)
+                    document = placeholder
+                    await session.flush()
+                    logger.info(f"Import placeholder filled, processing: {document.title} (ID: {document_id})")
+                else:
+                    document = Document(**fields)
+                    # Persist DB row early so we have an ID for vector mapping and dashboard display
+                    await document_repository.create(session, document)
+                    document_id = document.id
+                    logger.info(f"Document created with processing status: {document.title} (ID: {document_id})")
                 
                 # Commit immediately so the processing status is visible in dashboard
                 await session.commit()
                 
                 # Add a longer delay to make the processing status visible in the dashboard
-                await asyncio.sleep(5)
+                # (not for bulk imports – the batch progress endpoint covers those)
+                if placeholder is None:
+                    await asyncio.sleep(5)
                 
                 # Continue with processing in a new transaction
                 try:
@@ -725,10 +827,15 @@ async def process_new_document(file_path: str):
                         #  Vision embeddings (ColPali) – insert per page into Qdrant
                         # --------------------------------------------------------------
 
+                        images: list[Image.Image] = []
                         try:
-                            embedder = ColPaliEmbedder()
+                            if not vision.is_enabled():
+                                raise vision.VisionUnavailableError("disabled")
+
+                            from app import vector_store
+
+                            embedder = await vision.get_embedder()
 
-                            images: list[Image.Image] = []
                             ext = os.path.splitext(file_path)[1].lower()
 
                             if ext == ".pdf":
@@ -738,21 +845,31 @@ async def process_new_document(file_path: str):
                                 img = await asyncio.to_thread(Image.open, file_path)
                                 images = [img]
 
-                            # Iterate pages – embed & upsert
+                            # Iterate pages – embed & queue (batched across pages, sent with wait=False)
+                            entries: list[VectorEntry] = []
                             for page_idx, pil_img in enumerate(images):
-                                multi_vecs, _ = embedder.embed_page(pil_img)
-
-                                vector_ids = upsert_page(document.id, page_idx, multi_vecs)
-
-                                ve = VectorEntry(
+                                multi_vecs, _ = await asyncio.to_thread(embedder.embed_page, pil_img)
+                                patch_count = await vector_store.add_page(document.id, page_idx, multi_vecs)
+                                entries.append(VectorEntry(
                                     doc_id=document.id,
                                     page=page_idx,
-                                    vector_ids=json.dumps(vector_ids, ensure_ascii=False),
-                                )
-                                session.add(ve)
+                                    patch_count=patch_count,
+                                ))
+
+                            # Bookkeeping only once Qdrant accepted the points – never ahead of them
+                            await vector_store.flush()
+                            session.add_all(entries)
 
+                        except vision.VisionUnavailableError as exc:
+                            logger.debug("Skipping ColPali embedding: %s", exc)
                         except Exception as exc:
                             logger.warning("ColPali embedding failed: %s", exc)
+
+                        # Page thumbnails / previews – reuse the ColPali rasters when we have them
+                        try:
+                            await renditions.generate(file_path, file_hash, images=images)
+                        except Exception as exc:
+                            logger.warning("Rendition generation failed: %s", exc)
                         
                         # Compute *text* embedding (async) and persist for legacy search
                         try:
@@ -760,6 +877,11 @@ async def process_new_document(file_path: str):
                             emb = await get_embedding(text[:2048])  # limit tokens
                             # Convert to pgvector input format (list of floats) – SQLAlchemy will adapt
                             document.embedding = emb  # type: ignore[attr-defined]
+                            # No pgvector (SQLite) → keep the in-process ANN index current
+                            if local_vector_index.is_active():
+                                _idx = local_vector_index.get_index()
+                                await asyncio.to_thread(_idx.add, document.id, emb)
+                                await asyncio.to_thread(_idx.flush, False)
                         except Exception as e:
                             logger.warning("Embedding generation failed: %s", e)
                         
@@ -779,11 +901,8 @@ async def process_new_document(file_path: str):
                         #  Helper – canonical representation of company names to avoid dupes
                         # ------------------------------------------------------------------
 
-                        _LEGAL_SUFFIX_RE = re.compile(r"\b(ag|gmbh|sa|sarl|inc|ltd)\b\.?", re.I)
-
-                        def _canonical_name(name: str) -> str:
-                            name = _LEGAL_SUFFIX_RE.sub("", name.lower())
-                            return re.sub(r"[^a-z0-9]", "", name)
+                        _LEGAL_SUFFIX_RE = vendors.LEGAL_SUFFIX_RE
+                        _canonical_name = vendors.canonical_name
 
                         # ------------------------------------------------------------------
                         # 1) Canonical match (after stripping legal suffix & punctuation)
@@ -919,6 +1038,8 @@ async def process_new_document(file_path: str):
                             document.sender = vendor_entry.name
 
                         await session.flush()
+                        if vendor_entry is not None:
+                            await vendors.attach_address(session, document.vendor_id, vendor_entry.id)
 
                         logger.info(f"Address entry processed and saved: {vendor_entry.name}")
 
@@ -973,6 +1094,15 @@ async def process_new_document(file_path: str):
                             logger.warning(f"Tenant extraction failed for document {document_id}: {tenant_error}")
                             # Don't fail the entire process if tenant extraction fails
                         
+                        # ------------------------------------------------------------------
+                        # Related documents (kNN, sender/amount, recurring, reminders)
+                        # ------------------------------------------------------------------
+                        try:
+                            from app.relations import compute_relations
+                            await compute_relations(session, document_id)
+                        except Exception as rel_error:
+                            logger.warning(f"Relation computation failed for document {document_id}: {rel_error}")
+
                         # ------------------------------------------------------------------
                         # Mark document as successfully processed
                         # ------------------------------------------------------------------
@@ -1060,71 +1190,14 @@ def _normalize_amount(value):
     return None
 
 def _validate_and_convert_date_global(date_str: str) -> str | None:
+    """Normalise an extracted date to ISO ``YYYY-MM-DD`` via ``app.dates``.
+
+    Returns None if the date cannot be parsed.
     """
-    Global date validation and conversion to ISO format (YYYY-MM-DD).
-    Handles European (DD.MM.YYYY) and American (MM/DD/YYYY) formats.
-    Returns None if date cannot be parsed.
-    """
-    if not date_str or not isinstance(date_str, str):
-        return None
-    
-    date_str = date_str.strip()
-    if not date_str:
-        return None
-    
-    from datetime import datetime
-    
-    # Try ISO format first (already correct)
-    try:
-        dt = datetime.fromisoformat(date_str)
-        return dt.strftime('%Y-%m-%d')
-    except:
-        pass
-    
-    # Try European format (DD.MM.YYYY)
-    try:
-        if '.' in date_str:
-            parts = date_str.split('.')
-            if len(parts) == 3:
-                day, month, year = parts
-                dt = datetime(int(year), int(month), int(day))
-                logger.info(f"Converted European date {date_str} -> {dt.strftime('%Y-%m-%d')}")
-                return dt.strftime('%Y-%m-%d')
-    except:
-        pass
-    
-    # Try American format (MM/DD/YYYY)
-    try:
-        if '/' in date_str:
-            parts = date_str.split('/')
-            if len(parts) == 3:
-                month, day, year = parts
-                dt = datetime(int(year), int(month), int(day))
-                logger.info(f"Converted American date {date_str} -> {dt.strftime('%Y-%m-%d')}")
-                return dt.strftime('%Y-%m-%d')
-    except:
-        pass
-    
-    # Try other common formats
-    formats_to_try = [
-        '%Y-%m-%d',  # ISO (shouldn't reach here but just in case)
-        '%d-%m-%Y',  # DD-MM-YYYY
-        '%m-%d-%Y',  # MM-DD-YYYY
-        '%d/%m/%Y',  # DD/MM/YYYY
-        '%Y/%m/%d',  # YYYY/MM/DD
-    ]
-    
-    for fmt in formats_to_try:
-        try:
-            dt = datetime.strptime(date_str, fmt)
-            converted = dt.strftime('%Y-%m-%d')
-            logger.info(f"Converted date {date_str} ({fmt}) -> {converted}")
-            return converted
-        except:
-            continue
-    
-    logger.warning(f"Could not parse date: {date_str}")
-    return None
+    converted = dates.to_iso(date_str)
+    if converted is None and date_str:
+        logger.warning(f"Could not parse date: {date_str}")
+    return converted
 
 # Authentication routes
 @app.post("/api/auth/login")
@@ -1191,28 +1264,113 @@ async def get_documents(
     status: Optional[str] = None,
     document_type: Optional[str] = None,
     search: Optional[str] = None,
+    entity_id: Optional[int] = None,
+    sender: Optional[str] = None,
+    date_from: Optional[str] = Query(None, description="document_date lower bound (YYYY-MM-DD)"),
+    date_to: Optional[str] = Query(None, description="document_date upper bound (YYYY-MM-DD)"),
+    amount_min: Optional[float] = None,
+    amount_max: Optional[float] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated columns; default omits content and embedding"),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """List documents, newest first.
+
+    Without ``limit``/``cursor`` the legacy plain array is returned.  With
+    them the response is ``{"items", "next_cursor"}`` – pass ``next_cursor``
+    back as ``cursor`` to fetch the following page.
+    """
+    try:
+        columns = DocumentRepository.list_fields(fields)
+        items, next_cursor = await document_repository.get_page(
+            db,
+            fields=columns,
+            limit=limit,
+            cursor=cursor,
+            status=status,
+            document_type=document_type,
+            search=search,
+            entity_id=entity_id,
+            sender=sender,
+            date_from=date_from,
+            date_to=date_to,
+            amount_min=amount_min,
+            amount_max=amount_max,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    # Items are Row mappings – orjson encodes them as-is, no jsonable_encoder pass.
+    if limit is None and cursor is None:
+        return FastJSONResponse(content=items)
+    return FastJSONResponse(content={"items": items, "next_cursor": next_cursor})
+
+@app.get("/api/documents/export")
+async def export_documents(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    status: Optional[str] = None,
+    document_type: Optional[str] = None,
+    search: Optional[str] = None,
+    entity_id: Optional[int] = None,
+    sender: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    amount_min: Optional[float] = None,
+    amount_max: Optional[float] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated columns; default omits content and embedding"),
+    updated_since: Optional[datetime] = Query(None, description="Only rows changed after this (previous X-Export-Watermark)"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    documents = await document_repository.get_all(
-        db,
-        status=status,
-        document_type=document_type,
-        search=search,
+    """Stream matching documents as NDJSON or CSV (constant memory).
+
+    ``search`` uses the full-text index, so this doubles as a search-results
+    export.  The ``X-Export-Watermark`` header is the ``updated_since`` value
+    for the next incremental pull; rows changed shortly before it are sent
+    again (upsert by ``id``).  Deletions: ``/api/documents/export/deleted``.
+    """
+    from app.database import async_session
+
+    try:
+        columns = DocumentRepository.list_fields(fields)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    upper = await export.watermark(db)
+    batches = export.iter_documents(
+        async_session,
+        columns,
+        filters={
+            "status": status,
+            "document_type": document_type,
+            "search": search,
+            "entity_id": entity_id,
+            "sender": sender,
+            "date_from": date_from,
+            "date_to": date_to,
+            "amount_min": amount_min,
+            "amount_max": amount_max,
+        },
+        updated_since=updated_since,
+        upper=upper,
     )
+    body = export.encode_csv(batches, columns) if format == "csv" else export.encode_ndjson(batches)
 
-    # Safety: convert any SQLAlchemy model instances left over to plain dicts to
-    # avoid FastAPI jsonable_encoder errors.
-    serialisable = [
-        DocumentRepository._to_dict(d) if not isinstance(d, dict) else d
-        for d in documents
-    ]
+    headers = {"Content-Disposition": f'attachment; filename="documents.{format}"'}
+    if upper is not None:
+        headers["X-Export-Watermark"] = upper.isoformat()
+    return StreamingResponse(body, media_type=export.FORMATS[format], headers=headers)
 
-    # FastAPI's default jsonable_encoder stumbles over edge-cases here; bypass by
-    # returning a pre-encoded JSONResponse which uses the high-performance
-    # orjson backend internally (if installed) and happily serialises plain
-    # Python primitives.
-    return JSONResponse(content=serialisable)
+@app.get("/api/documents/export/deleted")
+async def export_deleted_documents(
+    since: Optional[datetime] = Query(None, description="Previous X-Export-Watermark"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Ids of documents deleted since *since* – the deletions of an incremental pull."""
+    return {"items": await export.deleted_since(db, since)}
 
 @app.get("/api/documents/{document_id}")
 async def get_document(
@@ -1266,7 +1424,8 @@ async def update_document(
     
     await document_repository.update(db, document)
     await db.commit()
-    return DocumentRepository._to_dict(document)
+    # refresh() expires the deferred heavy columns – reload them for the response
+    return await document_repository.get_by_id(db, document_id, as_dict=True)
 
 @app.delete("/api/documents/{document_id}")
 async def delete_document(
@@ -1280,6 +1439,24 @@ async def delete_document(
     
     await document_repository.delete(db, document_id)
     await db.commit()
+    file_serving.forget(document_id)
+
+    if local_vector_index.is_active():
+        try:
+            _idx = local_vector_index.get_index()
+            await asyncio.to_thread(_idx.delete, document_id)
+            await asyncio.to_thread(_idx.flush, False)
+        except Exception as exc:
+            logger.warning("Failed to drop document %s from the local vector index: %s", document_id, exc)
+
+    # Drop ColPali patch vectors as well (IDs are derived, so delete by doc_id)
+    if vision.is_enabled():
+        try:
+            from app.vector_store import delete_document as delete_vectors
+            await delete_vectors(document_id)
+        except Exception as exc:
+            logger.warning("Failed to delete vectors for document %s: %s", document_id, exc)
+
     return {"message": "Document deleted successfully"}
 
 @app.post("/api/documents/upload")
@@ -1289,15 +1466,57 @@ async def upload_document(
     current_user: User = Depends(get_current_user),
     background_tasks: BackgroundTasks = BackgroundTasks(),
 ):
-    # Save file to watch folder
-    file_path = os.path.join(settings.WATCH_FOLDER, file.filename)
-    with open(file_path, "wb") as buffer:
-        buffer.write(await file.read())
-    
-    # Process document in background
-    background_tasks.add_task(process_new_document, file_path)
+    # Stream into the watch folder (chunked, hashed, size-capped, atomic rename)
+    try:
+        stored = await ingestion.save_upload(file, db)
+    except ingestion.UploadRejected as exc:
+        if exc.document_id is not None:
+            return JSONResponse(
+                status_code=exc.status_code,
+                content={"detail": exc.detail, "document_id": exc.document_id},
+            )
+        raise HTTPException(status_code=exc.status_code, detail=exc.detail)
+
+    # The path stays claimed until processing ends, so the watcher skips it
+    background_tasks.add_task(
+        ingestion.process_claimed, stored.path, process_new_document, file_hash=stored.sha256
+    )
     
-    return {"message": "Document uploaded successfully", "file_path": file_path}
+    return {
+        "message": "Document uploaded successfully",
+        "file_path": stored.path,
+        "sha256": stored.sha256,
+        "size": stored.size,
+    }
+
+# Bulk import routes
+@app.post("/api/imports", status_code=202)
+async def create_import(
+    files: List[UploadFile] = File(...),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Import many files and/or ZIP/TAR archives as one batch.
+
+    Returns immediately with the batch progress; documents are processed in
+    the background by the import workers.
+    """
+    try:
+        return await bulk_import.create_batch(db, files, user_id=current_user.id)
+    except ingestion.UploadRejected as exc:
+        raise HTTPException(status_code=exc.status_code, detail=exc.detail)
+
+
+@app.get("/api/imports/{batch_id}")
+async def get_import(
+    batch_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    result = await bulk_import.progress(db, batch_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Import batch not found")
+    return result
 
 # Tag routes
 @app.get("/api/documents/{document_id}/tags")
@@ -1532,48 +1751,53 @@ async def delete_address_entry(entry_id: int, db: AsyncSession = Depends(get_db)
 # Analytics routes
 @app.get("/api/analytics/document-types")
 async def get_document_type_distribution(
+    entity_id: Optional[int] = None,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    analytics_service = AnalyticsService(db)
+    analytics_service = AnalyticsService(db, entity_id=entity_id)
     distribution = await analytics_service.get_document_type_distribution()
     return distribution
 
 @app.get("/api/analytics/payment-status")
 async def get_payment_status_distribution(
+    entity_id: Optional[int] = None,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    analytics_service = AnalyticsService(db)
+    analytics_service = AnalyticsService(db, entity_id=entity_id)
     distribution = await analytics_service.get_payment_status_distribution()
     return distribution
 
 @app.get("/api/analytics/monthly-documents")
 async def get_monthly_document_count(
     year: int,
+    entity_id: Optional[int] = None,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    analytics_service = AnalyticsService(db)
+    analytics_service = AnalyticsService(db, entity_id=entity_id)
     monthly_count = await analytics_service.get_monthly_document_count(year)
     return monthly_count
 
 @app.get("/api/analytics/monthly-invoices")
 async def get_monthly_invoice_amount(
     year: int,
+    entity_id: Optional[int] = None,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    analytics_service = AnalyticsService(db)
+    analytics_service = AnalyticsService(db, entity_id=entity_id)
     monthly_amount = await analytics_service.get_monthly_invoice_amount(year)
     return monthly_amount
 
 @app.get("/api/analytics/summary")
 async def get_summary_metrics(
+    entity_id: Optional[int] = None,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    analytics_service = AnalyticsService(db)
+    analytics_service = AnalyticsService(db, entity_id=entity_id)
     summary = await analytics_service.get_summary_metrics()
     return summary
 
@@ -1599,18 +1823,61 @@ async def get_events_for_date(
     events = await calendar_service.get_events_for_date(db, date)
     return events
 
+@app.get("/api/calendar/range")
+async def get_calendar_range(
+    start: date,
+    end: date,
+    tenant_id: Optional[int] = None,
+    document_type: Optional[str] = None,
+    include_paid: bool = True,
+    with_events: bool = Query(True, alias="events"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Documents due between *start* and *end* (inclusive) plus per-day counts.
+
+    One call per visible range (week / month / quarter, at most a year);
+    ``events=false`` returns only the per-day counts for heatmaps.
+    """
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if (end - start).days >= calendar_export.MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range exceeds {calendar_export.MAX_RANGE_DAYS} days")
+    await _check_calendar_tenant(db, current_user.id, tenant_id)
+    return await calendar_export.events_in_range(
+        db, start, end,
+        entity_ids=None if tenant_id is None else {tenant_id},
+        document_type=document_type, include_paid=include_paid, with_events=with_events,
+    )
+
+async def _check_calendar_tenant(db: AsyncSession, user_id: Optional[int], tenant_id: Optional[int]) -> None:
+    if tenant_id is not None and user_id is not None:
+        tenants = set((await db.execute(
+            select(UserEntity.entity_id).where(UserEntity.user_id == user_id)
+        )).scalars())
+        if tenant_id not in tenants:
+            raise HTTPException(status_code=404, detail="Tenant not found")
+
+async def _calendar_feed(request: Request, db: AsyncSession, user_id: Optional[int], tenant_id: Optional[int],
+                         days: Optional[int], document_type: Optional[str], include_paid: bool):
+    """Cached / conditional ICS feed shared by both export endpoints."""
+    await _check_calendar_tenant(db, user_id, tenant_id)
+    from app.database import async_session
+
+    flt = FeedFilter(entity_id=tenant_id, days=days, document_type=document_type, include_paid=include_paid)
+    return await calendar_export.feed_response(db, async_session, user_id, flt, request.headers)
+
 @app.get("/api/calendar/export")
 async def export_calendar(
+    request: Request,
+    tenant_id: Optional[int] = None,
+    days: Optional[int] = Query(None, ge=1, le=3650),
+    document_type: Optional[str] = None,
+    include_paid: bool = True,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    calendar_service = CalendarExportService(db)
-    ics_content = calendar_service.generate_ics_file()
-    return Response(
-        content=ics_content,
-        media_type="text/calendar",
-        headers={"Content-Disposition": "attachment; filename=calendar.ics"},
-    )
+    return await _calendar_feed(request, db, current_user.id, tenant_id, days, document_type, include_paid)
 
 # ---------------------------------------------------------------------------
 #  New token-based ICS export (public, read-only)
@@ -1641,7 +1908,12 @@ async def create_calendar_api_key(current_user: User = Depends(get_current_user)
 
 @app.get("/api/calendar/export/ics")
 async def export_calendar_ics(
+    request: Request,
     api_key: str | None = None,
+    tenant_id: Optional[int] = None,
+    days: Optional[int] = Query(None, ge=1, le=3650),
+    document_type: Optional[str] = None,
+    include_paid: bool = True,
     db: AsyncSession = Depends(get_db),
     current_user: User | None = Depends(get_current_user_optional),
 ):
@@ -1651,6 +1923,9 @@ async def export_calendar_ics(
     dependency) *or* an ``api_key`` query parameter obtained from
     ``POST /api/calendar/api-key``. This mirrors the behaviour of the document file
     download endpoint to make the API consistent.
+
+    Subscribed calendar apps poll this: responses carry an ``ETag`` and
+    ``Last-Modified`` and unchanged feeds answer ``304 Not Modified``.
     """
 
     # If no authenticated user, fall back to API-key validation
@@ -1659,14 +1934,13 @@ async def export_calendar_ics(
 
         if not api_key or api_key not in api_keys:
             raise HTTPException(status_code=401, detail="Could not validate credentials")
+        user_id = (await db.execute(
+            select(User.id).where(User.username == api_keys[api_key])
+        )).scalar_one_or_none()
+    else:
+        user_id = current_user.id
 
-    calendar_service = CalendarExportService(db)
-    ics_content = calendar_service.generate_ics_file()
-    return Response(
-        content=ics_content,
-        media_type="text/calendar",
-        headers={"Content-Disposition": "attachment; filename=calendar.ics"},
-    )
+    return await _calendar_feed(request, db, user_id, tenant_id, days, document_type, include_paid)
 
 # Search routes
 @app.get("/api/search")
@@ -1699,9 +1973,42 @@ async def semantic_search(
     results = await search_service.semantic_search(query)
     return results
 
+@app.get("/api/search/hybrid")
+async def hybrid_search(
+    q: str,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    document_type: Optional[str] = None,
+    status: Optional[str] = None,
+    sender: Optional[str] = None,
+    entity_id: Optional[int] = None,
+    semantic: bool = True,
+    prefix: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Full-text + vector search fused with reciprocal-rank fusion, with facets."""
+    search_service = SearchService(db)
+    result = await search_service.hybrid_search(
+        q,
+        page=page,
+        page_size=page_size,
+        filters={
+            "document_type": document_type,
+            "status": status,
+            "sender": sender,
+            "entity_id": entity_id,
+        },
+        semantic=semantic,
+        prefix=prefix,
+    )
+    return FastJSONResponse(content=result)
+
 @app.get("/api/search/related/{document_id}")
 async def get_related_documents(
     document_id: int,
+    limit: int = Query(5, ge=1, le=50),
+    rerank: bool = False,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
@@ -1710,7 +2017,9 @@ async def get_related_documents(
         raise HTTPException(status_code=404, detail="Document not found")
     
     search_service = SearchService(db)
-    related_docs = await search_service.suggest_related_documents(document_id=document.id)
+    related_docs = await search_service.suggest_related_documents(
+        document_id=document.id, limit=limit, rerank=rerank
+    )
     return related_docs
 
 # ---------------------------------------------------------------------------
@@ -1723,8 +2032,14 @@ async def vision_search(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
+    if not vision.is_enabled():
+        raise HTTPException(status_code=503, detail="Vision search is disabled")
+
     search_service = SearchService(db)
-    results = await search_service.vision_search(query)
+    try:
+        results = await search_service.vision_search(query)
+    except vision.VisionUnavailableError as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
     return results
 
 # ---------------------------------------------------------------------------
@@ -1737,190 +2052,16 @@ async def get_vendor_analytics(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """Get comprehensive analytics for a specific vendor."""
-    from collections import defaultdict
-    import calendar
-    
-    # Get all documents for this vendor
-    result = await db.execute(
-        select(Document).where(
-            Document.sender.ilike(f"%{vendor_name}%")
-        ).order_by(Document.document_date.desc())
-    )
-    documents = result.scalars().all()
-    
-    if not documents:
+    """Get comprehensive analytics for a specific vendor.
+
+    Aggregates run in SQL over the vendor's ``vendor_id`` (see
+    ``app.vendors``) and are cached until one of its documents changes.
+    """
+    vendor_id = await vendors.resolve(db, vendor_name)
+    result = await vendors.analytics(db, vendor_id) if vendor_id is not None else None
+    if result is None:
         raise HTTPException(status_code=404, detail="No documents found for this vendor")
-    
-    # Convert to dictionaries for easier processing
-    invoices = []
-    for doc in documents:
-        invoice_data = DocumentRepository._to_dict(doc)
-        invoices.append(invoice_data)
-    
-    # Analyze invoice patterns
-    current_year = datetime.now().year
-    yearly_totals = defaultdict(float)
-    yearly_vat = defaultdict(float)
-    yearly_counts = defaultdict(int)
-    monthly_pattern = defaultdict(list)  # year-month -> [invoices]
-    
-    # Process each invoice
-    for invoice in invoices:
-        doc_date = invoice.get('document_date')
-        amount = invoice.get('amount') or 0
-        vat_amount = invoice.get('tax_amount') or 0
-        
-        if doc_date:
-            try:
-                if isinstance(doc_date, str):
-                    # Try different date formats
-                    date_obj = None
-                    for fmt in ['%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M:%S.%f']:
-                        try:
-                            date_obj = datetime.strptime(doc_date.replace('Z', '').replace('+00:00', ''), fmt)
-                            break
-                        except ValueError:
-                            continue
-                    
-                    if date_obj is None:
-                        # Try fromisoformat as fallback
-                        date_obj = datetime.fromisoformat(doc_date.replace('Z', '+00:00'))
-                else:
-                    date_obj = doc_date
-                
-                year = date_obj.year
-                month = date_obj.month
-                
-                yearly_totals[year] += amount
-                yearly_vat[year] += vat_amount
-                yearly_counts[year] += 1
-                monthly_pattern[f"{year}-{month:02d}"].append(invoice)
-                
-            except (ValueError, TypeError):
-                continue
-    
-    # Detect missing invoices (simple heuristic: if we have invoices in consecutive months, flag missing months)
-    missing_periods = []
-    if len(monthly_pattern) >= 3:  # Need at least 3 invoices to detect pattern
-        # Get all year-month keys and sort them
-        periods = sorted(monthly_pattern.keys())
-        
-        # Check for gaps in monthly pattern for the last 2 years
-        start_date = datetime(current_year - 1, 1, 1)
-        end_date = datetime(current_year, 12, 31)
-        
-        current_date = start_date
-        while current_date <= end_date:
-            period_key = f"{current_date.year}-{current_date.month:02d}"
-            
-            # If this period is missing and we have invoices before and after
-            if period_key not in monthly_pattern:
-                # Check if we have invoices in surrounding months
-                prev_month = current_date - timedelta(days=32)
-                next_month = current_date + timedelta(days=32)
-                prev_key = f"{prev_month.year}-{prev_month.month:02d}"
-                next_key = f"{next_month.year}-{next_month.month:02d}"
-                
-                if prev_key in monthly_pattern and next_key in monthly_pattern:
-                    missing_periods.append({
-                        "period": period_key,
-                        "month_name": calendar.month_name[current_date.month],
-                        "year": current_date.year
-                    })
-            
-            # Move to next month
-            if current_date.month == 12:
-                current_date = current_date.replace(year=current_date.year + 1, month=1)
-            else:
-                current_date = current_date.replace(month=current_date.month + 1)
-    
-    # Calculate frequency pattern
-    frequency_analysis = "unknown"
-    if len(monthly_pattern) >= 6:
-        # Count how many months have invoices vs total months spanned
-        periods = sorted(monthly_pattern.keys())
-        if periods:
-            start_period = periods[0]
-            end_period = periods[-1]
-            start_year, start_month = map(int, start_period.split('-'))
-            end_year, end_month = map(int, end_period.split('-'))
-            
-            total_months = (end_year - start_year) * 12 + (end_month - start_month) + 1
-            months_with_invoices = len(monthly_pattern)
-            
-            coverage_ratio = months_with_invoices / total_months
-            
-            if coverage_ratio >= 0.9:
-                frequency_analysis = "monthly"
-            elif coverage_ratio >= 0.7:
-                frequency_analysis = "mostly_monthly"
-            elif coverage_ratio >= 0.25:
-                frequency_analysis = "quarterly"
-            else:
-                frequency_analysis = "irregular"
-    
-    # Prepare yearly breakdown for charts
-    yearly_breakdown = []
-    for year in sorted(yearly_totals.keys(), reverse=True):
-        yearly_breakdown.append({
-            "year": year,
-            "total_amount": round(yearly_totals[year], 2),
-            "total_vat": round(yearly_vat[year], 2),
-            "invoice_count": yearly_counts[year],
-            "average_amount": round(yearly_totals[year] / yearly_counts[year], 2) if yearly_counts[year] > 0 else 0
-        })
-    
-    # Calculate totals
-    total_amount = sum(yearly_totals.values())
-    total_vat = sum(yearly_vat.values())
-    total_invoices = len(invoices)
-    
-    # Recent activity (last 12 months)
-    twelve_months_ago = datetime.now() - timedelta(days=365)
-    recent_invoices = []
-    
-    for inv in invoices:
-        doc_date = inv.get('document_date')
-        if doc_date:
-            try:
-                if isinstance(doc_date, str):
-                    # Try different date formats
-                    date_obj = None
-                    for fmt in ['%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M:%S.%f']:
-                        try:
-                            date_obj = datetime.strptime(doc_date.replace('Z', '').replace('+00:00', ''), fmt)
-                            break
-                        except ValueError:
-                            continue
-                    
-                    if date_obj is None:
-                        # Try fromisoformat as fallback
-                        date_obj = datetime.fromisoformat(doc_date.replace('Z', '+00:00'))
-                else:
-                    date_obj = doc_date
-                
-                if date_obj >= twelve_months_ago:
-                    recent_invoices.append(inv)
-            except (ValueError, TypeError):
-                continue
-    
-    return {
-        "vendor_name": vendor_name,
-        "summary": {
-            "total_amount": round(total_amount, 2),
-            "total_vat": round(total_vat, 2),
-            "total_invoices": total_invoices,
-            "years_active": len(yearly_totals),
-            "frequency_pattern": frequency_analysis,
-            "recent_activity": len(recent_invoices)
-        },
-        "yearly_breakdown": yearly_breakdown,
-        "missing_periods": missing_periods,
-        "all_invoices": invoices,
-        "monthly_pattern": dict(monthly_pattern),
-        "currency": invoices[0].get('currency', 'CHF') if invoices else 'CHF'
-    }
+    return {"vendor_name": vendor_name, **result}
 
 # Settings routes
 @app.get("/api/settings")
@@ -2001,8 +2142,11 @@ async def update_settings(
         settings.AUTO_OCR = auto_ocr
     if auto_tagging is not None:
         settings.AUTO_TAGGING = auto_tagging
-    if default_currency:
+    if default_currency and fx.normalise_currency(default_currency) != fx.base_currency():
         settings.DEFAULT_CURRENCY = default_currency
+        # Base currency changed – every amount_base is re-converted in the background
+        from app.database import async_session
+        fx.schedule_reconvert(async_session)
 
     return await get_settings(db=db, current_user=current_user)
 
@@ -2213,12 +2357,16 @@ async def root():
 @app.get("/api/documents/{document_id}/file")
 async def download_document_file(
     document_id: int,
+    request: Request,
     api_key: str | None = None,
     db: AsyncSession = Depends(get_db),
     current_user: User | None = Depends(get_current_user_optional),
 ):
     """Return the raw file (PDF/image) for a document.
 
+    Supports ``Range`` (PDF viewers fetch pages on demand) and conditional
+    GET via an ``ETag`` derived from the document hash.
+
     For browser-embedded previews we cannot easily add custom headers, so we
     also accept `?api_key=...` as a query parameter in development mode.
     """
@@ -2230,34 +2378,64 @@ async def download_document_file(
         if not api_key or api_key not in api_keys:
             raise HTTPException(status_code=401, detail="Could not validate credentials")
 
-    """Return the raw file (PDF/image) for a document."""
-    document = await document_repository.get_by_id(db, document_id)
-    if not document:
-        raise HTTPException(status_code=404, detail="Document not found")
+    try:
+        served = await file_serving.lookup(db, document_id)
+    except file_serving.FileMissing as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    return file_serving.file_response(served, request.headers)
 
-    path = document.file_path
-    if not os.path.exists(path):
-        # Fallback: historical records may still reference /inbox/ after they
-        # have been moved to /archive/.  If so, try to derive the archive
-        # path by replacing the prefix.
-        inbox_prefix = os.getenv("WATCH_FOLDER", "/inbox")
-        archive_prefix = os.getenv("ARCHIVE_FOLDER", "/archive")
-        if path.startswith(inbox_prefix):
-            alt_path = archive_prefix + path[len(inbox_prefix):]
-            if os.path.exists(alt_path):
-                path = alt_path
-            else:
-                raise HTTPException(status_code=404, detail="File not found on disk")
-        else:
-            raise HTTPException(status_code=404, detail="File not found on disk")
-
-    filename = os.path.basename(path)
-    return FileResponse(
-        path,
-        media_type="application/pdf",
-        filename=filename,
-        headers={"Content-Disposition": f"inline; filename={filename}"},
-    )
+async def _page_rendition(document_id, page, kind, request, api_key, db, current_user):
+    if current_user is None:
+        from app.auth import api_keys
+
+        if not api_key or api_key not in api_keys:
+            raise HTTPException(status_code=401, detail="Could not validate credentials")
+    if page < 1:
+        raise HTTPException(status_code=404, detail="Page not found")
+
+    try:
+        served = await file_serving.lookup(db, document_id)
+    except file_serving.FileMissing as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    if not served.digest:
+        raise HTTPException(status_code=404, detail="No rendition available")
+
+    # Content-addressed → the tag never changes for a given page/kind
+    etag = f'"{served.digest[:16]}-{page}-{kind}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+    if file_serving.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    path = await renditions.get(served.path, served.digest, page - 1, kind)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Page not found")
+    return FileResponse(path, media_type="image/webp", headers=headers)
+
+
+@app.get("/api/documents/{document_id}/pages/{page}/thumbnail")
+async def get_page_thumbnail(
+    document_id: int,
+    page: int,
+    request: Request,
+    api_key: str | None = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: User | None = Depends(get_current_user_optional),
+):
+    """Small WebP thumbnail of *page* (1-based) for cards and list rows."""
+    return await _page_rendition(document_id, page, "thumbnail", request, api_key, db, current_user)
+
+
+@app.get("/api/documents/{document_id}/pages/{page}/preview")
+async def get_page_preview(
+    document_id: int,
+    page: int,
+    request: Request,
+    api_key: str | None = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: User | None = Depends(get_current_user_optional),
+):
+    """Screen-sized WebP preview of *page* (1-based)."""
+    return await _page_rendition(document_id, page, "preview", request, api_key, db, current_user)
 
 # ---------------------------------------------------------------------------
 # Admin-only dependency
@@ -2457,6 +2635,7 @@ async def health(db: AsyncSession = Depends(get_db)):
         "database": db_status,
         "llm": llm_status,
         "watcher": watcher_status,
+        "vision": vision.status(),
         "timestamp": datetime.now().isoformat(),
     }
 
@@ -2822,61 +3001,152 @@ async def cleanup_vendor_tenants(
         await db.rollback()
         raise HTTPException(status_code=500, detail=f"Cleanup failed: {str(e)}")
 
+@app.post("/api/admin/relations/rebuild")
+async def rebuild_document_relations(
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+):
+    """Recompute related-document links for all documents in the background."""
+
+    async def _run():
+        from app.database import async_session
+        from app.relations import rebuild_all
+        async with async_session() as session:
+            count = await rebuild_all(session)
+        logger.info("Rebuilt document relations for %d documents", count)
+
+    background_tasks.add_task(_run)
+    return {"status": "scheduled"}
+
 @app.post("/api/admin/cleanup-dates")
 async def cleanup_date_formats(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """Clean up date formats in the database, converting all to ISO format."""
-    from sqlalchemy import text
-    
-    # Get all documents with non-null dates
-    result = await db.execute(
-        text("SELECT id, document_date, due_date FROM documents WHERE document_date IS NOT NULL OR due_date IS NOT NULL")
-    )
-    documents = result.fetchall()
-    
-    converted_count = 0
-    errors = []
-    
-    for doc_id, doc_date, due_date in documents:
-        try:
-            # Check and convert document_date
-            if doc_date:
-                converted_doc_date = _validate_and_convert_date_global(str(doc_date))
-                if converted_doc_date != str(doc_date):
-                    await db.execute(
-                        text("UPDATE documents SET document_date = :new_date WHERE id = :doc_id"),
-                        {"new_date": converted_doc_date, "doc_id": doc_id}
-                    )
-                    converted_count += 1
-                    logger.info(f"Updated document {doc_id} document_date: {doc_date} -> {converted_doc_date}")
-            
-            # Check and convert due_date
-            if due_date:
-                converted_due_date = _validate_and_convert_date_global(str(due_date))
-                if converted_due_date != str(due_date):
-                    await db.execute(
-                        text("UPDATE documents SET due_date = :new_date WHERE id = :doc_id"),
-                        {"new_date": converted_due_date, "doc_id": doc_id}
-                    )
-                    converted_count += 1
-                    logger.info(f"Updated document {doc_id} due_date: {due_date} -> {converted_due_date}")
-        
-        except Exception as e:
-            error_msg = f"Failed to convert dates for document {doc_id}: {str(e)}"
-            errors.append(error_msg)
-            logger.error(error_msg)
-    
-    await db.commit()
-    
+    """Clean up date formats in the database, converting all to ISO format.
+
+    Runs the batched ``app.dates.backfill`` in normalising mode: text dates
+    are rewritten to ISO and the typed shadow columns refreshed.  Only rows
+    that actually change count as converted; rows holding a date that cannot
+    be parsed are reported in ``errors``.  Base-currency amounts follow in
+    the background (``fx.schedule_reconvert``).
+    """
+    from app.database import async_session
+
+    result = await dates.backfill(async_session, normalise=True)
+    if result["changed"]:
+        rollups.mark_stale()
+        calendar_export.invalidate()
+        fx.schedule_reconvert(async_session)  # conversion day follows the document date
     return {
         "status": "success",
-        "converted_count": converted_count,
-        "total_documents": len(documents),
-        "errors": errors
+        "converted_count": result["changed"],
+        "total_documents": result["scanned"],
+        "errors": [f"Failed to parse a date of document {doc_id}" for doc_id in result["failed"]],
+    }
+
+# ---------------------------------------------------------------------------
+#  FX rates (local CSV dumps – see app.fx)
+# ---------------------------------------------------------------------------
+
+@app.get("/api/fx/rates")
+async def list_fx_rates(
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Latest known rate per currency (per 1 EUR) and the base currency."""
+    from app.models import FxRate
+
+    latest = (
+        select(FxRate.currency, func.max(FxRate.rate_date).label("rate_date"))
+        .group_by(FxRate.currency)
+        .subquery()
+    )
+    rows = await db.execute(
+        select(FxRate.currency, FxRate.rate_date, FxRate.rate)
+        .join(latest, and_(FxRate.currency == latest.c.currency, FxRate.rate_date == latest.c.rate_date))
+        .order_by(FxRate.currency)
+    )
+    return {
+        "base_currency": fx.base_currency(),
+        "rates": [
+            {"currency": c, "rate_date": d.isoformat(), "rate": r} for c, d, r in rows
+        ],
     }
 
+
+@app.post("/api/fx/rates")
+async def upload_fx_rates(
+    file: UploadFile = File(...),
+    current_user: User = Depends(admin_required),
+):
+    """Load an ECB ``eurofxref(-hist).csv`` or ``date,currency,rate`` CSV (admins only).
+
+    Affected document amounts are re-converted in the background.
+    """
+    from app.database import async_session
+
+    try:
+        result = await fx.load_csv(async_session, (await file.read()).decode("utf-8-sig"))
+    except (UnicodeDecodeError, ValueError) as exc:
+        raise HTTPException(status_code=400, detail=f"Invalid rate file: {exc}") from exc
+    if result["currencies"]:
+        fx.schedule_reconvert(async_session, currencies=result["currencies"])
+    return result
+
+@app.get("/api/events/stream")
+async def stream_events(
+    tenant_id: Optional[int] = None,
+    last_event_id: Optional[int] = Header(default=None, alias="Last-Event-ID"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Server-Sent Events: ``document.status`` and ``notification.created``.
+
+    Replaces polling ``/api/notifications`` and ``/api/processing/status`` –
+    clients fetch those once, then apply events; on ``resync`` they refetch.
+    Tenant-scoped events are limited to the user's tenants (or *tenant_id*).
+    """
+    tenants = None  # API-key users see every tenant
+    if current_user.id is not None:
+        tenants = set((await db.execute(
+            select(UserEntity.entity_id).where(UserEntity.user_id == current_user.id)
+        )).scalars())
+    if tenant_id is not None:
+        if tenants is not None and tenant_id not in tenants:
+            raise HTTPException(status_code=404, detail="Tenant not found")
+        tenants = {tenant_id}
+    # Don't hold a pooled connection for the lifetime of the stream
+    await db.close()
+
+    sub = events.subscribe(current_user.id, tenants, last_event_id)
+    return StreamingResponse(
+        events.stream(sub),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/scheduler/jobs")
+async def get_scheduler_jobs(
+    window_days: int = Query(7, ge=1, le=90),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Scheduled jobs: cron, next run, last run and duration stats."""
+    return {"jobs": await scheduler.status(db, window_days=window_days)}
+
+@app.post("/api/scheduler/jobs/{name}/run")
+async def run_scheduler_job(
+    name: str,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(admin_required),
+):
+    """Run a job now (in the background, subject to the same single-runner claim).  Admins only."""
+    if name not in {j.name for j in scheduler.jobs()}:
+        raise HTTPException(status_code=404, detail="Job not found")
+    background_tasks.add_task(scheduler.run_job, name, jitter=False)
+    return {"message": f"Job {name} started"}
+
 @app.get("/api/processing/status")
 async def get_processing_status(
     db: AsyncSession = Depends(get_db),
@@ -2884,23 +3154,26 @@ async def get_processing_status(
 ):
     """Get current processing queue status for dashboard display."""
     
+    # Only the columns the dashboard shows – no full document rows
+    columns = (Document.id, Document.title, Document.file_path, Document.created_at, Document.updated_at)
+
     # Get current processing documents
     processing_result = await db.execute(
-        select(Document).filter(Document.status == 'processing').order_by(Document.created_at.desc())
+        select(*columns).filter(Document.status == 'processing').order_by(Document.created_at.desc())
     )
-    processing_docs = processing_result.scalars().all()
+    processing_docs = processing_result.all()
     
     # Get recent failed documents (last 10)
     failed_result = await db.execute(
-        select(Document).filter(Document.status == 'failed').order_by(Document.updated_at.desc()).limit(10)
+        select(*columns).filter(Document.status == 'failed').order_by(Document.updated_at.desc()).limit(10)
     )
-    failed_docs = failed_result.scalars().all()
+    failed_docs = failed_result.all()
     
     # Get recent successful documents (last 10)
     success_result = await db.execute(
-        select(Document).filter(Document.status == 'processed').order_by(Document.updated_at.desc()).limit(10)
+        select(*columns).filter(Document.status == 'processed').order_by(Document.updated_at.desc()).limit(10)
     )
-    success_docs = success_result.scalars().all()
+    success_docs = success_result.all()
     
     # Check if folder watcher is active (simple heuristic - any recent activity)
     from datetime import datetime, timedelta
@@ -1,8 +1,8 @@
 """
 Database models for the Document Management System.
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Table, Boolean, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Table, Boolean, Text, UniqueConstraint, Index, event
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
 from app.database import Base
 
@@ -13,6 +13,9 @@ except ImportError:
     # For SQLite, use Text to store vector data as JSON
     Vector = lambda size: Text
 
+# Deferred column group on Document – see Document.content
+HEAVY_COLUMNS = "heavy"
+
 # Association table for document-tag relationship
 document_tag = Table(
     "document_tag",
@@ -35,11 +38,20 @@ class Document(Base):
     """Document model representing a processed document."""
     
     __tablename__ = "documents"
+    __table_args__ = (
+        # Keyset pagination of the document list: ORDER BY created_at DESC, id DESC
+        Index("ix_documents_created_at_id", "created_at", "id"),
+        # Calendar range queries: WHERE entity_id = ? AND due_on BETWEEN ? AND ?
+        Index("ix_documents_entity_due_on", "entity_id", "due_on"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), nullable=False)
     file_path = Column(String(255), nullable=False)
-    content = Column(Text, nullable=True)
+    # Heavy columns (OCR text, LLM summary, 1536-d embedding) load on demand:
+    # list/analytics/notification queries never need them.  Use
+    # ``undefer_group(HEAVY_COLUMNS)`` where they are read in bulk.
+    content = deferred(Column(Text, nullable=True), group=HEAVY_COLUMNS)
     document_type = Column(String(50), nullable=True)
     sender = Column(String(255), nullable=True)
     recipient = Column(String(255), nullable=True)
@@ -49,23 +61,37 @@ class Document(Base):
     subtotal = Column(Float, nullable=True)
     tax_rate = Column(Float, nullable=True)
     tax_amount = Column(Float, nullable=True)
+    # ``amount`` in the base currency (DEFAULT_CURRENCY) at the document date –
+    # kept in sync by app.fx; NULL when no FX rate is known for ``currency``
+    amount_base = Column(Float, nullable=True)
     payment_date = Column(String(50), nullable=True)
+    # Typed shadows of the three text dates above, kept in sync by the
+    # listeners at the bottom of this module (see app.dates)
+    document_on = Column(Date, nullable=True, index=True)
+    due_on = Column(Date, nullable=True, index=True)
+    paid_on = Column(Date, nullable=True)
     category = Column(String(100), nullable=True)
     recurring = Column(Boolean, nullable=True)
     frequency = Column(String(20), nullable=True)  # monthly, quarterly etc.
     parent_id = Column(Integer, ForeignKey('documents.id'), nullable=True)
     original_file_name = Column(String(255), nullable=True)
-    summary = Column(Text, nullable=True)
+    summary = deferred(Column(Text, nullable=True), group=HEAVY_COLUMNS)
     confidence_score = Column(Float, nullable=True)
     currency = Column(String(10), nullable=True)
     status = Column(String(50), default="pending")
-    embedding = Column(Vector(1536), nullable=True)
+    embedding = deferred(Column(Vector(1536), nullable=True), group=HEAVY_COLUMNS)
     # SHA-256 hash of the original file, used for deduplication
     hash = Column(String(64), nullable=False, unique=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     # Multi-company FK (nullable for legacy docs)
     entity_id = Column(Integer, ForeignKey("entities.id"), nullable=True, index=True)
+    # Bulk import that created this row as a "queued" placeholder (NULL otherwise)
+    import_batch_id = Column(Integer, ForeignKey("import_batches.id"), nullable=True, index=True)
+    # Canonical vendor of ``sender`` – resolved on every ORM write by app.vendors
+    vendor_id = Column(Integer, ForeignKey("vendors.id", ondelete="SET NULL"), nullable=True, index=True)
+    # Set once app.relations has computed this document's related documents
+    relations_computed_at = Column(DateTime, nullable=True)
     entity = relationship("Entity")
     
     # Relationships
@@ -114,6 +140,10 @@ class Notification(Base):
     """Notification model for user alerts."""
     
     __tablename__ = "notifications"
+    __table_args__ = (
+        # Anti-join of the due-date scans: "unread notification of this type exists?"
+        Index("ix_notifications_document_type_read", "document_id", "type", "is_read"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), nullable=False)
@@ -165,11 +195,12 @@ class AddressEntry(Base):
 # ---------------------------------------------------------------------------
 
 class VectorEntry(Base):
-    """Mapping between internal document pages and Qdrant point IDs.
+    """Per-page bookkeeping for ColPali vectors stored in Qdrant.
 
-    Each row stores the list of patch-level vector IDs (UUID strings) that were
-    inserted for the given page.  We serialise the list as JSON inside a TEXT
-    column to keep the schema simple across SQLite & Postgres.
+    Point IDs are derived from (doc_id, page, patch) – see
+    :func:`app.vector_store.point_id` – so a row only records how many patch
+    vectors were written for the page.  ``vector_ids`` is kept for rows created
+    before the compact layout (JSON list of UUID strings) and is NULL otherwise.
     """
 
     __tablename__ = "vectors"
@@ -177,10 +208,51 @@ class VectorEntry(Base):
     id = Column(Integer, primary_key=True, index=True)
     doc_id = Column(Integer, ForeignKey("documents.id"), nullable=False, index=True)
     page = Column(Integer, nullable=False)
-    vector_ids = Column(Text, nullable=False)  # JSON list e.g. '["uuid1", "uuid2", ...]'
+    patch_count = Column(Integer, nullable=True)
+    vector_ids = Column(Text, nullable=True)  # legacy JSON list e.g. '["uuid1", "uuid2", ...]'
 
     document = relationship("Document")
 
+# ---------------------------------------------------------------------------
+#  Precomputed document relations ("related documents" panel)
+# ---------------------------------------------------------------------------
+
+class DocumentTombstone(Base):
+    """Id of a deleted document, so incremental exports can propagate deletions.
+
+    Written by a ``before_flush`` listener in :mod:`app.export` for every ORM
+    delete; pruned by the scheduler's ``housekeeping`` job.
+    """
+
+    __tablename__ = "document_tombstones"
+
+    id = Column(Integer, primary_key=True)
+    document_id = Column(Integer, nullable=False, index=True)  # no FK – the row is gone
+    deleted_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class DocumentRelation(Base):
+    """Directed, scored link between two documents.
+
+    Computed incrementally at ingestion by :mod:`app.relations` from cheap
+    signals (embedding kNN, sender/amount joins, recurring periods,
+    invoice → reminder).  Rows belong to ``document_id`` (the document whose
+    computation found them); links are symmetric, so lookups read both the
+    ``document_id`` and the ``related_id`` index.
+    """
+
+    __tablename__ = "document_relations"
+    __table_args__ = (
+        UniqueConstraint("document_id", "related_id", "relation_type", name="uq_document_relation"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    related_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    relation_type = Column(String(32), nullable=False)  # similar | same_sender | recurring | invoice_reminder
+    score = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 # ---------------------------------------------------------------------------
 #  Application-wide settings (single-row table)
 # ---------------------------------------------------------------------------
@@ -346,3 +418,169 @@ class ProcessingRule(Base):
     
     # Relationships
     preferred_tenant = relationship("Entity", foreign_keys=[preferred_tenant_id])
+
+
+# ---------------------------------------------------------------------------
+#  Bulk imports
+# ---------------------------------------------------------------------------
+
+class ImportBatch(Base):
+    """One bulk import (many files and/or ZIP/TAR archives) – see app.bulk_import."""
+
+    __tablename__ = "import_batches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String(255), nullable=True)  # uploaded file name(s), for display
+    status = Column(String(20), nullable=False, default="queued")  # queued | processing | done
+    total = Column(Integer, nullable=False, default=0)  # placeholders queued
+    duplicates = Column(Integer, nullable=False, default=0)  # already stored / repeated in batch
+    skipped = Column(Integer, nullable=False, default=0)  # unsupported or oversized members
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+# ---------------------------------------------------------------------------
+#  Notification outbox
+# ---------------------------------------------------------------------------
+
+class NotificationOutbox(Base):
+    """One pending channel delivery of a notification – drained by app.outbox.
+
+    Written in the same transaction as the notification itself; the
+    dispatcher claims due rows by pushing ``next_attempt_at`` forward (a
+    lease), so rows of a crashed worker become due again on their own.
+    """
+
+    __tablename__ = "notification_outbox"
+    __table_args__ = (
+        Index("ix_notification_outbox_due", "channel", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    notification_id = Column(Integer, ForeignKey("notifications.id", ondelete="CASCADE"), nullable=False)
+    channel = Column(String(50), nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # pending | sending | sent | failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+
+# ---------------------------------------------------------------------------
+#  Scheduler run history
+# ---------------------------------------------------------------------------
+
+class JobRun(Base):
+    """One run of a scheduled job (see app.scheduler).
+
+    ``(job, scheduled_for)`` is unique: the worker that inserts the row for a
+    schedule slot runs it, every other API worker skips that slot.
+    """
+
+    __tablename__ = "job_runs"
+    __table_args__ = (
+        UniqueConstraint("job", "scheduled_for", name="uq_job_runs_job_slot"),
+        Index("ix_job_runs_job_started", "job", "started_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    job = Column(String(100), nullable=False)
+    scheduled_for = Column(DateTime, nullable=False)
+    status = Column(String(20), nullable=False, default="running")  # running | ok | failed | abandoned
+    worker = Column(String(100), nullable=True)
+    started_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    duration_ms = Column(Float, nullable=True)
+    detail = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+
+
+# ---------------------------------------------------------------------------
+#  Vendor dimension
+# ---------------------------------------------------------------------------
+
+class Vendor(Base):
+    """Canonical vendor (document sender) – see app.vendors.
+
+    ``canonical`` is the sender name lower-cased without legal suffixes and
+    punctuation, so "Visana AG" and "VISANA" share one row.
+    """
+
+    __tablename__ = "vendors"
+
+    id = Column(Integer, primary_key=True, index=True)
+    canonical = Column(String(255), nullable=False, unique=True, index=True)
+    name = Column(String(255), nullable=False)  # display name (first sender spelling seen)
+    address_entry_id = Column(Integer, ForeignKey("address_book.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# ---------------------------------------------------------------------------
+#  FX rates
+# ---------------------------------------------------------------------------
+
+class FxRate(Base):
+    """Daily exchange rate – units of ``currency`` per 1 EUR (ECB convention).
+
+    Loaded from local CSV dumps by app.fx; never fetched over the network.
+    """
+
+    __tablename__ = "fx_rates"
+    __table_args__ = (
+        UniqueConstraint("currency", "rate_date", name="uq_fx_rates_currency_date"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    currency = Column(String(10), nullable=False)
+    rate_date = Column(Date, nullable=False)
+    rate = Column(Float, nullable=False)
+
+
+# ---------------------------------------------------------------------------
+#  Analytics rollups
+# ---------------------------------------------------------------------------
+
+class DocumentRollup(Base):
+    """Pre-aggregated document counts/amounts – maintained by app.rollups.
+
+    Key columns are NOT NULL so the unique constraint can drive upserts:
+    ``entity_id`` 0 means "no tenant", empty strings stand for NULL.
+    """
+
+    __tablename__ = "document_rollups"
+    __table_args__ = (
+        UniqueConstraint("entity_id", "month", "document_type", "status", "currency", name="uq_document_rollups_key"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    entity_id = Column(Integer, nullable=False, default=0)
+    month = Column(String(7), nullable=False, default="")  # YYYY-MM of document date (else created_at)
+    document_type = Column(String(50), nullable=False, default="")
+    status = Column(String(50), nullable=False, default="")
+    currency = Column(String(10), nullable=False, default="")
+    doc_count = Column(Integer, nullable=False, default=0)
+    amount_sum = Column(Float, nullable=False, default=0.0)  # base currency (see app.fx)
+    # Amounts with no rate for their currency – not in amount_sum, kept raw in ``currency``
+    unconverted_count = Column(Integer, nullable=False, default=0)
+    unconverted_sum = Column(Float, nullable=False, default=0.0)
+
+
+# ---------------------------------------------------------------------------
+#  Shadow DATE columns – every ORM write of a text date re-parses it
+# ---------------------------------------------------------------------------
+
+from app.dates import SHADOW_COLUMNS, parse_date  # noqa: E402 – plain helpers, no model imports
+
+
+def _sync_shadow_date(shadow: str):
+    def _on_set(target, value, oldvalue, initiator):
+        setattr(target, shadow, parse_date(value))
+
+    return _on_set
+
+
+for _source, _shadow in SHADOW_COLUMNS.items():
+    event.listen(getattr(Document, _source), "set", _sync_shadow_date(_shadow))
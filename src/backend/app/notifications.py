@@ -12,18 +12,30 @@ Key design goals:
 • Works out-of-the-box with a single *InAppChannel* so existing API routes
   keep functioning.  New channels can be plugged in without changing the core
   logic – ideal for future e-mail/push/SSE upgrades.
+• Due-date scans are set-based: one query anti-joins ``notifications`` on
+  the indexed ``due_on`` range, one ``INSERT … RETURNING`` stores the new
+  rows, and channels receive them in batches (:meth:`NotificationChannel.send_many`).
+• External channels are never called inside the caller's transaction: the
+  service only writes ``notification_outbox`` rows next to the notification
+  and :mod:`app.outbox` delivers them after commit – concurrently, batched,
+  rate-limited and with retries according to the channel's class attributes.
+• Every new notification is also published on the in-process event bus
+  (``notification.created``, see :mod:`app.events`) once the transaction
+  commits, scoped to the tenant of its document.
 """
 
 from __future__ import annotations
 
 import logging
+import os
 from abc import ABC, abstractmethod
-from datetime import datetime, timedelta
-from typing import List, Optional, Sequence
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence
 
-from sqlalchemy import select, update, func, text, cast, Date
+from sqlalchemy import exists, insert, select, update, func, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app import events, outbox
 from app.models import Notification, Document
 
 # ---------------------------------------------------------------------------
@@ -35,6 +47,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Default notifications handed to a channel per ``send_many`` call
+_FANOUT_BATCH = int(os.getenv("NOTIFICATION_FANOUT_BATCH", 500))
+
 
 # ---------------------------------------------------------------------------
 # Channel abstraction
@@ -42,7 +57,23 @@ logger = logging.getLogger(__name__)
 
 
 class NotificationChannel(ABC):
-    """Abstract *async* notification channel."""
+    """Abstract *async* notification channel.
+
+    Delivery policy for the outbox dispatcher – override per channel:
+    ``name`` (outbox key, defaults to the class name), ``batch_size``
+    (notifications per ``send_many``), ``batch_window`` (seconds a partial
+    batch may wait to fill – digests), ``concurrency`` (batches in flight),
+    ``rate_per_minute`` (``send_many`` calls, ``None`` = unlimited),
+    ``max_attempts`` and ``timeout`` (seconds per call).
+    """
+
+    name: Optional[str] = None
+    batch_size: int = _FANOUT_BATCH
+    batch_window: float = 0
+    concurrency: int = 4
+    rate_per_minute: Optional[float] = None
+    max_attempts: int = 5
+    timeout: Optional[float] = 60
 
     @abstractmethod
     async def send(self, notification: Notification, db: AsyncSession) -> None:  # noqa: D401,E501 – keep concise signature
@@ -52,6 +83,11 @@ class NotificationChannel(ABC):
         (e.g. to resolve user e-mail addresses).
         """
 
+    async def send_many(self, notifications: Sequence[Notification], db: AsyncSession) -> None:
+        """Deliver a batch of notifications – override to send them in one go."""
+        for notification in notifications:
+            await self.send(notification, db)
+
 
 class InAppChannel(NotificationChannel):
     """Default channel – no external delivery, only stored in DB."""
@@ -60,6 +96,9 @@ class InAppChannel(NotificationChannel):
         # Already persisted; nothing else to do.
         return
 
+    async def send_many(self, notifications: Sequence[Notification], db: AsyncSession) -> None:
+        return
+
 
 # ---------------------------------------------------------------------------
 # Serialisation helpers
@@ -96,6 +135,10 @@ class NotificationService:
         self.channels: List[NotificationChannel] = list(channels) if channels else []
         # Ensure InAppChannel is present exactly once at the *front* of list.
         self.channels.insert(0, InAppChannel())
+        # Everything else is delivered from the outbox after commit
+        self._outbox_channels = [
+            outbox.register(ch) for ch in self.channels if not isinstance(ch, InAppChannel)
+        ]
 
     # ---------------- CRUD helpers ----------------
 
@@ -107,7 +150,7 @@ class NotificationService:
         notification_type: str,
         document_id: Optional[int] = None,
     ) -> dict:
-        """Persist notification record and dispatch to channels."""
+        """Persist notification record and queue it for the channels."""
 
         notification = Notification(
             title=title,
@@ -117,19 +160,39 @@ class NotificationService:
         )
 
         db.add(notification)
+        # Assigns the PK (and column defaults) for the outbox rows
         await db.flush()
-        # Ensure PK assigned for downstream consumers
-        await db.refresh(notification)
-
-        # Fan-out to channels (ignore failures – log only)
-        for ch in self.channels:
-            try:
-                await ch.send(notification, db)
-            except Exception as exc:  # pragma: no-cover – diagnostics only
-                logger.warning("Notification channel %s failed: %s", ch.__class__.__name__, exc)
 
+        await self._dispatch([notification], db)
         return _notification_to_dict(notification)
 
+    async def _dispatch(
+        self,
+        notifications: Sequence[Notification],
+        db: AsyncSession,
+        tenants: Optional[Dict[int, Optional[int]]] = None,
+    ) -> None:
+        """Queue *notifications* for the external channels and the event bus – no sends.
+
+        *tenants* maps ``document_id`` → ``entity_id`` where the caller already
+        knows it; the rest are looked up in one query.
+        """
+        await outbox.enqueue(db, notifications, self._outbox_channels)
+
+        tenants = dict(tenants or {})
+        unknown = {n.document_id for n in notifications if n.document_id is not None} - set(tenants)
+        if unknown:
+            tenants.update((await db.execute(
+                select(Document.id, Document.entity_id).where(Document.id.in_(unknown))
+            )).all())
+        for n in notifications:
+            events.queue(
+                db.sync_session,
+                "notification.created",
+                _notification_to_dict(n),
+                entity_id=tenants.get(n.document_id),
+            )
+
     async def get_all_notifications(
         self,
         db: AsyncSession,
@@ -169,78 +232,80 @@ class NotificationService:
 
     # ---------------- Business-logic helpers ----------------
 
-    async def check_overdue_documents(self, db: AsyncSession) -> List[Notification]:
-        today = datetime.utcnow().date()
-
-        stmt = select(Document).filter(Document.status != "paid", Document.due_date != "")
-        overdue_docs = (await db.execute(stmt)).scalars().all()
+    async def _scan_due(
+        self,
+        db: AsyncSession,
+        notification_type: str,
+        due_range: Sequence,
+        title: Callable[[str], str],
+        message: Callable[[str, date, Optional[str]], str],
+    ) -> List[dict]:
+        """Notify every unpaid document in *due_range* without an unread *notification_type*.
 
-        notifications: List[Notification] = []
-        for doc in overdue_docs:
-            exists_stmt = select(Notification.id).filter(
-                Notification.document_id == doc.id,
-                Notification.type == "overdue",
-                Notification.is_read.is_(False),
-            )
-            if (await db.execute(exists_stmt)).first():
-                continue  # already notified
-
-            try:
-                doc_due = datetime.fromisoformat(str(doc.due_date)).date()  # type: ignore
-            except Exception:
-                continue
-
-            if doc_due >= today:
-                continue
-
-            days_overdue = (today - doc_due).days
-            notif = await self.create_notification(
-                db,
-                title=f"Overdue: {doc.title}",
-                message=f"Document '{doc.title}' is {days_overdue} days overdue (due {doc.due_date}).",
-                notification_type="overdue",
-                document_id=doc.id,
-            )
-            notifications.append(notif)
-        return notifications
+        One anti-join select, one bulk ``INSERT … RETURNING`` and one outbox
+        insert for the channel fan-out – no per-document round trips.
+        """
+        already_notified = exists().where(
+            Notification.document_id == Document.id,
+            Notification.type == notification_type,
+            Notification.is_read.is_(False),
+        )
+        stmt = (
+            select(Document.id, Document.title, Document.due_on, Document.due_date, Document.entity_id)
+            .where(Document.status != "paid", *due_range, ~already_notified)
+            .order_by(Document.due_on, Document.id)
+        )
+        rows = (await db.execute(stmt)).all()
+        if not rows:
+            return []
+
+        now = datetime.utcnow()
+        created = (await db.scalars(
+            insert(Notification).returning(Notification),
+            [
+                {
+                    "title": title(doc_title),
+                    "message": message(doc_title, due_on, due_date),
+                    "type": notification_type,
+                    "document_id": doc_id,
+                    "is_read": False,
+                    "created_at": now,
+                }
+                for doc_id, doc_title, due_on, due_date, _ in rows
+            ],
+        )).all()
+        # RETURNING order is not guaranteed for multi-row inserts – restore due-date order
+        position = {row[0]: i for i, row in enumerate(rows)}
+        created = sorted(created, key=lambda n: position[n.document_id])
+        await self._dispatch(created, db, tenants={row[0]: row[4] for row in rows})
+        return [_notification_to_dict(n) for n in created]
+
+    async def check_overdue_documents(self, db: AsyncSession) -> List[dict]:
+        today = datetime.utcnow().date()
+        return await self._scan_due(
+            db,
+            "overdue",
+            (Document.due_on < today,),
+            title=lambda t: f"Overdue: {t}",
+            message=lambda t, due_on, due_date: (
+                f"Document '{t}' is {(today - due_on).days} days overdue (due {due_date})."
+            ),
+        )
 
     async def check_upcoming_due_dates(
         self, db: AsyncSession, days_ahead: int = 7
-    ) -> List[Notification]:
+    ) -> List[dict]:
         today = datetime.utcnow().date()
         upcoming_limit = today + timedelta(days=days_ahead)
-
-        stmt = select(Document).filter(Document.status != "paid", Document.due_date != "")
-        docs = (await db.execute(stmt)).scalars().all()
-
-        notifications: List[Notification] = []
-        for doc in docs:
-            exists_stmt = select(Notification.id).filter(
-                Notification.document_id == doc.id,
-                Notification.type == "reminder",
-                Notification.is_read.is_(False),
-            )
-            if (await db.execute(exists_stmt)).first():
-                continue
-
-            try:
-                doc_due = datetime.fromisoformat(str(doc.due_date)).date()  # type: ignore
-            except Exception:
-                continue
-
-            if not (today <= doc_due <= upcoming_limit):
-                continue
-
-            days_until = (doc_due - today).days
-            notif = await self.create_notification(
-                db,
-                title=f"Upcoming: {doc.title}",
-                message=f"Document '{doc.title}' is due in {days_until} days ({doc.due_date}).",
-                notification_type="reminder",
-                document_id=doc.id,
-            )
-            notifications.append(notif)
-        return notifications
+        return await self._scan_due(
+            db,
+            "reminder",
+            (Document.due_on.between(today, upcoming_limit),),
+            title=lambda t: f"Upcoming: {t}",
+            message=lambda t, due_on, due_date: (
+                f"Document '{t}' is due in {(due_on - today).days} days ({due_date})."
+            ),
+        )
 
     async def create_due_date_notification(self, db: AsyncSession, document: Document):
         if not document.due_date:
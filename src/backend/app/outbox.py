@@ -0,0 +1,356 @@
+"""app.outbox
+==========
+Transactional outbox for notification delivery.
+
+Creating a notification only inserts rows: the notification itself plus
+one ``notification_outbox`` row per external channel, in the caller's
+transaction.  Nothing is sent while a request or ingest transaction is
+open, and a rolled-back transaction never sends anything.
+
+A background dispatcher (one task per registered channel) drains the
+outbox after commit:
+
+• **Claiming** – due rows are leased with one ``UPDATE … RETURNING`` that
+  pushes ``next_attempt_at`` past the send timeout; rows of a crashed
+  worker simply become due again.  Postgres adds ``SKIP LOCKED`` so several
+  workers can share the table.
+• **Batching** – rows go to :meth:`NotificationChannel.send_many` in groups
+  of the channel's ``batch_size``.  With a ``batch_window`` (digest e-mails)
+  a partial batch waits until its oldest row is that many seconds old.
+• **Concurrency** – up to ``concurrency`` batches per channel are in flight
+  at once; channels never wait on each other.
+• **Rate limits** – a token bucket per channel (``rate_per_minute``,
+  counted in ``send_many`` calls) bounds how much is claimed per pass.
+• **Retries** – a failed or timed-out batch is retried with exponential
+  backoff until ``max_attempts``, then marked ``failed`` with the error.
+
+Channel policy lives on the channel class (see
+:class:`app.notifications.NotificationChannel`); this module only reads it.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import event, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.models import Notification, NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 5))
+_CLAIM_LIMIT = int(os.getenv("OUTBOX_CLAIM_LIMIT", 500))
+_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", 300))
+_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", 30))
+_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", 3600))
+
+_DUE = ("pending", "sending")  # "sending" rows are due again once their lease expires
+
+_channels: Dict[str, Any] = {}
+_buckets: Dict[str, "_TokenBucket"] = {}
+_wake: Dict[str, asyncio.Event] = {}
+_tasks: Dict[str, asyncio.Task] = {}
+_session_factory = None
+
+
+def channel_name(channel) -> str:
+    return getattr(channel, "name", None) or type(channel).__name__
+
+
+def register(channel) -> str:
+    """Make *channel* deliverable by the dispatcher → its outbox name.
+
+    Registering another instance under the same name replaces the previous
+    one (and resets its rate limit).
+    """
+    name = channel_name(channel)
+    _channels[name] = channel
+    _buckets[name] = _TokenBucket(getattr(channel, "rate_per_minute", None))
+    if _session_factory is not None and name not in _tasks:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:  # registered from sync code – picked up by the next start_dispatcher()
+            return name
+        _spawn(name)
+    return name
+
+
+def _policy(channel, attr: str, default):
+    value = getattr(channel, attr, None)
+    return default if value is None else value
+
+
+# ---------------------------------------------------------------------------
+# Enqueue (caller's transaction)
+# ---------------------------------------------------------------------------
+
+async def enqueue(db, notifications: Sequence[Notification], channels: Iterable[str]) -> int:
+    """Queue *notifications* for every channel in *channels* → rows inserted.
+
+    One multi-row ``INSERT`` in the caller's transaction; the dispatcher is
+    woken once that transaction commits.
+    """
+    names = list(channels)
+    if not notifications or not names:
+        return 0
+    now = datetime.utcnow()
+    rows = [
+        {
+            "notification_id": n.id,
+            "channel": name,
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now,
+        }
+        for n in notifications
+        for name in names
+    ]
+    await db.execute(insert(NotificationOutbox), rows)
+    db.sync_session.info.setdefault("outbox_channels", set()).update(names)
+    return len(rows)
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session: Session) -> None:
+    for name in session.info.pop("outbox_channels", ()):
+        wake(name)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session: Session) -> None:
+    session.info.pop("outbox_channels", None)
+
+
+def wake(name: Optional[str] = None) -> None:
+    """Ask the dispatcher loop of *name* (all when ``None``) for an early pass."""
+    for key, flag in _wake.items():
+        if name is None or key == name:
+            flag.set()
+
+
+# ---------------------------------------------------------------------------
+# Rate limiting
+# ---------------------------------------------------------------------------
+
+class _TokenBucket:
+    """``rate_per_minute`` sends, refilled continuously, bursting up to a minute's worth."""
+
+    def __init__(self, rate_per_minute: Optional[float], clock=time.monotonic):
+        self.rate = rate_per_minute
+        self._clock = clock
+        self.tokens = float(rate_per_minute or 0)
+        self._last = clock()
+
+    def available(self) -> Optional[int]:
+        """Whole sends allowed right now (``None`` = unlimited)."""
+        if not self.rate:
+            return None
+        now = self._clock()
+        self.tokens = min(float(self.rate), self.tokens + (now - self._last) * self.rate / 60.0)
+        self._last = now
+        return int(self.tokens)
+
+    def take(self, n: int) -> None:
+        if self.rate:
+            self.tokens -= n
+
+
+# ---------------------------------------------------------------------------
+# Claim → deliver → record
+# ---------------------------------------------------------------------------
+
+async def _claimable(db, name: str, batch_size: int, window: float, now: datetime) -> int:
+    """Rows to claim now – only whole batches until the oldest waits *window* seconds."""
+    count, oldest = (await db.execute(
+        select(func.count(), func.min(NotificationOutbox.created_at)).where(
+            NotificationOutbox.channel == name,
+            NotificationOutbox.status.in_(_DUE),
+            NotificationOutbox.next_attempt_at <= now,
+        )
+    )).one()
+    if not count:
+        return 0
+    if oldest is not None and oldest <= now - timedelta(seconds=window):
+        return count
+    return (count // batch_size) * batch_size
+
+
+async def _claim(session_factory, name: str, limit: int, lease: float) -> List[Any]:
+    now = datetime.utcnow()
+    due = (
+        NotificationOutbox.channel == name,
+        NotificationOutbox.status.in_(_DUE),
+        NotificationOutbox.next_attempt_at <= now,
+    )
+    ids = (
+        select(NotificationOutbox.id)
+        .where(*due)
+        .order_by(NotificationOutbox.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    async with session_factory() as db:
+        rows = (await db.execute(
+            update(NotificationOutbox)
+            .where(NotificationOutbox.id.in_(ids), *due)
+            .values(status="sending", next_attempt_at=now + timedelta(seconds=lease))
+            .returning(NotificationOutbox.id, NotificationOutbox.notification_id, NotificationOutbox.attempts)
+            .execution_options(synchronize_session=False)
+        )).all()
+        await db.commit()
+    return sorted(rows, key=lambda r: r.id)
+
+
+def _backoff(attempts: int) -> float:
+    return min(_BACKOFF_MAX, _BACKOFF_BASE * 2 ** (attempts - 1))
+
+
+async def _record(session_factory, channel, rows, error: Optional[str], found: set) -> None:
+    now = datetime.utcnow()
+    max_attempts = _policy(channel, "max_attempts", 5)
+    params = []
+    for row in rows:
+        if row.notification_id not in found:
+            params.append({"id": row.id, "status": "failed", "last_error": "notification no longer exists"})
+        elif error is None:
+            params.append({"id": row.id, "status": "sent", "sent_at": now, "last_error": None,
+                           "attempts": row.attempts + 1})
+        else:
+            attempts = row.attempts + 1
+            retry = attempts < max_attempts
+            params.append({
+                "id": row.id,
+                "status": "pending" if retry else "failed",
+                "attempts": attempts,
+                "last_error": error[:2000],
+                "next_attempt_at": now + timedelta(seconds=_backoff(attempts)) if retry else now,
+            })
+    # Rows differ in the columns they set → one executemany per shape
+    shapes: Dict[tuple, list] = {}
+    for p in params:
+        shapes.setdefault(tuple(sorted(p)), []).append(p)
+    async with session_factory() as db:
+        for group in shapes.values():
+            await db.execute(update(NotificationOutbox), group)
+        await db.commit()
+
+
+async def _deliver(session_factory, name: str, channel, rows) -> int:
+    """Send one batch → notifications delivered."""
+    ids = [r.notification_id for r in rows]
+    error = None
+    found: set = set()
+    try:
+        async with session_factory() as db:
+            notifications = (await db.scalars(
+                select(Notification).where(Notification.id.in_(ids))
+            )).all()
+            by_id = {n.id: n for n in notifications}
+            found = set(by_id)
+            ordered = [by_id[i] for i in ids if i in by_id]
+            if ordered:
+                await asyncio.wait_for(
+                    channel.send_many(ordered, db), timeout=_policy(channel, "timeout", None)
+                )
+                await db.commit()
+    except asyncio.TimeoutError:
+        error = f"timed out after {_policy(channel, 'timeout', None)}s"
+    except Exception as exc:
+        error = f"{type(exc).__name__}: {exc}"
+    if error is not None:
+        logger.warning("Notification channel %s failed for %d notification(s): %s", name, len(rows), error)
+    await _record(session_factory, channel, rows, error, found)
+    return 0 if error else len(found)
+
+
+async def _drain(session_factory, name: str) -> int:
+    """Deliver everything due for *name* within its rate limit → notifications delivered."""
+    channel = _channels.get(name)
+    if channel is None:
+        return 0
+    batch_size = max(1, _policy(channel, "batch_size", 1))
+    window = _policy(channel, "batch_window", 0)
+    timeout = _policy(channel, "timeout", None)
+    lease = max(_LEASE_SECONDS, (timeout or 0) * 2)
+    gate = asyncio.Semaphore(max(1, _policy(channel, "concurrency", 1)))
+    bucket = _buckets.setdefault(name, _TokenBucket(getattr(channel, "rate_per_minute", None)))
+
+    async def _send(batch):
+        async with gate:
+            return await _deliver(session_factory, name, channel, batch)
+
+    delivered = 0
+    while True:
+        limit = _CLAIM_LIMIT
+        allowed = bucket.available()
+        if allowed is not None:
+            limit = min(limit, allowed * batch_size)
+        if window:
+            async with session_factory() as db:
+                limit = min(limit, await _claimable(db, name, batch_size, window, datetime.utcnow()))
+        if limit <= 0:
+            return delivered
+        rows = await _claim(session_factory, name, limit, lease)
+        if not rows:
+            return delivered
+        batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+        bucket.take(len(batches))
+        delivered += sum(await asyncio.gather(*(_send(b) for b in batches)))
+        if len(rows) < limit:
+            return delivered
+
+
+async def dispatch_once(session_factory) -> Dict[str, int]:
+    """Drain every registered channel once, concurrently → ``{channel: delivered}``."""
+    names = list(_channels)
+    counts = await asyncio.gather(*(_drain(session_factory, n) for n in names))
+    return dict(zip(names, counts))
+
+
+# ---------------------------------------------------------------------------
+# Background dispatcher
+# ---------------------------------------------------------------------------
+
+async def _channel_loop(name: str) -> None:
+    flag = _wake.setdefault(name, asyncio.Event())
+    while True:
+        flag.clear()
+        try:
+            await _drain(_session_factory, name)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:  # pragma: no cover – retried next tick
+            logger.warning("Outbox dispatch for %s failed: %s", name, exc)
+        try:
+            await asyncio.wait_for(flag.wait(), timeout=_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+def _spawn(name: str) -> None:
+    _tasks[name] = asyncio.create_task(_channel_loop(name), name=f"outbox:{name}")
+
+
+def start_dispatcher(session_factory) -> None:
+    """Spawn one delivery loop per registered channel; idempotent."""
+    global _session_factory
+    _session_factory = session_factory
+    for name in _channels:
+        if name not in _tasks or _tasks[name].done():
+            _spawn(name)
+
+
+def stop_dispatcher() -> None:
+    global _session_factory
+    _session_factory = None
+    for task in _tasks.values():
+        task.cancel()
+    _tasks.clear()
+    _wake.clear()
@@ -0,0 +1,273 @@
+"""app.relations
+==============
+Related-documents engine built from cheap signals.
+
+Relations are computed once per document at ingestion (and on demand for
+documents that predate this module) and stored in ``document_relations`` as
+that document's *outgoing* rows.  Links are symmetric, so the "related
+documents" panel reads both directions (two indexed lookups) – recomputing
+one document only replaces its own rows and never drops links another
+document found.  ``documents.relations_computed_at`` records that a document
+was processed, so one without any relations is not recomputed per request.
+
+Signals, strongest first:
+
+• ``invoice_reminder`` – a reminder (Mahnung / rappel / …) and the invoice it
+  chases: the latest same-sender invoice dated before it with a matching
+  amount.
+• ``recurring``        – same sender, amount within 10 %, dates a whole
+  number of billing periods apart (1, 2, 3, 6 or 12 months ± a week).
+• ``similar``          – embedding kNN (pgvector or the local index).
+• ``same_sender``      – remaining documents from the same sender, scored
+  higher when the amount matches.
+
+The LLM is only used, optionally, to re-rank the top few results.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select, union_all, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.dates import parse_date as _parse_date
+from app.models import Document, DocumentRelation
+
+logger = logging.getLogger(__name__)
+
+_KNN_K = int(os.getenv("RELATIONS_KNN_K", 8))
+_MIN_SIMILARITY = float(os.getenv("RELATIONS_MIN_SIMILARITY", 0.75))
+_SENDER_CANDIDATES = int(os.getenv("RELATIONS_SENDER_CANDIDATES", 50))
+_MAX_RELATIONS = int(os.getenv("RELATIONS_MAX_PER_DOCUMENT", 20))
+_RERANK_TOP = int(os.getenv("RELATIONS_RERANK_TOP", 5))
+
+_REMINDER_RE = re.compile(
+    r"\b(reminder|mahnung|zahlungserinnerung|rappel|sollecito|payment overdue|überfällig)\b", re.I
+)
+_INVOICE_RE = re.compile(r"\b(invoice|rechnung|facture|fattura|bill)\b", re.I)
+
+_PERIOD_MONTHS = (1, 2, 3, 6, 12)
+
+# Scores per relation type – kNN similarity is used as-is for "similar"
+_SCORES = {
+    "invoice_reminder": 0.95,
+    "recurring": 0.8,
+    "same_sender_amount": 0.6,
+    "same_sender": 0.3,
+}
+
+
+def _is_reminder(row) -> bool:
+    return (row.document_type or "").lower() == "reminder" or bool(_REMINDER_RE.search(row.title or ""))
+
+
+def _is_invoice(row) -> bool:
+    return (row.document_type or "").lower() == "invoice" or bool(_INVOICE_RE.search(row.title or ""))
+
+
+def _amount_close(a: Optional[float], b: Optional[float], tolerance: float) -> bool:
+    if a is None or b is None:
+        return False
+    if a == b:
+        return True
+    return abs(a - b) <= tolerance * max(abs(a), abs(b))
+
+
+def _is_recurring(d1: Optional[date], d2: Optional[date]) -> bool:
+    if d1 is None or d2 is None or d1 == d2:
+        return False
+    early, late = sorted((d1, d2))
+    months = (late.year - early.year) * 12 + (late.month - early.month)
+    for period in _PERIOD_MONTHS:
+        if months in (period - 1, period, period + 1) and months > 0:
+            # Compare against the same day *period* months later (clamped to month length)
+            y, m = divmod(early.month - 1 + period, 12)
+            try:
+                target = early.replace(year=early.year + y, month=m + 1)
+            except ValueError:  # 31st → shorter month
+                target = early.replace(year=early.year + y, month=m + 1, day=28)
+            if abs((late - target).days) <= 7:
+                return True
+    return False
+
+
+def _chased_invoices(rows) -> Dict[int, int]:
+    """Map reminder id → the invoice it most likely chases.
+
+    That is the latest invoice from the pool dated on/before the reminder
+    whose amount matches (reminders may add a fee – up to +20 %).
+    """
+    invoices = [r for r in rows if _is_invoice(r) and not _is_reminder(r)]
+    chased: Dict[int, int] = {}
+    for reminder in (r for r in rows if _is_reminder(r)):
+        d_rem = _parse_date(reminder.document_date)
+        best = None
+        for inv in invoices:
+            d_inv = _parse_date(inv.document_date)
+            if d_rem and d_inv and d_inv > d_rem:
+                continue
+            if reminder.amount is not None and inv.amount is not None and not _amount_close(
+                reminder.amount, inv.amount, 0.2
+            ):
+                continue
+            if best is None or (d_inv or date.min) > (_parse_date(best.document_date) or date.min):
+                best = inv
+        if best is not None:
+            chased[reminder.id] = best.id
+    return chased
+
+
+def _pair_relation(doc, other, chased: Dict[int, int]) -> Tuple[str, float]:
+    """Classify a same-sender pair → (relation_type, score)."""
+    if chased.get(doc.id) == other.id or chased.get(other.id) == doc.id:
+        return "invoice_reminder", _SCORES["invoice_reminder"]
+
+    d_doc, d_other = _parse_date(doc.document_date), _parse_date(other.document_date)
+    if _amount_close(doc.amount, other.amount, 0.1) and _is_recurring(d_doc, d_other):
+        return "recurring", _SCORES["recurring"]
+    if doc.amount is not None and doc.amount == other.amount:
+        return "same_sender", _SCORES["same_sender_amount"]
+    return "same_sender", _SCORES["same_sender"]
+
+
+_ROW_COLUMNS = (
+    Document.id,
+    Document.title,
+    Document.sender,
+    Document.document_type,
+    Document.document_date,
+    Document.amount,
+    Document.embedding,
+)
+
+
+async def compute_relations(session: AsyncSession, document_id: int) -> int:
+    """(Re)compute and store the relations of *document_id* → number of pairs stored."""
+    from app.local_vector_index import parse_embedding
+    from app.search import SearchService
+
+    doc = (await session.execute(select(*_ROW_COLUMNS).where(Document.id == document_id))).first()
+    if doc is None:
+        return 0
+
+    found: Dict[Tuple[int, str], float] = {}
+
+    # 1) Embedding kNN ---------------------------------------------------
+    embedding = parse_embedding(doc.embedding)
+    if embedding is not None:
+        try:
+            hits = await SearchService(session)._vector_candidates(embedding.tolist(), _KNN_K + 1)
+            for other_id, similarity in hits:
+                if other_id != document_id and similarity >= _MIN_SIMILARITY:
+                    found[(other_id, "similar")] = round(float(similarity), 4)
+        except Exception as exc:  # vector backends are optional
+            logger.debug("kNN relations skipped for %s: %s", document_id, exc)
+
+    # 2) Same sender: reminders, recurring bills, plain same-sender ------
+    if doc.sender:
+        others = (await session.execute(
+            select(*_ROW_COLUMNS[:-1])
+            .where(func.lower(Document.sender) == doc.sender.lower(), Document.id != document_id)
+            .order_by(Document.id.desc())
+            .limit(_SENDER_CANDIDATES)
+        )).all()
+        chased = _chased_invoices([doc, *others])
+        for other in others:
+            relation_type, score = _pair_relation(doc, other, chased)
+            found[(other.id, relation_type)] = score
+
+    # Keep the strongest links only
+    best = sorted(found.items(), key=lambda kv: -kv[1])[:_MAX_RELATIONS]
+
+    await session.execute(delete(DocumentRelation).where(DocumentRelation.document_id == document_id))
+    session.add_all(
+        DocumentRelation(document_id=document_id, related_id=other_id, relation_type=relation_type, score=score)
+        for (other_id, relation_type), score in best
+    )
+    # Core UPDATE: not a content change, so updated_at (export/feed watermarks) stays
+    await session.execute(
+        update(Document)
+        .where(Document.id == document_id)
+        .values(relations_computed_at=datetime.utcnow(), updated_at=Document.updated_at)
+    )
+    await session.flush()
+    return len(best)
+
+
+async def is_computed(session: AsyncSession, document_id: int) -> bool:
+    """True once :func:`compute_relations` ran for *document_id* (even if it found nothing)."""
+    computed = await session.scalar(select(Document.relations_computed_at).where(Document.id == document_id))
+    return computed is not None
+
+
+async def related_for(session: AsyncSession, document_id: int, limit: int = 5) -> List[Dict[str, Any]]:
+    """Stored relations of *document_id* (either direction) → ``[{id, score, relationship_types}]`` best first."""
+    outgoing = select(
+        DocumentRelation.related_id.label("other_id"), DocumentRelation.relation_type, DocumentRelation.score
+    ).where(DocumentRelation.document_id == document_id)
+    incoming = select(
+        DocumentRelation.document_id.label("other_id"), DocumentRelation.relation_type, DocumentRelation.score
+    ).where(DocumentRelation.related_id == document_id)
+    both = union_all(outgoing, incoming).subquery()
+    rows = (await session.execute(
+        select(both.c.other_id, both.c.relation_type, both.c.score).order_by(both.c.score.desc())
+    )).all()
+
+    merged: Dict[int, Dict[str, Any]] = {}
+    for related_id, relation_type, score in rows:
+        entry = merged.setdefault(related_id, {"id": related_id, "score": score, "relationship_types": []})
+        if relation_type not in entry["relationship_types"]:
+            entry["relationship_types"].append(relation_type)
+        entry["score"] = max(entry["score"], score)
+    return sorted(merged.values(), key=lambda e: -e["score"])[:limit]
+
+
+async def rerank_with_llm(llm_processor, source: Dict[str, Any], items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Let the LLM reorder the top ``RELATIONS_RERANK_TOP`` items; the tail keeps its order."""
+    head, tail = items[:_RERANK_TOP], items[_RERANK_TOP:]
+    if len(head) < 2:
+        return items
+
+    def _brief(d):
+        return {k: d.get(k) for k in ("id", "title", "sender", "document_type", "document_date", "amount")}
+
+    prompt = (
+        "Order these candidate documents by how related they are to the source document. "
+        "Return only a JSON array of ids, most related first.\n\n"
+        f"Source: {json.dumps(_brief(source))}\n"
+        f"Candidates: {json.dumps([_brief(d) for d in head])}"
+    )
+    try:
+        response = await llm_processor._query_llm(prompt)
+        cleaned = re.sub(r"^```(?:json)?\s*|\s*```$", "", (response or "").strip())
+        order = [int(i) for i in json.loads(cleaned)]
+    except Exception as exc:
+        logger.info("Related-documents re-rank skipped: %s", exc)
+        return items
+
+    position = {doc_id: n for n, doc_id in enumerate(order)}
+    head.sort(key=lambda d: position.get(d["id"], len(order)))
+    return head + tail
+
+
+async def rebuild_all(session: AsyncSession, batch_size: int = 200) -> int:
+    """Compute relations for every document (backfill) → documents processed."""
+    processed = 0
+    last_id = 0
+    while True:
+        ids = (await session.execute(
+            select(Document.id).where(Document.id > last_id).order_by(Document.id).limit(batch_size)
+        )).scalars().all()
+        if not ids:
+            break
+        for doc_id in ids:
+            await compute_relations(session, doc_id)
+        await session.commit()
+        processed += len(ids)
+        last_id = ids[-1]
+    return processed
@@ -0,0 +1,208 @@
+"""app.renditions
+==============
+Small WebP renditions of document pages for cards, lists and previews.
+
+Two kinds per page – ``thumbnail`` (≤ 256 px) and ``preview`` (≤ 1200 px).
+Files are content-addressed by the document's SHA-256, so identical
+uploads share them and a rendition never goes stale:
+
+    <cache>/<sha[:2]>/<sha>/<page>-<kind>.webp
+
+Ingestion calls ``generate`` with the page rasters it already produced for
+ColPali (when vision is on) and otherwise rasterises with PyMuPDF at a low
+resolution – only the first ``RENDITION_PAGES`` pages, the rest are rendered
+on first request.  The cache is bounded by ``RENDITION_CACHE_MAX_MB``: once
+that much has been written since the last sweep, the least-recently-served
+files (mtime is bumped on every hit) are removed down to 90 %.
+"""
+from __future__ import annotations
+
+import asyncio
+import io
+import logging
+import os
+import threading
+import uuid
+from typing import Iterable, List, Optional
+
+from PIL import Image
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+KINDS = {
+    "thumbnail": (256, 70),  # max edge px, WebP quality
+    "preview": (1200, 80),
+}
+_IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".tiff", ".tif"}
+_PAGES = int(os.getenv("RENDITION_PAGES", 10))
+_MAX_BYTES = int(os.getenv("RENDITION_CACHE_MAX_MB", 512)) * 1024 * 1024
+
+_lock = threading.Lock()
+_written_since_sweep = 0
+
+
+def cache_dir() -> str:
+    """``documents.renditions`` beside the SQLite file unless overridden."""
+    return os.getenv(
+        "RENDITION_CACHE_DIR",
+        os.path.splitext(settings.DATABASE_PATH)[0] + ".renditions",
+    )
+
+
+def rendition_path(digest: str, page: int, kind: str) -> str:
+    """Cache location for 0-based *page* of the document with SHA-256 *digest*."""
+    return os.path.join(cache_dir(), digest[:2], digest, f"{page}-{kind}.webp")
+
+
+# ---------------------------------------------------------------------------
+# Rendering (blocking – call through asyncio.to_thread)
+# ---------------------------------------------------------------------------
+
+def _encode(image: Image.Image, kind: str) -> bytes:
+    edge, quality = KINDS[kind]
+    img = image.copy()
+    img.thumbnail((edge, edge), Image.LANCZOS)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, format="WEBP", quality=quality, method=4)
+    return buf.getvalue()
+
+
+def _store(path: str, data: bytes) -> None:
+    global _written_since_sweep
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+    with _lock:
+        _written_since_sweep += len(data)
+        sweep_due = _written_since_sweep > _MAX_BYTES // 10
+        if sweep_due:
+            _written_since_sweep = 0
+    if sweep_due:
+        evict()
+
+
+def _store_page(digest: str, page: int, image: Image.Image) -> None:
+    for kind in KINDS:
+        path = rendition_path(digest, page, kind)
+        if not os.path.exists(path):
+            _store(path, _encode(image, kind))
+
+
+def _rasterise(file_path: str, pages: Iterable[int]) -> List[tuple]:
+    """``[(page, PIL image)]`` for the requested 0-based *pages* that exist."""
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in _IMAGE_EXTENSIONS:
+        with Image.open(file_path) as img:
+            img.load()
+            return [(0, img.copy())] if 0 in set(pages) else []
+    if ext != ".pdf":
+        return []
+
+    import fitz  # PyMuPDF – same rasteriser the OCR path uses
+
+    out = []
+    edge = max(e for e, _ in KINDS.values())
+    with fitz.open(file_path) as doc:
+        for page in pages:
+            if not 0 <= page < doc.page_count:
+                continue
+            p = doc.load_page(page)
+            # Render just large enough for the biggest rendition
+            zoom = min(edge / max(p.rect.width, p.rect.height, 1), 4.0)
+            pix = p.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            out.append((page, Image.frombytes("RGB", (pix.width, pix.height), pix.samples)))
+    return out
+
+
+def _generate_sync(file_path: str, digest: str, images: Optional[List[Image.Image]]) -> int:
+    if images:
+        pages = list(enumerate(images[:_PAGES]))
+    else:
+        pages = _rasterise(file_path, range(_PAGES))
+    for page, image in pages:
+        _store_page(digest, page, image)
+    return len(pages)
+
+
+async def generate(file_path: str, digest: str, images: Optional[List[Image.Image]] = None) -> int:
+    """Write renditions for the first pages of a document → pages rendered.
+
+    *images* are page rasters already in memory (ColPali); when absent the
+    file is rasterised here.
+    """
+    if not digest:
+        return 0
+    return await asyncio.to_thread(_generate_sync, file_path, digest, images)
+
+
+def _get_sync(file_path: str, digest: str, page: int, kind: str) -> Optional[str]:
+    path = rendition_path(digest, page, kind)
+    try:
+        os.utime(path)  # LRU bookkeeping for eviction
+        return path
+    except FileNotFoundError:
+        pass
+    for index, image in _rasterise(file_path, [page]):
+        _store_page(digest, index, image)
+        return path
+    return None
+
+
+async def get(file_path: str, digest: str, page: int, kind: str = "thumbnail") -> Optional[str]:
+    """Path of the rendition for 0-based *page*, rendering it if missing.
+
+    ``None`` when the page does not exist or the type cannot be rendered.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown rendition kind: {kind}")
+    return await asyncio.to_thread(_get_sync, file_path, digest, page, kind)
+
+
+# ---------------------------------------------------------------------------
+# Eviction
+# ---------------------------------------------------------------------------
+
+def evict(max_bytes: Optional[int] = None) -> int:
+    """Remove least-recently-used renditions until the cache is ≤ 90 % of *max_bytes*.
+
+    Returns the number of files removed.
+    """
+    limit = _MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    total = 0
+    for root, _, names in os.walk(cache_dir()):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+    if total <= limit:
+        return 0
+
+    removed = 0
+    target = int(limit * 0.9)
+    for _, size, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        total -= size
+        removed += 1
+        parent = os.path.dirname(path)
+        try:
+            os.rmdir(parent)  # only succeeds once the document folder is empty
+        except OSError:
+            pass
+    logger.info("Rendition cache: evicted %d file(s), %.1f MB left", removed, total / 1024 / 1024)
+    return removed
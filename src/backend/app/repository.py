@@ -3,15 +3,48 @@ Document repository for data access operations.
 """
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
-from sqlalchemy import or_, and_, delete as sqla_delete
+from sqlalchemy.orm import selectinload, undefer_group
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy import or_, and_, tuple_, delete as sqla_delete
 from typing import List, Optional, Dict, Any, Union
-from app.models import Document, Tag, document_tag as dt, User as UserDB
+import base64
+import decimal
+import json
+from datetime import date, datetime
+from app.models import HEAVY_COLUMNS, Document, DocumentRelation, Tag, document_tag as dt, User as UserDB
+from app.dates import range_conditions
 import logging
 from sqlalchemy import select as sa_select, update as sa_update, delete as sa_delete
 
 logger = logging.getLogger(__name__)
 
+
+def _embedding_list(value) -> Optional[List[float]]:
+    """pgvector / numpy / list embedding → plain ``list[float]``."""
+    if isinstance(value, str):  # SQLite TEXT column: "[0.1, 0.2, …]"
+        value = json.loads(value)
+    return [float(x) for x in value]
+
+
+def _json_safe(out: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert datetimes, Decimals and numpy scalars in *out* in place."""
+    try:
+        import numpy as _np  # type: ignore
+        _np_generic = (_np.generic,)  # numpy scalar types
+    except Exception:  # pragma: no cover – numpy absent
+        _np_generic = tuple()
+
+    for key, value in list(out.items()):  # copy to avoid mutation while iterating
+        if isinstance(value, (datetime, date)):
+            out[key] = value.isoformat()
+        elif isinstance(value, decimal.Decimal):
+            out[key] = float(value)
+        elif _np_generic and isinstance(value, _np_generic):
+            # Convert numpy scalar (e.g., np.float32) -> python float/int
+            out[key] = value.item()
+    return out
+
+
 class DocumentRepository:
     """Repository for document data access operations."""
     
@@ -31,68 +64,199 @@ class DocumentRepository:
         await db.refresh(document)
         return document
     
-    async def get_by_id(self, db: AsyncSession, document_id: int, as_dict: bool = False) -> Optional[Union[Document, Dict[str, Any]]]:
+    async def get_by_id(
+        self, db: AsyncSession, document_id: int, as_dict: bool = False, heavy: bool = True
+    ) -> Optional[Union[Document, Dict[str, Any]]]:
         """
         Get document by ID.
         
         Args:
             db: Database session
             document_id: Document ID
+            heavy: Also load the deferred content/summary/embedding columns
             
         Returns:
             Document if found, None otherwise
         """
         stmt = select(Document).options(selectinload(Document.tags)).filter(Document.id == document_id)
+        if heavy:
+            stmt = stmt.options(undefer_group(HEAVY_COLUMNS))
         result = await db.execute(stmt)
         doc = result.scalars().first()
         return self._to_dict(doc) if as_dict and doc else doc
     
+    # Columns left out of list responses unless asked for via ``fields`` –
+    # the OCR text and the 1536-float embedding dominate the payload.
+    HEAVY_FIELDS = frozenset({"content", "embedding"})
+
+    @classmethod
+    def list_fields(cls, fields: Optional[str] = None) -> List[str]:
+        """Resolve a ``fields=a,b,c`` query value to column names (+ ``tags``).
+
+        Raises ``ValueError`` on unknown names.
+        """
+        available = [c.name for c in Document.__table__.columns] + ["tags"]
+        if not fields:
+            return [f for f in available if f not in cls.HEAVY_FIELDS]
+        requested = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = sorted(set(requested) - set(available))
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+        return list(dict.fromkeys(requested))
+
+    @staticmethod
+    def encode_cursor(created_at, document_id: int) -> str:
+        raw = json.dumps([created_at.isoformat() if created_at else None, document_id])
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: str):
+        """Cursor → ``(created_at, id)``; raises ``ValueError`` when malformed."""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            created_at, document_id = json.loads(raw)
+            return (datetime.fromisoformat(created_at) if created_at else None), int(document_id)
+        except Exception as exc:
+            raise ValueError("Invalid cursor") from exc
+
+    @staticmethod
+    def _list_filters(
+        status: Optional[str] = None,
+        document_type: Optional[str] = None,
+        search: Optional[str] = None,
+        entity_id: Optional[int] = None,
+        sender: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        amount_min: Optional[float] = None,
+        amount_max: Optional[float] = None,
+    ) -> list:
+        filters = []
+        if status:
+            filters.append(Document.status == status)
+        if document_type:
+            filters.append(Document.document_type == document_type)
+        if entity_id is not None:
+            filters.append(Document.entity_id == entity_id)
+        if sender:
+            filters.append(Document.sender.ilike(f"%{sender}%"))
+        filters.extend(range_conditions(Document.document_on, Document.document_date, date_from, date_to))
+        if amount_min is not None:
+            filters.append(Document.amount >= amount_min)
+        if amount_max is not None:
+            filters.append(Document.amount <= amount_max)
+        if search:
+            # Inverted index (tsvector / FTS5) when available, ILIKE otherwise
+            from app.fulltext import match_clause
+            filters.append(match_clause(search))
+        return filters
+
+    async def _tag_names(self, db: AsyncSession, document_ids: List[int]) -> Dict[int, List[str]]:
+        """Tag names for many documents in one query."""
+        out: Dict[int, List[str]] = {doc_id: [] for doc_id in document_ids}
+        if not document_ids:
+            return out
+        rows = await db.execute(
+            sa_select(dt.c.document_id, Tag.name)
+            .join(Tag, Tag.id == dt.c.tag_id)
+            .where(dt.c.document_id.in_(document_ids))
+            .order_by(Tag.name)
+        )
+        for doc_id, name in rows:
+            out[doc_id].append(name)
+        return out
+
     async def get_all(
         self, 
         db: AsyncSession, 
         status: Optional[str] = None,
         document_type: Optional[str] = None,
-        search: Optional[str] = None
-    ) -> List[Union[Document, Dict[str, Any]]]:
+        search: Optional[str] = None,
+        *,
+        fields: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        **filters: Any,
+    ) -> List[Dict[str, Any]]:
         """
-        Get all documents with optional filtering.
+        Get documents as plain dicts, newest first, with optional filtering.
         
         Args:
             db: Database session
             status: Filter by status
             document_type: Filter by document type
-            search: Search term for title or content
+            search: Search term for title, sender or content
+            fields: Columns to return (see ``list_fields``); default omits
+                ``content`` and ``embedding``
+            limit: Page size; ``None`` returns every match
+            cursor: Opaque cursor from ``get_page`` to continue after
+            **filters: ``entity_id``, ``sender``, ``date_from``, ``date_to``,
+                ``amount_min``, ``amount_max``
             
         Returns:
             List of documents
         """
-        query = select(Document).options(selectinload(Document.tags))
-        
-        # Apply filters
-        filters = []
-        if status:
-            filters.append(Document.status == status)
-        if document_type:
-            filters.append(Document.document_type == document_type)
-        if search:
-            filters.append(
-                or_(
-                    Document.title.ilike(f"%{search}%"),
-                    Document.content.ilike(f"%{search}%"),
-                    Document.sender.ilike(f"%{search}%")
-                )
+        items, _ = await self.get_page(
+            db, status=status, document_type=document_type, search=search,
+            fields=fields, limit=limit, cursor=cursor, **filters,
+        )
+        return items
+
+    async def get_page(
+        self,
+        db: AsyncSession,
+        *,
+        fields: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        **filters: Any,
+    ):
+        """
+        Keyset-paginated document list ordered by ``(created_at, id)`` descending.
+
+        Only the requested columns are selected, so the list never loads OCR
+        text or embeddings unless asked to.  The cursor encodes the last row's
+        ``(created_at, id)``; the next page starts strictly after it, which
+        stays O(page) however deep the client scrolls.
+
+        Returns:
+            ``(items, next_cursor)`` – ``next_cursor`` is ``None`` on the last page.
+            Items hold native values; encode with ``app.responses.dumps``.
+        """
+        fields = fields or self.list_fields()
+        columns = [c for c in fields if c != "tags"]
+        # id/created_at are always needed for the cursor, even if not returned
+        selected = list(dict.fromkeys(["id", "created_at", *columns]))
+        table = Document.__table__
+
+        query = sa_select(*(table.c[name] for name in selected))
+        conditions = self._list_filters(**filters)
+        if cursor:
+            after_created, after_id = self.decode_cursor(cursor)
+            conditions.append(
+                tuple_(Document.created_at, Document.id) < tuple_(after_created, after_id)
             )
-        
-        if filters:
-            query = query.filter(and_(*filters))
-        
-        # Order by created_at descending
-        query = query.order_by(Document.created_at.desc())
-        
-        result = await db.execute(query)
-        docs = result.scalars().all()
-        # Return plain dicts for JSON response
-        return [self._to_dict(d) for d in docs]
+        if conditions:
+            query = query.where(and_(*conditions))
+        query = query.order_by(Document.created_at.desc(), Document.id.desc())
+        if limit is not None:
+            query = query.limit(limit + 1)  # one extra row tells us whether there is a next page
+
+        rows = (await db.execute(query)).mappings().all()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self.encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+        tags = await self._tag_names(db, [r["id"] for r in rows]) if "tags" in fields else {}
+        # Values stay native (datetime, numpy) – app.responses encodes them
+        items = []
+        for row in rows:
+            out = {name: row[name] for name in columns}
+            if "tags" in fields:
+                out["tags"] = tags[row["id"]]
+            items.append(out)
+        return items, next_cursor
     
     async def update(self, db: AsyncSession, document: Document) -> Document:
         """
@@ -120,7 +284,7 @@ class DocumentRepository:
         Returns:
             True if deleted, False otherwise
         """
-        document = await self.get_by_id(db, document_id)
+        document = await self.get_by_id(db, document_id, heavy=False)
         if not document:
             return False
         
@@ -130,6 +294,12 @@ class DocumentRepository:
         await db.execute(
             sqla_delete(dt).where(dt.c.document_id == document_id)
         )
+        # Related-document links in both directions (SQLite does not enforce ON DELETE CASCADE)
+        await db.execute(
+            sqla_delete(DocumentRelation).where(
+                or_(DocumentRelation.document_id == document_id, DocumentRelation.related_id == document_id)
+            )
+        )
 
         # Now we can safely delete the document row itself.
         await db.delete(document)
@@ -147,7 +317,7 @@ class DocumentRepository:
         Returns:
             True if added, False otherwise
         """
-        document = await self.get_by_id(db, document_id)
+        document = await self.get_by_id(db, document_id, heavy=False)
         if not document:
             return False
         
@@ -180,7 +350,7 @@ class DocumentRepository:
         Returns:
             True if removed, False otherwise
         """
-        document = await self.get_by_id(db, document_id)
+        document = await self.get_by_id(db, document_id, heavy=False)
         if not document:
             return False
         
@@ -209,7 +379,7 @@ class DocumentRepository:
         Returns:
             List of tag names
         """
-        document = await self.get_by_id(db, document_id)
+        document = await self.get_by_id(db, document_id, heavy=False)
         if not document:
             return []
         
@@ -222,7 +392,8 @@ class DocumentRepository:
         """Return a JSON-serialisable representation of *doc* (no SA state).
 
         Vector columns are converted to `list[float] | None` and the SQLAlchemy
-        "_sa_instance_state" attribute is stripped.  Tags are flattened to a
+        "_sa_instance_state" attribute is stripped.  Deferred heavy columns are
+        only included when they were loaded.  Tags are flattened to a
         list of names by default so the frontend doesn't need to deal with the
         association table.
         """
@@ -230,25 +401,19 @@ class DocumentRepository:
         if doc is None:
             return {}
 
+        # Deferred columns that were not loaded are left out rather than
+        # lazy-loaded (which would fail under async anyway).
+        unloaded = sa_inspect(doc).unloaded
         out: Dict[str, Any] = {
-            col.name: getattr(doc, col.name) for col in doc.__table__.columns  # type: ignore[attr-defined]
+            col.name: getattr(doc, col.name)
+            for col in doc.__table__.columns  # type: ignore[attr-defined]
+            if col.name not in unloaded
         }
 
         # pgvector Vector -> list[float]
-        try:
-            from pgvector import Vector  # type: ignore
-            import numpy as np  # type: ignore
-            vector_types = (list, tuple, Vector, np.ndarray)
-        except ImportError:
-            try:
-                import numpy as np  # type: ignore
-                vector_types = (list, tuple, np.ndarray)
-            except ImportError:
-                vector_types = (list, tuple)
-
-        if isinstance(out.get("embedding"), vector_types):
+        if out.get("embedding") is not None and not isinstance(out["embedding"], str):
             # Convert to plain Python float list to satisfy standard json encoder
-            out["embedding"] = [float(x) for x in out["embedding"]]
+            out["embedding"] = _embedding_list(out["embedding"])
 
         # Tags – use already-loaded collection to avoid lazy IO after session close
         if include_tags:
@@ -259,26 +424,7 @@ class DocumentRepository:
                 out["tags"] = []
 
         # Convert any remaining non-JSON-serialisable primitives ------------
-
-        from datetime import datetime, date
-        try:
-            import numpy as _np  # type: ignore
-            _np_generic = (_np.generic,)  # numpy scalar types
-        except Exception:  # pragma: no cover – numpy absent
-            _np_generic = tuple()
-
-        import decimal
-
-        for key, value in list(out.items()):  # copy to avoid mutation while iterating
-            if isinstance(value, (datetime, date)):
-                out[key] = value.isoformat()
-            elif isinstance(value, decimal.Decimal):
-                out[key] = float(value)
-            elif _np_generic and isinstance(value, _np_generic):
-                # Convert numpy scalar (e.g., np.float32) -> python float/int
-                out[key] = value.item()
-
-        return out
+        return _json_safe(out)
 
 # ---------------------------------------------------------------------------
 # User repository
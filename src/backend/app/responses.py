@@ -0,0 +1,55 @@
+"""app.responses
+=============
+Fast JSON encoding for API responses.
+
+``FastJSONResponse`` renders with orjson when it is installed (it is in
+requirements.txt) and falls back to the stdlib encoder otherwise.  orjson
+serialises datetimes, numpy arrays/scalars and dataclasses natively, so
+handlers can return plain ``Row`` mappings without converting every field
+first.  It is the app's default response class; list-heavy routes return it
+directly to also skip FastAPI's ``jsonable_encoder`` pass.
+"""
+from __future__ import annotations
+
+import decimal
+import json
+from datetime import date, datetime
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover – optional speed-up
+    orjson = None
+
+_ORJSON_OPTIONS = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+
+def _default(value: Any) -> Any:
+    """Types neither encoder handles natively."""
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):  # stdlib fallback only
+        return value.isoformat()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if hasattr(value, "tolist"):  # numpy arrays / scalars, pgvector values
+        return value.tolist()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialise *content* to UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """``JSONResponse`` rendered through :func:`dumps`."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
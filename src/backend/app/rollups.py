@@ -0,0 +1,312 @@
+"""app.rollups
+===========
+Pre-aggregated document counts and amounts for the dashboard.
+
+``document_rollups`` holds one row per (tenant, month, document_type,
+status, currency) with ``doc_count`` and ``amount_sum`` (in the base
+currency, see ``app.fx``); amounts with no known rate are kept out of
+``amount_sum`` and counted in ``unconverted_count`` / ``unconverted_sum``
+(raw, in the row's currency).  Analytics reads
+sum a few hundred rollup rows instead of scanning ``documents``, so
+dashboard latency does not grow with the archive.
+
+Maintenance
+-----------
+• **Incremental** – an ``after_flush`` listener on every ORM session turns
+  inserted / updated / deleted ``Document`` objects into per-key deltas
+  (old key −1, new key +1, amounts likewise) and applies them with one
+  ``INSERT … ON CONFLICT DO UPDATE`` per touched key, inside the same
+  transaction as the document write.
+• **Reconciliation** – Core statements (bulk import placeholders, the date
+  backfill) bypass the ORM, and concurrent writers can race, so
+  :func:`reconcile` recomputes the rollups with one ``GROUP BY`` and fixes
+  any drift – every six hours as the ``rollup_reconcile`` job of
+  ``app.scheduler``, and from a background task in each process at startup
+  and whenever ``mark_stale()`` asks for an early run.  Until the first
+  reconciliation in this process, analytics fall back to live queries.
+  Bulk rewrites of the aggregated columns (``fx.reconvert``) run inside
+  :func:`held`, which does the same until they finish.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from sqlalchemy import case, delete, event, func, inspect as sa_inspect, select, update
+from sqlalchemy.orm import Session
+
+from app.dates import month_start, parse_date
+from app.fx import base_amount, unconverted
+from app.models import Document, DocumentRollup
+
+logger = logging.getLogger(__name__)
+
+_STALE_CHECK = float(os.getenv("ROLLUP_STALE_CHECK_INTERVAL", 60))
+
+# (entity_id, month, document_type, status, currency)
+RollupKey = Tuple[int, str, str, str, str]
+_KEY_ATTRS = ("entity_id", "document_on", "created_at", "document_type", "status", "currency", "amount", "amount_base")
+
+_ready = False
+_stale = False
+_held = 0
+_last_run = 0.0
+_task: Optional[asyncio.Task] = None
+
+
+def month_key(value: Any) -> str:
+    """``YYYY-MM`` for a date-ish *value*, ``""`` when there is none."""
+    d = parse_date(value)
+    return f"{d.year:04d}-{d.month:02d}" if d else ""
+
+
+def _key(values: Dict[str, Any]) -> RollupKey:
+    return (
+        values.get("entity_id") or 0,
+        month_key(values.get("document_on") or values.get("created_at")),
+        values.get("document_type") or "",
+        values.get("status") or "",
+        values.get("currency") or "",
+    )
+
+
+def _amounts(values: Dict[str, Any]) -> Tuple[float, int, float]:
+    """``(amount_sum, unconverted_count, unconverted_sum)`` contribution of one document."""
+    base, raw = values.get("amount_base"), values.get("amount")
+    if base is None and raw is not None:  # fx.unconverted()
+        return 0.0, 1, raw
+    return base or 0.0, 0, 0.0
+
+
+def is_ready() -> bool:
+    """True once this process has reconciled – rollup reads are trustworthy."""
+    return _ready and not _held
+
+
+def mark_stale() -> None:
+    """Request a reconciliation soon (after writes that bypass the ORM)."""
+    global _stale
+    _stale = True
+
+
+@contextlib.contextmanager
+def held() -> Iterator[None]:
+    """Serve live queries while the block rewrites documents behind the ORM's
+    back, then request a reconciliation."""
+    global _held
+    _held += 1
+    try:
+        yield
+    finally:
+        _held -= 1
+        mark_stale()
+
+
+# ---------------------------------------------------------------------------
+# Incremental maintenance
+# ---------------------------------------------------------------------------
+
+def _inserted_values(state) -> Dict[str, Any]:
+    # Attributes never set were inserted as NULL (none of the keys has a server default)
+    return {name: state.dict.get(name) for name in _KEY_ATTRS}
+
+
+def _current_values(state) -> Optional[Dict[str, Any]]:
+    if any(name in state.unloaded for name in _KEY_ATTRS):
+        return None
+    return {name: getattr(state.obj(), name) for name in _KEY_ATTRS}
+
+
+def _committed_values(state) -> Optional[Dict[str, Any]]:
+    """Values as of the last load/flush – the key the rollup currently counts."""
+    out = {}
+    for name in _KEY_ATTRS:
+        if name in state.unloaded:
+            return None
+        hist = state.attrs[name].history
+        if hist.deleted:
+            out[name] = hist.deleted[0]
+        elif hist.unchanged:
+            out[name] = hist.unchanged[0]
+        else:
+            out[name] = getattr(state.obj(), name)
+    return out
+
+
+def _deltas(session: Session) -> Optional[Dict[RollupKey, list]]:
+    deltas: Dict[RollupKey, list] = defaultdict(lambda: [0, 0.0, 0, 0.0])
+
+    def _add(values, sign):
+        entry = deltas[_key(values)]
+        entry[0] += sign
+        for n, value in enumerate(_amounts(values), 1):
+            entry[n] += sign * value
+
+    for obj in session.new:
+        if isinstance(obj, Document):
+            _add(_inserted_values(sa_inspect(obj)), +1)
+    for obj in session.deleted:
+        if isinstance(obj, Document):
+            values = _committed_values(sa_inspect(obj))
+            if values is None:
+                return None
+            _add(values, -1)
+    for obj in session.dirty:
+        if not isinstance(obj, Document) or not session.is_modified(obj):
+            continue
+        state = sa_inspect(obj)
+        old, new = _committed_values(state), _current_values(state)
+        if old is None or new is None:
+            return None
+        if _key(old) != _key(new) or _amounts(old) != _amounts(new):
+            _add(old, -1)
+            _add(new, +1)
+    return {k: v for k, v in deltas.items() if any(v)}
+
+
+def _upsert(dialect: str):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    stmt = insert(DocumentRollup)
+    return stmt.on_conflict_do_update(
+        index_elements=["entity_id", "month", "document_type", "status", "currency"],
+        set_={
+            "doc_count": DocumentRollup.doc_count + stmt.excluded.doc_count,
+            "amount_sum": DocumentRollup.amount_sum + stmt.excluded.amount_sum,
+            "unconverted_count": DocumentRollup.unconverted_count + stmt.excluded.unconverted_count,
+            "unconverted_sum": DocumentRollup.unconverted_sum + stmt.excluded.unconverted_sum,
+        },
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session: Session, flush_context) -> None:
+    if not any(isinstance(o, Document) for o in (*session.new, *session.dirty, *session.deleted)):
+        return
+    deltas = _deltas(session)
+    if deltas is None:  # partially loaded rows – let the reconciler sort it out
+        mark_stale()
+        return
+    if not deltas:
+        return
+    conn = session.connection()
+    stmt = _upsert(conn.dialect.name)
+    if stmt is None:
+        mark_stale()
+        return
+    conn.execute(stmt, [
+        {
+            "entity_id": key[0], "month": key[1], "document_type": key[2], "status": key[3],
+            "currency": key[4], "doc_count": count, "amount_sum": amount,
+            "unconverted_count": unconverted_count, "unconverted_sum": unconverted_sum,
+        }
+        for key, (count, amount, unconverted_count, unconverted_sum) in deltas.items()
+    ])
+
+
+# ---------------------------------------------------------------------------
+# Reconciliation
+# ---------------------------------------------------------------------------
+
+def _rounded(values) -> tuple:
+    count, amount, unconverted_count, unconverted_sum = values
+    return int(count), round(float(amount), 6), int(unconverted_count), round(float(unconverted_sum), 6)
+
+
+def _stored(row: DocumentRollup) -> tuple:
+    return _rounded((row.doc_count, row.amount_sum, row.unconverted_count, row.unconverted_sum))
+
+
+async def reconcile(session_factory) -> int:
+    """Recompute all rollups from ``documents`` and fix drift → rows changed."""
+    global _ready, _stale, _last_run
+    _stale = False
+    effective = func.coalesce(Document.document_on, func.date(Document.created_at))
+    keys = (
+        func.coalesce(Document.entity_id, 0),
+        month_start(effective),
+        func.coalesce(Document.document_type, ""),
+        func.coalesce(Document.status, ""),
+        func.coalesce(Document.currency, ""),
+    )
+    async with session_factory() as db:
+        truth: Dict[RollupKey, Tuple[int, float, int, float]] = defaultdict(lambda: (0, 0.0, 0, 0.0))
+        is_unconverted = unconverted()
+        rows = await db.execute(
+            select(
+                *keys,
+                func.count(Document.id),
+                func.coalesce(func.sum(base_amount()), 0.0),
+                func.coalesce(func.sum(case((is_unconverted, 1), else_=0)), 0),
+                func.coalesce(func.sum(case((is_unconverted, Document.amount), else_=0.0)), 0.0),
+            ).group_by(*keys)
+        )
+        for entity_id, month, doc_type, status, currency, *values in rows:
+            key = (entity_id, month_key(month), doc_type, status, currency)
+            truth[key] = tuple(prev + value for prev, value in zip(truth[key], values))
+
+        current = {
+            (r.entity_id, r.month, r.document_type, r.status, r.currency): r
+            for r in (await db.execute(select(DocumentRollup))).scalars()
+        }
+        changed = 0
+        for key, row in current.items():
+            if key not in truth:
+                await db.execute(delete(DocumentRollup).where(DocumentRollup.id == row.id))
+                changed += 1
+            elif _stored(row) != _rounded(truth[key]):
+                count, amount, unconverted_count, unconverted_sum = truth[key]
+                await db.execute(
+                    update(DocumentRollup).where(DocumentRollup.id == row.id)
+                    .values(doc_count=count, amount_sum=amount,
+                            unconverted_count=unconverted_count, unconverted_sum=unconverted_sum)
+                )
+                changed += 1
+        for key, (count, amount, unconverted_count, unconverted_sum) in truth.items():
+            if key not in current:
+                db.add(DocumentRollup(
+                    entity_id=key[0], month=key[1], document_type=key[2], status=key[3], currency=key[4],
+                    doc_count=count, amount_sum=amount,
+                    unconverted_count=unconverted_count, unconverted_sum=unconverted_sum,
+                ))
+                changed += 1
+        await db.commit()
+
+    _ready = True
+    _last_run = time.monotonic()
+    if changed:
+        logger.info("Rollups reconciled: %d row(s) corrected", changed)
+    return changed
+
+
+async def _reconcile_loop(session_factory) -> None:
+    while True:
+        if (not _ready or _stale) and not _held:
+            try:
+                await reconcile(session_factory)
+            except Exception as exc:  # pragma: no cover – retried next tick
+                logger.warning("Rollup reconciliation failed: %s", exc)
+        await asyncio.sleep(_STALE_CHECK)
+
+
+def start_reconciler(session_factory) -> None:
+    """Spawn the startup / stale-triggered reconciler (first run immediately); idempotent."""
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_reconcile_loop(session_factory), name="rollup_reconciler")
+
+
+def stop_reconciler() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
@@ -1,71 +1,581 @@
 """app.scheduler
 ================
-Background task that periodically scans invoices and creates *reminder*
-notifications three days before the due-date.
+Lightweight cron-style scheduler for periodic maintenance jobs.
 
 We skip heavyweight dependencies (Celery, APScheduler) and instead launch a
-lightweight asyncio task from `main.startup()` that sleeps until the next run.
+single asyncio task from `main.startup()` that sleeps until the next job is
+due.  Jobs are plain ``async def job(session_factory)`` coroutines registered
+with :func:`job` under a name and a five-field cron expression (UTC, e.g.
+``"15 2 * * *"``; ``@hourly`` / ``@daily`` / ``@weekly`` / ``@monthly``
+aliases work too).  ``SCHEDULE_<NAME>`` overrides a job's expression from
+the environment, ``SCHEDULE_<NAME>=off`` disables it.
+
+Several API workers run this loop at once, so each run is claimed first:
+
+• ``job_runs`` has a unique ``(job, scheduled_for)`` – the worker that
+  inserts the row for a schedule slot runs it, the others skip the slot.
+• On Postgres the run additionally holds ``pg_try_advisory_lock`` for the
+  job, so a run that outlasts its interval never overlaps the next one.
+• A random delay of up to ``jitter`` seconds spreads jobs that share a slot.
+
+The ``job_runs`` rows double as run history (status, duration, error) for
+``GET /api/scheduler/jobs``.  Jobs marked ``catch_up`` run once at startup
+when their last slot was missed while no worker was up.
 """
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import logging
-from datetime import datetime, timedelta, timezone
+import os
+import random
+import socket
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import case, delete, func, select, text, update
+from sqlalchemy.exc import IntegrityError
 
 from app.database import async_session
+from app.models import Document, DocumentTombstone, JobRun, NotificationOutbox
 from app.notifications import NotificationService
 
 logger = logging.getLogger(__name__)
 
 # How many days before due-date a reminder should fire
 DAYS_BEFORE_DUE = 3
-# At which UTC hour the daily scan runs (02:00 by default)
-SCAN_HOUR_UTC = 2
+
+_HISTORY_DAYS = int(os.getenv("SCHEDULER_HISTORY_DAYS", 30))
+# Deleted-document ids kept for incremental export consumers (app.export.deleted_since)
+_TOMBSTONE_DAYS = int(os.getenv("EXPORT_TOMBSTONE_DAYS", 90))
+_EMBEDDING_BATCH = int(os.getenv("EMBEDDING_BACKFILL_BATCH", 50))
+_WORKER = f"{socket.gethostname()}:{os.getpid()}"
 
 # Dedicated service instance for scheduler (avoids import cycle with app.main)
 _service = NotificationService()
 
 
-async def _run_once() -> None:
-    """Execute one scan cycle and create missing reminder notifications."""
-    async with async_session() as db:
-        created = await _service.check_upcoming_due_dates(
-            db, days_ahead=DAYS_BEFORE_DUE
+# ---------------------------------------------------------------------------
+# Cron expressions
+# ---------------------------------------------------------------------------
+
+_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+}
+_NAMES = {
+    3: {m: i for i, m in enumerate(
+        ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), start=1)},
+    4: {d: i for i, d in enumerate(("sun", "mon", "tue", "wed", "thu", "fri", "sat"))},
+}
+_BOUNDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+
+class CronExpr:
+    """Five-field cron expression: minute hour day-of-month month day-of-week.
+
+    Fields accept ``*``, numbers, ``a-b`` ranges, ``/step`` and comma lists;
+    months and weekdays also ``jan``–``dec`` / ``sun``–``sat``.  As in
+    classic cron, when both day fields are restricted a day matching either
+    one fires.
+    """
+
+    def __init__(self, expr: str):
+        self.expr = expr.strip()
+        fields = _ALIASES.get(self.expr.lower(), self.expr).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expr!r}")
+        parsed = [self._field(f, i) for i, f in enumerate(fields)]
+        self.minutes, self.hours, self.days, self.months, dows = parsed
+        self.weekdays = {d % 7 for d in dows}  # 7 is Sunday as well
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _field(spec: str, index: int) -> Set[int]:
+        lo, hi = _BOUNDS[index]
+        names = _NAMES.get(index, {})
+        values: Set[int] = set()
+        for part in spec.lower().split(","):
+            rng, _, step = part.partition("/")
+            if rng == "*":
+                start, end = lo, hi
+            else:
+                first, _, last = rng.partition("-")
+                start = names.get(first) if first in names else int(first)
+                end = (names.get(last) if last in names else int(last)) if last else (hi if step else start)
+            stride = int(step) if step else 1
+            if not (lo <= start <= end <= hi) or stride < 1:
+                raise ValueError(f"Invalid cron field {spec!r}")
+            values.update(range(start, end + 1, stride))
+        return values
+
+    def _day_matches(self, day: datetime) -> bool:
+        dom = day.day in self.days
+        dow = (day.weekday() + 1) % 7 in self.weekdays  # cron: Sunday = 0
+        if self._any_day and self._any_weekday:
+            return True
+        if self._any_day:
+            return dow
+        if self._any_weekday:
+            return dom
+        return dom or dow
+
+    def next_after(self, after: datetime) -> datetime:
+        """First matching minute strictly after *after* (naive UTC)."""
+        t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"Cron expression never fires: {self.expr!r}")
+
+    def __repr__(self) -> str:
+        return f"CronExpr({self.expr!r})"
+
+
+# ---------------------------------------------------------------------------
+# Job registry
+# ---------------------------------------------------------------------------
+
+JobFunc = Callable[[Any], Awaitable[Any]]
+
+
+@dataclass
+class Job:
+    name: str
+    cron: Optional[CronExpr]  # None = disabled
+    func: JobFunc
+    description: str = ""
+    jitter: float = 0
+    timeout: float = 3600
+    catch_up: bool = False
+
+
+_jobs: Dict[str, Job] = {}
+_running: Dict[str, asyncio.Task] = {}
+_task: Optional[asyncio.Task] = None
+_wake: Optional[asyncio.Event] = None
+
+
+def job(name: str, cron: str, *, jitter: float = 0, timeout: float = 3600, catch_up: bool = False):
+    """Register the decorated ``async def f(session_factory)`` as a scheduled job."""
+
+    def decorator(func: JobFunc) -> JobFunc:
+        spec = os.getenv(f"SCHEDULE_{name.upper()}", cron).strip()
+        _jobs[name] = Job(
+            name=name,
+            cron=None if spec.lower() in ("", "off", "none", "disabled") else CronExpr(spec),
+            func=func,
+            description=(func.__doc__ or "").strip().splitlines()[0] if func.__doc__ else "",
+            jitter=jitter,
+            timeout=timeout,
+            catch_up=catch_up,
+        )
+        if _wake is not None:
+            _wake.set()
+        return func
+
+    return decorator
+
+
+def jobs() -> List[Job]:
+    return list(_jobs.values())
+
+
+# ---------------------------------------------------------------------------
+# Claim → run → record
+# ---------------------------------------------------------------------------
+
+def _lock_key(name: str) -> int:
+    """Stable signed 64-bit key for ``pg_try_advisory_lock``."""
+    return int.from_bytes(hashlib.sha1(f"scheduler:{name}".encode()).digest()[:8], "big", signed=True)
+
+
+async def _claim(session_factory, name: str, slot: datetime) -> Optional[int]:
+    """Insert the ``running`` row for *slot* → run id, ``None`` when another worker has it."""
+    async with session_factory() as db:
+        run = JobRun(job=name, scheduled_for=slot, status="running", worker=_WORKER,
+                     started_at=datetime.utcnow())
+        db.add(run)
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            return None
+        return run.id
+
+
+async def _finish(session_factory, run_id: int, started: float, error: Optional[str], detail: Any) -> None:
+    async with session_factory() as db:
+        await db.execute(
+            update(JobRun).where(JobRun.id == run_id).values(
+                status="failed" if error else "ok",
+                finished_at=datetime.utcnow(),
+                duration_ms=round((time.perf_counter() - started) * 1000, 1),
+                error=error[:2000] if error else None,
+                detail=None if detail is None else str(detail)[:500],
+            )
         )
         await db.commit()
-        if created:
-            logger.info("Scheduler: created %d upcoming-due notifications", len(created))
-        else:
-            logger.debug("Scheduler: no upcoming invoices in next %d days", DAYS_BEFORE_DUE)
 
 
-async def scheduler_loop() -> None:
-    """Background coroutine that runs forever with a 24-h cadence."""
+async def run_job(name: str, slot: Optional[datetime] = None, session_factory=None,
+                  jitter: bool = True) -> Optional[str]:
+    """Run *name* for *slot* (default: now) unless another worker claims it → final status.
+
+    Returns ``None`` when the run was skipped (slot taken, job locked).
+    """
+    factory = session_factory or async_session
+    spec = _jobs[name]
+    slot = slot or datetime.utcnow().replace(microsecond=0)
+    if jitter and spec.jitter:
+        await asyncio.sleep(random.uniform(0, spec.jitter))
+
+    bind = factory.kw.get("bind")
+    if bind is None or bind.dialect.name != "postgresql":
+        return await _run_claimed(factory, spec, slot)
+    # Session-level lock → pin one connection for the whole run
+    async with bind.connect() as conn:
+        locked = (await conn.execute(select(func.pg_try_advisory_lock(_lock_key(name))))).scalar()
+        await conn.commit()
+        if not locked:
+            logger.debug("Scheduler: %s is running on another worker – skipping %s", name, slot)
+            return None
+        try:
+            return await _run_claimed(factory, spec, slot)
+        finally:
+            await conn.execute(select(func.pg_advisory_unlock(_lock_key(name))))
+            await conn.commit()
+
+
+async def _run_claimed(factory, spec: Job, slot: datetime) -> Optional[str]:
+    run_id = await _claim(factory, spec.name, slot)
+    if run_id is None:
+        logger.debug("Scheduler: slot %s of %s already claimed", slot, spec.name)
+        return None
+    started = time.perf_counter()
+    error, detail = None, None
+    try:
+        detail = await asyncio.wait_for(spec.func(factory), timeout=spec.timeout)
+    except asyncio.TimeoutError:
+        error = f"timed out after {spec.timeout:.0f}s"
+    except Exception as exc:
+        error = f"{type(exc).__name__}: {exc}"
+    if error:
+        logger.warning("Scheduler: job %s failed: %s", spec.name, error)
+    else:
+        logger.info("Scheduler: job %s finished in %.1fs (%s)", spec.name, time.perf_counter() - started, detail)
+    await _finish(factory, run_id, started, error, detail)
+    return "failed" if error else "ok"
+
+
+def _spawn(name: str, slot: datetime, session_factory) -> None:
+    if name in _running and not _running[name].done():
+        logger.info("Scheduler: previous %s run still in progress – skipping %s", name, slot)
+        return
+
+    async def _guarded():
+        try:
+            await run_job(name, slot, session_factory)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:  # pragma: no cover – bookkeeping failures only
+            logger.exception("Scheduler: job %s crashed: %s", name, exc)
 
-    # Perform an immediate run on startup so the system is up-to-date even if
-    # the container starts after the scheduled time.
-    await _run_once()
+    _running[name] = asyncio.create_task(_guarded(), name=f"job:{name}")
 
+
+# ---------------------------------------------------------------------------
+# Loop
+# ---------------------------------------------------------------------------
+
+async def _missed_slots(session_factory, now: datetime) -> Dict[str, datetime]:
+    """Latest missed slot of every ``catch_up`` job (last recorded run → now)."""
+    names = [j.name for j in _jobs.values() if j.catch_up and j.cron is not None]
+    if not names:
+        return {}
+    async with session_factory() as db:
+        last = dict((await db.execute(
+            select(JobRun.job, func.max(JobRun.scheduled_for)).where(JobRun.job.in_(names)).group_by(JobRun.job)
+        )).all())
+    missed = {}
+    for name in names:
+        cron = _jobs[name].cron
+        slot = cron.next_after(last.get(name) or now - timedelta(days=1))
+        if slot <= now:
+            while (following := cron.next_after(slot)) <= now:
+                slot = following
+            missed[name] = slot
+    return missed
+
+
+async def scheduler_loop(session_factory=None) -> None:
+    """Background coroutine: start every job at its next slot, forever."""
+    global _wake
+    factory = session_factory or async_session
+    _wake = asyncio.Event()
+
+    now = datetime.utcnow()
+    try:
+        for name, slot in (await _missed_slots(factory, now)).items():
+            logger.info("Scheduler: catching up missed %s run (%s)", name, slot)
+            _spawn(name, slot, factory)
+    except Exception as exc:  # pragma: no cover – history table unavailable
+        logger.warning("Scheduler catch-up check failed: %s", exc)
+
+    upcoming: Dict[str, datetime] = {}
     while True:
-        # Calculate seconds until the next SCAN_HOUR_UTC.
-        now = datetime.now(tz=timezone.utc)
-        next_run = now.replace(hour=SCAN_HOUR_UTC, minute=0, second=0, microsecond=0)
-        if next_run <= now:
-            next_run = next_run + timedelta(days=1)
-        sleep_seconds = (next_run - now).total_seconds()
-        logger.debug("Scheduler sleeping for %.0f seconds (until %s)", sleep_seconds, next_run)
-        await asyncio.sleep(sleep_seconds)
+        now = datetime.utcnow()
+        for spec in _jobs.values():
+            if spec.cron is not None and spec.name not in upcoming:
+                upcoming[spec.name] = spec.cron.next_after(now)
+        for name, slot in sorted(upcoming.items(), key=lambda kv: kv[1]):
+            if slot <= now:
+                _spawn(name, slot, factory)
+                upcoming[name] = _jobs[name].cron.next_after(now)
+        if upcoming:
+            sleep = max(0.0, (min(upcoming.values()) - datetime.utcnow()).total_seconds())
+        else:
+            sleep = 3600.0
+        _wake.clear()
         try:
-            await _run_once()
-        except Exception as exc:  # pragma: no-cover – monitor only
-            logger.exception("Scheduler run failed: %s", exc)
+            # Wake at the slot (or a minute later to notice clock jumps) or on job registration
+            await asyncio.wait_for(_wake.wait(), timeout=min(sleep, 60.0))
+        except asyncio.TimeoutError:
+            pass
+
+
+def next_runs() -> Dict[str, Optional[datetime]]:
+    now = datetime.utcnow()
+    return {j.name: j.cron.next_after(now) if j.cron else None for j in _jobs.values()}
 
 
-def start_scheduler() -> None:
+def start_scheduler(session_factory=None) -> None:
     """Spawn the background task; safe to call multiple times."""
-    loop = asyncio.get_event_loop()
-    # Avoid multiple tasks in hot-reload scenarios
-    for t in asyncio.all_tasks(loop):
-        if t.get_coro().__name__ == "scheduler_loop":
-            return
-    loop.create_task(scheduler_loop(), name="scheduler_loop") 
\ No newline at end of file
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.create_task(scheduler_loop(session_factory), name="scheduler_loop")
+
+
+def stop_scheduler() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
+    for task in _running.values():
+        task.cancel()
+    _running.clear()
+
+
+# ---------------------------------------------------------------------------
+# Status
+# ---------------------------------------------------------------------------
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+async def status(db, window_days: int = 7) -> List[Dict[str, Any]]:
+    """Every job with its schedule, last run and duration stats over *window_days*."""
+    since = datetime.utcnow() - timedelta(days=window_days)
+    stats = {
+        row.job: row for row in (await db.execute(
+            select(
+                JobRun.job,
+                func.count().label("runs"),
+                func.sum(case((JobRun.status == "failed", 1), else_=0)).label("failures"),
+                func.avg(JobRun.duration_ms).label("avg_ms"),
+                func.max(JobRun.duration_ms).label("max_ms"),
+            )
+            .where(JobRun.started_at >= since)
+            .group_by(JobRun.job)
+        )).all()
+    }
+    latest = select(func.max(JobRun.id)).group_by(JobRun.job)
+    last = {run.job: run for run in (await db.scalars(select(JobRun).where(JobRun.id.in_(latest))))}
+    upcoming = next_runs()
+
+    out = []
+    for spec in _jobs.values():
+        run, agg = last.get(spec.name), stats.get(spec.name)
+        out.append({
+            "name": spec.name,
+            "description": spec.description,
+            "cron": spec.cron.expr if spec.cron else None,
+            "enabled": spec.cron is not None,
+            "next_run": _iso(upcoming.get(spec.name)),
+            "running_here": spec.name in _running and not _running[spec.name].done(),
+            "last_run": {
+                "status": run.status,
+                "scheduled_for": _iso(run.scheduled_for),
+                "started_at": _iso(run.started_at),
+                "finished_at": _iso(run.finished_at),
+                "duration_ms": run.duration_ms,
+                "worker": run.worker,
+                "detail": run.detail,
+                "error": run.error,
+            } if run else None,
+            "stats": {
+                "window_days": window_days,
+                "runs": agg.runs if agg else 0,
+                "failures": int(agg.failures or 0) if agg else 0,
+                "avg_ms": round(agg.avg_ms, 1) if agg and agg.avg_ms is not None else None,
+                "max_ms": agg.max_ms if agg else None,
+            },
+        })
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Built-in jobs
+# ---------------------------------------------------------------------------
+
+@job("upcoming_due_reminders", "0 2 * * *", catch_up=True)
+async def _upcoming_due_reminders(session_factory) -> int:
+    """Create reminder notifications for invoices due within DAYS_BEFORE_DUE days."""
+    async with session_factory() as db:
+        created = await _service.check_upcoming_due_dates(db, days_ahead=DAYS_BEFORE_DUE)
+        await db.commit()
+    return len(created)
+
+
+@job("overdue_scan", "15 2 * * *", catch_up=True)
+async def _overdue_scan(session_factory) -> int:
+    """Create overdue notifications for unpaid documents past their due date."""
+    async with session_factory() as db:
+        created = await _service.check_overdue_documents(db)
+        await db.commit()
+    return len(created)
+
+
+@job("rollup_reconcile", "0 */6 * * *", jitter=60)
+async def _rollup_reconcile(session_factory) -> int:
+    """Recompute the dashboard rollups and fix drift."""
+    from app import rollups
+
+    return await rollups.reconcile(session_factory)
+
+
+@job("vendor_link", "30 * * * *", jitter=60)
+async def _vendor_link(session_factory) -> int:
+    """Link documents written without the ORM to their vendor."""
+    from app import vendors
+
+    return await vendors.link_documents(session_factory)
+
+
+@job("embedding_backfill", "*/15 * * * *", jitter=30, timeout=900)
+async def _embedding_backfill(session_factory) -> int:
+    """Embed processed documents that have text but no embedding yet."""
+    from app import local_vector_index
+    from app.embeddings import get_embedding
+
+    # Keyset-paged on id: rows skipped as blank are passed, not re-selected forever
+    after_id, done = 0, 0
+    while done < _EMBEDDING_BATCH:
+        async with session_factory() as db:
+            rows = (await db.execute(
+                select(Document.id, Document.content)
+                .where(
+                    Document.id > after_id,
+                    Document.embedding.is_(None),
+                    Document.content.isnot(None),
+                    func.trim(Document.content) != "",
+                    Document.status == "processed",
+                )
+                .order_by(Document.id)
+                .limit(_EMBEDDING_BATCH)
+            )).all()
+        if not rows:
+            break
+        after_id = rows[-1][0]
+        for doc_id, content in rows:
+            if done >= _EMBEDDING_BATCH:
+                break
+            if not content.strip():  # e.g. only newlines – TRIM() strips spaces only
+                continue
+            emb = await get_embedding(content[:2048])
+            async with session_factory() as db:
+                await db.execute(update(Document).where(Document.id == doc_id).values(embedding=emb))
+                await db.commit()
+            if local_vector_index.is_active():
+                await asyncio.to_thread(local_vector_index.get_index().add, doc_id, emb)
+            done += 1
+    if done and local_vector_index.is_active():
+        await asyncio.to_thread(local_vector_index.get_index().flush, False)
+    return done
+
+
+@job("rendition_eviction", "45 * * * *", jitter=60)
+async def _rendition_eviction(session_factory) -> int:
+    """Trim the thumbnail/preview disk cache to its size budget."""
+    from app import renditions
+
+    return await asyncio.to_thread(renditions.evict)
+
+
+@job("housekeeping", "30 3 * * *", jitter=300)
+async def _housekeeping(session_factory) -> Dict[str, int]:
+    """Prune delivered outbox rows, old run history and tombstones; close abandoned runs."""
+    now = datetime.utcnow()
+    cutoff = now - timedelta(days=_HISTORY_DAYS)
+    async with session_factory() as db:
+        outbox = (await db.execute(
+            delete(NotificationOutbox).where(NotificationOutbox.status == "sent", NotificationOutbox.sent_at < cutoff)
+        )).rowcount or 0
+        history = (await db.execute(delete(JobRun).where(JobRun.started_at < cutoff))).rowcount or 0
+        tombstones = (await db.execute(
+            delete(DocumentTombstone).where(DocumentTombstone.deleted_at < now - timedelta(days=_TOMBSTONE_DAYS))
+        )).rowcount or 0
+        # A run still "running" long past every timeout belongs to a dead worker
+        longest = max((j.timeout for j in _jobs.values()), default=3600)
+        abandoned = (await db.execute(
+            update(JobRun)
+            .where(JobRun.status == "running", JobRun.started_at < now - timedelta(seconds=2 * longest))
+            .values(status="abandoned", finished_at=now)
+        )).rowcount or 0
+        await db.commit()
+    return {"outbox": outbox, "history": history, "tombstones": tombstones, "abandoned": abandoned}
+
+
+@job("index_maintenance", "0 4 * * *", jitter=300)
+async def _index_maintenance(session_factory) -> str:
+    """Refresh planner statistics and merge the full-text index segments."""
+    async with session_factory() as db:
+        dialect = (await db.connection()).dialect.name
+        if dialect == "sqlite":
+            await db.execute(text("PRAGMA optimize"))
+            await db.execute(text("ANALYZE"))
+            fts = (await db.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='documents_fts'"
+            ))).first()
+            if fts:
+                await db.execute(text("INSERT INTO documents_fts(documents_fts) VALUES ('optimize')"))
+        else:
+            await db.execute(text("ANALYZE"))
+        await db.commit()
+    return dialect
+
+
+@job("vacuum", "0 5 * * 0", jitter=300, timeout=4 * 3600)
+async def _vacuum(session_factory) -> str:
+    """Reclaim free pages (weekly)."""
+    async with session_factory() as db:
+        conn = await db.connection(execution_options={"isolation_level": "AUTOCOMMIT"})
+        dialect = conn.dialect.name
+        await conn.exec_driver_sql("VACUUM" if dialect == "sqlite" else "VACUUM (ANALYZE)")
+    return dialect
@@ -1,14 +1,21 @@
 """
 LLM-powered search functionality for the Document Management System.
 """
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
-from sqlalchemy.orm import Session
-from app.models import Document
-from app.llm import LLMProcessor
+import os
 import re
 import json
-from sqlalchemy.sql import text
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+from sqlalchemy import extract, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import TTLCache
+from app.dates import range_conditions
+from app.models import Document
+from app.llm import LLMProcessor
+from app import fulltext
 
 # Configure logging
 logging.basicConfig(
@@ -17,91 +24,266 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Parsed natural-language queries: normalised query -> filters dict.  Identical
+# questions ("unpaid swisscom invoices 2024") skip the LLM round-trip.
+_intent_cache: TTLCache[Dict[str, Any]] = TTLCache(
+    maxsize=int(os.getenv("SEARCH_INTENT_CACHE_SIZE", 512)),
+    ttl=float(os.getenv("SEARCH_INTENT_CACHE_TTL", 3600)),
+)
+
+# Local vector index with filters: fetch this many times *limit* per round
+_FILTER_OVERFETCH = int(os.getenv("SEARCH_FILTER_OVERFETCH", 4))
+
+# Columns every search result needs – heavy ones (content, embedding) stay in the DB
+_RESULT_COLUMNS = (
+    Document.id,
+    Document.title,
+    Document.sender,
+    Document.document_date,
+    Document.document_type,
+    Document.status,
+    Document.amount,
+    Document.currency,
+)
+
+
+def _normalise_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query.strip().lower()).rstrip("?!. ")
+
+
+def _project(row, **extra: Any) -> Dict[str, Any]:
+    """Shape a row selected with ``_RESULT_COLUMNS`` into the API result dict."""
+    m = row._mapping
+    result = {
+        "id": m["id"],
+        "title": m["title"],
+        "sender": m["sender"],
+        "document_date": m["document_date"],
+        "document_type": m["document_type"],
+        "status": m["status"],
+        "amount": float(m["amount"]) if m["amount"] is not None else None,
+        "currency": m["currency"],
+    }
+    result.update(extra)
+    return result
+
+
 class SearchService:
     """Service for LLM-powered document search."""
-    
-    def __init__(self, db: Session):
+
+    def __init__(self, db: AsyncSession):
         """Initialize the search service with a database session."""
         self.db = db
         self.llm_processor = LLMProcessor()
-    
+
+    async def _fetch(self, ids: Iterable[int]) -> Dict[int, Any]:
+        """Load result rows for *ids* in one query → {id: row}."""
+        ids = list(ids)
+        if not ids:
+            return {}
+        rows = await self.db.execute(select(*_RESULT_COLUMNS).where(Document.id.in_(ids)))
+        return {row.id: row for row in rows}
+
+    async def _ranked(self, hits: Iterable[Tuple[int, float]], score_key: str) -> List[Dict[str, Any]]:
+        """Project ``(id, score)`` hits in order, skipping ids that no longer exist."""
+        hits = list(hits)
+        rows = await self._fetch(doc_id for doc_id, _ in hits)
+        return [
+            _project(rows[doc_id], **{score_key: round(float(score), 4)})
+            for doc_id, score in hits
+            if doc_id in rows
+        ]
+
     async def basic_search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
         """Perform a basic keyword search on documents.
-        
+
         Args:
             query: Search query
             limit: Maximum number of results to return
-            
+
         Returns:
-            List of matching documents
+            List of matching documents, best match first
         """
-        # Split query into keywords
-        keywords = query.lower().split()
-        
-        # Build filter conditions for each keyword
-        results = []
-        
-        # Search in document content, title, and sender
-        documents = self.db.query(Document).filter(
-            Document.content_text.ilike(f"%{query}%") |
-            Document.title.ilike(f"%{query}%") |
-            Document.sender.ilike(f"%{query}%")
-        ).limit(limit).all()
-        
-        # Format results
-        for doc in documents:
-            results.append({
-                "id": doc.id,
-                "title": doc.title,
-                "sender": doc.sender,
-                "document_date": doc.document_date.isoformat() if doc.document_date else None,
-                "document_type": doc.document_type,
-                "status": doc.status,
-                "relevance": "high" if query.lower() in doc.title.lower() else "medium"
-            })
-        
+        hits = await fulltext.search_ids(self.db, query, limit, prefix=True)
+        results = await self._ranked(hits, "score")
+        q = query.lower()
+        for r in results:
+            r["relevance"] = "high" if q in (r["title"] or "").lower() else "medium"
         return results
-    
+
+    async def _vector_candidates(self, embed: List[float], limit: int, conditions: Iterable = ()) -> List[tuple]:
+        """Return ``(document_id, cosine_similarity)`` nearest to *embed*, best first.
+
+        Postgres uses pgvector's ``<=>`` operator with *conditions* in the
+        same WHERE clause; databases without vector support (SQLite) use the
+        in-process index in ``app.local_vector_index``, over-fetching until
+        *limit* hits pass the *conditions* (or the index is exhausted).
+        """
+        from app import local_vector_index
+
+        conditions = list(conditions)
+        if local_vector_index.is_active():
+            index = local_vector_index.get_index()
+            if not conditions:
+                return await asyncio.to_thread(index.search, embed, limit)
+            k = limit * _FILTER_OVERFETCH
+            while True:
+                hits = await asyncio.to_thread(index.search, embed, k)
+                allowed = set((await self.db.execute(
+                    select(Document.id).where(Document.id.in_([i for i, _ in hits]), *conditions)
+                )).scalars()) if hits else set()
+                kept = [(i, s) for i, s in hits if i in allowed]
+                if len(kept) >= limit or len(hits) < k:
+                    return kept[:limit]
+                k *= _FILTER_OVERFETCH
+
+        distance = Document.embedding.cosine_distance(embed).label("distance")
+        rows = await self.db.execute(
+            select(Document.id, distance)
+            .where(Document.embedding.isnot(None), *conditions)
+            .order_by(distance)
+            .limit(limit)
+        )
+        return [(doc_id, 1 - dist) for doc_id, dist in rows.all()]
+
     async def semantic_search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Vector-based semantic search using pgvector.<- returns docs ordered by cosine distance."""
+        """Vector-based semantic search – returns docs ordered by cosine similarity."""
 
         from app.embeddings import get_embedding
         embed = await get_embedding(query)
 
-        # Use pgvector operator <-> for cosine distance
-        sql = (
-            "SELECT * , embedding <-> :emb AS distance "
-            "FROM documents WHERE embedding IS NOT NULL ORDER BY embedding <-> :emb LIMIT :lim"
+        hits = await self._vector_candidates(embed, limit)
+        return await self._ranked(hits, "relevance_score")
+
+    async def hybrid_search(
+        self,
+        query: str,
+        page: int = 1,
+        page_size: int = 20,
+        filters: Optional[Dict[str, Any]] = None,
+        semantic: bool = True,
+        prefix: bool = False,
+        candidates: int = 200,
+        embedding: Optional[List[float]] = None,
+    ) -> Dict[str, Any]:
+        """Full-text (BM25 / ts_rank) + vector search fused with reciprocal-rank fusion.
+
+        The filters (``document_type``, ``status``, ``sender``, ``entity_id``)
+        are part of both retrievers' queries, so a selective filter still
+        yields a full candidate list.  The vector side returns up to
+        *candidates* ids; the full-text side enough to fill the requested
+        page.  ``total`` and the facets are counted in SQL over every
+        filtered full-text match plus the vector candidates – not just the
+        fused window.
+
+        Returns:
+            Dict with ``total``, ``page``, ``page_size``, ``items`` and
+            ``facets`` (counts per document_type / status / sender / year).
+        """
+        filters = {k: v for k, v in (filters or {}).items() if v not in (None, "")}
+        conditions = [
+            getattr(Document, field) == filters[field]
+            for field in ("document_type", "status", "sender", "entity_id")
+            if field in filters
+        ]
+        page = max(page, 1)
+        # prefix=True matches the last term as a prefix (search-as-you-type)
+
+        async def _vector_ranking() -> List[int]:
+            if not semantic:
+                return []
+            try:
+                embed = embedding
+                if embed is None:
+                    from app.embeddings import get_embedding
+                    embed = await get_embedding(query)
+                return [i for i, _ in await self._vector_candidates(embed, candidates, conditions)]
+            except Exception as exc:  # vector side is best-effort
+                logger.warning("Hybrid search: vector retrieval failed: %s", exc)
+                return []
+
+        text_hits = await fulltext.search_ids(
+            self.db, query, max(candidates, page * page_size), prefix=prefix, conditions=conditions
         )
-        rows = self.db.execute(text(sql), {"emb": embed, "lim": limit})
-        results = []
-        for row in rows:
-            doc = row[0] if isinstance(row, tuple) else row  # depending on execution style
-            results.append({
-                "id": doc.id,
-                "title": doc.title,
-                "sender": doc.sender,
-                "document_type": doc.document_type,
-                "status": doc.status,
-                "relevance_score": 1 - row['distance'] if isinstance(row, dict) else None
-            })
-        return results
-    
+        vector_ids = await _vector_ranking()
+        fused = fulltext.rrf_fuse([[i for i, _ in text_hits], vector_ids])
+        text_rank = {doc_id: r for r, (doc_id, _) in enumerate(text_hits, start=1)}
+        vector_rank = {doc_id: r for r, doc_id in enumerate(vector_ids, start=1)}
+
+        # Total and facets over the whole filtered result set --------------
+        matches = fulltext.match_clause(query, prefix=prefix) if query.strip() else None
+        if matches is not None and vector_ids:
+            matches = or_(matches, Document.id.in_(vector_ids))
+        elif matches is None:
+            matches = Document.id.in_(vector_ids)
+        scope = [matches, *conditions]
+
+        total = (await self.db.execute(select(func.count()).select_from(Document).where(*scope))).scalar_one()
+        facets: Dict[str, Dict[str, int]] = {}
+        if total:
+            year = extract("year", Document.document_on)
+            for name, col, present in (
+                ("document_type", Document.document_type, Document.document_type),
+                ("status", Document.status, Document.status),
+                ("sender", Document.sender, Document.sender),
+                ("year", year, Document.document_on),
+            ):
+                rows = await self.db.execute(
+                    select(col, func.count())
+                    .where(*scope, present.isnot(None))
+                    .group_by(col)
+                    .order_by(func.count().desc())
+                    .limit(10)
+                )
+                facets[name] = {str(int(k)) if name == "year" else str(k): n for k, n in rows.all()}
+
+        # Page -----------------------------------------------------------
+        window = fused[(page - 1) * page_size: page * page_size]
+        rows = await self._fetch(i for i, _ in window)
+        items = [
+            _project(
+                rows[doc_id],
+                score=round(score, 6),
+                fulltext_rank=text_rank.get(doc_id),
+                vector_rank=vector_rank.get(doc_id),
+            )
+            for doc_id, score in window
+            if doc_id in rows
+        ]
+
+        return {
+            "query": query,
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "items": items,
+            "facets": facets,
+        }
+
     async def extract_search_intent(self, query: str) -> Dict[str, Any]:
         """Extract search intent from a natural language query using LLM.
-        
+
+        Successful parses are cached per normalised query (LRU + TTL, see
+        ``SEARCH_INTENT_CACHE_SIZE`` / ``SEARCH_INTENT_CACHE_TTL``); failures
+        are not, so a flaky LLM does not pin the keyword fallback.
+
         Args:
             query: Natural language search query
-            
+
         Returns:
             Dictionary with extracted search parameters
         """
+        key = _normalise_query(query)
+        cached = _intent_cache.get(key)
+        if cached is not None:
+            return dict(cached)
+
         prompt = f"""
         You are an AI assistant helping with document search. Given the following natural language search query,
         extract the search intent and parameters.
-        
+
         Search query: "{query}"
-        
+
         Return a JSON object with the following fields (include only if mentioned in the query):
         - document_type: The type of document (invoice, receipt, contract, etc.)
         - sender: The sender of the document
@@ -109,7 +291,7 @@ class SearchService:
         - amount_range: An object with "min" and "max" amounts
         - status: The document status (paid, unpaid, etc.)
         - keywords: An array of important keywords from the query
-        
+
         Example response format:
         {{
           "document_type": "invoice",
@@ -120,192 +302,127 @@ class SearchService:
           "keywords": ["urgent", "electricity"]
         }}
         """
-        
-        # Get LLM response
-        llm_response = await self.llm_processor._query_llm(prompt)
-        
+
+        try:
+            llm_response = await self.llm_processor._query_llm(prompt)
+        except Exception as exc:
+            logger.error("Search intent extraction failed: %s", exc)
+            return {"keywords": [query]}
+
         try:
-            # Parse LLM response to get search parameters
-            search_params = json.loads(llm_response)
-            return search_params
+            # Models like to wrap JSON in ```json fences – strip them first
+            cleaned = re.sub(r"^```(?:json)?\s*|\s*```$", "", (llm_response or "").strip())
+            search_params = json.loads(cleaned)
         except json.JSONDecodeError:
             logger.error("Failed to parse LLM response as JSON")
             return {"keywords": [query]}
-    
+        if not isinstance(search_params, dict):
+            return {"keywords": [query]}
+
+        _intent_cache.set(key, search_params)
+        return dict(search_params)
+
     async def advanced_search(self, params, limit: int = 20) -> List[Dict[str, Any]]:
         """Perform an advanced search using LLM to extract search intent and find relevant documents.
-        
+
         Args:
             params: Search parameters (can be a dict or a query string)
             limit: Maximum number of results to return
-            
+
         Returns:
             List of matching documents
         """
         # Determine whether params is already a dict of filters or a query string
         if isinstance(params, dict):
-            search_params = params
+            search_params = dict(params)
+            # {"query": "..."} → parse it, explicit filters in the same body win
+            if search_params.get("query"):
+                parsed = await self.extract_search_intent(str(search_params.pop("query")))
+                search_params = {**parsed, **search_params}
         else:
             # Treat params as natural-language query and extract intent
             query = str(params)
             search_params = await self.extract_search_intent(query)
-        
+
         # Build DB query based on extracted parameters
-        db_query = self.db.query(Document)
-        
-        # Apply filters based on search parameters
-        if "document_type" in search_params and search_params["document_type"]:
-            db_query = db_query.filter(Document.document_type == search_params["document_type"])
-        
-        if "sender" in search_params and search_params["sender"]:
-            db_query = db_query.filter(Document.sender.ilike(f"%{search_params['sender']}%"))
-        
-        if "status" in search_params and search_params["status"]:
-            db_query = db_query.filter(Document.status == search_params["status"])
-        
-        if "date_range" in search_params and search_params["date_range"]:
-            date_range = search_params["date_range"]
-            if "start" in date_range and date_range["start"]:
-                db_query = db_query.filter(Document.document_date >= date_range["start"])
-            if "end" in date_range and date_range["end"]:
-                db_query = db_query.filter(Document.document_date <= date_range["end"])
-        
-        if "amount_range" in search_params and search_params["amount_range"]:
-            amount_range = search_params["amount_range"]
-            if "min" in amount_range and amount_range["min"] is not None:
-                db_query = db_query.filter(Document.amount >= amount_range["min"])
-            if "max" in amount_range and amount_range["max"] is not None:
-                db_query = db_query.filter(Document.amount <= amount_range["max"])
-        
-        # Apply keyword filters if available
-        if "keywords" in search_params and search_params["keywords"]:
-            for keyword in search_params["keywords"]:
-                db_query = db_query.filter(
-                    Document.content_text.ilike(f"%{keyword}%") |
-                    Document.title.ilike(f"%{keyword}%")
-                )
-        
-        # Get DB results
-        documents = db_query.limit(limit).all()
-        
-        # Format results
-        results = []
-        for doc in documents:
-            results.append({
-                "id": doc.id,
-                "title": doc.title,
-                "sender": doc.sender,
-                "document_date": doc.document_date.isoformat() if doc.document_date else None,
-                "document_type": doc.document_type,
-                "status": doc.status,
-                "amount": float(doc.amount) if doc.amount else None
-            })
-        
-        return results
-    
-    async def suggest_related_documents(self, document_id: int, limit: int = 5) -> List[Dict[str, Any]]:
-        """Suggest related documents for a given document using LLM.
-        
+        conditions = []
+
+        if search_params.get("document_type"):
+            conditions.append(Document.document_type == search_params["document_type"])
+
+        if search_params.get("sender"):
+            conditions.append(Document.sender.ilike(f"%{search_params['sender']}%"))
+
+        if search_params.get("status"):
+            conditions.append(Document.status == search_params["status"])
+
+        date_range = search_params.get("date_range") or {}
+        conditions.extend(
+            range_conditions(Document.document_on, Document.document_date, date_range.get("start"), date_range.get("end"))
+        )
+
+        amount_range = search_params.get("amount_range") or {}
+        if amount_range.get("min") is not None:
+            conditions.append(Document.amount >= amount_range["min"])
+        if amount_range.get("max") is not None:
+            conditions.append(Document.amount <= amount_range["max"])
+
+        # Keyword filters go through the full-text index
+        for keyword in search_params.get("keywords") or []:
+            conditions.append(fulltext.match_clause(str(keyword)))
+
+        rows = await self.db.execute(
+            select(*_RESULT_COLUMNS)
+            .where(*conditions)
+            .order_by(Document.created_at.desc())
+            .limit(limit)
+        )
+        return [_project(row) for row in rows]
+
+    async def suggest_related_documents(
+        self, document_id: int, limit: int = 5, rerank: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Related documents from the precomputed ``document_relations`` table.
+
+        Documents ingested before relations existed are computed on first
+        request (once – ``relations_computed_at`` marks them even when
+        nothing related was found).  With *rerank* the LLM reorders the top few results only.
+
         Args:
             document_id: Document ID
             limit: Maximum number of results to return
-            
+            rerank: Ask the LLM to re-rank the strongest candidates
+
         Returns:
-            List of related documents
+            List of related documents with ``relationship_type`` (strongest
+            signal), all ``relationship_types`` and ``confidence`` (0-10)
         """
-        # Get the source document
-        source_doc = self.db.query(Document).filter(Document.id == document_id).first()
-        if not source_doc:
-            return []
-        
-        # Get potential related documents (excluding the source document)
-        potential_related = self.db.query(Document).filter(Document.id != document_id).limit(30).all()
-        if not potential_related:
+        from app import relations
+
+        related = await relations.related_for(self.db, document_id, limit)
+        if not related and not await relations.is_computed(self.db, document_id):
+            found = await relations.compute_relations(self.db, document_id)
+            await self.db.commit()  # also persists the "computed" marker when nothing was found
+            if found:
+                related = await relations.related_for(self.db, document_id, limit)
+        if not related:
             return []
-        
-        # Prepare data for LLM
-        source_data = {
-            "id": source_doc.id,
-            "title": source_doc.title,
-            "sender": source_doc.sender,
-            "content_preview": source_doc.content_text[:500] + "..." if source_doc.content_text and len(source_doc.content_text) > 500 else source_doc.content_text,
-            "document_type": source_doc.document_type,
-            "document_date": source_doc.document_date.isoformat() if source_doc.document_date else None
-        }
-        
-        potential_data = []
-        for doc in potential_related:
-            potential_data.append({
-                "id": doc.id,
-                "title": doc.title,
-                "sender": doc.sender,
-                "content_preview": doc.content_text[:200] + "..." if doc.content_text and len(doc.content_text) > 200 else doc.content_text,
-                "document_type": doc.document_type,
-                "document_date": doc.document_date.isoformat() if doc.document_date else None
-            })
-        
-        # Create prompt for LLM
-        prompt = f"""
-        You are an AI assistant helping to find related documents. Given a source document and a list of potential related documents,
-        identify which documents are most likely related to the source document and explain the relationship.
-        
-        Source document:
-        {json.dumps(source_data, indent=2)}
-        
-        Potential related documents:
-        {json.dumps(potential_data, indent=2)}
-        
-        Return a JSON array of objects with document IDs, relationship types, and confidence scores (0-10).
-        Each object should have "id", "relationship_type", and "confidence" fields.
-        Only include documents with a confidence score of 5 or higher, sorted by confidence (highest first).
-        
-        Relationship types can be:
-        - "same_sender": Documents from the same sender
-        - "invoice_payment": An invoice and its payment
-        - "invoice_reminder": An invoice and its reminder
-        - "related_subject": Documents with related subject matter
-        - "time_sequence": Documents that are part of a time sequence
-        
-        Example response format:
-        [
-          {{"id": 5, "relationship_type": "invoice_payment", "confidence": 9}},
-          {{"id": 2, "relationship_type": "same_sender", "confidence": 7}},
-          {{"id": 10, "relationship_type": "related_subject", "confidence": 6}}
+
+        rows = await self._fetch([document_id] + [r["id"] for r in related])
+        results = [
+            _project(
+                rows[r["id"]],
+                relationship_type=r["relationship_types"][0],
+                relationship_types=r["relationship_types"],
+                confidence=round(r["score"] * 10, 1),
+            )
+            for r in related
+            if r["id"] in rows
         ]
-        """
-        
-        # Get LLM response
-        llm_response = await self.llm_processor._query_llm(prompt)
-        
-        try:
-            # Parse LLM response to get related documents
-            related_docs = json.loads(llm_response)
-            
-            # Format results
-            results = []
-            for item in related_docs[:limit]:
-                doc_id = item["id"]
-                relationship_type = item["relationship_type"]
-                confidence = item["confidence"]
-                
-                # Find document in potential related
-                for doc in potential_related:
-                    if doc.id == doc_id:
-                        results.append({
-                            "id": doc.id,
-                            "title": doc.title,
-                            "sender": doc.sender,
-                            "document_date": doc.document_date.isoformat() if doc.document_date else None,
-                            "document_type": doc.document_type,
-                            "relationship_type": relationship_type,
-                            "confidence": confidence
-                        })
-                        break
-            
-            return results
-        except json.JSONDecodeError:
-            logger.error("Failed to parse LLM response as JSON")
-            return []
+
+        if rerank and document_id in rows:
+            results = await relations.rerank_with_llm(self.llm_processor, _project(rows[document_id]), results)
+        return results
 
     # ------------------------------------------------------------------
     #  Vision search (ColPali + Qdrant) ---------------------------------
@@ -320,13 +437,13 @@ class SearchService:
         doc_id.
         """
 
-        from app.colpali_embedder import ColPaliEmbedder
+        from app import vision
         from app.vector_store import search as qdrant_search
 
-        embedder = ColPaliEmbedder()
-        q_vec = embedder.embed_text(query)
+        embedder = await vision.get_embedder()
+        q_vec = await asyncio.to_thread(embedder.embed_text, query)
 
-        points = qdrant_search(q_vec, top_k=50)  # fetch more to allow aggregation
+        points = await qdrant_search(q_vec, top_k=50)  # fetch more to allow aggregation
 
         # Aggregate by document id --------------------------------------
         doc_best: dict[int, float] = {}
@@ -341,25 +458,4 @@ class SearchService:
         # Sort and trim --------------------------------------------------
         ranked = sorted(doc_best.items(), key=lambda x: x[1], reverse=True)[:limit]
 
-        # Retrieve documents --------------------------------------------
-        results: list[dict[str, any]] = []
-        if not ranked:
-            return results
-
-        doc_ids = [d for d, _ in ranked]
-        rows = self.db.query(Document).filter(Document.id.in_(doc_ids)).all()
-        doc_map = {d.id: d for d in rows}
-
-        for doc_id, score in ranked:
-            d = doc_map.get(doc_id)
-            if d:
-                results.append({
-                    "id": d.id,
-                    "title": d.title,
-                    "sender": d.sender,
-                    "document_type": d.document_type,
-                    "status": d.status,
-                    "vision_score": score,
-                })
-
-        return results
+        return await self._ranked(ranked, "vision_score")
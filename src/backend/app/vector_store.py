@@ -1,73 +1,310 @@
-"""Lightweight Qdrant helper used by ColPali integration.
+"""Lightweight async Qdrant helper used by ColPali integration.
 
-The module lazily creates a single QdrantClient instance.  It exposes:
-    • ensure_collection() – idempotently create expected collection
-    • upsert_page(doc_id, page_idx, multi_vectors) – inserts patch vectors and
-      returns their generated IDs (UUID strings).
+The module lazily creates a single ``AsyncQdrantClient`` per process.  It
+exposes:
+    • ensure_collection() – idempotently create expected collection (the
+      result is cached, so only the first call costs a round-trip)
+    • add_page(doc_id, page_idx, multi_vectors) – buffers patch vectors and
+      returns the number of points queued; buffered points are sent in large
+      ``wait=False`` upserts across pages.
+    • flush() – push the buffer now (also done by the background flusher).
+      Ingestion flushes after a document's last page and only then records
+      its ``VectorEntry`` rows, so bookkeeping never runs ahead of Qdrant.
+    • search() / delete_document()
 
-We purposely keep the dependency surface minimal so it can be imported in the
-`process_new_document` background task without heavy initialisation when the
-vector DB is not required.
+Storage is kept compact: point IDs are *derived* from (doc_id, page, patch) so
+nothing needs to be mapped back in the relational DB, payloads only carry the
+two integers required for aggregation, and the collection is created with
+scalar (int8) or binary quantisation so only the quantised vectors live in
+RAM while the float32 originals stay on disk for rescoring.
+
+``VECTOR_DB_MODE=local`` runs Qdrant in-process (``VECTOR_DB_PATH`` for a
+persistent directory, in-memory otherwise) – handy for tests and single-box
+installs without a Qdrant server.  In server mode gRPC is preferred.
 """
 
 from __future__ import annotations
 
+import asyncio
+import logging
 import os
-import uuid
-from typing import List, Sequence
+from typing import Dict, List, Sequence
 
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient
 from qdrant_client.http import models as qmodels
 
+logger = logging.getLogger(__name__)
+
 _COLLECTION = os.getenv("QDRANT_COLLECTION", "colpali_pages")
 _HOST = os.getenv("VECTOR_DB_HOST", "qdrant")
 _PORT = int(os.getenv("VECTOR_DB_PORT", 6333))
+_GRPC_PORT = int(os.getenv("VECTOR_DB_GRPC_PORT", 6334))
+_PREFER_GRPC = bool(int(os.getenv("VECTOR_DB_PREFER_GRPC", "1")))
+
+# server | local – local = embedded Qdrant, no network service required
+_MODE = os.getenv("VECTOR_DB_MODE", "server").lower()
+_LOCAL_PATH = os.getenv("VECTOR_DB_PATH")  # None → ":memory:"
+
+# scalar | binary | none – scalar (int8) keeps ~99% recall at 1/4 of the RAM
+_QUANTIZATION = os.getenv("COLPALI_QUANTIZATION", "scalar").lower()
+# Keep float32 originals on disk (only used for rescoring when quantised)
+_VECTORS_ON_DISK = bool(int(os.getenv("COLPALI_VECTORS_ON_DISK", "1")))
+
+# Write buffering: flush once this many points are pending …
+_BATCH_POINTS = int(os.getenv("VECTOR_DB_BATCH_POINTS", 8192))
+# … or at the latest after this many seconds (background flusher)
+_FLUSH_INTERVAL = float(os.getenv("VECTOR_DB_FLUSH_INTERVAL", 2.0))
+
+# Bit layout of deterministic point IDs: doc_id | page (12 bits) | patch (12 bits)
+_PATCH_BITS = 12
+_PAGE_BITS = 12
+_MAX_PATCH = (1 << _PATCH_BITS) - 1
+_MAX_PAGE = (1 << _PAGE_BITS) - 1
 
-_client: QdrantClient | None = None
+_client: AsyncQdrantClient | None = None
+_ready_collections: set[str] = set()
+_collection_lock: asyncio.Lock | None = None
+_pending: List[qmodels.PointStruct] = []
+_flush_lock: asyncio.Lock | None = None
+_flusher_task: asyncio.Task | None = None
 
-def _get_client() -> QdrantClient:
+
+def _get_client() -> AsyncQdrantClient:
     global _client
     if _client is None:
-        _client = QdrantClient(host=_HOST, port=_PORT)
+        if _MODE == "local":
+            _client = AsyncQdrantClient(path=_LOCAL_PATH) if _LOCAL_PATH else AsyncQdrantClient(location=":memory:")
+        else:
+            _client = AsyncQdrantClient(
+                host=_HOST,
+                port=_PORT,
+                grpc_port=_GRPC_PORT,
+                prefer_grpc=_PREFER_GRPC,
+            )
     return _client
 
 
-def ensure_collection(vector_size: int = 128):
-    client = _get_client()
-    try:
-        client.get_collection(_COLLECTION)
-    except Exception:  # collection does not exist → create fresh
-        client.recreate_collection(
-            collection_name=_COLLECTION,
-            vectors_config=qmodels.VectorParams(size=vector_size, distance=qmodels.Distance.COSINE),
+def point_id(doc_id: int, page_idx: int, patch_idx: int) -> int:
+    """Return the deterministic unsigned 64-bit point ID for one patch vector.
+
+    Re-ingesting a page overwrites its points instead of leaving orphans, and
+    the (doc_id, page, patch) triple can be recovered from the ID alone.
+    """
+    if not (0 <= page_idx <= _MAX_PAGE and 0 <= patch_idx <= _MAX_PATCH):
+        raise ValueError(f"page/patch index out of range: page={page_idx}, patch={patch_idx}")
+    return (doc_id << (_PAGE_BITS + _PATCH_BITS)) | (page_idx << _PATCH_BITS) | patch_idx
+
+
+def split_point_id(pid: int) -> tuple[int, int, int]:
+    """Inverse of :func:`point_id` → (doc_id, page, patch)."""
+    return pid >> (_PAGE_BITS + _PATCH_BITS), (pid >> _PATCH_BITS) & _MAX_PAGE, pid & _MAX_PATCH
+
+
+def _quantization_config(mode: str | None = None):
+    mode = (mode or _QUANTIZATION).lower()
+    if mode == "binary":
+        return qmodels.BinaryQuantization(binary=qmodels.BinaryQuantizationConfig(always_ram=True))
+    if mode == "scalar":
+        return qmodels.ScalarQuantization(
+            scalar=qmodels.ScalarQuantizationConfig(
+                type=qmodels.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=True,
+            )
         )
+    return None
+
+
+def _search_params() -> qmodels.SearchParams | None:
+    if _quantization_config() is None:
+        return None
+    # Search the in-RAM quantised vectors, then rescore the best candidates
+    # against the on-disk originals so ranking quality is preserved.
+    return qmodels.SearchParams(
+        quantization=qmodels.QuantizationSearchParams(rescore=True, oversampling=2.0)
+    )
 
 
-def upsert_page(doc_id: int, page_idx: int, multi_vectors: Sequence[Sequence[float]]) -> List[str]:
-    """Insert *multi_vectors* for a given page -> returns list of point IDs."""
-    ensure_collection(len(multi_vectors[0]))
-    client = _get_client()
+async def ensure_collection(vector_size: int = 128) -> None:
+    """Create the collection if needed – cached after the first successful call."""
+    global _collection_lock
 
-    point_ids: list[str] = []
-    points: list[qmodels.PointStruct] = []
+    if _COLLECTION in _ready_collections:
+        return
+    if _collection_lock is None:
+        _collection_lock = asyncio.Lock()
 
-    for vec in multi_vectors:
-        pid = uuid.uuid4().hex  # compact UUID string
-        point_ids.append(pid)
-        points.append(
-            qmodels.PointStruct(
-                id=pid,
-                vector=list(vec),  # ensure plain list of float for Cython JSON
-                payload={"doc_id": doc_id, "page": page_idx},
+    async with _collection_lock:
+        if _COLLECTION in _ready_collections:
+            return
+
+        client = _get_client()
+        try:
+            info = await client.get_collection(_COLLECTION)
+        except Exception:  # collection does not exist → create fresh
+            await client.create_collection(
+                collection_name=_COLLECTION,
+                vectors_config=qmodels.VectorParams(
+                    size=vector_size,
+                    distance=qmodels.Distance.COSINE,
+                    on_disk=_VECTORS_ON_DISK,
+                ),
+                quantization_config=_quantization_config(),
+                on_disk_payload=True,
+            )
+            # Payload index so per-document deletes don't scan the whole collection
+            await client.create_payload_index(
+                _COLLECTION, "doc_id", field_schema=qmodels.PayloadSchemaType.INTEGER
             )
+        else:
+            # Collections created before compact mode: switch quantisation on in place
+            quant = _quantization_config()
+            if quant is not None and info.config.quantization_config is None and _MODE != "local":
+                await client.update_collection(_COLLECTION, quantization_config=quant)
+
+        _ready_collections.add(_COLLECTION)
+
+
+async def add_page(doc_id: int, page_idx: int, multi_vectors: Sequence[Sequence[float]]) -> int:
+    """Queue *multi_vectors* of one page for upsert -> returns number of points queued.
+
+    Points are flushed in batches of ``VECTOR_DB_BATCH_POINTS`` (or by the
+    background flusher) with ``wait=False`` so ingestion never blocks on
+    Qdrant's indexing.
+    """
+    await ensure_collection(len(multi_vectors[0]))
+
+    _pending.extend(
+        qmodels.PointStruct(
+            id=point_id(doc_id, page_idx, patch_idx),
+            vector=[float(x) for x in vec],  # ensure plain list of float for JSON/gRPC
+            payload={"doc_id": doc_id, "page": page_idx},
         )
+        for patch_idx, vec in enumerate(multi_vectors)
+    )
+
+    if len(_pending) >= _BATCH_POINTS:
+        await flush()
+    return len(multi_vectors)
+
+
+async def flush() -> int:
+    """Send all buffered points to Qdrant – returns number of points sent."""
+    global _flush_lock
+
+    if not _pending:
+        return 0
+    if _flush_lock is None:
+        _flush_lock = asyncio.Lock()
+
+    async with _flush_lock:
+        batch = _pending[:]
+        del _pending[: len(batch)]
+        if not batch:
+            return 0
+        try:
+            await _get_client().upsert(collection_name=_COLLECTION, points=batch, wait=False)
+        except Exception:
+            # Put points back so the next flush retries them
+            _pending[:0] = batch
+            raise
+        return len(batch)
+
+
+async def _flush_loop() -> None:
+    while True:
+        await asyncio.sleep(_FLUSH_INTERVAL)
+        try:
+            await flush()
+        except Exception as exc:  # pragma: no cover – diagnostics only
+            logger.warning("Vector flush failed (%d points pending): %s", len(_pending), exc)
+
 
-    client.upsert(collection_name=_COLLECTION, points=points)
-    return point_ids
+def start_flusher() -> None:
+    """Spawn the periodic background flusher; safe to call multiple times."""
+    global _flusher_task
+    if _flusher_task is None or _flusher_task.done():
+        _flusher_task = asyncio.create_task(_flush_loop(), name="vector_store_flusher")
 
 
-def search(query_vector: Sequence[float], top_k: int = 20):
+async def aclose() -> None:
+    """Flush pending points and close the client (application shutdown)."""
+    global _client, _flusher_task
+    if _flusher_task is not None:
+        _flusher_task.cancel()
+        _flusher_task = None
+    if _client is not None:
+        try:
+            await flush()
+        finally:
+            await _client.close()
+            _client = None
+            _ready_collections.clear()
+
+
+async def delete_document(doc_id: int) -> None:
+    """Remove all patch vectors that belong to *doc_id* (including unflushed ones)."""
+    _pending[:] = [p for p in _pending if p.payload.get("doc_id") != doc_id]
+    if _COLLECTION not in _ready_collections:
+        try:
+            await _get_client().get_collection(_COLLECTION)
+        except Exception:
+            return  # nothing stored yet
+    await _get_client().delete(
+        collection_name=_COLLECTION,
+        points_selector=qmodels.FilterSelector(
+            filter=qmodels.Filter(
+                must=[qmodels.FieldCondition(key="doc_id", match=qmodels.MatchValue(value=doc_id))]
+            )
+        ),
+    )
+
+
+async def search(query_vector: Sequence[float], top_k: int = 20):
     """Return top_k ScoredPoint results from Qdrant for *query_vector*."""
-    ensure_collection(len(query_vector))
-    client = _get_client()
-    return client.search(collection_name=_COLLECTION, query_vector=list(query_vector), limit=top_k) 
\ No newline at end of file
+    await ensure_collection(len(query_vector))
+    return await _get_client().search(
+        collection_name=_COLLECTION,
+        query_vector=[float(x) for x in query_vector],
+        limit=top_k,
+        search_params=_search_params(),
+    )
+
+
+def estimate_memory(
+    pages: int = 1000,
+    patches_per_page: int = 1030,
+    dim: int = 128,
+    quantization: str | None = None,
+    hnsw_m: int = 16,
+) -> Dict[str, float]:
+    """*Estimated* Qdrant footprint (MiB) for *pages* ColPali pages.
+
+    A sizing formula, not a measurement – vector bytes + HNSW links (``2*m``
+    4-byte neighbour IDs on layer 0) + point ID/payload overhead, after
+    Qdrant's capacity-planning guidance.  ``benchmarks/vector_memory.py
+    --measure`` loads real collections to check it.
+    """
+    quantization = (quantization or _QUANTIZATION).lower()
+    points = pages * patches_per_page
+    mib = 1024 * 1024
+
+    float_bytes = points * dim * 4
+    if quantization == "scalar":
+        quant_bytes = points * dim
+    elif quantization == "binary":
+        quant_bytes = points * dim / 8
+    else:
+        quant_bytes = 0
+    graph_bytes = points * hnsw_m * 2 * 4
+    # 8-byte integer ID + two small ints of payload (+ index entry)
+    meta_bytes = points * (8 + 32)
+
+    ram_vectors = quant_bytes if quant_bytes and _VECTORS_ON_DISK else float_bytes + quant_bytes
+    return {
+        "points": points,
+        "ram_mib": round((ram_vectors + graph_bytes + meta_bytes) / mib, 1),
+        "disk_mib": round((float_bytes + quant_bytes + graph_bytes + meta_bytes) / mib, 1),
+        "vectors_float32_mib": round(float_bytes / mib, 1),
+        "vectors_quantised_mib": round(quant_bytes / mib, 1),
+    }
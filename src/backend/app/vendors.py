@@ -0,0 +1,373 @@
+"""app.vendors
+===========
+Vendor dimension – one ``vendors`` row per canonical sender name.
+
+Every ORM write that sets ``Document.sender`` resolves the canonical vendor
+in a ``before_flush`` listener and stores it as ``documents.vendor_id``, so
+vendor analytics filter on an indexed FK instead of ``sender ILIKE '%…%'``.
+Ingestion links the vendor to the address-book entry it enriched.  Rows
+written before the column existed are linked by :func:`link_documents`
+(batched by primary key – from the Alembic migration and at startup).
+
+:func:`analytics` computes yearly / monthly totals, VAT and missing-invoice
+gaps in SQL (window functions over the vendor's invoice months), in the base
+currency (see ``app.fx``).  Results are cached per vendor and dropped
+whenever a flush touches one of the vendor's documents.
+"""
+from __future__ import annotations
+
+import calendar
+import logging
+import os
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Integer, and_, bindparam, cast, event, extract, func, insert, inspect as sa_inspect, select, update
+from sqlalchemy.orm import Session
+
+from app import fx
+from app.cache import TTLCache
+from app.dates import month_start
+from app.models import Document, Vendor
+
+logger = logging.getLogger(__name__)
+
+_BATCH = int(os.getenv("VENDOR_LINK_BATCH_SIZE", 1000))
+
+_analytics: TTLCache[Dict[str, Any]] = TTLCache(
+    maxsize=int(os.getenv("VENDOR_ANALYTICS_CACHE_SIZE", 256)),
+    ttl=float(os.getenv("VENDOR_ANALYTICS_CACHE_TTL", 300)),
+)
+
+LEGAL_SUFFIX_RE = re.compile(r"\b(ag|gmbh|sa|sarl|inc|ltd)\b\.?", re.I)
+
+
+def canonical_name(name: Optional[str]) -> str:
+    """Lower-case *name* without legal suffix and punctuation ("" when blank)."""
+    name = LEGAL_SUFFIX_RE.sub("", (name or "").lower())
+    return re.sub(r"[^a-z0-9]", "", name)[:255]
+
+
+def invalidate(vendor_id: Optional[int] = None) -> None:
+    """Drop cached analytics for *vendor_id* (all vendors when ``None``)."""
+    if vendor_id is None:
+        _analytics.clear()
+    else:
+        _analytics.pop(vendor_id)
+
+
+# ---------------------------------------------------------------------------
+# Resolution on write
+# ---------------------------------------------------------------------------
+
+def _insert_ignore(dialect: str):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(Vendor).on_conflict_do_nothing(index_elements=["canonical"])
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(Vendor).on_conflict_do_nothing(index_elements=["canonical"])
+    return insert(Vendor)
+
+
+def _vendor_id(execute, dialect: str, canon: str, name: str) -> int:
+    """Id of the vendor for *canon*, inserting it first if needed (race-safe)."""
+    lookup = select(Vendor.id).where(Vendor.canonical == canon)
+    vendor_id = execute(lookup).scalar()
+    if vendor_id is None:
+        execute(_insert_ignore(dialect).values(canonical=canon, name=name.strip()[:255]))
+        vendor_id = execute(lookup).scalar()
+    return vendor_id
+
+
+@event.listens_for(Session, "before_flush")
+def _resolve_vendors(session: Session, flush_context, instances) -> None:
+    docs = [
+        obj for obj in (*session.new, *session.dirty)
+        if isinstance(obj, Document)
+        and (obj in session.new or sa_inspect(obj).attrs.sender.history.has_changes())
+    ]
+    if not docs:
+        return
+    resolved: Dict[str, int] = {}
+    with session.no_autoflush:
+        dialect = session.connection().dialect.name
+        for doc in docs:
+            canon = canonical_name(doc.sender)
+            if not canon:
+                doc.vendor_id = None
+                continue
+            if canon not in resolved:
+                resolved[canon] = _vendor_id(session.execute, dialect, canon, doc.sender)
+            doc.vendor_id = resolved[canon]
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_touched(session: Session, flush_context) -> None:
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if not isinstance(obj, Document):
+            continue
+        state = sa_inspect(obj)
+        if "vendor_id" in state.unloaded:
+            invalidate()
+            return
+        hist = state.attrs.vendor_id.history
+        for vendor_id in (*hist.added, *hist.unchanged, *hist.deleted):
+            if vendor_id is not None:
+                invalidate(vendor_id)
+
+
+async def attach_address(db, vendor_id: Optional[int], address_entry_id: Optional[int]) -> None:
+    """Link *vendor_id* to its address-book entry unless it already has one."""
+    if vendor_id is None or address_entry_id is None:
+        return
+    await db.execute(
+        update(Vendor)
+        .where(Vendor.id == vendor_id, Vendor.address_entry_id.is_(None))
+        .values(address_entry_id=address_entry_id)
+    )
+
+
+# ---------------------------------------------------------------------------
+# Backfill
+# ---------------------------------------------------------------------------
+
+def _link_statements(table, after_id: int, batch_size: int):
+    select_stmt = (
+        select(table.c.id, table.c.sender)
+        .where(table.c.id > after_id, table.c.vendor_id.is_(None), table.c.sender.isnot(None), table.c.sender != "")
+        .order_by(table.c.id)
+        .limit(batch_size)
+    )
+    values = {"vendor_id": bindparam("vendor_id")}
+    if "updated_at" in table.c:  # Alembic's lightweight tables leave it out
+        values["updated_at"] = datetime.utcnow()
+    update_stmt = update(table).where(table.c.id == bindparam("_id")).values(values)
+    return select_stmt, update_stmt
+
+
+def _link_params(rows, execute, dialect: str, resolved: Dict[str, int]) -> List[Dict[str, Any]]:
+    params = []
+    for row in rows:
+        canon = canonical_name(row["sender"])
+        if not canon:
+            continue
+        if canon not in resolved:
+            resolved[canon] = _vendor_id(execute, dialect, canon, row["sender"])
+        params.append({"_id": row["id"], "vendor_id": resolved[canon]})
+    return params
+
+
+def link_documents_sync(connection, table, batch_size: int = _BATCH) -> int:
+    """Blocking variant for Alembic – commits are left to the migration context."""
+    after_id, linked, resolved = 0, 0, {}
+    dialect = connection.dialect.name
+    while True:
+        select_stmt, update_stmt = _link_statements(table, after_id, batch_size)
+        rows = connection.execute(select_stmt).mappings().all()
+        if not rows:
+            return linked
+        params = _link_params(rows, connection.execute, dialect, resolved)
+        if params:
+            connection.execute(update_stmt, params)
+        after_id = rows[-1]["id"]
+        linked += len(params)
+
+
+async def link_documents(session_factory, batch_size: int = _BATCH) -> int:
+    """Set ``vendor_id`` on documents that have a sender but no vendor → rows linked."""
+    table = Document.__table__
+    after_id, linked, resolved = 0, 0, {}
+    while True:
+        select_stmt, update_stmt = _link_statements(table, after_id, batch_size)
+        async with session_factory() as db:
+            rows = (await db.execute(select_stmt)).mappings().all()
+            if not rows:
+                break
+            conn = await db.connection()
+            params = await conn.run_sync(
+                lambda sync_conn: _link_params(rows, sync_conn.execute, sync_conn.dialect.name, resolved)
+            )
+            if params:
+                await db.execute(update_stmt, params)
+            await db.commit()
+        after_id = rows[-1]["id"]
+        linked += len(params)
+    if linked:
+        invalidate()
+        logger.info("Vendor backfill: linked %d document(s)", linked)
+    return linked
+
+
+# ---------------------------------------------------------------------------
+# Analytics
+# ---------------------------------------------------------------------------
+
+async def resolve(db, name: str) -> Optional[int]:
+    """Vendor id for a requested *name* – canonical match, else the busiest ``ILIKE`` match."""
+    canon = canonical_name(name)
+    if canon:
+        vendor_id = (await db.execute(select(Vendor.id).where(Vendor.canonical == canon))).scalar()
+        if vendor_id is not None:
+            return vendor_id
+    stmt = (
+        select(Vendor.id)
+        .join(Document, Document.vendor_id == Vendor.id)
+        .where(Vendor.name.ilike(f"%{name}%"))
+        .group_by(Vendor.id)
+        .order_by(func.count(Document.id).desc())
+        .limit(1)
+    )
+    return (await db.execute(stmt)).scalar()
+
+
+def _month_index(column):
+    """Months since year 0 – consecutive months differ by exactly one."""
+    return cast(extract("year", column), Integer) * 12 + cast(extract("month", column), Integer) - 1
+
+
+def _frequency(months_with: int, first: Optional[int], last: Optional[int]) -> str:
+    if months_with < 6 or first is None:
+        return "unknown"
+    coverage = months_with / (last - first + 1)
+    if coverage >= 0.9:
+        return "monthly"
+    if coverage >= 0.7:
+        return "mostly_monthly"
+    if coverage >= 0.25:
+        return "quarterly"
+    return "irregular"
+
+
+async def analytics(db, vendor_id: int) -> Optional[Dict[str, Any]]:
+    """Totals, yearly/monthly breakdown and missing periods for one vendor.
+
+    ``None`` when the vendor has no documents.  Cached per vendor.
+    """
+    cached = _analytics.get(vendor_id)
+    if cached is not None:
+        return cached
+
+    scope = Document.vendor_id == vendor_id
+    dated = and_(scope, Document.document_on.isnot(None))
+    today = date.today()
+
+    # Invoice list (light columns – the table and month chart only need these)
+    rows = (await db.execute(
+        select(
+            Document.id, Document.title, Document.document_type, Document.document_date, Document.document_on,
+            Document.due_date, Document.amount, Document.amount_base, Document.tax_amount, Document.currency,
+            Document.status,
+        )
+        .where(scope)
+        .order_by(Document.document_on.desc().nullslast(), Document.id.desc())
+    )).all()
+    if not rows:
+        return None
+
+    invoices = []
+    monthly_pattern: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        item = {k: v for k, v in row._mapping.items() if k != "document_on"}
+        invoices.append(item)
+        if row.document_on is not None:
+            monthly_pattern.setdefault(f"{row.document_on.year}-{row.document_on.month:02d}", []).append(item)
+
+    # Yearly totals
+    year = cast(extract("year", Document.document_on), Integer).label("year")
+    yearly = (await db.execute(
+        select(
+            year,
+            func.coalesce(func.sum(fx.base_amount()), 0.0),
+            func.coalesce(func.sum(fx.base_tax()), 0.0),
+            func.count(Document.id),
+            func.count(fx.base_amount()),
+        )
+        .where(dated)
+        .group_by(year)
+        .order_by(year.desc())
+    )).all()
+    yearly_breakdown = [
+        {
+            "year": y,
+            "total_amount": round(total, 2),
+            "total_vat": round(vat, 2),
+            "invoice_count": count,
+            "average_amount": round(total / converted, 2) if converted else 0,
+        }
+        for y, total, vat, count, converted in yearly
+    ]
+
+    # Monthly totals
+    bucket = month_start(Document.document_on).label("month")
+    monthly = (await db.execute(
+        select(
+            bucket,
+            func.coalesce(func.sum(fx.base_amount()), 0.0),
+            func.coalesce(func.sum(fx.base_tax()), 0.0),
+            func.count(Document.id),
+        )
+        .where(dated)
+        .group_by(bucket)
+        .order_by(bucket)
+    )).all()
+    monthly_totals = [
+        {"period": str(m)[:7], "total_amount": round(total, 2), "total_vat": round(vat, 2), "invoice_count": count}
+        for m, total, vat, count in monthly
+    ]
+
+    # Missing invoices: a month with no invoice between two months that have one
+    idx = _month_index(Document.document_on).label("idx")
+    months = select(idx).where(dated).group_by(idx).subquery()
+    ordered = select(
+        months.c.idx,
+        func.lead(months.c.idx).over(order_by=months.c.idx).label("next_idx"),
+        func.count().over().label("months_with"),
+        func.min(months.c.idx).over().label("first_idx"),
+        func.max(months.c.idx).over().label("last_idx"),
+    ).subquery()
+    window_lo, window_hi = (today.year - 1) * 12, today.year * 12 + 11  # last year + this year
+    gaps = (await db.execute(
+        select(ordered.c.idx + 1)
+        .where(
+            ordered.c.next_idx - ordered.c.idx == 2,
+            ordered.c.months_with >= 3,
+            ordered.c.idx + 1 >= window_lo,
+            ordered.c.idx + 1 <= window_hi,
+        )
+        .order_by(ordered.c.idx)
+    )).scalars().all()
+    missing_periods = [
+        {"period": f"{g // 12}-{g % 12 + 1:02d}", "month_name": calendar.month_name[g % 12 + 1], "year": g // 12}
+        for g in gaps
+    ]
+    stats = (await db.execute(
+        select(ordered.c.months_with, ordered.c.first_idx, ordered.c.last_idx).limit(1)
+    )).first()
+    frequency = _frequency(*stats) if stats else "unknown"
+
+    recent = (await db.execute(
+        select(func.count(Document.id)).where(scope, Document.document_on >= today - timedelta(days=365))
+    )).scalar() or 0
+
+    result = {
+        "summary": {
+            # Base-currency totals; amounts without a known rate are listed apart
+            "total_amount": round(sum(row[1] for row in yearly), 2),
+            "total_vat": round(sum(row[2] for row in yearly), 2),
+            "total_invoices": len(invoices),
+            "years_active": len(yearly_breakdown),
+            "frequency_pattern": frequency,
+            "recent_activity": recent,
+            "unconverted": await fx.unconverted_totals(db, scope),
+        },
+        "yearly_breakdown": yearly_breakdown,
+        "monthly_totals": monthly_totals,
+        "missing_periods": missing_periods,
+        "all_invoices": invoices,
+        "monthly_pattern": monthly_pattern,
+        "currency": fx.base_currency(),  # totals; each invoice keeps its own currency
+    }
+    _analytics.set(vendor_id, result)
+    return result
@@ -0,0 +1,121 @@
+"""app.vision
+=============
+Optional vision-retrieval (ColPali) support.
+
+``app.colpali_embedder`` pulls in ``torch`` and ``colpali_engine`` which add
+several seconds and a few hundred MB of RSS to every process importing them.
+This module keeps those imports off the API import path:
+
+• ``VISION_SEARCH_ENABLED=0`` disables the feature entirely – nothing heavy is
+  ever imported and vision endpoints answer *503*.
+• Otherwise the model is loaded on first use, or ahead of time by the
+  background warm-up task that ``main.startup()`` launches when
+  ``VISION_WARMUP`` is set.  Loading happens in a worker thread so the event
+  loop keeps serving requests meanwhile.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from app.config import settings
+
+if TYPE_CHECKING:  # pragma: no cover – typing only, avoids importing torch
+    from app.colpali_embedder import ColPaliEmbedder
+
+logger = logging.getLogger(__name__)
+
+
+class VisionUnavailableError(RuntimeError):
+    """Raised when vision search is disabled or the model failed to load."""
+
+
+# Module-level state – one embedder per process (ColPaliEmbedder is a singleton anyway)
+_embedder: "ColPaliEmbedder | None" = None
+_load_lock: asyncio.Lock | None = None
+_warmup_task: asyncio.Task | None = None
+_state: str = "idle"  # idle | loading | ready | failed
+_error: Optional[str] = None
+_load_seconds: Optional[float] = None
+
+
+def is_enabled() -> bool:
+    """Return True if vision retrieval is switched on via configuration."""
+    return bool(settings.VISION_SEARCH_ENABLED)
+
+
+def status() -> Dict[str, Any]:
+    """Return a JSON-friendly snapshot of the vision subsystem (used by /api/health)."""
+    return {
+        "enabled": is_enabled(),
+        "state": _state if is_enabled() else "disabled",
+        "error": _error,
+        "load_seconds": round(_load_seconds, 2) if _load_seconds is not None else None,
+    }
+
+
+def _load_embedder() -> "ColPaliEmbedder":
+    """Import ColPali and instantiate the model (blocking – run in a thread)."""
+    from app.colpali_embedder import ColPaliEmbedder  # heavy: torch + colpali_engine
+
+    return ColPaliEmbedder()
+
+
+async def get_embedder() -> "ColPaliEmbedder":
+    """Return the process-wide ColPali embedder, loading it on first call.
+
+    Raises:
+        VisionUnavailableError: if the feature is disabled or loading failed.
+    """
+    global _embedder, _load_lock, _state, _error, _load_seconds
+
+    if not is_enabled():
+        raise VisionUnavailableError("Vision search is disabled (VISION_SEARCH_ENABLED=0)")
+
+    if _embedder is not None:
+        return _embedder
+
+    if _load_lock is None:
+        _load_lock = asyncio.Lock()
+
+    async with _load_lock:
+        # Another coroutine may have finished loading while we waited
+        if _embedder is not None:
+            return _embedder
+
+        _state = "loading"
+        started = time.perf_counter()
+        try:
+            _embedder = await asyncio.to_thread(_load_embedder)
+        except Exception as exc:
+            _state = "failed"
+            _error = str(exc)
+            logger.warning("ColPali model could not be loaded: %s", exc)
+            raise VisionUnavailableError(f"ColPali model could not be loaded: {exc}") from exc
+
+        _load_seconds = time.perf_counter() - started
+        _state = "ready"
+        _error = None
+        logger.info("ColPali model loaded in %.1fs", _load_seconds)
+        return _embedder
+
+
+async def warm_up() -> None:
+    """Load the model in the background; failures are logged, never raised."""
+    try:
+        await get_embedder()
+    except VisionUnavailableError:
+        pass
+
+
+def start_warmup() -> None:
+    """Spawn the warm-up task once if vision is enabled and warm-up requested."""
+    global _warmup_task
+
+    if not (is_enabled() and settings.VISION_WARMUP):
+        return
+    if _warmup_task is not None and not _warmup_task.done():
+        return
+    _warmup_task = asyncio.create_task(warm_up(), name="vision_warmup")
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Cost of loading full Document rows vs. the deferred (slim) default.
+
+Builds a temporary SQLite DB with ``--n`` documents, each carrying
+``--content-kb`` of OCR text, a short summary and a ``--dim`` embedding, then
+times ``select(Document)`` over every row and records the Python heap peak
+(tracemalloc) for:
+
+• eager   – heavy columns undeferred (what every query did before)
+• slim    – the default mapping: content/summary/embedding deferred
+
+Everything lives in a temporary directory; nothing touches documents.db.
+
+Usage (from src/backend):
+    python benchmarks/deferred_columns.py
+    python benchmarks/deferred_columns.py --n 10000 --content-kb 4
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, ".")
+
+from sqlalchemy import create_engine, select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+from sqlalchemy.orm import undefer_group  # noqa: E402
+
+from app.models import HEAVY_COLUMNS, Base, Document  # noqa: E402
+
+
+def _build(path, n, content_kb, dim, rng):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    con = sqlite3.connect(path)
+    words = "rechnung betrag total mwst konto zahlbar bis datum kunde nummer".split()
+    for start in range(0, n, 5000):
+        rows = []
+        for i in range(start, min(start + 5000, n)):
+            content = " ".join(rng.choice(words, content_kb * 150))
+            embedding = json.dumps(np.round(rng.standard_normal(dim), 6).tolist())
+            rows.append((i + 1, f"Doc {i}", f"/bench/{i}.pdf", content, content[:400], embedding,
+                         "invoice", f"Sender {i % 300}", "2024-05-01", float(i % 500), "unpaid", f"{i:064x}"))
+        con.executemany(
+            "INSERT INTO documents (id, title, file_path, content, summary, embedding, document_type, sender,"
+            " document_date, amount, status, hash, created_at) VALUES (?,?,?,?,?,?,?,?,?,?,?,?, CURRENT_TIMESTAMP)",
+            rows,
+        )
+    con.commit()
+    con.close()
+
+
+async def _measure(engine, label, stmt, repeat):
+    timings, peak = [], 0
+    for _ in range(repeat):
+        gc.collect()
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        async with AsyncSession(engine) as db:
+            docs = (await db.execute(stmt)).scalars().all()
+            assert docs
+        timings.append((time.perf_counter() - t0) * 1000)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        del docs
+    print(f"{label:8} {min(timings):>10.0f} {np.median(timings):>10.0f} {peak / 2**20:>10.1f}")
+
+
+async def main_async(args, path) -> int:
+    t0 = time.perf_counter()
+    _build(path, args.n, args.content_kb, args.dim, np.random.default_rng(3))
+    print(f"fixture: {args.n} docs, {args.content_kb} KB text, dim={args.dim}, "
+          f"{os.path.getsize(path) / 2**20:.0f} MB ({time.perf_counter() - t0:.1f}s)")
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    print(f"\n{'load':8} {'min ms':>10} {'p50 ms':>10} {'peak MB':>10}")
+    await _measure(engine, "eager", select(Document).options(undefer_group(HEAVY_COLUMNS)), args.repeat)
+    await _measure(engine, "slim", select(Document), args.repeat)
+    await engine.dispose()
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=20_000)
+    parser.add_argument("--content-kb", type=int, default=8)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp(prefix="deferred_bench_")
+    try:
+        return asyncio.run(main_async(args, os.path.join(tmp, "bench.db")))
+    finally:
+        import shutil
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Latency of search paths on a synthetic SQLite corpus.
+
+Generates ``--n`` documents (default 100k) with Zipf-distributed words – short
+titles, a sender and ~``--words`` words of "OCR" text – plus one random
+embedding per document in the embedded vector index, then reports p50/p99
+for:
+
+• ilike        – the previous ``ILIKE '%q%'`` filter over title/sender/content
+• fts5         – ``fulltext.search_ids`` (BM25, top 200)
+• hybrid       – ``SearchService.hybrid_search`` (FTS + vector, RRF, facets)
+• hybrid-text  – the same with ``semantic=False``
+
+Everything lives in a temporary directory; nothing touches documents.db.
+
+Usage (from src/backend):
+    python benchmarks/hybrid_search.py
+    python benchmarks/hybrid_search.py --n 20000 --dim 384 --queries 100
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+_TMP = tempfile.mkdtemp(prefix="hybrid_bench_")
+os.environ["DATABASE_PATH"] = os.path.join(_TMP, "bench.db")
+os.environ.pop("DATABASE_URL", None)
+os.environ["LOCAL_VECTOR_INDEX_PATH"] = os.path.join(_TMP, "bench.vectors")
+
+sys.path.insert(0, ".")
+
+from sqlalchemy import create_engine, select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+
+from app import fulltext, local_vector_index  # noqa: E402
+from app.models import Base, Document  # noqa: E402
+from app.search import SearchService  # noqa: E402
+
+
+def _vocabulary(rng, size: int):
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyzäöü"))
+    return ["".join(rng.choice(letters, rng.integers(3, 11))) for _ in range(size)]
+
+
+def _build_corpus(path, n, words, dim, rng):
+    vocab = _vocabulary(rng, 20000)
+    senders = [f"{vocab[i].title()} AG" for i in range(500)]
+    types = ["invoice", "receipt", "contract", "letter", "reminder"]
+    statuses = ["paid", "unpaid", "pending", "overdue"]
+
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    zipf = np.minimum(rng.zipf(1.2, size=(n, words)), len(vocab)) - 1
+    con = sqlite3.connect(path)
+    rows = []
+    for i in range(n):
+        content = " ".join(vocab[j] for j in zipf[i])
+        rows.append((
+            i + 1,
+            " ".join(vocab[j] for j in zipf[i][:4]).title(),
+            f"/bench/{i}.pdf",
+            content,
+            types[i % len(types)],
+            senders[int(rng.integers(0, len(senders)))],
+            f"{2019 + i % 6}-{1 + i % 12:02d}-01",
+            statuses[i % len(statuses)],
+            f"{i:064x}",
+        ))
+    con.executemany(
+        "INSERT INTO documents (id, title, file_path, content, document_type, sender, document_date, status, hash)"
+        " VALUES (?,?,?,?,?,?,?,?,?)",
+        rows,
+    )
+    con.commit()
+    con.close()
+
+    # Fresh index with the requested dimension, installed as the process-wide one
+    index = local_vector_index._index = local_vector_index.LocalVectorIndex(
+        local_vector_index.default_path(), dim=dim
+    )
+    for start in range(0, n, 10000):
+        stop = min(start + 10000, n)
+        index.add_many(list(range(start + 1, stop + 1)), rng.standard_normal((stop - start, dim), dtype=np.float32))
+    index.flush()
+    return vocab, zipf
+
+
+def _queries(rng, vocab, zipf, count):
+    out = []
+    for _ in range(count):
+        doc = zipf[int(rng.integers(0, len(zipf)))]
+        terms = [vocab[j] for j in rng.choice(doc, int(rng.integers(1, 4)), replace=False)]
+        if rng.random() < 0.3:  # search-as-you-type: partial last word
+            terms[-1] = terms[-1][: max(3, len(terms[-1]) - 2)]
+        out.append(" ".join(terms))
+    return out
+
+
+async def _time(label, fn, queries):
+    samples = []
+    for q in queries:
+        t0 = time.perf_counter()
+        await fn(q)
+        samples.append((time.perf_counter() - t0) * 1000)
+    arr = np.asarray(samples)
+    print(f"{label:12} {len(samples):>7} {np.percentile(arr, 50):>9.2f} {np.percentile(arr, 99):>9.2f}")
+
+
+async def main_async(args) -> int:
+    rng = np.random.default_rng(7)
+    db_path = os.environ["DATABASE_PATH"]
+
+    t0 = time.perf_counter()
+    vocab, zipf = _build_corpus(db_path, args.n, args.words, args.dim, rng)
+    print(f"corpus: {args.n} docs, {args.words} words each, dim={args.dim} ({time.perf_counter() - t0:.1f}s)")
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    t0 = time.perf_counter()
+    async with engine.begin() as conn:
+        await fulltext.ensure_index(conn)
+    print(f"fts5 index build: {time.perf_counter() - t0:.1f}s, db size {os.path.getsize(db_path) / 2**20:.0f} MB")
+
+    queries = _queries(rng, vocab, zipf, args.queries)
+    embeddings = rng.standard_normal((len(queries), args.dim), dtype=np.float32)
+    emb_for = dict(zip(queries, embeddings))
+
+    async with AsyncSession(engine) as db:
+        service = SearchService(db)
+
+        async def ilike(q):
+            from sqlalchemy import or_
+            await db.execute(
+                select(Document.id).where(or_(
+                    Document.title.ilike(f"%{q}%"),
+                    Document.content.ilike(f"%{q}%"),
+                    Document.sender.ilike(f"%{q}%"),
+                )).limit(200)
+            )
+
+        async def fts(q):
+            await fulltext.search_ids(db, q, 200)
+
+        async def hybrid(q):
+            await service.hybrid_search(q, embedding=emb_for[q].tolist())
+
+        async def hybrid_text(q):
+            await service.hybrid_search(q, semantic=False)
+
+        print(f"\n{'path':12} {'queries':>7} {'p50 ms':>9} {'p99 ms':>9}")
+        await _time("ilike", ilike, queries[: args.ilike_queries])
+        await _time("fts5", fts, queries)
+        await _time("hybrid", hybrid, queries)
+        await _time("hybrid-text", hybrid_text, queries)
+
+    await engine.dispose()
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--words", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--ilike-queries", type=int, default=30, help="ILIKE is slow – fewer samples")
+    args = parser.parse_args()
+    try:
+        return asyncio.run(main_async(args))
+    finally:
+        import shutil
+        shutil.rmtree(_TMP, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Cost of the due-date notification scans on a large invoice table.
+
+Builds a temporary SQLite DB with ``--n`` unpaid invoices whose due dates
+spread over ±``--days`` around today, then times:
+
+• first    – ``check_overdue_documents`` creating every missing notification
+• steady   – the same scan again (anti-join finds nothing to do)
+• upcoming – ``check_upcoming_due_dates`` for the next 7 days
+
+Everything lives in a temporary directory; nothing touches documents.db.
+
+Usage (from src/backend):
+    python benchmarks/notification_scan.py
+    python benchmarks/notification_scan.py --n 100000 --days 365
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, ".")
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+
+from app.models import Base  # noqa: E402
+from app.notifications import NotificationService  # noqa: E402
+
+
+def _build(path, n, days):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    today = date.today()
+    con = sqlite3.connect(path)
+    rows = []
+    for i in range(n):
+        due = today + timedelta(days=(i % (2 * days)) - days)
+        rows.append((i + 1, f"Invoice {i}", f"/bench/{i}.pdf", "invoice", due.isoformat(), due.isoformat(),
+                     "paid" if i % 4 == 0 else "unpaid", f"{i:064x}"))
+    con.executemany(
+        "INSERT INTO documents (id, title, file_path, document_type, due_date, due_on, status, hash, created_at)"
+        " VALUES (?,?,?,?,?,?,?,?, CURRENT_TIMESTAMP)",
+        rows,
+    )
+    con.commit()
+    con.close()
+
+
+async def _time(engine, label, scan):
+    t0 = time.perf_counter()
+    async with AsyncSession(engine) as db:
+        created = await scan(db)
+        await db.commit()
+    print(f"{label:9} {(time.perf_counter() - t0) * 1000:>10.1f} {len(created):>10}")
+
+
+async def main_async(args, path) -> int:
+    t0 = time.perf_counter()
+    _build(path, args.n, args.days)
+    print(f"fixture: {args.n} invoices, due ±{args.days} days ({time.perf_counter() - t0:.1f}s)")
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    service = NotificationService()
+    print(f"\n{'scan':9} {'ms':>10} {'created':>10}")
+    await _time(engine, "first", service.check_overdue_documents)
+    await _time(engine, "steady", service.check_overdue_documents)
+    await _time(engine, "upcoming", lambda db: service.check_upcoming_due_dates(db, days_ahead=7))
+    await engine.dispose()
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=365)
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp(prefix="notification_bench_")
+    try:
+        return asyncio.run(main_async(args, os.path.join(tmp, "bench.db")))
+    finally:
+        import shutil
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
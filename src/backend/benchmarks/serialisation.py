@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Serialisation cost of the document list, per ``--n`` documents (default 10k).
+
+Loads the same rows two ways from a temporary SQLite DB and times each
+pipeline up to the response bytes:
+
+• orm+stdlib      – ORM entities → ``DocumentRepository._to_dict`` →
+                    stdlib ``JSONResponse`` (the previous /api/documents path)
+• orm+encoder     – the same through FastAPI's ``jsonable_encoder`` (what a
+                    handler returning dicts gets by default)
+• rows+stdlib     – ``get_page`` Row projections → stdlib json fallback
+• rows+orjson     – ``get_page`` Row projections → ``FastJSONResponse``
+
+"build" is DB fetch + dict construction, "encode" is bytes out.
+
+Usage (from src/backend):
+    python benchmarks/serialisation.py
+    python benchmarks/serialisation.py --n 50000 --repeat 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, ".")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from sqlalchemy import create_engine, select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+
+from app import responses  # noqa: E402
+from app.models import Base, Document  # noqa: E402
+from app.repository import DocumentRepository  # noqa: E402
+
+
+def _build(path, n, rng):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    con = sqlite3.connect(path)
+    con.executemany(
+        "INSERT INTO documents (id, title, file_path, document_type, sender, recipient, document_date, due_date,"
+        " amount, tax_amount, currency, status, hash, created_at, updated_at)"
+        " VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)",
+        [
+            (i, f"Rechnung {i}", f"/data/inbox/{i}.pdf", "invoice", f"Sender {i % 300} AG", "Personal",
+             "2024-05-01", "2024-05-31", float(rng.uniform(5, 500)), 7.7, "CHF", "unpaid", f"{i:064x}")
+            for i in range(1, n + 1)
+        ],
+    )
+    con.executemany("INSERT INTO tags (id, name) VALUES (?, ?)", [(t, f"tag{t}") for t in range(1, 21)])
+    con.executemany(
+        "INSERT INTO document_tag (document_id, tag_id) VALUES (?, ?)",
+        [(i, 1 + i % 20) for i in range(1, n + 1, 3)],
+    )
+    con.commit()
+    con.close()
+
+
+def _stdlib_render(content):
+    return json.dumps(content, default=responses._default, ensure_ascii=False).encode()
+
+
+async def _pipelines(db):
+    repo = DocumentRepository()
+
+    async def orm():
+        docs = (await db.execute(select(Document).order_by(Document.created_at.desc()))).scalars().all()
+        return [DocumentRepository._to_dict(d) for d in docs]
+
+    async def rows():
+        items, _ = await repo.get_page(db)
+        return items
+
+    return {
+        "orm+stdlib": (orm, lambda c: JSONResponse(content=c).body),
+        "orm+encoder": (orm, lambda c: JSONResponse(content=jsonable_encoder(c)).body),
+        "rows+stdlib": (rows, _stdlib_render),
+        "rows+orjson": (rows, lambda c: responses.FastJSONResponse(content=c).body),
+    }
+
+
+async def main_async(args, path) -> int:
+    _build(path, args.n, np.random.default_rng(5))
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    print(f"{args.n} documents, best of {args.repeat}; orjson {'on' if responses.orjson else 'MISSING'}\n")
+    print(f"{'pipeline':14} {'build ms':>9} {'encode ms':>10} {'total ms':>9} {'bytes':>10}")
+    for label, (build, encode) in (await _pipelines(None)).items():
+        best_build = best_encode = float("inf")
+        size = 0
+        for _ in range(args.repeat):
+            async with AsyncSession(engine) as db:
+                build_fn = (await _pipelines(db))[label][0]
+                t0 = time.perf_counter()
+                content = await build_fn()
+                t1 = time.perf_counter()
+                body = encode(content)
+                t2 = time.perf_counter()
+            best_build, best_encode = min(best_build, t1 - t0), min(best_encode, t2 - t1)
+            size = len(body)
+        print(f"{label:14} {best_build * 1000:>9.0f} {best_encode * 1000:>10.0f} "
+              f"{(best_build + best_encode) * 1000:>9.0f} {size:>10}")
+    await engine.dispose()
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp(prefix="serialisation_bench_")
+    try:
+        return asyncio.run(main_async(args, os.path.join(tmp, "bench.db")))
+    finally:
+        import shutil
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
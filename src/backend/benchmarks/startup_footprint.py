@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Measure API worker start-up cost with and without vision search.
+
+Each scenario runs in a fresh interpreter so import caches do not leak between
+measurements.  We report the wall time of ``import app.main`` and the resident
+set size afterwards; the ``warm`` scenario additionally waits for the ColPali
+model to load (requires torch + colpali-engine and the model weights).
+
+Usage (from src/backend):
+    python benchmarks/startup_footprint.py            # disabled vs enabled
+    python benchmarks/startup_footprint.py --warm     # + enabled & model loaded
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+_PROBE = r"""
+import asyncio, json, os, time
+import psutil
+
+t0 = time.perf_counter()
+import app.main  # noqa: F401
+import_seconds = time.perf_counter() - t0
+
+warm_seconds = None
+if os.environ.get("PROBE_WARM") == "1":
+    from app import vision
+    t1 = time.perf_counter()
+    try:
+        asyncio.run(vision.get_embedder())
+        warm_seconds = time.perf_counter() - t1
+    except vision.VisionUnavailableError as exc:
+        warm_seconds = f"failed: {exc}"
+
+print(json.dumps({
+    "import_seconds": round(import_seconds, 3),
+    "warm_seconds": warm_seconds if not isinstance(warm_seconds, float) else round(warm_seconds, 2),
+    "rss_mb": round(psutil.Process().memory_info().rss / 2**20, 1),
+    "torch_loaded": "torch" in __import__("sys").modules,
+}))
+"""
+
+
+def _run(label: str, enabled: bool, warm: bool = False) -> dict:
+    env = dict(os.environ)
+    env["VISION_SEARCH_ENABLED"] = "1" if enabled else "0"
+    env["PROBE_WARM"] = "1" if warm else "0"
+    # Keep the probe self-contained: local SQLite, no network services required
+    env.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
+    proc = subprocess.run(
+        [sys.executable, "-c", _PROBE],
+        cwd=os.path.join(os.path.dirname(__file__), ".."),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        return {"scenario": label, "error": proc.stderr.strip().splitlines()[-1:]}
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["scenario"] = label
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--warm", action="store_true", help="also measure enabled + model loaded")
+    args = parser.parse_args()
+
+    rows = [
+        _run("vision disabled", enabled=False),
+        _run("vision enabled (lazy)", enabled=True),
+    ]
+    if args.warm:
+        rows.append(_run("vision enabled + warm model", enabled=True, warm=True))
+
+    print(f"{'scenario':32} {'import s':>9} {'warm s':>9} {'RSS MB':>8}  torch")
+    for r in rows:
+        if "error" in r:
+            print(f"{r['scenario']:32} ERROR {r['error']}")
+            continue
+        print(
+            f"{r['scenario']:32} {r['import_seconds']:>9} {str(r['warm_seconds'] or '-'):>9} "
+            f"{r['rss_mb']:>8}  {r['torch_loaded']}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
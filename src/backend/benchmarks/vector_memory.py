@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Qdrant footprint of ColPali vectors per 1k pages for each storage mode, next
+to the legacy layout (random UUID points + JSON id list in the relational
+``vectors`` table).
+
+Two sources, always labelled in the output:
+
+• *estimate* (default) – ``app.vector_store.estimate_memory``, a sizing
+  formula (vectors + HNSW links + id/payload overhead).  Nothing is loaded.
+• *measured* (``--measure``) – loads ``--pages`` pages of random patch vectors
+  into a scratch collection per mode, waits for indexing and records the
+  growth in Qdrant's own memory.  Against a server (``VECTOR_DB_MODE=server``)
+  that is ``memory_resident_bytes`` from ``/metrics``; in local mode it is the
+  RSS of this process plus the collection directory on disk.  Local (embedded)
+  Qdrant keeps plain float32 arrays – it neither quantises nor builds HNSW –
+  so only server measurements say anything about the quantisation modes.
+
+Usage (from src/backend):
+    python benchmarks/vector_memory.py [--pages 1000] [--patches 1030] [--dim 128]
+    python benchmarks/vector_memory.py --measure --pages 100
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+sys.path.insert(0, ".")
+
+from app import vector_store  # noqa: E402
+from app.vector_store import estimate_memory, point_id  # noqa: E402
+
+_MIB = 1024 * 1024
+_MODES = ("none", "scalar", "binary")
+
+
+def _legacy_id_list_mib(pages: int, patches: int) -> float:
+    """Bytes the old JSON UUID list occupied in the relational DB."""
+    sample = json.dumps([uuid.uuid4().hex for _ in range(patches)])
+    return round(pages * len(sample) / _MIB, 1)
+
+
+def _dir_bytes(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _dirs, files in os.walk(path)
+        for name in files
+    )
+
+
+def _server_resident_bytes() -> int:
+    import httpx
+
+    text = httpx.get(f"http://{vector_store._HOST}:{vector_store._PORT}/metrics", timeout=10).text
+    match = re.search(r"^memory_resident_bytes\s+(\d+)", text, re.MULTILINE)
+    if not match:
+        raise RuntimeError("Qdrant /metrics has no memory_resident_bytes (server too old?)")
+    return int(match.group(1))
+
+
+def _load(client, qmodels, name: str, mode: str, pages: int, patches: int, dim: int) -> None:
+    client.create_collection(
+        collection_name=name,
+        vectors_config=qmodels.VectorParams(
+            size=dim, distance=qmodels.Distance.COSINE, on_disk=vector_store._VECTORS_ON_DISK,
+        ),
+        quantization_config=vector_store._quantization_config(mode),
+        on_disk_payload=True,
+    )
+    rng = np.random.default_rng(0)
+    for page in range(pages):
+        vectors = rng.standard_normal((patches, dim), dtype=np.float32)
+        doc_id, page_idx = divmod(page, 64)
+        client.upsert(
+            collection_name=name,
+            points=[
+                qmodels.PointStruct(
+                    id=point_id(doc_id + 1, page_idx, patch), vector=vec.tolist(),
+                    payload={"doc_id": doc_id + 1, "page": page_idx},
+                )
+                for patch, vec in enumerate(vectors)
+            ],
+            wait=True,
+        )
+    # Wait for the optimiser (HNSW / quantisation) so the index is in memory
+    while client.get_collection(name).status != qmodels.CollectionStatus.GREEN:
+        time.sleep(1)
+
+
+def measure(pages: int, patches: int, dim: int) -> dict:
+    """Load each mode into a scratch collection → measured MiB per 1k pages."""
+    import psutil
+    from qdrant_client import QdrantClient
+    from qdrant_client.http import models as qmodels
+
+    local = vector_store._MODE == "local"
+    scratch = tempfile.mkdtemp(prefix="vector_memory_") if local else None
+    process = psutil.Process()
+    results = {}
+    try:
+        for mode in _MODES:
+            name = f"bench_vector_memory_{mode}"
+            if local:
+                client = QdrantClient(path=os.path.join(scratch, mode))
+                before = process.memory_info().rss
+            else:
+                client = QdrantClient(host=vector_store._HOST, port=vector_store._PORT)
+                client.delete_collection(name)
+                before = _server_resident_bytes()
+            try:
+                _load(client, qmodels, name, mode, pages, patches, dim)
+                ram = (process.memory_info().rss if local else _server_resident_bytes()) - before
+                disk = _dir_bytes(os.path.join(scratch, mode)) if local else None
+                points = client.count(name, exact=True).count
+            finally:
+                client.delete_collection(name)
+                client.close()
+            scale = 1000 / pages
+            results[mode] = {
+                "points": points,
+                "ram_mib": round(max(ram, 0) * scale / _MIB, 1),
+                "disk_mib": None if disk is None else round(disk * scale / _MIB, 1),
+            }
+    finally:
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--patches", type=int, default=1030, help="patch vectors per page")
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--measure", action="store_true", help="load real collections instead of estimating")
+    args = parser.parse_args()
+
+    print(f"ColPali storage for {args.pages} pages × {args.patches} patches × {args.dim}d")
+    if args.measure:
+        where = "embedded Qdrant, process RSS" if vector_store._MODE == "local" else "Qdrant server /metrics"
+        print(f"MEASURED ({where}), scaled to 1k pages")
+        if vector_store._MODE == "local":
+            print("note: embedded Qdrant stores float32 only (no quantisation/HNSW) – modes differ by noise")
+        rows = measure(args.pages, args.patches, args.dim)
+    else:
+        print("ESTIMATED (sizing formula, nothing loaded – use --measure for real numbers), per "
+              f"{args.pages} pages")
+        rows = {mode: estimate_memory(args.pages, args.patches, args.dim, quantization=mode) for mode in _MODES}
+
+    print(f"{'mode':10} {'points':>10} {'RAM MiB':>9} {'disk MiB':>9}")
+    for mode, row in rows.items():
+        disk = "n/a" if row["disk_mib"] is None else row["disk_mib"]
+        print(f"{mode:10} {row['points']:>10} {row['ram_mib']:>9} {disk:>9}")
+
+    print(
+        f"\nLegacy JSON UUID lists in SQL 'vectors' table: "
+        f"{_legacy_id_list_mib(args.pages, args.patches)} MiB (now 0 – IDs are derived)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
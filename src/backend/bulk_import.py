@@ -0,0 +1,93 @@
+"""Bulk-import files, folders and ZIP/TAR archives through the API.
+
+    python bulk_import.py scans/2024 archive.zip --user admin --password ... --wait
+
+Plain files are sent in batches of ``--batch-size`` per request, archives one
+per request (the server unpacks them as a stream).  ``--wait`` polls the
+batch progress until every batch is done.
+"""
+import argparse
+import getpass
+import os
+import sys
+import time
+
+import httpx
+
+DOCUMENT_EXTENSIONS = {".pdf", ".docx", ".doc", ".jpg", ".jpeg", ".png", ".tiff", ".tif"}
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+def collect(paths):
+    files, archives = [], []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if not name.startswith(".") and os.path.splitext(name)[1].lower() in DOCUMENT_EXTENSIONS:
+                        files.append(os.path.join(root, name))
+        elif path.lower().endswith(ARCHIVE_SUFFIXES):
+            archives.append(path)
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            print(f"Skipping {path}: not found", file=sys.stderr)
+    return files, archives
+
+
+def upload(client, paths):
+    handles = [open(p, "rb") for p in paths]
+    try:
+        r = client.post("/api/imports", files=[("files", (os.path.basename(p), fh)) for p, fh in zip(paths, handles)])
+    finally:
+        for fh in handles:
+            fh.close()
+    r.raise_for_status()
+    batch = r.json()
+    print(f"batch {batch['id']}: {batch['total']} queued, {batch['duplicates']} duplicates, {batch['skipped']} skipped")
+    return batch["id"]
+
+
+def wait(client, batch_ids, interval):
+    pending = set(batch_ids)
+    while pending:
+        time.sleep(interval)
+        for batch_id in sorted(pending):
+            p = client.get(f"/api/imports/{batch_id}").json()
+            rate = f"{p['documents_per_minute']}/min" if p["documents_per_minute"] else "-"
+            eta = f"{p['eta_seconds']}s" if p["eta_seconds"] is not None else "-"
+            print(f"batch {batch_id}: {p['completed']}/{p['total']} done, {p['failed']} failed, {rate}, eta {eta}")
+            if p["status"] == "done":
+                pending.discard(batch_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="files, folders or .zip/.tar[.gz] archives")
+    parser.add_argument("--url", default=os.getenv("DOCS_API_URL", "http://localhost:8808"))
+    parser.add_argument("--user", default=os.getenv("DOCS_API_USER", "admin"))
+    parser.add_argument("--password", default=os.getenv("DOCS_API_PASSWORD"))
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--wait", action="store_true", help="poll progress until all batches are done")
+    parser.add_argument("--interval", type=float, default=5.0)
+    args = parser.parse_args()
+
+    files, archives = collect(args.paths)
+    if not files and not archives:
+        parser.error("nothing to import")
+
+    with httpx.Client(base_url=args.url, timeout=None) as client:
+        password = args.password or getpass.getpass(f"Password for {args.user}: ")
+        r = client.post("/api/auth/login", data={"username": args.user, "password": password})
+        r.raise_for_status()
+        client.headers["Authorization"] = f"Bearer {r.json()['access_token']}"
+
+        batch_ids = [upload(client, [a]) for a in archives]
+        for start in range(0, len(files), args.batch_size):
+            batch_ids.append(upload(client, files[start:start + args.batch_size]))
+        if args.wait:
+            wait(client, batch_ids, args.interval)
+
+
+if __name__ == "__main__":
+    main()
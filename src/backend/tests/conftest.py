@@ -2,12 +2,14 @@
 Pytest configuration and fixtures for 137Docs backend tests.
 """
 import pytest
+import pytest_asyncio
 import asyncio
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from httpx import AsyncClient
 from app.main import app
 from tests.test_models import Base
+from app import models as app_models
 from app.database import get_db
 import os
 import tempfile
@@ -51,6 +53,19 @@ async def test_session(test_engine):
         yield session
         await session.rollback()
 
+@pytest_asyncio.fixture
+async def factory(tmp_path):
+    """Session factory over a fresh SQLite file holding every ``app.models`` table.
+
+    Modules that need seed rows or patched settings override it with a
+    fixture of the same name that takes this one as an argument.
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(app_models.Base.metadata.create_all)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
 @pytest.fixture
 async def test_client(test_session):
     """Create test HTTP client with database override."""
@@ -0,0 +1,9 @@
+"""
+Shared helpers for tests that run against the real ``app.models`` schema.
+"""
+from app.models import Document
+
+
+def make_document(n, **fields) -> Document:
+    """A minimal valid Document – unique ``file_path`` / ``hash`` derived from *n*."""
+    return Document(**{"title": f"d{n}", "file_path": f"/{n}", "hash": str(n), **fields})
@@ -0,0 +1,160 @@
+"""
+Tests for bulk (multi-file / archive) imports.
+"""
+import hashlib
+import io
+import os
+import tarfile
+import zipfile
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from starlette.datastructures import UploadFile
+
+from app import bulk_import, ingestion
+from app.config import settings
+from app.models import Document, ImportBatch
+
+_KNOWN = b"%PDF-1.4 already stored"
+
+
+@pytest_asyncio.fixture
+async def factory(factory, tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion, "_claims", {})
+    monkeypatch.setattr(bulk_import, "_queue", None)
+    monkeypatch.setenv("IMPORT_FOLDER", str(tmp_path / "imports"))
+    monkeypatch.setattr(settings, "MAX_UPLOAD_SIZE", 64)
+    async with factory() as db:
+        db.add(Document(title="Known", file_path="/k.pdf", hash=hashlib.sha256(_KNOWN).hexdigest()))
+        await db.commit()
+    return factory
+
+
+def _zip(members) -> UploadFile:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    buf.seek(0)
+    return UploadFile(buf, filename="scans.zip")
+
+
+def _tar(members) -> UploadFile:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tf:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    buf.seek(0)
+    return UploadFile(buf, filename="scans.tar.gz")
+
+
+class TestCreateBatch:
+    """bulk_import.create_batch"""
+
+    @pytest.mark.asyncio
+    async def test_unpacks_dedupes_and_inserts_placeholders(self, factory):
+        uploads = [
+            _zip({
+                "2024/jan/a.pdf": b"%PDF a",
+                "2024/feb/a.pdf": b"%PDF b",     # same name, other content → renamed
+                "copy/a.pdf": b"%PDF a",         # same content → duplicate
+                "notes.txt": b"text",            # unsupported → skipped
+                ".DS_Store": b"junk",            # hidden → skipped
+                "big.pdf": b"x" * 100,           # over MAX_UPLOAD_SIZE → skipped
+            }),
+            _tar({"scan.png": b"png bytes", "old.pdf": _KNOWN}),  # old.pdf already stored
+            UploadFile(io.BytesIO(b"%PDF c"), filename="single.pdf"),
+        ]
+        async with factory() as db:
+            result = await bulk_import.create_batch(db, uploads, user_id=None)
+
+        assert result["total"] == 4
+        assert result["duplicates"] == 2
+        assert result["skipped"] == 3
+        assert result["queued"] == 4 and result["status"] == "queued"
+
+        async with factory() as db:
+            docs = (await db.execute(
+                select(Document).where(Document.import_batch_id == result["id"]).order_by(Document.id)
+            )).scalars().all()
+        assert sorted(d.original_file_name for d in docs) == ["a.pdf", "a.pdf", "scan.png", "single.pdf"]
+        assert {os.path.basename(d.file_path) for d in docs} == {"a.pdf", "a (1).pdf", "scan.png", "single.pdf"}
+        for doc in docs:
+            assert doc.status == "queued"
+            assert hashlib.sha256(open(doc.file_path, "rb").read()).hexdigest() == doc.hash
+
+        queue = bulk_import._get_queue()
+        jobs = [queue.get_nowait() for _ in range(queue.qsize())]
+        assert [j[1] for j in jobs] == [d.id for d in docs]
+
+    @pytest.mark.asyncio
+    async def test_bad_archive_rolls_back(self, factory, tmp_path):
+        bad = UploadFile(io.BytesIO(b"not a zip"), filename="broken.zip")
+        async with factory() as db:
+            with pytest.raises(ingestion.UploadRejected) as exc:
+                await bulk_import.create_batch(db, [bad])
+        assert exc.value.status_code == 400
+        async with factory() as db:
+            assert (await db.execute(select(ImportBatch))).first() is None
+        assert os.listdir(tmp_path / "imports") == []
+
+
+class TestWorkers:
+    """Queue → process_new_document(document_id=…) → progress"""
+
+    @pytest.mark.asyncio
+    async def test_processes_placeholders_and_reports_progress(self, factory):
+        seen = []
+
+        async def process(path, file_hash=None, document_id=None):
+            assert ingestion.is_claimed(path)
+            seen.append(document_id)
+            async with factory() as db:
+                doc = await db.get(Document, document_id)
+                doc.status = "failed" if path.endswith("bad.pdf") else "processed"
+                await db.commit()
+
+        async with factory() as db:
+            result = await bulk_import.create_batch(
+                db, [_zip({"a.pdf": b"%PDF a", "b.pdf": b"%PDF b", "bad.pdf": b"%PDF bad"})]
+            )
+        bulk_import.start_workers(process, factory, concurrency=2)
+        try:
+            await bulk_import._get_queue().join()
+        finally:
+            await bulk_import.stop_workers()
+
+        assert len(seen) == 3
+        assert ingestion._claims == {}
+        async with factory() as db:
+            p = await bulk_import.progress(db, result["id"])
+        assert p["status"] == "done"
+        assert (p["completed"], p["failed"], p["queued"], p["processing"]) == (2, 1, 0, 0)
+        assert p["finished_at"] is not None and p["eta_seconds"] in (0, None)
+
+    @pytest.mark.asyncio
+    async def test_progress_eta_and_resume(self, factory):
+        async with factory() as db:
+            result = await bulk_import.create_batch(
+                db, [_zip({f"{n}.pdf": f"%PDF {n}".encode() for n in range(4)})]
+            )
+            batch = await db.get(ImportBatch, result["id"])
+            batch.started_at = datetime.utcnow() - timedelta(seconds=60)
+            docs = (await db.execute(select(Document).where(Document.import_batch_id == batch.id))).scalars().all()
+            docs[0].status = "processed"
+            docs[1].status = "processing"
+            await db.commit()
+
+            p = await bulk_import.progress(db, batch.id)
+            assert p["completed"] == 1 and p["queued"] == 2 and p["processing"] == 1
+            assert p["documents_per_minute"] == pytest.approx(1.0, rel=0.1)
+            assert p["eta_seconds"] == pytest.approx(180, rel=0.1)
+
+            # After a restart the queue is empty – queued/processing rows are re-enqueued
+            bulk_import._queue = None
+            assert await bulk_import.resume_pending(db) == 3
+            assert await bulk_import.progress(db, 999) is None
@@ -0,0 +1,159 @@
+"""
+Tests for app.calendar_export: the cached ICS feed and calendar range queries.
+"""
+from datetime import date, datetime
+
+import pytest
+
+from app import calendar_export
+from app.calendar_export import FeedFilter
+from app.models import Document
+
+from tests.helpers import make_document
+
+
+@pytest.fixture(autouse=True)
+def _cache():
+    calendar_export.invalidate()
+    yield
+    calendar_export.invalidate()
+
+
+async def _body(response) -> str:
+    if hasattr(response, "body_iterator"):
+        return b"".join([chunk async for chunk in response.body_iterator]).decode()
+    return response.body.decode()
+
+
+def _doc(i, due_on, **kw):
+    return make_document(i, **{
+        "title": f"Invoice {i}", "sender": "Acme", "document_type": "invoice", "status": "pending",
+        "due_on": due_on, "updated_at": datetime(2025, 6, 1, 12, 0, i), **kw,
+    })
+
+
+class TestRendering:
+    """calendar_export._escape / _fold / iter_feed"""
+
+    def test_escape_and_fold(self):
+        assert calendar_export._escape("a,b;c\\d\ne") == "a\\,b\\;c\\\\d\\ne"
+        folded = calendar_export._fold("SUMMARY:" + "ä" * 60)
+        lines = folded.split("\r\n")
+        assert folded.endswith("\r\n") and all(len(line.encode()) <= 75 for line in lines)
+        assert lines[1].startswith(" ") and "".join(l[1:] if n else l for n, l in enumerate(lines)) == "SUMMARY:" + "ä" * 60
+
+    @pytest.mark.asyncio
+    async def test_streams_filtered_events(self, factory):
+        async with factory() as db:
+            db.add_all([
+                _doc(1, date(2025, 7, 2), entity_id=1, title="Rent, July"),
+                _doc(2, date(2025, 7, 1), entity_id=2),
+                _doc(3, None),
+                _doc(4, date(2025, 7, 3), status="paid", entity_id=1),
+            ])
+            await db.commit()
+            ics = "".join([c async for c in calendar_export.iter_feed(db, FeedFilter())])
+            tenant = "".join([c async for c in calendar_export.iter_feed(db, FeedFilter(entity_id=1, include_paid=False))])
+
+        assert ics.startswith("BEGIN:VCALENDAR\r\n") and ics.endswith("END:VCALENDAR\r\n")
+        assert ics.count("BEGIN:VEVENT") == 3
+        assert ics.index("UID:document-2@") < ics.index("UID:document-1@")  # due-date order
+        assert "DTSTART;VALUE=DATE:20250702\r\nDTEND;VALUE=DATE:20250703" in ics
+        assert "SUMMARY:Invoice: Rent\\, July" in tenant and tenant.count("BEGIN:VEVENT") == 1
+
+
+class TestConditional:
+    """calendar_export.feed_response"""
+
+    @pytest.mark.asyncio
+    async def test_etag_cache_and_invalidation(self, factory):
+        async with factory() as db:
+            db.add(_doc(1, date(2025, 7, 1)))
+            await db.commit()
+
+            first = await calendar_export.feed_response(db, factory, 7, FeedFilter(), {})
+            etag = first.headers["etag"]
+            assert first.status_code == 200 and "UID:document-1@" in await _body(first)
+            assert first.headers["last-modified"] == "Sun, 01 Jun 2025 12:00:01 GMT"
+
+            # Conditional requests answer 304 from the cache – no rendering, no query
+            assert (await calendar_export.feed_response(db, factory, 7, FeedFilter(), {"if-none-match": etag})).status_code == 304
+            assert (await calendar_export.feed_response(
+                db, factory, 7, FeedFilter(), {"if-modified-since": first.headers["last-modified"]}
+            )).status_code == 304
+            cached = await calendar_export.feed_response(db, factory, 7, FeedFilter(), {})
+            assert not hasattr(cached, "body_iterator") and cached.headers["etag"] == etag
+
+            # Other owners / filters are separate entries
+            other = await calendar_export.feed_response(db, factory, 8, FeedFilter(), {"if-none-match": etag})
+            assert other.status_code == 200
+
+            # An ORM change to a document drops the cached feeds and changes the ETag
+            db.add(_doc(2, date(2025, 7, 5)))
+            await db.commit()
+            changed = await calendar_export.feed_response(db, factory, 7, FeedFilter(), {"if-none-match": etag})
+            assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+        # The body streams from its own session – the request session is closed by then
+        assert "UID:document-2@" in await _body(changed)
+
+    @pytest.mark.asyncio
+    async def test_last_modified_moves_when_documents_leave_the_feed(self, factory):
+        import app.export  # noqa: F401 – registers the tombstone listener
+
+        flt = FeedFilter(include_paid=False)
+        async with factory() as db:
+            db.add_all([_doc(1, date(2025, 7, 1)), _doc(2, date(2025, 7, 2)), _doc(3, date(2025, 7, 3))])
+            await db.commit()
+            first = await calendar_export.feed_response(db, factory, 7, flt, {})
+            since = {"if-modified-since": first.headers["last-modified"]}
+            assert (await calendar_export.feed_response(db, factory, 7, flt, since)).status_code == 304
+
+            # Paid → out of the filter; the filtered max(updated_at) alone would not move
+            doc = await db.get(Document, 3)
+            doc.status, doc.updated_at = "paid", datetime(2025, 6, 2)
+            await db.commit()
+            paid = await calendar_export.feed_response(db, factory, 7, flt, since)
+            assert paid.status_code == 200 and "UID:document-3@" not in await _body(paid)
+
+            # Deleted → the tombstone moves Last-Modified
+            since = {"if-modified-since": paid.headers["last-modified"]}
+            await db.delete(await db.get(Document, 1))
+            await db.commit()
+            deleted = await calendar_export.feed_response(db, factory, 7, flt, since)
+            assert deleted.status_code == 200 and "UID:document-1@" not in await _body(deleted)
+
+
+class TestRange:
+    """calendar_export.events_in_range / CalendarExportService"""
+
+    @pytest.mark.asyncio
+    async def test_projection_counts_and_tenants(self, factory):
+        async with factory() as db:
+            db.add_all([
+                _doc(1, date(2025, 7, 1), entity_id=1, amount=100.0, amount_base=100.0),
+                _doc(2, date(2025, 7, 1), entity_id=1, status="paid", amount=50.0, amount_base=50.0),
+                _doc(3, date(2025, 7, 15), entity_id=2),
+                _doc(4, date(2025, 8, 1), entity_id=1),
+            ])
+            await db.commit()
+
+            july = await calendar_export.events_in_range(db, date(2025, 7, 1), date(2025, 7, 31))
+            assert [e["id"] for e in july["events"]] == [1, 2, 3] and not july["truncated"]
+            assert set(july["events"][0]) == {
+                "id", "title", "sender", "document_type", "status", "due_date", "amount", "currency", "entity_id",
+            }
+            assert july["days"] == [
+                {"date": "2025-07-01", "count": 2, "unpaid": 1, "amount": 150.0},
+                {"date": "2025-07-15", "count": 1, "unpaid": 1, "amount": 0.0},
+            ]
+
+            tenant = await calendar_export.events_in_range(
+                db, date(2025, 7, 1), date(2025, 8, 31), entity_ids={1}, include_paid=False, with_events=False,
+            )
+            assert tenant["events"] == [] and [d["date"] for d in tenant["days"]] == ["2025-07-01", "2025-08-01"]
+            assert (await calendar_export.events_in_range(db, date(2025, 7, 1), date(2025, 7, 31), entity_ids=set()))["days"] == []
+
+            # Legacy month endpoint: end of month inclusive, typed dates only
+            month = await calendar_export.CalendarExportService(db).get_events_for_month(db, 7, 2025)
+            assert [(e["id"], e["due_date"]) for e in month] == [(1, "2025-07-01"), (2, "2025-07-01"), (3, "2025-07-15")]
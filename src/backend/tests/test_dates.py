@@ -0,0 +1,142 @@
+"""
+Tests for the canonical date parser, shadow DATE columns and SQL analytics.
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, select
+
+from app import dates
+from app.analytics import AnalyticsService
+from app.models import Document
+from app.notifications import NotificationService
+
+
+class TestParseDate:
+    """dates.parse_date"""
+
+    @pytest.mark.parametrize("value, expected", [
+        ("2024-03-31", date(2024, 3, 31)),
+        ("2024-03-31T10:15:00Z", date(2024, 3, 31)),
+        ("2024-03-31 10:15", date(2024, 3, 31)),
+        ("2024-03-311", None),               # the day must end there
+        ("2024-03-3x", None),
+        ("2024/03/31", date(2024, 3, 31)),
+        ("31.03.2024", date(2024, 3, 31)),
+        ("1.2.24", date(2024, 2, 1)),
+        ("03/31/2024", date(2024, 3, 31)),   # US month-first
+        ("31/03/2024", date(2024, 3, 31)),   # …falls back to day-first
+        ("01/02/2024", date(2024, 1, 2)),
+        ("01-02-2024", date(2024, 2, 1)),    # dash is day-first
+        (datetime(2024, 5, 6, 7, 8), date(2024, 5, 6)),
+        (date(2024, 5, 6), date(2024, 5, 6)),
+        ("2024-02-30", None),
+        ("next Tuesday", None),
+        ("", None),
+        (None, None),
+    ])
+    def test_formats(self, value, expected):
+        assert dates.parse_date(value) == expected
+
+    def test_to_iso(self):
+        assert dates.to_iso("31.03.2024") == "2024-03-31"
+        assert dates.to_iso("garbage") is None
+
+
+class TestShadowColumns:
+    """ORM listeners keep document_on / due_on / paid_on in sync"""
+
+    def test_set_events(self):
+        doc = Document(title="x", document_date="2024-01-05", due_date="31.01.2024")
+        assert (doc.document_on, doc.due_on, doc.paid_on) == (date(2024, 1, 5), date(2024, 1, 31), None)
+        doc.payment_date = "02/03/2024"
+        doc.due_date = "unknown"
+        assert doc.paid_on == date(2024, 2, 3)
+        assert doc.due_on is None
+
+
+class TestBackfill:
+    """dates.backfill"""
+
+    @pytest.mark.asyncio
+    async def test_fills_rows_written_without_the_orm(self, factory):
+        async with factory() as db:
+            # Core insert bypasses the attribute listeners – like pre-migration rows
+            await db.execute(insert(Document), [
+                {"id": 1, "title": "a", "file_path": "/a", "hash": "a",
+                 "document_date": "15.01.2024", "due_date": "2024-02-15"},
+                {"id": 2, "title": "b", "file_path": "/b", "hash": "b", "document_date": "soon"},
+                {"id": 3, "title": "c", "file_path": "/c", "hash": "c", "payment_date": "03/04/2024"},
+                {"id": 4, "title": "d", "file_path": "/d", "hash": "d"},
+            ])
+            await db.commit()
+
+        assert await dates.backfill(factory, batch_size=2) == {"scanned": 3, "parsed": 2, "changed": 2, "failed": [2]}
+        # only "soon" left – visited, reported, not rewritten
+        assert await dates.backfill(factory, batch_size=2) == {"scanned": 1, "parsed": 0, "changed": 0, "failed": [2]}
+
+        async with factory() as db:
+            rows = (await db.execute(
+                select(Document.id, Document.document_date, Document.document_on, Document.due_on, Document.paid_on)
+                .order_by(Document.id)
+            )).all()
+        assert rows[0][1:] == ("15.01.2024", date(2024, 1, 15), date(2024, 2, 15), None)
+        assert rows[1][2] is None
+        assert rows[2][4] == date(2024, 3, 4)
+
+        # normalise=True rewrites parseable text dates to ISO (cleanup-dates)
+        result = await dates.backfill(factory, normalise=True)
+        assert (result["changed"], result["failed"]) == (2, [2])  # documents 1 and 3 rewritten
+        async with factory() as db:
+            texts = (await db.execute(select(Document.document_date).order_by(Document.id))).scalars().all()
+        assert texts == ["2024-01-15", "soon", None, None]
+        assert (await dates.backfill(factory, normalise=True))["changed"] == 0  # already ISO
+
+
+class TestAnalytics:
+    """AnalyticsService month grouping / payment summary in SQL"""
+
+    @pytest.mark.asyncio
+    async def test_grouped_in_sql(self, factory):
+        today = datetime.utcnow().date()
+        this_month = today.replace(day=1)
+        last_month = (this_month - timedelta(days=1)).replace(day=1)
+        async with factory() as db:
+            db.add_all([
+                Document(title="i1", file_path="/1", hash="1", document_type="invoice", amount=100.0,
+                         status="unpaid", document_date=this_month.strftime("%d.%m.%Y"),
+                         due_date=(today - timedelta(days=3)).isoformat()),
+                Document(title="i2", file_path="/2", hash="2", document_type="invoice", amount=50.0,
+                         status="paid", document_date=(last_month + timedelta(days=4)).isoformat()),
+                Document(title="i3", file_path="/3", hash="3", document_type="invoice", amount=25.0,
+                         status="unpaid", document_date=this_month.isoformat(),
+                         due_date=(today + timedelta(days=3)).isoformat()),
+                Document(title="old", file_path="/4", hash="4", document_type="letter",
+                         document_date="2001-01-01"),
+                Document(title="undated", file_path="/5", hash="5", document_type="letter"),
+            ])
+            await db.commit()
+
+            service = AnalyticsService(db)
+            by_month = await service.get_document_count_by_month(months=3)
+            assert [(m["year"], m["month"], m["count"]) for m in by_month] == [
+                (last_month.year, last_month.month, 1),
+                (this_month.year, this_month.month, 3),  # i1, i3 + undated (created_at)
+            ]
+            assert by_month[-1]["month_name"] == this_month.strftime("%B")
+
+            amounts = await service.get_invoice_amount_by_month(months=3)
+            assert [(m["month"], m["total_amount"], m["count"]) for m in amounts] == [
+                (last_month.month, 50.0, 1), (this_month.month, 125.0, 2),
+            ]
+
+            summary = await service.get_payment_status_summary()
+            assert summary["total_invoices"] == 3
+            assert (summary["paid_invoices"], summary["unpaid_invoices"], summary["overdue_invoices"]) == (1, 2, 1)
+            assert summary["overdue_amount"] == 100.0 and summary["total_amount"] == 175.0
+
+            service = NotificationService()
+            overdue = await service.check_overdue_documents(db)
+            upcoming = await service.check_upcoming_due_dates(db, days_ahead=7)
+            assert [n["document_id"] for n in overdue] == [1]
+            assert [n["document_id"] for n in upcoming] == [3]
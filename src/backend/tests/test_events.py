@@ -0,0 +1,100 @@
+"""
+Tests for the in-process event bus behind /api/events/stream.
+"""
+import asyncio
+import json
+
+import pytest
+
+from app import events
+from app.models import Document, Entity
+from app.notifications import NotificationService
+
+
+@pytest.fixture(autouse=True)
+def _bus(monkeypatch):
+    monkeypatch.setattr(events, "_subscribers", set())
+    monkeypatch.setattr(events, "_recent", events.deque(maxlen=8))
+
+
+def _drain(sub):
+    out = []
+    while not sub.queue.empty():
+        out.append(sub.queue.get_nowait())
+    return out
+
+
+class TestBus:
+    """events.subscribe / events.publish"""
+
+    @pytest.mark.asyncio
+    async def test_filtering_lag_and_replay(self):
+        alice = events.subscribe(user_id=1, entity_ids={10})
+        admin = events.subscribe(user_id=None)
+        events.publish("document.status", {"id": 1}, entity_id=10)
+        events.publish("document.status", {"id": 2}, entity_id=20)
+        events.publish("document.status", {"id": 3})  # unassigned → everyone
+        events.publish("notification.created", {"id": 4}, user_id=2)
+        assert [e.data["id"] for e in _drain(alice)] == [1, 3]
+        assert [e.data["id"] for e in _drain(admin)] == [1, 2, 3]
+
+        # A reconnecting client resumes after its Last-Event-ID …
+        last = events.publish("document.status", {"id": 5}).id
+        resumed = events.subscribe(user_id=1, entity_ids={10}, last_event_id=last - 4)
+        assert [e.data["id"] for e in _drain(resumed)] == [3, 5]
+        # … unless the buffer no longer reaches back that far
+        assert events.subscribe(user_id=1, entity_ids={10}, last_event_id=-100).lagged
+
+        # A full queue drops events and flags the subscriber instead of blocking
+        slow = events.Subscription(user_id=1, entity_ids=None, queue=asyncio.Queue(maxsize=1))
+        events._subscribers.add(slow)
+        events.publish("document.status", {"id": 6})
+        events.publish("document.status", {"id": 7})
+        assert slow.lagged and slow.queue.qsize() == 1
+
+        frames = events.stream(slow, heartbeat=0.01)
+        assert (await frames.__anext__()).startswith("event: ready")
+        assert '"id": 6' in await frames.__anext__()
+        assert await frames.__anext__() == "event: resync\ndata: {}\n\n"
+        assert await frames.__anext__() == ": keep-alive\n\n"
+        await frames.aclose()
+        assert slow not in events._subscribers
+
+
+class TestTransactional:
+    """events._collect_status_changes / NotificationService._dispatch"""
+
+    @pytest.mark.asyncio
+    async def test_published_after_commit_only(self, factory):
+        sub = events.subscribe(user_id=1, entity_ids=None)
+        async with factory() as db:
+            db.add(Entity(name="Acme AG", alias="Acme"))
+            await db.flush()
+            doc = Document(title="scan", file_path="/s", hash="s", status="processing", entity_id=1)
+            db.add(doc)
+            await db.flush()
+            assert _drain(sub) == []  # not before commit
+            await db.commit()
+            created = _drain(sub)
+            assert [(e.type, e.data["status"], e.data["previous"], e.entity_id) for e in created] == [
+                ("document.status", "processing", None, 1),
+            ]
+
+            doc.title = "renamed"  # no status change → no event
+            await db.commit()
+            doc.status = "failed"
+            await db.flush()
+            await db.rollback()
+            assert _drain(sub) == []
+            await db.refresh(doc)
+
+            doc.status = "processed"
+            await NotificationService().create_notification(db, "Done", "scan processed", "system", document_id=doc.id)
+            await db.commit()
+        published = _drain(sub)
+        assert [(e.type, e.entity_id) for e in published] == [
+            ("document.status", 1), ("notification.created", 1),
+        ]
+        assert published[0].data["previous"] == "processing"
+        note = json.loads(events.format_sse(published[1]).split("data: ")[1])
+        assert note["title"] == "Done" and note["document_id"] == doc.id
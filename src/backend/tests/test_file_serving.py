@@ -0,0 +1,143 @@
+"""
+Tests for document file serving (Range, ETag, path cache).
+"""
+import pytest
+import pytest_asyncio
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app import file_serving
+from app.models import Document
+
+_BODY = bytes(range(256)) * 40  # 10 240 bytes
+
+
+@pytest.fixture
+def served(tmp_path):
+    path = tmp_path / "scan.pdf"
+    path.write_bytes(_BODY)
+    st = path.stat()
+    return file_serving.ServedFile(
+        path=str(path), size=st.st_size, mtime=st.st_mtime, etag='"abc123"', media_type="application/pdf"
+    )
+
+
+@pytest.fixture
+def client(served):
+    async def endpoint(request: Request):
+        return file_serving.file_response(served, request.headers)
+
+    return TestClient(Starlette(routes=[Route("/file", endpoint)]))
+
+
+class TestParseRange:
+    """file_serving.parse_range"""
+
+    @pytest.mark.parametrize("header, expected", [
+        (None, None),
+        ("bytes=0-99", (0, 99)),
+        ("bytes=100-", (100, 999)),
+        ("bytes=-100", (900, 999)),
+        ("bytes=-5000", (0, 999)),
+        ("bytes=990-5000", (990, 999)),
+        ("bytes=0-1,5-9", None),   # multi-range → whole file
+        ("items=0-1", None),
+        ("bytes=abc", None),
+    ])
+    def test_ranges(self, header, expected):
+        assert file_serving.parse_range(header, 1000) == expected
+
+    @pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5-2", "bytes=-0"])
+    def test_unsatisfiable(self, header):
+        with pytest.raises(ValueError):
+            file_serving.parse_range(header, 1000)
+
+
+class TestFileResponse:
+    """file_serving.file_response"""
+
+    def test_full_file(self, client):
+        r = client.get("/file")
+        assert r.status_code == 200
+        assert r.content == _BODY
+        assert r.headers["content-type"] == "application/pdf"
+        assert r.headers["etag"] == '"abc123"'
+        assert r.headers["accept-ranges"] == "bytes"
+        assert r.headers["content-length"] == str(len(_BODY))
+
+    def test_range(self, client, monkeypatch):
+        monkeypatch.setattr(file_serving, "_CHUNK", 100)  # slice spans several chunks
+        r = client.get("/file", headers={"Range": "bytes=1000-1999"})
+        assert r.status_code == 206
+        assert r.content == _BODY[1000:2000]
+        assert r.headers["content-range"] == f"bytes 1000-1999/{len(_BODY)}"
+        assert r.headers["content-length"] == "1000"
+
+        r = client.get("/file", headers={"Range": "bytes=-10"})
+        assert r.status_code == 206 and r.content == _BODY[-10:]
+
+    def test_unsatisfiable_range(self, client):
+        r = client.get("/file", headers={"Range": "bytes=999999-"})
+        assert r.status_code == 416
+        assert r.headers["content-range"] == f"bytes */{len(_BODY)}"
+
+    def test_if_none_match(self, client):
+        r = client.get("/file", headers={"If-None-Match": 'W/"abc123", "other"'})
+        assert r.status_code == 304
+        assert r.content == b""
+        assert r.headers["etag"] == '"abc123"'
+        assert client.get("/file", headers={"If-None-Match": '"stale"'}).status_code == 200
+
+    def test_if_range(self, client):
+        r = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": '"abc123"'})
+        assert r.status_code == 206
+        r = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": '"changed"'})
+        assert r.status_code == 200 and r.content == _BODY
+
+
+@pytest_asyncio.fixture
+async def session(factory, monkeypatch):
+    monkeypatch.setattr(file_serving, "_paths", file_serving.TTLCache(maxsize=16, ttl=60))
+    async with factory() as db:
+        yield db
+
+
+class TestLookup:
+    """file_serving.lookup"""
+
+    @pytest.mark.asyncio
+    async def test_archive_fallback_cache_and_mime(self, session, tmp_path, monkeypatch):
+        inbox, archive = tmp_path / "inbox", tmp_path / "archive"
+        archive.mkdir()
+        (archive / "photo.JPG").write_bytes(b"jpeg")
+        monkeypatch.setenv("WATCH_FOLDER", str(inbox))
+        monkeypatch.setenv("ARCHIVE_FOLDER", str(archive))
+        session.add_all([
+            Document(id=1, title="Photo", file_path=str(inbox / "photo.JPG"), hash="f00"),
+            Document(id=2, title="Legacy", file_path=str(archive / "photo.JPG"), hash=""),
+        ])
+        await session.commit()
+
+        served = await file_serving.lookup(session, 1)
+        assert served.path == str(archive / "photo.JPG")
+        assert served.etag == '"f00"'
+        assert served.media_type == "image/jpeg"
+        assert served.size == 4
+
+        # Cached: no database round-trip while the file is still there
+        async def _no_db(*args, **kwargs):
+            raise AssertionError("database queried")
+        with monkeypatch.context() as m:
+            m.setattr(session, "execute", _no_db)
+            assert (await file_serving.lookup(session, 1)).path == served.path
+
+        # No hash → weak validator
+        assert (await file_serving.lookup(session, 2)).etag.startswith('W/"')
+
+        (archive / "photo.JPG").unlink()
+        with pytest.raises(file_serving.FileMissing):
+            await file_serving.lookup(session, 1)
+        with pytest.raises(file_serving.FileMissing):
+            await file_serving.lookup(session, 99)
@@ -0,0 +1,152 @@
+"""
+Tests for the full-text index (SQLite FTS5) and hybrid rank fusion.
+"""
+from datetime import date
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+
+from app import fulltext
+from app.models import Document
+from app.search import SearchService
+
+
+@pytest_asyncio.fixture
+async def session(factory, monkeypatch):
+    monkeypatch.setattr(fulltext, "_backend", None)
+    async with factory() as db:
+        conn = await db.connection()
+        # One document stored before the index exists → picked up by the rebuild
+        await conn.execute(Document.__table__.insert().values(
+            title="Hetzner Rechnung", sender="Hetzner Online GmbH", content="Server hosting",
+            file_path="/a.pdf", hash="a", document_type="invoice", status="unpaid",
+            document_date="2024-03-01", document_on=date(2024, 3, 1),
+        ))
+        assert await fulltext.ensure_index(conn) == "fts5"
+        await db.commit()
+
+        db.add_all([
+            Document(title="Swisscom Rechnung Mai", sender="Swisscom AG", content="Mobile abo",
+                     file_path="/b.pdf", hash="b", document_type="invoice", status="paid",
+                     document_date="2024-05-01"),
+            Document(title="Mietvertrag", sender="Immo AG", content="Wohnung Zürich miete",
+                     file_path="/c.pdf", hash="c", document_type="contract", status="pending",
+                     document_date="2023-01-10"),
+        ])
+        await db.commit()
+        yield db
+
+
+class TestRrfFuse:
+    """Reciprocal-rank fusion."""
+
+    def test_documents_in_both_lists_win(self):
+        fused = fulltext.rrf_fuse([[1, 2, 3], [3, 4, 1]])
+        assert [doc_id for doc_id, _ in fused][:2] == [1, 3]
+        assert {doc_id for doc_id, _ in fused} == {1, 2, 3, 4}
+
+    def test_empty(self):
+        assert fulltext.rrf_fuse([[], []]) == []
+
+
+class TestTsConfig:
+    """FULLTEXT_TS_CONFIG validation and binding."""
+
+    def test_invalid_names_fall_back_to_simple(self):
+        assert fulltext._ts_config("german") == "german"
+        assert fulltext._ts_config("simple'); DROP TABLE documents; --") == "simple"
+
+    def test_postgres_query_binds_config(self, monkeypatch):
+        from sqlalchemy.dialects import postgresql
+
+        monkeypatch.setattr(fulltext, "_backend", "postgres")
+        compiled = fulltext.match_clause("rechnung").compile(dialect=postgresql.dialect())
+        assert "CAST(%(fts_cfg)s AS regconfig)" in str(compiled)
+        assert compiled.params["fts_cfg"] == fulltext._TS_CONFIG
+
+
+class TestFts5:
+    """SQLite FTS5 backend kept in sync by triggers."""
+
+    @pytest.mark.asyncio
+    async def test_rebuild_insert_and_prefix(self, session):
+        ids = [i for i, _ in await fulltext.search_ids(session, "rechn", prefix=True)]
+        titles = {d.title for d in (await session.execute(
+            select(Document).where(Document.id.in_(ids)))).scalars()}
+        assert titles == {"Hetzner Rechnung", "Swisscom Rechnung Mai"}
+
+    @pytest.mark.asyncio
+    async def test_ranked_search_matches_whole_terms_by_default(self, session):
+        assert await fulltext.search_ids(session, "rechn") == []
+        assert len(await fulltext.search_ids(session, "rechnung")) == 2
+
+    @pytest.mark.asyncio
+    async def test_diacritics_and_update_trigger(self, session):
+        assert len(await fulltext.search_ids(session, "zurich")) == 1
+        doc = (await session.execute(select(Document).where(Document.hash == "c"))).scalar_one()
+        doc.content = "Wohnung Basel"
+        await session.commit()
+        assert await fulltext.search_ids(session, "zurich") == []
+        assert len(await fulltext.search_ids(session, "basel")) == 1
+
+    @pytest.mark.asyncio
+    async def test_match_clause_and_syntax_is_quoted(self, session):
+        rows = await session.execute(select(Document.hash).where(fulltext.match_clause("swisscom")))
+        assert rows.scalars().all() == ["b"]
+        # FTS5 operators in user input must not raise
+        assert await fulltext.search_ids(session, 'AND "( NEAR*') == []
+
+    @pytest.mark.asyncio
+    async def test_hybrid_search_facets_and_filters(self, session):
+        result = await SearchService(session).hybrid_search("rechnung", semantic=False)
+        assert result["total"] == 2
+        assert result["facets"]["status"] == {"unpaid": 1, "paid": 1}
+        assert result["facets"]["year"] == {"2024": 2}
+
+        paid = await SearchService(session).hybrid_search(
+            "rechnung", semantic=False, filters={"status": "paid"}, page_size=1
+        )
+        assert paid["total"] == 1
+        assert paid["items"][0]["sender"] == "Swisscom AG"
+        assert paid["items"][0]["fulltext_rank"] is not None
+
+    @pytest.mark.asyncio
+    async def test_filters_reach_past_the_candidate_window(self, session):
+        # 30 matching documents of another tenant rank ahead of tenant 7's one
+        session.add_all([
+            Document(title=f"Rechnung {i}", sender="Noise AG", file_path=f"/n{i}", hash=f"n{i}",
+                     status="unpaid", entity_id=1, document_date="31.01.2024")
+            for i in range(30)
+        ] + [Document(title="Rechnung Tenant", sender="Seven AG", file_path="/t", hash="t",
+                      status="unpaid", entity_id=7, document_date="03/15/2022")])
+        await session.commit()
+        service = SearchService(session)
+
+        scoped = await service.hybrid_search("rechnung", semantic=False, candidates=5, filters={"entity_id": 7})
+        assert scoped["total"] == 1 and scoped["items"][0]["sender"] == "Seven AG"
+        assert scoped["facets"]["year"] == {"2022": 1}
+
+        everything = await service.hybrid_search("rechnung", semantic=False, candidates=5, page=4, page_size=10)
+        assert everything["total"] == 33 and len(everything["items"]) == 3
+        assert everything["facets"]["year"] == {"2024": 32, "2022": 1}
+
+    @pytest.mark.asyncio
+    async def test_local_vector_candidates_overfetch_until_filter_is_met(self, session, monkeypatch):
+        from app import local_vector_index
+
+        ids = [d for d in (await session.execute(select(Document.id).order_by(Document.id))).scalars()]
+        calls = []
+
+        class _Index:
+            def search(self, vector, k):
+                calls.append(k)
+                ranked = list(reversed(ids))  # the contract (newest) ranks first
+                return [(i, 1.0) for i in ranked[:k]]
+
+        monkeypatch.setattr(local_vector_index, "is_active", lambda: True)
+        monkeypatch.setattr(local_vector_index, "get_index", lambda: _Index())
+        hits = await SearchService(session)._vector_candidates(
+            [0.1], 2, [Document.document_type == "invoice"]
+        )
+        assert [i for i, _ in hits] == [ids[1], ids[0]] and calls == [8]
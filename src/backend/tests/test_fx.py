@@ -0,0 +1,142 @@
+"""
+Tests for FX rate loading and base-currency amounts.
+"""
+import asyncio
+from datetime import date
+
+import pytest
+from sqlalchemy import insert, select
+
+from app import fx, rollups
+from app.analytics import AnalyticsService
+from app.config import settings
+from app.models import Document
+
+ECB_HIST = """Date,USD,JPY,CHF,XYZ,
+2024-03-01,1.0800,162.0,0.9500,N/A,
+2024-02-01,1.0900,160.0,0.9400,N/A,
+"""
+
+
+@pytest.fixture
+def factory(factory, monkeypatch):
+    monkeypatch.setattr(settings, "DEFAULT_CURRENCY", "CHF")
+    return factory
+
+
+class TestParseCsv:
+    """fx.parse_csv"""
+
+    def test_ecb_dumps_and_long_format(self):
+        rows = fx.parse_csv(ECB_HIST)
+        assert ("USD", date(2024, 3, 1), 1.08) in rows
+        assert len(rows) == 6  # N/A and the trailing empty column are skipped
+
+        daily = fx.parse_csv("\ufeffDate, USD, CHF, \n17 June 2025, 1.1500, 0.9400, \n")
+        assert daily == [("USD", date(2025, 6, 17), 1.15), ("CHF", date(2025, 6, 17), 0.94)]
+
+        long = fx.parse_csv("currency,date,rate\nusd,2024-01-02,1.1\nGBP,bad,0.8\n")
+        assert long == [("USD", date(2024, 1, 2), 1.1)]
+
+        with pytest.raises(ValueError):
+            fx.parse_csv("foo,bar\n1,2\n")
+
+
+class TestConversion:
+    """fx._convert_amounts / fx.reconvert"""
+
+    @pytest.mark.asyncio
+    async def test_amount_base_on_write_and_bulk_reconvert(self, factory):
+        assert await fx.load_csv(factory, ECB_HIST) == {"rates": 6, "currencies": ["CHF", "JPY", "USD"]}
+        async with factory() as db:
+            docs = [
+                Document(title="eur", file_path="/1", hash="1", amount=100.0, currency="EUR",
+                         document_date="2024-03-15"),
+                Document(title="usd", file_path="/2", hash="2", amount=108.0, currency="usd ",
+                         document_date="2024-03-15"),
+                Document(title="early", file_path="/3", hash="3", amount=100.0, currency="EUR",
+                         document_date="2023-01-01"),  # before the first rate → earliest
+                Document(title="chf", file_path="/4", hash="4", amount=50.0, currency="CHF"),
+                Document(title="gbp", file_path="/5", hash="5", amount=10.0, currency="GBP"),
+            ]
+            db.add_all(docs)
+            await db.commit()
+            assert [round(d.amount_base, 6) for d in docs[:4]] == [95.0, 95.0, 94.0, 50.0]
+            assert docs[4].amount_base is None
+
+            docs[0].document_date = "2024-02-10"  # conversion day follows the date
+            await db.commit()
+            assert round(docs[0].amount_base, 6) == 94.0
+
+            # Rows written without the ORM are converted in bulk
+            await db.execute(insert(Document), [
+                {"title": "core", "file_path": "/6", "hash": "6", "amount": 162.0, "currency": "JPY",
+                 "document_on": date(2024, 3, 2)},
+            ])
+            await db.commit()
+
+        assert await fx.reconvert(factory, only_missing=True, batch_size=2) == 1  # JPY row; GBP has no rate → unchanged
+        assert await fx.load_csv(factory, "date,currency,rate\n2024-01-01,GBP,0.5\n") == {
+            "rates": 1, "currencies": ["GBP"],
+        }
+        assert await fx.reconvert(factory, currencies=["GBP"]) == 1
+        async with factory() as db:
+            rows = dict((await db.execute(select(Document.hash, Document.amount_base))).all())
+        assert round(rows["6"], 6) == 0.95
+        assert round(rows["5"], 6) == 19.0
+
+        # Base currency change → everything re-converted
+        settings.DEFAULT_CURRENCY = "USD"
+        assert await fx.reconvert(factory) == 6
+        async with factory() as db:
+            rows = dict((await db.execute(select(Document.hash, Document.amount_base))).all())
+        assert round(rows["2"], 6) == 108.0 and round(rows["4"], 6) == round(50.0 / 0.95 * 1.08, 6)
+
+    @pytest.mark.asyncio
+    async def test_scheduled_runs_are_tracked(self, factory, monkeypatch, caplog):
+        monkeypatch.setattr(rollups, "_ready", True)
+        monkeypatch.setattr(rollups, "_stale", False)
+        await fx.load_csv(factory, ECB_HIST)
+        async with factory() as db:
+            await db.execute(insert(Document), [
+                {"title": "usd", "file_path": "/1", "hash": "1", "amount": 108.0, "currency": "USD",
+                 "document_on": date(2024, 3, 1)},
+            ])
+            await db.commit()
+
+        # A newer full run supersedes the pending one; rollups wait for it
+        first, second = fx.schedule_reconvert(factory), fx.schedule_reconvert(factory)
+        assert fx._reconvert_task is second
+        await asyncio.sleep(0)
+        assert not rollups.is_ready()
+        assert await second == 1 and first.cancelled()
+        assert rollups.is_ready() and rollups._stale
+
+        def broken():
+            raise RuntimeError("db gone")
+
+        with caplog.at_level("WARNING", logger="app.fx"):
+            await asyncio.wait([fx.schedule_reconvert(broken)])
+            await asyncio.sleep(0)
+        assert "FX re-conversion failed: db gone" in caplog.text
+        assert rollups.is_ready()
+
+
+class TestAnalytics:
+    """AnalyticsService sums base-currency amounts"""
+
+    @pytest.mark.asyncio
+    async def test_payment_summary_in_base_currency(self, factory):
+        await fx.load_csv(factory, ECB_HIST)
+        async with factory() as db:
+            db.add_all([
+                Document(title="a", file_path="/a", hash="a", document_type="invoice", status="paid",
+                         amount=100.0, currency="EUR", document_date="2024-03-05"),
+                Document(title="b", file_path="/b", hash="b", document_type="invoice", status="unpaid",
+                         amount=10.0, currency="CHF", document_date="2024-03-05"),
+            ])
+            await db.commit()
+            summary = await AnalyticsService(db).get_payment_status_summary()
+        assert summary["currency"] == "CHF"
+        assert round(summary["total_amount"], 6) == 105.0
+        assert round(summary["paid_amount"], 6) == 95.0
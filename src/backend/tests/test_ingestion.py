@@ -0,0 +1,93 @@
+"""
+Tests for streaming uploads and the ingestion claim registry.
+"""
+import hashlib
+import io
+import os
+
+import pytest
+import pytest_asyncio
+from starlette.datastructures import UploadFile
+
+from app import ingestion
+from app.models import Document
+
+_KNOWN = b"%PDF-1.4 already stored"
+
+
+@pytest_asyncio.fixture
+async def session(factory, monkeypatch):
+    monkeypatch.setattr(ingestion, "_CHUNK", 4)  # many chunks for tiny payloads
+    monkeypatch.setattr(ingestion, "_claims", {})
+    async with factory() as db:
+        db.add(Document(title="Known", file_path="/k.pdf", hash=hashlib.sha256(_KNOWN).hexdigest()))
+        await db.commit()
+        yield db
+
+
+def _upload(data: bytes, name: str = "invoice.pdf") -> UploadFile:
+    return UploadFile(io.BytesIO(data), filename=name)
+
+
+class TestSaveUpload:
+    """ingestion.save_upload"""
+
+    @pytest.mark.asyncio
+    async def test_streams_hashes_and_claims(self, session, tmp_path):
+        inbox = tmp_path / "inbox"
+        data = b"%PDF-1.4 new document body"
+        stored = await ingestion.save_upload(_upload(data), session, folder=str(inbox), max_size=1024)
+
+        assert stored.sha256 == hashlib.sha256(data).hexdigest()
+        assert stored.size == len(data)
+        assert open(stored.path, "rb").read() == data
+        assert os.listdir(inbox) == ["invoice.pdf"]  # no .part left behind
+        assert ingestion.is_claimed(stored.path)
+
+        # Same name, different content → unique name, not an overwrite
+        again = await ingestion.save_upload(_upload(b"other"), session, folder=str(inbox), max_size=1024)
+        assert os.path.basename(again.path) == "invoice (1).pdf"
+
+        # Same content while the first is still in flight → 409
+        with pytest.raises(ingestion.UploadRejected) as exc:
+            await ingestion.save_upload(_upload(data, "copy.pdf"), session, folder=str(inbox), max_size=1024)
+        assert exc.value.status_code == 409
+
+    @pytest.mark.asyncio
+    async def test_rejects_oversized_and_duplicates(self, session, tmp_path):
+        inbox = tmp_path / "inbox"
+        with pytest.raises(ingestion.UploadRejected) as exc:
+            await ingestion.save_upload(_upload(b"x" * 100), session, folder=str(inbox), max_size=10)
+        assert exc.value.status_code == 413
+
+        with pytest.raises(ingestion.UploadRejected) as exc:
+            await ingestion.save_upload(_upload(_KNOWN), session, folder=str(inbox), max_size=1024)
+        assert exc.value.status_code == 409
+        assert exc.value.document_id == 1
+
+        with pytest.raises(ingestion.UploadRejected):
+            await ingestion.save_upload(_upload(b"x", "../../etc/.hidden"), session, folder=str(inbox))
+        assert os.listdir(inbox) == []
+
+
+class TestClaims:
+    """Watcher and upload share one claim per path."""
+
+    @pytest.mark.asyncio
+    async def test_watcher_skips_claimed_paths(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(ingestion, "_claims", {})
+        seen = []
+
+        async def process(path, **kwargs):
+            seen.append(path)
+            # A second watcher event for the same file while processing
+            await ingestion.ingest_path(path, process)
+
+        path = str(tmp_path / "a.pdf")
+        assert ingestion.claim(path, "abc")
+        await ingestion.ingest_path(path, process)
+        assert seen == []
+
+        await ingestion.process_claimed(path, process)
+        assert seen == [path]
+        assert not ingestion.is_claimed(path)
@@ -0,0 +1,67 @@
+"""
+Tests for the embedded vector index used on SQLite installs.
+"""
+import numpy as np
+import pytest
+
+from app import local_vector_index as lvi
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    return rng.standard_normal((200, 16)).astype(np.float32)
+
+
+class TestLocalVectorIndex:
+    """Incremental add/delete and persistence."""
+
+    def test_nearest_neighbour(self, tmp_path, vectors):
+        index = lvi.LocalVectorIndex(str(tmp_path), dim=16)
+        index.add_many(list(range(200)), vectors)
+        doc_id, score = index.search(vectors[42], k=1)[0]
+        assert doc_id == 42
+        assert score == pytest.approx(1.0, abs=1e-5)
+
+    def test_update_replaces_vector(self, tmp_path, vectors):
+        index = lvi.LocalVectorIndex(str(tmp_path), dim=16)
+        index.add_many(list(range(200)), vectors)
+        index.add(1, vectors[150])
+        assert len(index) == 200
+        assert {d for d, _ in index.search(vectors[150], k=2)} == {1, 150}
+
+    def test_delete_and_reopen(self, tmp_path, vectors):
+        index = lvi.LocalVectorIndex(str(tmp_path), dim=16)
+        index.add_many(list(range(200)), vectors)
+        assert index.delete(7) is True
+        assert index.delete(7) is False
+        index.flush()
+
+        reopened = lvi.LocalVectorIndex(str(tmp_path))
+        assert reopened.dim == 16
+        assert len(reopened) == 199
+        assert 7 not in {d for d, _ in reopened.search(vectors[7], k=5)}
+
+    def test_compaction_keeps_live_rows(self, tmp_path, vectors):
+        index = lvi.LocalVectorIndex(str(tmp_path), dim=16)
+        index.add_many(list(range(200)), vectors)
+        for doc_id in range(0, 200, 2):
+            index.delete(doc_id)
+        index.compact()
+        assert len(index) == 100
+        assert index.search(vectors[101], k=1)[0][0] == 101
+
+    @pytest.mark.skipif(lvi.hnswlib is None, reason="hnswlib not installed")
+    def test_hnsw_backend(self, tmp_path, vectors, monkeypatch):
+        monkeypatch.setattr(lvi, "_HNSW_MIN", 50)
+        index = lvi.LocalVectorIndex(str(tmp_path), dim=16)
+        index.add_many(list(range(200)), vectors)
+        assert index._hnsw is not None
+        index.delete(3)
+        assert index.search(vectors[9], k=1)[0][0] == 9
+        assert 3 not in {d for d, _ in index.search(vectors[3], k=5)}
+
+    def test_parse_embedding(self):
+        assert lvi.parse_embedding("[1.0, 2.5]").tolist() == [1.0, 2.5]
+        assert lvi.parse_embedding(None) is None
+        assert lvi.parse_embedding("") is None
@@ -0,0 +1,195 @@
+"""
+Tests for the set-based due-date notification scan and the outbox dispatcher.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, select, update
+
+from app import outbox
+from app.models import Document, Notification, NotificationOutbox
+from app.notifications import NotificationChannel, NotificationService
+
+
+class _Recorder(NotificationChannel):
+    batch_size = 2
+
+    def __init__(self, name="recorder", **policy):
+        self.name = name
+        self.batches = []
+        self.__dict__.update(policy)
+
+    async def send(self, notification, db):  # pragma: no cover – send_many is used
+        raise AssertionError("expected batched delivery")
+
+    async def send_many(self, notifications, db):
+        self.batches.append([n.document_id for n in notifications])
+
+
+class _Flaky(_Recorder):
+    def __init__(self, failures, **policy):
+        super().__init__(name="flaky", **policy)
+        self.failures = failures
+
+    async def send_many(self, notifications, db):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("smtp down")
+        await super().send_many(notifications, db)
+
+
+@pytest.fixture(autouse=True)
+def _registry(monkeypatch):
+    monkeypatch.setattr(outbox, "_channels", {})
+    monkeypatch.setattr(outbox, "_buckets", {})
+
+
+class TestDueScans:
+    """NotificationService.check_overdue_documents / check_upcoming_due_dates"""
+
+    @pytest.mark.asyncio
+    async def test_set_based_scan(self, factory):
+        today = datetime.utcnow().date()
+        async with factory() as db:
+            db.add_all([
+                Document(title=f"late{n}", file_path=f"/l{n}", hash=f"l{n}", status="unpaid",
+                         due_date=(today - timedelta(days=n + 1)).isoformat())
+                for n in range(5)
+            ] + [
+                Document(title="paid", file_path="/p", hash="p", status="paid",
+                         due_date=(today - timedelta(days=3)).isoformat()),
+                Document(title="soon", file_path="/s", hash="s", status="unpaid",
+                         due_date=(today + timedelta(days=2)).isoformat()),
+                Document(title="later", file_path="/x", hash="x", status="unpaid",
+                         due_date=(today + timedelta(days=30)).isoformat()),
+            ])
+            await db.commit()
+
+        statements = []
+        event.listen(factory.kw["bind"].sync_engine, "before_cursor_execute",
+                     lambda conn, cursor, stmt, *a: statements.append(stmt))
+
+        channel = _Recorder()
+        service = NotificationService(channels=[channel])
+        async with factory() as db:
+            overdue = await service.check_overdue_documents(db)
+            await db.commit()
+        # Oldest due date first; one select + one insert each for notifications
+        # and outbox rows regardless of size – channels are not called yet
+        assert [n["title"] for n in overdue] == [f"Overdue: late{n}" for n in range(4, -1, -1)]
+        assert overdue[0]["message"].endswith("is 5 days overdue (due %s)." % (today - timedelta(days=5)).isoformat())
+        assert all(n["id"] for n in overdue)
+        assert len([s for s in statements if s.lstrip().upper().startswith(("SELECT", "INSERT"))]) == 3
+        assert channel.batches == []
+
+        assert await outbox.dispatch_once(factory) == {"recorder": 5}
+        # Batches are delivered concurrently – completion order is not fixed
+        assert sorted(channel.batches) == sorted([[o["document_id"] for o in overdue[i:i + 2]] for i in (0, 2, 4)])
+        assert await outbox.dispatch_once(factory) == {"recorder": 0}
+
+        async with factory() as db:
+            assert await service.check_overdue_documents(db) == []  # anti-join: already notified
+            upcoming = await service.check_upcoming_due_dates(db, days_ahead=7)
+            assert [n["title"] for n in upcoming] == ["Upcoming: soon"]
+            assert upcoming[0]["message"] == f"Document 'soon' is due in 2 days ({(today + timedelta(days=2)).isoformat()})."
+
+            # Reading a notification re-arms the reminder for that document
+            await service.mark_all_as_read(db)
+            assert len(await service.check_overdue_documents(db)) == 5
+            await db.commit()
+            total = len((await db.execute(select(Notification.id))).all())
+        assert total == 11
+
+
+async def _notify(factory, service, count):
+    async with factory() as db:
+        for n in range(count):
+            await service.create_notification(db, f"n{n}", "msg", "system", document_id=n + 1)
+        await db.commit()
+
+
+async def _statuses(factory):
+    async with factory() as db:
+        rows = (await db.execute(
+            select(NotificationOutbox.status, NotificationOutbox.attempts).order_by(NotificationOutbox.id)
+        )).all()
+    return [tuple(r) for r in rows]
+
+
+class TestOutbox:
+    """outbox.enqueue / outbox.dispatch_once"""
+
+    @pytest.mark.asyncio
+    async def test_rollback_queues_nothing(self, factory):
+        channel = _Recorder()
+        service = NotificationService(channels=[channel])
+        async with factory() as db:
+            await service.create_notification(db, "t", "m", "system")
+            await db.rollback()
+        assert await outbox.dispatch_once(factory) == {"recorder": 0}
+        assert await _statuses(factory) == []
+
+    @pytest.mark.asyncio
+    async def test_retries_with_backoff_then_fails(self, factory, monkeypatch):
+        monkeypatch.setattr(outbox, "_BACKOFF_BASE", 0)
+        channel = _Flaky(failures=1, batch_size=1)
+        await _notify(factory, NotificationService(channels=[channel]), 1)
+        # First attempt fails; due again at once (zero backoff) and the retry succeeds
+        assert await outbox.dispatch_once(factory) == {"flaky": 0}
+        assert await _statuses(factory) == [("pending", 1)]
+        assert await outbox.dispatch_once(factory) == {"flaky": 1}
+        assert await _statuses(factory) == [("sent", 2)]
+
+        monkeypatch.setattr(outbox, "_BACKOFF_BASE", 60)
+        hopeless = _Flaky(failures=99, batch_size=1, max_attempts=3)
+        await _notify(factory, NotificationService(channels=[hopeless]), 1)
+        assert await outbox.dispatch_once(factory) == {"flaky": 0}
+        assert (await _statuses(factory))[1] == ("pending", 1)  # backing off
+        async with factory() as db:
+            await db.execute(update(NotificationOutbox).values(next_attempt_at=datetime.utcnow()))
+            await db.commit()
+        monkeypatch.setattr(outbox, "_BACKOFF_BASE", 0)
+        for _ in range(3):  # one attempt per pass; the third attempt is the last
+            await outbox.dispatch_once(factory)
+        async with factory() as db:
+            row = (await db.execute(select(NotificationOutbox).order_by(NotificationOutbox.id.desc()))).scalars().first()
+        assert (row.status, row.attempts, row.last_error) == ("failed", 3, "ConnectionError: smtp down")
+
+    @pytest.mark.asyncio
+    async def test_rate_limit_and_digest_window(self, factory):
+        limited = _Recorder(name="sms", batch_size=1, rate_per_minute=2)
+        digest = _Recorder(name="digest", batch_size=3, batch_window=3600)
+        await _notify(factory, NotificationService(channels=[limited, digest]), 4)
+
+        # Two sends per minute; the digest ships one full batch and holds the rest
+        assert await outbox.dispatch_once(factory) == {"sms": 2, "digest": 3}
+        assert await outbox.dispatch_once(factory) == {"sms": 0, "digest": 0}
+        assert [len(b) for b in digest.batches] == [3]
+
+        async with factory() as db:
+            await db.execute(
+                update(NotificationOutbox).values(created_at=datetime.utcnow() - timedelta(hours=2))
+            )
+            await db.commit()
+        assert (await outbox.dispatch_once(factory))["digest"] == 1  # window elapsed
+
+    @pytest.mark.asyncio
+    async def test_slow_channel_does_not_block_others(self, factory):
+        release = asyncio.Event()
+
+        class _Slow(_Recorder):
+            async def send_many(self, notifications, db):
+                await release.wait()
+                await super().send_many(notifications, db)
+
+        slow, fast = _Slow(name="slow", batch_size=1, timeout=None), _Recorder(name="fast", batch_size=1)
+        await _notify(factory, NotificationService(channels=[slow, fast]), 3)
+        pending = asyncio.create_task(outbox.dispatch_once(factory))
+        for _ in range(200):
+            if len(fast.batches) == 3:
+                break
+            await asyncio.sleep(0.01)
+        assert len(fast.batches) == 3 and slow.batches == []
+        release.set()
+        assert await pending == {"slow": 3, "fast": 3}
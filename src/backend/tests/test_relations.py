@@ -0,0 +1,97 @@
+"""
+Tests for the related-documents engine.
+"""
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+
+from app import relations
+from app.models import Document, DocumentRelation
+from app.search import SearchService
+
+
+@pytest_asyncio.fixture
+async def session(factory):
+    async with factory() as db:
+        db.add_all([
+            Document(id=1, title="Rechnung 4711", sender="Swisscom AG", document_type="invoice",
+                     amount=49.9, document_date="2024-04-03", file_path="/1", hash="1"),
+            Document(id=2, title="Rechnung 4812", sender="Swisscom AG", document_type="invoice",
+                     amount=49.9, document_date="2024-05-03", file_path="/2", hash="2"),
+            Document(id=3, title="1. Mahnung", sender="swisscom ag", document_type="letter",
+                     amount=59.9, document_date="2024-05-20", file_path="/3", hash="3"),
+            Document(id=4, title="Police", sender="Helsana", document_type="contract",
+                     amount=300.0, document_date="2024-01-01", file_path="/4", hash="4"),
+        ])
+        await db.commit()
+        yield db
+
+
+class TestPairHeuristics:
+    """Recurring-period detection."""
+
+    def test_recurring_periods(self):
+        d = relations._parse_date
+        assert relations._is_recurring(d("2024-01-31"), d("2024-02-28"))
+        assert relations._is_recurring(d("2024-01-15"), d("2024-04-12"))
+        assert not relations._is_recurring(d("2024-01-15"), d("2024-02-28"))
+        assert not relations._is_recurring(d("2024-01-15"), None)
+
+
+class TestRelations:
+    """Stored relations and the related-documents API."""
+
+    @pytest.mark.asyncio
+    async def test_compute_and_lookup(self, session):
+        await relations.compute_relations(session, 2)
+        await session.commit()
+
+        related = {r["id"]: r for r in await relations.related_for(session, 2)}
+        assert related[1]["relationship_types"] == ["recurring"]
+        assert related[3]["relationship_types"] == ["invoice_reminder"]
+        assert 4 not in related
+
+        # Links are symmetric: 3 sees 2 although only 2 was computed
+        back = await relations.related_for(session, 3)
+        assert [r["id"] for r in back] == [2]
+
+    @pytest.mark.asyncio
+    async def test_recompute_replaces_rows(self, session):
+        await relations.compute_relations(session, 2)
+        await relations.compute_relations(session, 2)
+        count = len((await session.execute(
+            select(DocumentRelation).where(DocumentRelation.document_id == 2))).scalars().all())
+        assert count == 2
+
+    @pytest.mark.asyncio
+    async def test_recompute_keeps_links_found_by_other_documents(self, session):
+        await relations.compute_relations(session, 3)  # 3 → 2 (reminder), 3 → 1
+        await relations.compute_relations(session, 2)
+        await relations.compute_relations(session, 2)
+        owners = (await session.execute(
+            select(DocumentRelation.document_id).where(DocumentRelation.related_id == 2))).scalars().all()
+        assert 3 in owners
+        related = {r["id"]: r["relationship_types"] for r in await relations.related_for(session, 2)}
+        assert related[3] == ["invoice_reminder"]  # found by both sides, listed once
+
+    @pytest.mark.asyncio
+    async def test_search_service_computes_on_demand(self, session):
+        results = await SearchService(session).suggest_related_documents(1)
+        assert results[0]["id"] == 2
+        assert results[0]["relationship_type"] == "recurring"
+        assert results[0]["confidence"] == 8.0
+
+    @pytest.mark.asyncio
+    async def test_document_without_relations_is_computed_once(self, session, monkeypatch):
+        calls = []
+        compute = relations.compute_relations
+
+        async def _counting(db, document_id):
+            calls.append(document_id)
+            return await compute(db, document_id)
+
+        monkeypatch.setattr(relations, "compute_relations", _counting)
+        service = SearchService(session)
+        assert await service.suggest_related_documents(4) == []
+        assert await service.suggest_related_documents(4) == []
+        assert calls == [4] and await relations.is_computed(session, 4)
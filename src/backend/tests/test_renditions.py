@@ -0,0 +1,99 @@
+"""
+Tests for the page thumbnail / preview rendition cache.
+"""
+import os
+import time
+
+import pytest
+from PIL import Image
+
+from app import renditions
+
+fitz = pytest.importorskip("fitz")
+
+_DIGEST = "ab" + "0" * 62
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("RENDITION_CACHE_DIR", str(tmp_path / "renditions"))
+    return tmp_path / "renditions"
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    path = tmp_path / "three.pdf"
+    doc = fitz.open()
+    for n in range(3):
+        page = doc.new_page(width=595, height=842)
+        page.insert_text((72, 72), f"Page {n + 1}")
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def _size(path):
+    with Image.open(path) as img:
+        assert img.format == "WEBP"
+        return img.size
+
+
+class TestGenerate:
+    """renditions.generate / renditions.get"""
+
+    @pytest.mark.asyncio
+    async def test_rasterises_first_pages_and_renders_rest_on_demand(self, pdf, cache, monkeypatch):
+        monkeypatch.setattr(renditions, "_PAGES", 2)
+        assert await renditions.generate(pdf, _DIGEST) == 2
+
+        folder = cache / "ab" / _DIGEST
+        assert sorted(os.listdir(folder)) == [
+            "0-preview.webp", "0-thumbnail.webp", "1-preview.webp", "1-thumbnail.webp",
+        ]
+        assert max(_size(folder / "0-thumbnail.webp")) == 256
+        assert max(_size(folder / "0-preview.webp")) == 1200
+
+        # Page 3 was not pre-rendered → rendered on first request
+        path = await renditions.get(pdf, _DIGEST, 2, "thumbnail")
+        assert path == renditions.rendition_path(_DIGEST, 2, "thumbnail")
+        assert os.path.exists(path)
+
+        assert await renditions.get(pdf, _DIGEST, 7, "thumbnail") is None
+        with pytest.raises(ValueError):
+            await renditions.get(pdf, _DIGEST, 0, "poster")
+
+    @pytest.mark.asyncio
+    async def test_reuses_rasters_and_images(self, tmp_path, cache):
+        rasters = [Image.new("RGB", (2000, 1000), "white"), Image.new("L", (100, 50))]
+        assert await renditions.generate("/does/not/matter.pdf", _DIGEST, images=rasters) == 2
+        assert _size(renditions.rendition_path(_DIGEST, 0, "thumbnail")) == (256, 128)
+        assert _size(renditions.rendition_path(_DIGEST, 1, "preview")) == (100, 50)  # never upscaled
+
+        png = tmp_path / "scan.png"
+        Image.new("RGB", (400, 800), "grey").save(png)
+        digest = "cd" + "1" * 62
+        path = await renditions.get(str(png), digest, 0, "thumbnail")
+        assert _size(path) == (128, 256)
+        assert await renditions.get(str(png), digest, 1, "thumbnail") is None
+        assert await renditions.generate(str(png), "") == 0
+
+
+class TestEvict:
+    """renditions.evict"""
+
+    def test_removes_least_recently_used(self, cache):
+        paths = []
+        for n in range(5):
+            digest = f"{n:02d}" + "f" * 62
+            path = renditions.rendition_path(digest, 0, "thumbnail")
+            os.makedirs(os.path.dirname(path))
+            with open(path, "wb") as fh:
+                fh.write(b"x" * 1000)
+            os.utime(path, (time.time() - 100 + n, time.time() - 100 + n))
+            paths.append(path)
+        os.utime(paths[0])  # recently served → kept
+
+        assert renditions.evict(max_bytes=10_000) == 0
+        assert renditions.evict(max_bytes=3_000) == 3
+        assert [os.path.exists(p) for p in paths] == [True, False, False, False, True]
+        assert not os.path.exists(os.path.dirname(paths[1]))  # empty document folder dropped
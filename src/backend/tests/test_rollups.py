@@ -0,0 +1,155 @@
+"""
+Tests for the pre-aggregated analytics rollups.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import delete, insert, select
+
+from app import rollups
+from app.analytics import AnalyticsService
+from app.config import settings
+from app.models import Document, DocumentRollup
+
+from tests.helpers import make_document
+
+
+@pytest.fixture
+def factory(factory, monkeypatch):
+    monkeypatch.setattr(rollups, "_ready", False)
+    monkeypatch.setattr(rollups, "_stale", False)
+    monkeypatch.setattr(settings, "DEFAULT_CURRENCY", "EUR")
+    return factory
+
+
+async def _rollups(factory):
+    async with factory() as db:
+        rows = (await db.execute(select(DocumentRollup))).scalars().all()
+    return {
+        (r.entity_id, r.month, r.document_type, r.status, r.currency): (r.doc_count, r.amount_sum)
+        for r in rows if r.doc_count
+    }
+
+
+class TestIncremental:
+    """rollups._after_flush"""
+
+    @pytest.mark.asyncio
+    async def test_orm_writes_match_a_full_reconcile(self, factory):
+        async with factory() as db:
+            db.add_all([
+                make_document(1, document_type="invoice", status="unpaid", amount=100.0, currency="EUR",
+                     document_date="2024-03-05", entity_id=1),
+                make_document(2, document_type="invoice", status="unpaid", amount=40.0, currency="EUR",
+                     document_date="2024-03-20", entity_id=1),
+                make_document(3, document_type="letter", document_date="02.04.2024"),
+            ])
+            await db.commit()
+        assert await _rollups(factory) == {
+            (1, "2024-03", "invoice", "unpaid", "EUR"): (2, 140.0),
+            (0, "2024-04", "letter", "pending", ""): (1, 0.0),
+        }
+
+        async with factory() as db:
+            docs = {d.id: d for d in (await db.execute(select(Document))).scalars()}
+            docs[1].status = "paid"                 # key moves
+            docs[2].amount = 45.0                   # amount changes in place
+            docs[3].document_date = "2024-05-01"    # month moves
+            await db.commit()
+            await db.delete(docs[2])
+            await db.commit()
+
+        incremental = await _rollups(factory)
+        assert incremental == {
+            (1, "2024-03", "invoice", "paid", "EUR"): (1, 100.0),
+            (0, "2024-05", "letter", "pending", ""): (1, 0.0),
+        }
+        assert await rollups.reconcile(factory) >= 0
+        assert await _rollups(factory) == incremental
+
+    @pytest.mark.asyncio
+    async def test_reconcile_fixes_core_writes(self, factory):
+        async with factory() as db:
+            db.add(make_document(1, document_type="invoice", status="paid", amount=10.0, document_date="2024-01-10"))
+            await db.commit()
+            # Core statements bypass the listener → drift
+            await db.execute(insert(Document), [
+                {"title": "q", "file_path": "/q", "hash": "q", "status": "queued",
+                 "created_at": datetime(2024, 2, 1, 12, 0)},
+            ])
+            await db.execute(delete(Document).where(Document.hash == "1"))
+            await db.commit()
+
+        assert await _rollups(factory) == {(0, "2024-01", "invoice", "paid", ""): (1, 10.0)}
+        assert not rollups.is_ready()
+        assert await rollups.reconcile(factory) == 2
+        assert rollups.is_ready()
+        assert await _rollups(factory) == {(0, "2024-02", "", "queued", ""): (1, 0.0)}
+        assert await rollups.reconcile(factory) == 0
+
+
+class TestAnalyticsReads:
+    """AnalyticsService on the rollup tables"""
+
+    @pytest.mark.asyncio
+    async def test_matches_live_queries(self, factory):
+        today = datetime.utcnow().date()
+        async with factory() as db:
+            db.add_all([
+                make_document(1, document_type="invoice", status="unpaid", amount=100.0, entity_id=1,
+                     document_date=today.isoformat(), due_date="2001-01-01"),
+                make_document(2, document_type="invoice", status="paid", amount=50.0, entity_id=2,
+                     document_date=today.isoformat()),
+                make_document(3, document_type="letter", entity_id=1, document_date=today.isoformat()),
+                make_document(4, document_type="invoice", status="unpaid", amount=30.0, currency="GBP",
+                              entity_id=2, document_date=today.isoformat()),  # no GBP rate
+            ])
+            await db.commit()
+
+        async def _all(service):
+            return (
+                await service.get_document_count_by_type(),
+                await service.get_document_count_by_status(),
+                await service.get_document_count_by_month(months=2),
+                await service.get_invoice_amount_by_month(months=2),
+                await service.get_payment_status_summary(),
+            )
+
+        async with factory() as db:
+            live = [await _all(AnalyticsService(db, entity_id=e)) for e in (None, 1)]
+            assert await rollups.reconcile(factory) == 0  # the listener kept them exact
+            rolled = [await _all(AnalyticsService(db, entity_id=e)) for e in (None, 1)]
+
+        sort = lambda rows: sorted(rows, key=repr)  # noqa: E731
+        for before, after in zip(live, rolled):
+            assert sort(before[0]) == sort(after[0])
+            assert sort(before[1]) == sort(after[1])
+            assert before[2:] == after[2:]
+        assert rolled[1][4]["total_invoices"] == 1 and rolled[1][4]["overdue_amount"] == 100.0
+        assert rolled[0][4]["paid_amount"] == 50.0
+        # Unconvertible amounts stay out of base totals and are reported per currency
+        assert rolled[0][4]["total_amount"] == 150.0 and rolled[0][4]["unconverted_count"] == 1
+        assert rolled[0][4]["unconverted"] == [{"currency": "GBP", "count": 1, "amount": 30.0}]
+        assert sum(m["unconverted_count"] for m in rolled[0][3]) == 1
+
+    @pytest.mark.asyncio
+    async def test_invoice_months_match_live_queries(self, factory):
+        today = datetime.utcnow().date()
+        first_month = (today - timedelta(days=60)).replace(day=1)
+        async with factory() as db:
+            db.add_all([
+                make_document(1, document_type="invoice", amount=100.0, document_date=today.isoformat()),
+                make_document(2, document_type="invoice", document_date=today.isoformat()),  # no amount
+                make_document(3, document_type="invoice", amount=50.0),  # undated → created_at
+                make_document(4, document_type="invoice", amount=7.0, document_date=first_month.isoformat()),
+            ])
+            await db.commit()
+
+            live = await AnalyticsService(db).get_invoice_amount_by_month(months=2)
+            await rollups.reconcile(factory)
+            rolled = await AnalyticsService(db).get_invoice_amount_by_month(months=2)
+
+        assert live == rolled
+        this_month = [m for m in live if (m["year"], m["month"]) == (today.year, today.month)]
+        assert [(m["total_amount"], m["count"]) for m in this_month] == [(150.0, 3)]
+        assert sum(m["count"] for m in live) == 4
@@ -0,0 +1,141 @@
+"""
+Tests for the cron-style scheduler.
+"""
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+from app import scheduler
+from app.models import Document, JobRun
+from app.scheduler import CronExpr
+
+from tests.helpers import make_document
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(scheduler, "_jobs", {})
+    monkeypatch.setattr(scheduler, "_running", {})
+    return scheduler._jobs
+
+
+class TestCronExpr:
+    """scheduler.CronExpr"""
+
+    @pytest.mark.parametrize("expr, after, expected", [
+        ("0 2 * * *", datetime(2025, 6, 1, 1, 59, 30), datetime(2025, 6, 1, 2, 0)),
+        ("0 2 * * *", datetime(2025, 6, 1, 2, 0), datetime(2025, 6, 2, 2, 0)),  # strictly after
+        ("*/15 * * * *", datetime(2025, 6, 1, 10, 7), datetime(2025, 6, 1, 10, 15)),
+        ("0 */6 * * *", datetime(2025, 6, 1, 19, 0), datetime(2025, 6, 2, 0, 0)),
+        ("30 9 * * mon-fri", datetime(2025, 6, 6, 10, 0), datetime(2025, 6, 9, 9, 30)),  # Fri → Mon
+        ("0 5 * * 0", datetime(2025, 6, 1, 6, 0), datetime(2025, 6, 8, 5, 0)),  # Sunday
+        ("0 5 * * 7", datetime(2025, 6, 1, 6, 0), datetime(2025, 6, 8, 5, 0)),  # 7 is Sunday too
+        ("0 0 1,15 * *", datetime(2025, 6, 2), datetime(2025, 6, 15)),
+        ("0 0 13 * fri", datetime(2025, 6, 7), datetime(2025, 6, 13)),  # either day field
+        ("0 0 29 feb *", datetime(2025, 3, 1), datetime(2028, 2, 29)),
+        ("@monthly", datetime(2025, 12, 31, 23, 59), datetime(2026, 1, 1)),
+        ("5-10/5 1,3 * * *", datetime(2025, 6, 1, 1, 5), datetime(2025, 6, 1, 1, 10)),
+    ])
+    def test_next_after(self, expr, after, expected):
+        assert CronExpr(expr).next_after(after) == expected
+
+    @pytest.mark.parametrize("expr", ["* * * *", "60 * * * *", "0 0 32 * *", "*/0 * * * *", "0 0 * foo *"])
+    def test_invalid(self, expr):
+        with pytest.raises(ValueError):
+            CronExpr(expr)
+
+    def test_never_fires(self):
+        with pytest.raises(ValueError):
+            CronExpr("0 0 31 feb *").next_after(datetime(2025, 1, 1))
+
+
+class TestRuns:
+    """scheduler.run_job / scheduler.status"""
+
+    @pytest.mark.asyncio
+    async def test_single_runner_history_and_status(self, factory, registry):
+        calls = []
+
+        @scheduler.job("count", "*/5 * * * *")
+        async def _count(session_factory):
+            """Count things."""
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 42
+
+        @scheduler.job("broken", "@daily", timeout=0.05)
+        async def _broken(session_factory):
+            await asyncio.sleep(1)
+
+        slot = datetime(2025, 6, 1, 10, 5)
+        # Two workers fire the same slot – exactly one runs it
+        results = await asyncio.gather(*(
+            scheduler.run_job("count", slot, session_factory=factory) for _ in range(2)
+        ))
+        assert sorted(results, key=str) == [None, "ok"] and len(calls) == 1
+        assert await scheduler.run_job("broken", slot, session_factory=factory) == "failed"
+
+        async with factory() as db:
+            runs = {r.job: r for r in (await db.scalars(select(JobRun))).all()}
+            assert runs["count"].detail == "42" and runs["count"].duration_ms >= 10
+            assert runs["broken"].error == "timed out after 0s"
+
+            status = {s["name"]: s for s in await scheduler.status(db)}
+        assert status["count"]["description"] == "Count things."
+        assert status["count"]["cron"] == "*/5 * * * *" and status["count"]["next_run"]
+        assert status["count"]["last_run"]["status"] == "ok"
+        assert status["broken"]["stats"]["failures"] == 1
+
+    @pytest.mark.asyncio
+    async def test_env_override_and_catch_up(self, factory, registry, monkeypatch):
+        monkeypatch.setenv("SCHEDULE_QUIET", "off")
+
+        @scheduler.job("quiet", "* * * * *")
+        async def _quiet(session_factory):
+            return None
+
+        @scheduler.job("nightly", "0 2 * * *", catch_up=True)
+        async def _nightly(session_factory):
+            return None
+
+        assert registry["quiet"].cron is None
+        now = datetime(2025, 6, 3, 12, 0)
+        # Never ran → the latest slot before now is caught up
+        assert await scheduler._missed_slots(factory, now) == {"nightly": datetime(2025, 6, 3, 2, 0)}
+        assert await scheduler.run_job("nightly", datetime(2025, 6, 3, 2, 0), session_factory=factory) == "ok"
+        assert await scheduler._missed_slots(factory, now) == {}
+        assert await scheduler._missed_slots(factory, datetime(2025, 6, 5, 3, 0)) == {
+            "nightly": datetime(2025, 6, 5, 2, 0),
+        }
+
+
+class TestJobs:
+    """scheduler._embedding_backfill"""
+
+    @pytest.mark.asyncio
+    async def test_embedding_backfill_moves_past_blank_content(self, factory, monkeypatch):
+        from app import embeddings, local_vector_index
+
+        async def _embed(text):
+            return [0.5] * 1536
+
+        monkeypatch.setattr(scheduler, "_EMBEDDING_BATCH", 2)
+        monkeypatch.setattr(embeddings, "get_embedding", _embed)
+        monkeypatch.setattr(local_vector_index, "is_active", lambda: False)
+        async with factory() as db:
+            db.add_all(
+                [make_document(n, content="\n\t\n", status="processed") for n in range(1, 4)]
+                + [make_document(4, content="   ", status="processed"),
+                   make_document(5, content="Rechnung", status="processed"),
+                   make_document(6, content="Mahnung", status="processed")]
+            )
+            await db.commit()
+
+        assert await scheduler._embedding_backfill(factory) == 2
+        async with factory() as db:
+            embedded = (await db.execute(
+                select(Document.id).where(Document.embedding.isnot(None)).order_by(Document.id)
+            )).scalars().all()
+        assert embedded == [5, 6]
@@ -0,0 +1,95 @@
+"""
+Tests for the async SearchService and its query-intent cache.
+"""
+import json
+
+import pytest
+import pytest_asyncio
+
+from app import fulltext, search
+from app.cache import TTLCache
+from app.models import Document
+from app.search import SearchService
+
+
+class _FakeLLM:
+    """Stands in for LLMProcessor – counts round-trips."""
+
+    def __init__(self, response):
+        self.response = response
+        self.calls = 0
+
+    async def _query_llm(self, prompt, task_type="enricher"):
+        self.calls += 1
+        return self.response
+
+
+@pytest_asyncio.fixture
+async def session(factory, monkeypatch):
+    monkeypatch.setattr(fulltext, "_backend", None)
+    monkeypatch.setattr(search, "_intent_cache", TTLCache(maxsize=8, ttl=60))
+    async with factory() as db:
+        await fulltext.ensure_index(await db.connection())
+        await db.commit()
+        db.add_all([
+            Document(title="Swisscom Rechnung", sender="Swisscom AG", content="Mobile abo",
+                     file_path="/a.pdf", hash="a", document_type="invoice", status="unpaid",
+                     document_date="2024-05-01", amount=49.9),
+            Document(title="Steuererklärung", sender="Kanton Zürich", content="Steuern 2023",
+                     file_path="/b.pdf", hash="b", document_type="letter", status="pending",
+                     document_date="2024-02-01", amount=1200.0),
+        ])
+        await db.commit()
+        yield db
+
+
+class TestTTLCache:
+    """LRU eviction and expiry."""
+
+    def test_lru_and_ttl(self):
+        now = [0.0]
+        cache = TTLCache(maxsize=2, ttl=10, clock=lambda: now[0])
+        cache.set("a", 1)
+        cache.set("b", 2)
+        assert cache.get("a") == 1  # a is now most recent
+        cache.set("c", 3)  # evicts b
+        assert cache.get("b") is None
+        now[0] = 11
+        assert cache.get("a") is None
+        assert cache.stats()["hits"] == 1
+
+
+class TestSearchService:
+    """Async select()-based search paths."""
+
+    @pytest.mark.asyncio
+    async def test_basic_search(self, session):
+        results = await SearchService(session).basic_search("swiss")
+        assert [r["sender"] for r in results] == ["Swisscom AG"]
+        assert results[0]["relevance"] == "high"
+        assert results[0]["amount"] == 49.9
+
+    @pytest.mark.asyncio
+    async def test_advanced_search_filters(self, session):
+        results = await SearchService(session).advanced_search(
+            {"amount_range": {"min": 100}, "keywords": ["steuern"]}
+        )
+        assert [r["title"] for r in results] == ["Steuererklärung"]
+
+    @pytest.mark.asyncio
+    async def test_intent_is_cached_per_normalised_query(self, session):
+        service = SearchService(session)
+        service.llm_processor = _FakeLLM("```json\n" + json.dumps({"status": "unpaid"}) + "\n```")
+
+        first = await service.advanced_search("Unpaid invoices?")
+        second = await service.advanced_search("  unpaid   INVOICES ")
+        assert service.llm_processor.calls == 1
+        assert [r["status"] for r in first] == [r["status"] for r in second] == ["unpaid"]
+
+    @pytest.mark.asyncio
+    async def test_unparseable_intent_not_cached(self, session):
+        service = SearchService(session)
+        service.llm_processor = _FakeLLM("sorry, no idea")
+        assert await service.extract_search_intent("rechnung") == {"keywords": ["rechnung"]}
+        await service.extract_search_intent("rechnung")
+        assert service.llm_processor.calls == 2
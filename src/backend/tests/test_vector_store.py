@@ -0,0 +1,68 @@
+"""
+Tests for the async Qdrant helper running in embedded (local) mode.
+"""
+import pytest
+import pytest_asyncio
+
+pytest.importorskip("qdrant_client")
+
+from app import vector_store
+
+
+@pytest_asyncio.fixture
+async def local_store(monkeypatch):
+    """Point the module at an in-memory embedded Qdrant and reset its state."""
+    monkeypatch.setattr(vector_store, "_MODE", "local")
+    monkeypatch.setattr(vector_store, "_LOCAL_PATH", None)
+    monkeypatch.setattr(vector_store, "_QUANTIZATION", "none")
+    monkeypatch.setattr(vector_store, "_client", None)
+    monkeypatch.setattr(vector_store, "_collection_lock", None)
+    monkeypatch.setattr(vector_store, "_flush_lock", None)
+    monkeypatch.setattr(vector_store, "_ready_collections", set())
+    monkeypatch.setattr(vector_store, "_pending", [])
+    yield vector_store
+    await vector_store.aclose()
+
+
+class TestPointIds:
+    """Derived point IDs round-trip."""
+
+    def test_split_inverts_point_id(self):
+        pid = vector_store.point_id(123456, 7, 1029)
+        assert vector_store.split_point_id(pid) == (123456, 7, 1029)
+
+    def test_out_of_range_page_rejected(self):
+        with pytest.raises(ValueError):
+            vector_store.point_id(1, 5000, 0)
+
+
+class TestBufferedWrites:
+    """Writes are buffered and flushed in batches."""
+
+    @pytest.mark.asyncio
+    async def test_add_flush_search_delete(self, local_store):
+        assert await local_store.add_page(1, 0, [[1.0, 0.0, 0.0], [0.9, 0.1, 0.0]]) == 2
+        assert await local_store.add_page(2, 0, [[0.0, 1.0, 0.0]]) == 1
+        assert len(local_store._pending) == 3  # below batch threshold → still buffered
+
+        assert await local_store.flush() == 3
+        assert local_store._pending == []
+
+        hits = await local_store.search([1.0, 0.0, 0.0], top_k=1)
+        assert hits[0].payload["doc_id"] == 1
+
+        await local_store.delete_document(1)
+        hits = await local_store.search([1.0, 0.0, 0.0], top_k=5)
+        assert {h.payload["doc_id"] for h in hits} == {2}
+
+    @pytest.mark.asyncio
+    async def test_batch_threshold_triggers_flush(self, local_store, monkeypatch):
+        monkeypatch.setattr(local_store, "_BATCH_POINTS", 2)
+        await local_store.add_page(3, 0, [[0.0, 0.0, 1.0], [0.0, 0.1, 0.9]])
+        assert local_store._pending == []
+
+    @pytest.mark.asyncio
+    async def test_delete_drops_unflushed_points(self, local_store):
+        await local_store.add_page(4, 0, [[0.5, 0.5, 0.0]])
+        await local_store.delete_document(4)
+        assert local_store._pending == []
@@ -0,0 +1,112 @@
+"""
+Tests for the vendor dimension and SQL-side vendor analytics.
+"""
+from datetime import date
+
+import pytest
+from sqlalchemy import insert, select
+
+from app import vendors
+from app.config import settings
+from app.models import Document, Vendor
+
+from tests.helpers import make_document
+
+
+@pytest.fixture
+def factory(factory, monkeypatch):
+    monkeypatch.setattr(settings, "DEFAULT_CURRENCY", "CHF")
+    vendors.invalidate()
+    return factory
+
+
+def _doc(n, sender="Visana AG", **kw):
+    return make_document(n, sender=sender, document_type="invoice", **kw)
+
+
+class TestCanonicalName:
+    """vendors.canonical_name"""
+
+    def test_strips_suffix_and_punctuation(self):
+        assert vendors.canonical_name("Visana Services AG.") == "visanaservices"
+        assert vendors.canonical_name("ACME, Inc") == "acme"
+        assert vendors.canonical_name(None) == ""
+
+
+class TestResolution:
+    """vendors._resolve_vendors / vendors.link_documents"""
+
+    @pytest.mark.asyncio
+    async def test_orm_writes_and_backfill(self, factory):
+        async with factory() as db:
+            a, b, c = _doc(1), _doc(2, sender="VISANA"), _doc(3, sender="Swisscom (Schweiz) AG")
+            db.add_all([a, b, c, _doc(4, sender=None)])
+            await db.commit()
+            assert a.vendor_id == b.vendor_id != c.vendor_id
+
+            c.sender = "visana ag"
+            await db.commit()
+            assert c.vendor_id == a.vendor_id
+
+            # Rows written without the ORM (pre-migration data) are linked in batches
+            await db.execute(insert(Document), [
+                {"title": "x", "file_path": "/x", "hash": "x", "sender": "Visana"},
+                {"title": "y", "file_path": "/y", "hash": "y", "sender": "Post CH AG"},
+            ])
+            await db.commit()
+
+        assert await vendors.link_documents(factory, batch_size=1) == 2
+        assert await vendors.link_documents(factory) == 0
+        async with factory() as db:
+            names = (await db.execute(select(Vendor.canonical).order_by(Vendor.id))).scalars().all()
+            linked = (await db.execute(
+                select(Document.hash, Document.vendor_id).where(Document.hash.in_(["x", "y"])).order_by(Document.hash)
+            )).all()
+        assert names == ["visana", "swisscomschweiz", "postch"]
+        assert [v for _, v in linked] == [1, 3]
+
+
+class TestAnalytics:
+    """vendors.analytics"""
+
+    @pytest.mark.asyncio
+    async def test_totals_gaps_and_cache(self, factory):
+        year = date.today().year
+        # Monthly invoices Jan–Jun of last year with March missing
+        months = [1, 2, 4, 5, 6]
+        async with factory() as db:
+            db.add_all([
+                _doc(m, amount=100.0 + m, tax_amount=8.0, currency="CHF",
+                     document_date=f"{year - 1}-{m:02d}-15")
+                for m in months
+            ] + [
+                _doc(99, amount=10.0, document_date=None),
+                _doc(98, amount=20.0, currency="usd", document_date=f"{year - 1}-06-20"),  # no USD rate
+            ])
+            await db.commit()
+
+            vendor_id = await vendors.resolve(db, "Visana AG")
+            assert vendor_id == await vendors.resolve(db, "visa")  # ILIKE fallback
+            assert await vendors.resolve(db, "nobody") is None
+
+            result = await vendors.analytics(db, vendor_id)
+            assert result["summary"]["total_invoices"] == 7
+            assert result["summary"]["unconverted"] == [{"currency": "USD", "count": 1, "amount": 20.0}]
+            assert result["yearly_breakdown"] == [{
+                "year": year - 1, "total_amount": 518.0, "total_vat": 40.0,
+                "invoice_count": 6, "average_amount": 103.6,
+            }]
+            assert [m["period"] for m in result["monthly_totals"]][:2] == [f"{year - 1}-01", f"{year - 1}-02"]
+            assert result["missing_periods"] == [{"period": f"{year - 1}-03", "month_name": "March", "year": year - 1}]
+            assert result["summary"]["frequency_pattern"] == "unknown"  # fewer than six months
+            assert sorted(result["monthly_pattern"]) == [f"{year - 1}-{m:02d}" for m in months]
+            assert result["all_invoices"][-1]["title"] == "d99"  # undated last
+
+            # Cached until a document of the vendor changes
+            assert await vendors.analytics(db, vendor_id) is result
+            db.add(_doc(3, amount=103.0, document_date=f"{year - 1}-03-15"))
+            await db.commit()
+            refreshed = await vendors.analytics(db, vendor_id)
+            assert refreshed is not result
+            assert refreshed["missing_periods"] == []
+            assert refreshed["summary"]["frequency_pattern"] == "monthly"
@@ -3,7 +3,7 @@ import { Card, CardHeader, CardTitle, CardContent } from '../ui/card';
 import { Badge } from '../ui/badge';
 import { Skeleton } from '../ui/skeleton';
 import { formatDistanceToNow } from 'date-fns';
-import { processingApi } from '../../services/api';
+import { processingApi, subscribeEvents } from '../../services/api';
 import { Link } from 'react-router-dom';
 import { ArrowRight } from 'lucide-react';
 
@@ -65,11 +65,20 @@ const ProcessingQueue: React.FC = () => {
 
   useEffect(() => {
     fetchProcessingStatus();
-    
-    // Poll every 3 seconds for real-time updates
-    const interval = setInterval(fetchProcessingStatus, 3000);
-    
-    return () => clearInterval(interval);
+
+    // Refetch when a document changes status (coalesced) instead of polling
+    let pending: ReturnType<typeof setTimeout> | null = null;
+    const unsubscribe = subscribeEvents((type) => {
+      if (type === 'document.status' || type === 'resync') {
+        if (pending) clearTimeout(pending);
+        pending = setTimeout(fetchProcessingStatus, 500);
+      }
+    });
+
+    return () => {
+      unsubscribe();
+      if (pending) clearTimeout(pending);
+    };
   }, []);
 
   if (error) {
@@ -33,6 +33,8 @@ interface VendorAnalytics {
     years_active: number;
     frequency_pattern: string;
     recent_activity: number;
+    // Amounts with no FX rate – not part of the totals
+    unconverted?: Array<{ currency: string; count: number; amount: number }>;
   };
   yearly_breakdown: Array<{
     year: number;
@@ -253,6 +255,11 @@ const VendorAnalytics: React.FC = () => {
                 <p className="text-2xl font-bold text-gray-900 dark:text-white">
                   {formatCurrency(analytics.summary.total_amount, analytics.currency)}
                 </p>
+                {analytics.summary.unconverted?.map((u) => (
+                  <p key={u.currency} className="text-xs text-gray-500 dark:text-gray-400">
+                    + {formatCurrency(u.amount, u.currency || analytics.currency)} without exchange rate
+                  </p>
+                ))}
               </div>
             </div>
           </div>
@@ -29,41 +29,18 @@ import {
   isBefore,
   differenceInCalendarDays,
 } from 'date-fns';
-import { calendarApi, API_BASE_URL } from '../services/api';
+import { calendarApi, useCalendarRange, API_BASE_URL } from '../services/api';
 import { toast } from 'sonner';
 
-// ---------------------------------------------------------------------------
-// Placeholder events – replace with real API later
-// ---------------------------------------------------------------------------
-const sampleEvents = [
-  {
-    id: 1,
-    invoiceId: 'INV-2025-0520',
-    dueDate: '2025-05-20',
-    sender: 'AWS',
-    amount: 450.25,
-    currency: 'USD',
-    status: 'Pending',
-  },
-  {
-    id: 2,
-    invoiceId: 'INV-2025-0524',
-    dueDate: '2025-05-24',
-    sender: 'Stripe',
-    amount: 210.0,
-    currency: 'USD',
-    status: 'Scheduled',
-  },
-  {
-    id: 3,
-    invoiceId: 'INV-2025-0519',
-    dueDate: '2025-05-19',
-    sender: 'Google Cloud',
-    amount: 380.4,
-    currency: 'USD',
-    status: 'Overdue',
-  },
-];
+type DayEvent = {
+  id: number;
+  invoiceId: string;
+  dueDate: string;
+  sender: string;
+  amount: number;
+  currency: string;
+  status: string;
+};
 
 const statusColor = (status: string) => {
   switch (status.toLowerCase()) {
@@ -85,21 +62,46 @@ const CalendarPage: React.FC = () => {
   const [horizon, setHorizon] = useState<number>(14); // days ahead for upcoming list
   const [apiKey, setApiKey] = useState<string | null>(null);
 
-  // Events mapped by date (yyyy-MM-dd → [])
-  const eventsByDate = useMemo(() => {
-    const map: Record<string, typeof sampleEvents> = {};
-    sampleEvents.forEach((e) => {
-      map[e.dueDate] = [...(map[e.dueDate] ?? []), e];
-    });
-    return map;
-  }, []);
-
   // Generate calendar grid (start on Monday)
   const monthStart = startOfMonth(currentMonth);
   const monthEnd = endOfMonth(currentMonth);
   const startDate = startOfWeek(monthStart, { weekStartsOn: 1 });
   const endDate = endOfWeek(monthEnd, { weekStartsOn: 1 });
 
+  // One range call covers the visible grid and the upcoming-payments horizon
+  const horizonEnd = addDays(today, 30);
+  const { range } = useCalendarRange(
+    format(isBefore(today, startDate) ? today : startDate, 'yyyy-MM-dd'),
+    format(isBefore(endDate, horizonEnd) ? horizonEnd : endDate, 'yyyy-MM-dd'),
+  );
+
+  const events = useMemo<DayEvent[]>(() => {
+    const todayKey = format(today, 'yyyy-MM-dd');
+    return (range?.events ?? []).map((e) => {
+      const status = e.status ?? 'pending';
+      const overdue = status.toLowerCase() !== 'paid' && e.due_date < todayKey;
+      return {
+        id: e.id,
+        invoiceId: e.title,
+        dueDate: e.due_date,
+        sender: e.sender ?? '',
+        amount: e.amount ?? 0,
+        currency: e.currency ?? '',
+        status: overdue ? 'Overdue' : status,
+      };
+    });
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [range]);
+
+  // Events mapped by date (yyyy-MM-dd → [])
+  const eventsByDate = useMemo(() => {
+    const map: Record<string, DayEvent[]> = {};
+    events.forEach((e) => {
+      map[e.dueDate] = [...(map[e.dueDate] ?? []), e];
+    });
+    return map;
+  }, [events]);
+
   const dates: Date[] = [];
   for (let d = startDate; d <= endDate; d = addDays(d, 1)) {
     dates.push(d);
@@ -107,23 +109,23 @@ const CalendarPage: React.FC = () => {
 
   // Upcoming payments list
   const upcoming = useMemo(() => {
-    const arr = [...sampleEvents].filter((e) => {
+    const arr = [...events].filter((e) => {
       const diff = differenceInCalendarDays(new Date(e.dueDate), today);
       return diff >= 0 && diff <= horizon;
     });
     arr.sort((a, b) => (a.dueDate < b.dueDate ? -1 : 1));
     return arr;
-  }, [horizon]);
+  }, [events, horizon]);
 
   const kpis = useMemo(() => {
-    const totalDue = sampleEvents.reduce(
+    const totalDue = events.reduce(
       (sum, e) => (isSameMonth(new Date(e.dueDate), currentMonth) ? sum + e.amount : sum),
       0,
     );
-    const overdue = sampleEvents.filter((e) => e.status.toLowerCase() === 'overdue').length;
+    const overdue = events.filter((e) => e.status.toLowerCase() === 'overdue').length;
     const next7 = upcoming.length;
     return { totalDue, overdue, next7 };
-  }, [currentMonth, upcoming]);
+  }, [events, currentMonth, upcoming]);
 
   const renderDayCell = (day: Date) => {
     const dateKey = format(day, 'yyyy-MM-dd');
@@ -32,6 +32,7 @@ import {
 import { format } from 'date-fns';
 import { Link } from 'react-router-dom';
 import ProcessingQueue from '../components/dashboard/ProcessingQueue';
+import { subscribeEvents } from '../services/api';
 import DueSoonList from '../components/dashboard/DueSoonList';
 import SmartStats from '../components/dashboard/SmartStats';
 import AlertsPanel from '../components/dashboard/AlertsPanel';
@@ -53,6 +54,9 @@ interface AnalyticsData {
       paid_percentage: number;
       unpaid_percentage: number;
       overdue_percentage: number;
+      // Amounts with no FX rate – not part of the totals above
+      unconverted_count?: number;
+      unconverted?: Array<{ currency: string; count: number; amount: number }>;
     };
   };
   monthlyInvoices: Array<{ year: number; month: number; month_name: string; total_amount: number; count: number }>;
@@ -350,6 +354,12 @@ const PaymentStatusOverview: React.FC = () => {
             </div>
           </div>
         </div>
+        {!!paymentSummary.unconverted_count && (
+          <div className="mt-4 text-xs text-muted-foreground">
+            Not included (no exchange rate):{' '}
+            {paymentSummary.unconverted?.map((u) => `${u.currency || '?'} ${u.amount.toLocaleString()} (${u.count})`).join(', ')}
+          </div>
+        )}
       </CardContent>
     </Card>
   );
@@ -411,10 +421,19 @@ const DocumentProcessingStatus: React.FC = () => {
     };
 
     fetchProcessingStats();
-    
-    // Refresh every 10 seconds
-    const interval = setInterval(fetchProcessingStats, 10000);
-    return () => clearInterval(interval);
+
+    // Refresh when a document changes status (coalesced) instead of polling
+    let pending: ReturnType<typeof setTimeout> | null = null;
+    const unsubscribe = subscribeEvents((type) => {
+      if (type === 'document.status' || type === 'resync') {
+        if (pending) clearTimeout(pending);
+        pending = setTimeout(fetchProcessingStats, 1000);
+      }
+    });
+    return () => {
+      unsubscribe();
+      if (pending) clearTimeout(pending);
+    };
   }, []);
 
   if (loading) {
@@ -19,7 +19,7 @@ import {
   RotateCcw
 } from 'lucide-react';
 import { formatDistanceToNow } from 'date-fns';
-import { processingApi, settingsApi } from '../services/api';
+import { processingApi, settingsApi, subscribeEvents } from '../services/api';
 
 interface ProcessingStep {
   id: string;
@@ -313,12 +313,19 @@ const ProcessingActivityPage: React.FC = () => {
     console.log('🚀 ProcessingActivityPage mounted');
     fetchProcessingActivity();
     
-    // Poll every 5 seconds for real-time updates (reduced frequency for testing)
-    const interval = setInterval(fetchProcessingActivity, 5000);
+    // Refetch when a document changes status (coalesced) instead of polling
+    let pending: ReturnType<typeof setTimeout> | null = null;
+    const unsubscribe = subscribeEvents((type) => {
+      if (type === 'document.status' || type === 'resync') {
+        if (pending) clearTimeout(pending);
+        pending = setTimeout(fetchProcessingActivity, 500);
+      }
+    });
     
     return () => {
       console.log('🛑 ProcessingActivityPage unmounted');
-      clearInterval(interval);
+      unsubscribe();
+      if (pending) clearTimeout(pending);
     };
   }, []);
 
@@ -326,6 +326,15 @@ export const useNotifications = () => {
 
   useEffect(() => {
     fetchData();
+    // New notifications arrive over the event stream – no polling
+    const unsubscribe = subscribeEvents((type, data) => {
+      if (type === 'notification.created') {
+        setNotifications((prev) => (prev.some((n) => n.id === data.id) ? prev : [data, ...prev]));
+      } else if (type === 'resync') {
+        fetchData();
+      }
+    });
+    return unsubscribe;
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, []);
 
@@ -543,7 +552,45 @@ type CalendarEvent = {
   status: string;
 };
 
+export type CalendarRangeEvent = {
+  id: number;
+  title: string;
+  sender: string | null;
+  document_type: string | null;
+  status: string | null;
+  due_date: string;
+  amount: number | null;
+  currency: string | null;
+  entity_id: number | null;
+};
+
+export type CalendarDay = { date: string; count: number; unpaid: number; amount: number };
+
+export type CalendarRange = {
+  start: string;
+  end: string;
+  days: CalendarDay[];
+  events: CalendarRangeEvent[];
+  truncated: boolean;
+};
+
 export const calendarApi = {
+  /** Documents due in [start, end] (yyyy-MM-dd, inclusive) plus per-day counts. */
+  async getRange(
+    start: string,
+    end: string,
+    opts: { tenantId?: number; events?: boolean } = {},
+  ): Promise<CalendarRange | null> {
+    try {
+      const res = await http.get<CalendarRange>('/calendar/range', {
+        params: { start, end, tenant_id: opts.tenantId, events: opts.events ?? true },
+      });
+      return res.data;
+    } catch (err) {
+      console.error(err);
+      return null;
+    }
+  },
   async getEvents(month: number, year: number): Promise<CalendarEvent[]> {
     try {
       const res = await http.get<CalendarEvent[]>('/calendar/events', {
@@ -583,6 +630,25 @@ export const useCalendarEvents = (month: number, year: number) => {
   return { events, loading, error };
 };
 
+export const useCalendarRange = (start: string, end: string, tenantId?: number) => {
+  const [range, setRange] = useState<CalendarRange | null>(null);
+  const [loading, setLoading] = useState<boolean>(true);
+
+  useEffect(() => {
+    let cancelled = false;
+    setLoading(true);
+    calendarApi
+      .getRange(start, end, { tenantId })
+      .then((r) => !cancelled && setRange(r))
+      .finally(() => !cancelled && setLoading(false));
+    return () => {
+      cancelled = true;
+    };
+  }, [start, end, tenantId]);
+
+  return { range, loading };
+};
+
 /* -------------------------------------------------------------------------- */
 /*                               Settings API                                */
 /* -------------------------------------------------------------------------- */
@@ -1086,6 +1152,71 @@ export const processingApi = {
   }
 };
 
+// ---------------------------------------------------------------------------
+// Live events (Server-Sent Events) – replaces polling of notifications and
+// processing status.  Uses fetch instead of EventSource so the auth headers
+// are sent; reconnects with Last-Event-ID so no event is missed.
+// ---------------------------------------------------------------------------
+
+export type LiveEventType = 'document.status' | 'notification.created' | 'resync';
+
+export const subscribeEvents = (
+  onEvent: (type: LiveEventType, data: any) => void,
+  tenantId?: number,
+): (() => void) => {
+  const controller = new AbortController();
+  let lastEventId: string | null = null;
+  let retryMs = 1000;
+
+  const connect = async () => {
+    while (!controller.signal.aborted) {
+      try {
+        const headers: Record<string, string> = { Accept: 'text/event-stream' };
+        const token = localStorage.getItem('auth_token');
+        if (token) headers.Authorization = `Bearer ${token}`;
+        if ((import.meta as any).env?.DEV) headers['X-API-Key'] = 'test-api-key';
+        if (lastEventId) headers['Last-Event-ID'] = lastEventId;
+
+        const query = tenantId ? `?tenant_id=${tenantId}` : '';
+        const res = await fetch(`${API_BASE_URL}/events/stream${query}`, { headers, signal: controller.signal });
+        if (!res.ok || !res.body) throw new Error(`HTTP error! status: ${res.status}`);
+        retryMs = 1000;
+
+        const reader = res.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = '';
+        for (;;) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += value;
+          let end;
+          while ((end = buffer.indexOf('\n\n')) >= 0) {
+            const frame = buffer.slice(0, end);
+            buffer = buffer.slice(end + 2);
+            let type = 'message';
+            let data = '';
+            for (const line of frame.split('\n')) {
+              if (line.startsWith('id: ')) lastEventId = line.slice(4);
+              else if (line.startsWith('event: ')) type = line.slice(7);
+              else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            if (type === 'document.status' || type === 'notification.created' || type === 'resync') {
+              onEvent(type, data ? JSON.parse(data) : {});
+            }
+          }
+        }
+      } catch (err) {
+        if (controller.signal.aborted) return;
+        console.warn('Event stream disconnected, reconnecting:', err);
+      }
+      await new Promise((resolve) => setTimeout(resolve, retryMs));
+      retryMs = Math.min(retryMs * 2, 30000);
+    }
+  };
+
+  connect();
+  return () => controller.abort();
+};
+
 // ---------------------------------------------------------------------------
 // Processing Rules API
 // ---------------------------------------------------------------------------